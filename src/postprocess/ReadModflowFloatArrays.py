@@ -17,6 +17,9 @@
 #                     (new program name, extractFloatArrayValues.py)
 # 2013-08-06    jwg   add method to write all elements of the array as a csv table
 # 2014-09-02    jwg   add arrays indicating no-flow and dry-cell status
+# 2026-10-18          add a fast path: parse the whole array, flag the no-flow and
+#                     dry cells and write the table with NumPy, instead of
+#                     cell by cell
 
 
 import os
@@ -24,6 +27,8 @@ import math
 import shelve
 import numpy as np
 
+from utilities import run_logger
+
 class ModelGrid:
     def __init__(self,gridTuple):
         self.layers, self.rows, self.columns = gridTuple
@@ -54,13 +59,19 @@ class MFFloatArray:
         if self.grid.columns % self.valuesPerLine == 0:
             self.linesPerBlock = int(math.floor(self.grid.columns/self.valuesPerLine))
             self.blockType = "filled"
-            self.valuesInLastLineOfBlock = 0
+            self.valuesInLastLineOfBlock = self.valuesPerLine
         else:
             self.linesPerBlock = int(math.floor(self.grid.columns/self.valuesPerLine)) + 1
             self.blockType = "unFilled"
             self.valuesInLastLineOfBlock = self.grid.columns - (self.linesPerBlock - 1)*self.valuesPerLine
            
-    def parseFloatArray(self):
+    def parseFloatArray(self, fast=True):
+        """ Parse the array. fast=False parses it cell by cell (slow; kept
+            as the reference for the fast path).
+        """
+        if fast:
+            self.parseFloatArrayFast()
+            return
         for i in range(0,self.grid.rows):
             thisRow = i + 1
             thisCol = 0
@@ -68,6 +79,21 @@ class MFFloatArray:
             self.parseBlock(thisRow, thisCol)
             self.list_array.append(self.block_list)
 
+    def parseFloatArrayFast(self):
+        """ Parse the whole array at once. The lines are padded to the full
+            line width, so each row block is linesPerBlock*valuesPerLine
+            fixed-width fields, and the first grid.columns of them are the
+            values of the row.
+        """
+        lineWidth = self.valuesPerLine*self.fieldWidth
+        lines = [self.inFile.readline().rstrip().ljust(lineWidth)[:lineWidth]
+                 for i in range(self.grid.rows*self.linesPerBlock)]
+        fields = np.frombuffer(''.join(lines).encode('ascii'), dtype='S{0}'.format(self.fieldWidth))
+        self.np_array = fields.reshape(self.grid.rows, -1)[:, :self.grid.columns].astype(float)
+        self.noflow_cell = np.abs(self.np_array - self.head_noflow) < 1.
+        self.dry_cell = np.abs(self.np_array - self.head_dry) < 1.
+        self.list_array = self.np_array.tolist()
+
     def parseBlock(self, thisRow, thisCol):
         for i in range(0, self.linesPerBlock):
             if i == self.linesPerBlock - 1:
@@ -177,12 +203,19 @@ class MFFloatArray:
 #        self.outFile.write(line + '\n')
 #        return(thisCol)
     
-    def writeFloatArrayAsTable(self, array_layer, results_dir):
+    def writeFloatArrayAsTable(self, array_layer, results_dir, fast=True):
         """ Write the data to an ASCII file with two columns: cell sequence number, and cell value. """
         outputFileName = os.path.join(results_dir,"dh_lyr{0}".format(array_layer))
         with open(outputFileName + '_tableFormat.csv', 'w') as outputFile:
             headerString = "{0},dh_lyr{1}\n".format('cellAddress2D',array_layer)
             outputFile.write(headerString)
+            if fast:
+                # The whole table in one write; str() formats the values as
+                # the row by row writer does
+                seqnums = range(1, self.grid.rows*self.grid.columns + 1)
+                values = self.np_array.ravel().tolist()
+                outputFile.write(''.join(map('{0},{1}\n'.format, seqnums, values)))
+                return
             for row in range(1, self.grid.rows+1):
                 for column in range(1, self.grid.columns+1):
                     seqnum = (row - 1)*self.grid.columns + column
@@ -283,7 +316,7 @@ def read_arrays(array_spec_in, array_file_names_in, results_dir, logfile):
             
             currentmessage = ('\tprocessing array %s\n' % (array_file_name))
             print (currentmessage)
-            with open(logfile,'a') as lf: lf.write(currentmessage)
+            run_logger.log(logfile, currentmessage)
             
             anArray = MFFloatArray(myGrid, array_file_name, valuesPerLine,
                                    fieldWidth, fieldFormat, head_noflow,
@@ -308,7 +341,7 @@ def read_arrays(array_spec_in, array_file_names_in, results_dir, logfile):
     ##book.close()
     currentmessage = ('\tFinished reading arrays\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     return array_dict
 
@@ -326,11 +359,11 @@ def main(results_dir, array_spec_in, array_file_names_in, logfile): # !!! PMB !!
     #array_file_names_in = 'sim_head_arrays_file_names.asc'
     #----------------------------------
     
-    array_dict = read_arrays(array_spec_in,array_file_names_in, results_dir, logfile)
+    read_arrays(array_spec_in,array_file_names_in, results_dir, logfile)
     
     currentmessage = ('\tModflow array processing complete\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     return
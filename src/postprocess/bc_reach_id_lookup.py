@@ -0,0 +1,252 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Boundary-condition reach id lookup tables stored as NumPy arrays.
+
+    Replaces lookup_bc_reach_ids_auto.shelf, which depends on the shelve /
+    dbm backend of the Python that wrote it. The tables are a directory of
+    .npy files that are memory-mapped when read, so loading costs almost
+    nothing and concurrent runs share one cached copy:
+
+        lookup_format.txt     format version and the file of each table
+        reach_ids_*.npy       int32 bc reach ids, in the order of the
+                              MODFLOW listing, one per (bc_type, stress period)
+        reach_ids_from_2d_ids_*_2d_ids.npy
+                              sorted int32 2d reach ids
+        reach_ids_from_2d_ids_*_offsets.npy
+                              int64 offsets: the 3d ids of the i-th 2d id
+                              are 3d_ids[offsets[i]:offsets[i+1]]
+        reach_ids_from_2d_ids_*_3d_ids.npy
+                              int32 3d reach ids
+
+    Identical tables (e.g., stress periods 1 and 2) share one file.
+
+    Convert a shelf (or the text dump of one, lookup_bc_reach_ids_auto.txt)
+    with:
+
+        python bc_reach_id_lookup.py lookup_bc_reach_ids_auto.shelf lookup_bc_reach_ids_auto
+"""
+
+import ast
+import hashlib
+import os
+import shelve
+import sys
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+FORMAT_FILE = 'lookup_format.txt'
+
+
+class ReachIdsFrom2dIds:
+    """ Read-only mapping of a 2d reach id to the list of its 3d reach ids
+        (CSR layout), used like the dict it replaces.
+    """
+
+    def __init__(self, ids_2d, offsets, ids_3d):
+        self.ids_2d = ids_2d
+        self.offsets = offsets
+        self.ids_3d = ids_3d
+
+    def index(self, bc_2d_id):
+        i = int(np.searchsorted(self.ids_2d, bc_2d_id))
+        if (i == len(self.ids_2d) or self.ids_2d[i] != bc_2d_id):
+            raise KeyError(bc_2d_id)
+        return i
+
+    def __getitem__(self, bc_2d_id):
+        i = self.index(bc_2d_id)
+        return self.ids_3d[self.offsets[i]:self.offsets[i+1]].tolist()
+
+    def __contains__(self, bc_2d_id):
+        try:
+            self.index(bc_2d_id)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.ids_2d)
+
+    def __iter__(self):
+        return iter(self.ids_2d.tolist())
+
+    def keys(self):
+        return self.ids_2d.tolist()
+
+    def items(self):
+        return [(bc_2d_id, self[bc_2d_id]) for bc_2d_id in self.keys()]
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def read_format_file(lookup_dir):
+    """ Returns {table name: file name} """
+    tables = {}
+    version = None
+    with open(os.path.join(lookup_dir, FORMAT_FILE), 'r') as fin:
+        for line in fin:
+            items = line.split()
+            if (len(items) < 3 or items[0].startswith('#')): continue
+            if (items[0] == 'set' and items[1] == 'version'): version = int(items[2])
+            elif (items[0] == 'table'): tables[items[1]] = items[2]
+        # END for over line
+    #
+    if (version != FORMAT_VERSION):
+        raise ValueError('\nERROR:\t{0} is lookup format version {1}; version {2} is expected.\n'
+                         '\tConvert the shelf file again with bc_reach_id_lookup.py\n'
+                         .format(lookup_dir, version, FORMAT_VERSION))
+    return tables
+
+
+def table_key(name):
+    """ 'riv_2' --> ('riv', 2) """
+    bc_type, stress_period = name.rsplit('_', 1)
+    return (bc_type, int(stress_period))
+
+
+def read_lookup_tables(lookup_dir):
+    """ Load the lookup tables, memory-mapped. Returns the dictionary of
+        sim_q_reach_3d_auto.retrieve_id_data_from_lookup_shelf_file.
+    """
+    tables = read_format_file(lookup_dir)
+
+    def load(name):
+        return np.load(os.path.join(lookup_dir, tables[name]), mmap_mode='r')
+
+    reach_ids = {}
+    reach_ids_from_2d_ids = {}
+    for name in tables:
+        if name.startswith('reach_ids.'):
+            reach_ids[table_key(name.split('.')[1])] = load(name)
+        elif name.startswith('reach_ids_from_2d_ids.') and name.endswith('.2d_ids'):
+            key_name = name.split('.')[1]
+            prefix = 'reach_ids_from_2d_ids.' + key_name
+            reach_ids_from_2d_ids[table_key(key_name)] = ReachIdsFrom2dIds(load(prefix + '.2d_ids'),
+                                                                           load(prefix + '.offsets'),
+                                                                           load(prefix + '.3d_ids'))
+    # END for over name
+
+    bc_id_dict = {}
+    bc_id_dict['lists_of_3d_ids_by_bc_type_and_stress_period'] = reach_ids
+    bc_id_dict['lists_of_3d_ids_from_2d_ids'] = reach_ids_from_2d_ids
+    return bc_id_dict
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Convert
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def read_shelf_or_dump(input_file):
+    """ Read 'reach_ids' and 'reach_ids_from_2d_ids' from a shelf file, or
+        from a text dump with one '<name> <repr of the dict>' line each.
+    """
+    data = {}
+    if input_file.endswith('.txt'):
+        with open(input_file, 'r') as fin:
+            for line in fin:
+                if (line.strip() == ''): continue
+                name, value = line.split(' ', 1)
+                data[name] = ast.literal_eval(value.strip())
+            # END for over line
+        #
+    else:
+        book = shelve.open(input_file, 'r')
+        data['reach_ids'] = book['reach_ids']
+        data['reach_ids_from_2d_ids'] = book['reach_ids_from_2d_ids']
+        book.close()
+    #
+    return data['reach_ids'], data['reach_ids_from_2d_ids']
+
+
+def write_array(lookup_dir, stem, array, files_by_hash):
+    """ Save an array unless an identical one was saved already.
+        Returns the file name.
+    """
+    digest = hashlib.sha1(array.dtype.str.encode('utf-8') + array.tobytes()).hexdigest()
+    if digest not in files_by_hash:
+        fname = stem + '.npy'
+        np.save(os.path.join(lookup_dir, fname), array)
+        files_by_hash[digest] = fname
+    return files_by_hash[digest]
+
+
+def convert(input_file, lookup_dir):
+    reach_ids, reach_ids_from_2d_ids = read_shelf_or_dump(input_file)
+
+    if not os.path.isdir(lookup_dir): os.makedirs(lookup_dir)
+
+    tables = []
+    files_by_hash = {}
+    for key in sorted(reach_ids):
+        key_name = '{0}_{1}'.format(key[0], key[1])
+        fname = write_array(lookup_dir, 'reach_ids_' + key_name,
+                            np.asarray(reach_ids[key], dtype=np.int32), files_by_hash)
+        tables.append(('reach_ids.' + key_name, fname))
+    # END for over key
+
+    for key in sorted(reach_ids_from_2d_ids):
+        key_name = '{0}_{1}'.format(key[0], key[1])
+        mapping = reach_ids_from_2d_ids[key]
+        ids_2d = sorted(mapping)
+        lengths = [len(mapping[bc_2d_id]) for bc_2d_id in ids_2d]
+        offsets = np.zeros(len(ids_2d)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        ids_3d = [bc_3d_id for bc_2d_id in ids_2d for bc_3d_id in mapping[bc_2d_id]]
+        stem = 'reach_ids_from_2d_ids_' + key_name
+        prefix = 'reach_ids_from_2d_ids.' + key_name
+        tables.append((prefix + '.2d_ids', write_array(lookup_dir, stem + '_2d_ids',
+                                                       np.asarray(ids_2d, dtype=np.int32), files_by_hash)))
+        tables.append((prefix + '.offsets', write_array(lookup_dir, stem + '_offsets',
+                                                        offsets, files_by_hash)))
+        tables.append((prefix + '.3d_ids', write_array(lookup_dir, stem + '_3d_ids',
+                                                       np.asarray(ids_3d, dtype=np.int32), files_by_hash)))
+    # END for over key
+
+    with open(os.path.join(lookup_dir, FORMAT_FILE), 'w') as fout:
+        fout.write('# Boundary-condition reach id lookup tables (bc_reach_id_lookup.py)\n')
+        fout.write('# Converted from {}\n'.format(os.path.basename(input_file)))
+        fout.write('set version {}\n'.format(FORMAT_VERSION))
+        for name, fname in tables:
+            fout.write('table {0} {1}\n'.format(name, fname))
+        # END for over name
+    #
+
+    # Check the conversion
+    converted = read_lookup_tables(lookup_dir)
+    for key in reach_ids:
+        if (list(reach_ids[key]) != converted['lists_of_3d_ids_by_bc_type_and_stress_period'][key].tolist()):
+            raise ValueError('\nERROR:\treach_ids {} did not convert correctly\n'.format(key))
+    # END for over key
+    for key in reach_ids_from_2d_ids:
+        mapping = converted['lists_of_3d_ids_from_2d_ids'][key]
+        for bc_2d_id in reach_ids_from_2d_ids[key]:
+            if (list(reach_ids_from_2d_ids[key][bc_2d_id]) != mapping[bc_2d_id]):
+                raise ValueError('\nERROR:\treach_ids_from_2d_ids {0}, {1} did not convert correctly\n'
+                                 .format(key, bc_2d_id))
+        # END for over bc_2d_id
+    # END for over key
+    return
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) != 3):
+        print ('usage: python bc_reach_id_lookup.py <shelf file or text dump> <output directory>')
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
+    print ('Lookup tables written to {}'.format(sys.argv[2]))
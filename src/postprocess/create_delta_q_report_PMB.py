@@ -15,6 +15,8 @@ import sys
 sys.path.insert(0, os.path.join('src','utilities'))
 import mydefinitions as mydef
 
+from utilities import run_logger
+
 
 
 # Quick function to return a dictionary list
@@ -201,7 +203,7 @@ def main(logfile,
     
     currentmessage = ('Done with delta_q_report!\n\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
 #
 #main('test_logfile.log',
 #     os.getcwd(),
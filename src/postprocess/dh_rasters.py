@@ -0,0 +1,139 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Rasters of the simulated change in heads
+#
+# Writes the change in heads (stress period 2 - stress period 1) of each
+# model layer as a raster, dh_lyr<n>.tif (GeoTIFF) or dh_lyr<n>.asc (ESRI
+# ASCII grid), straight from the binary heads file. The rasters are
+# georeferenced with the grid definition file (grid_index.py) and the
+# grid projection, gis/projections/nfseg_v1_1_grid.prj, so they can be
+# opened in any GIS without joining the dh table to the grid feature
+# class (make_ArcGIS_table_from_csv.py).
+#
+# Cells that are not in the grid, and dry or inactive cells (heads of
+# 1e29 or more in either stress period), have no data.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import os
+import time
+
+import numpy as np
+
+from utilities import basic_utilities as bscut
+from utilities import run_logger
+from utilities import grid_index
+from utilities import raster_writer
+from process_heads import modflow_heads_file
+
+
+# Raster formats: file extension
+RASTER_FORMATS = {'tif':'.tif', 'asc':'.asc'}
+
+# Heads of dry and inactive cells (HDRY, HNOFLO) are at least this large
+INACTIVE_HEAD = 1.e29
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Change in heads of a layer, with NaN in the cells
+# without data
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def get_layer_dh(hds, layer, grid, per_b=2, stp_b=1, per_a=1, stp_a=1):
+
+    heads_a = hds.get_layer(per_a, layer, stp_a)
+    heads_b = hds.get_layer(per_b, layer, stp_b)
+    dh = (heads_b - heads_a).astype(np.float32)
+    inactive = (np.abs(heads_a) >= INACTIVE_HEAD) | (np.abs(heads_b) >= INACTIVE_HEAD)
+    inactive |= grid.missing[1:,1:]
+    dh[inactive] = np.nan
+    return dh
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+#==============================================================================
+#
+# MAIN PROGRAM
+#
+#==============================================================================
+
+def main(hds_file, layers, grid_definition_file, prj_file, out_dir, raster_format, logfile):
+
+    currentmessage = ('\tWriting rasters of the change in heads ({0}) ...\n'.format(raster_format)
+                      + bscut.datetime() + '\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    if raster_format not in RASTER_FORMATS:
+        error_message = ('\nERROR:\tThe raster format must be one of {0}, not {1}\n'
+                         .format(', '.join(sorted(RASTER_FORMATS)), raster_format))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+    if not os.path.isfile(grid_definition_file):
+        error_message = ('\nERROR:\tThe model grid definition file, {}, is missing. The rasters '
+                         'cannot be georeferenced without it\n'.format(grid_definition_file))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+
+    grid = grid_index.GridIndex.read(grid_definition_file)
+    projection = grid_index.Projection(prj_file)
+    hds = modflow_heads_file.HeadsFile(hds_file)
+
+    if ((hds.nrow, hds.ncol) != (grid.nrow, grid.ncol)):
+        hds.close()
+        error_message = ('\nERROR:\tThe heads file {0} ({1} rows, {2} columns) does not match the grid '
+                         'definition {3} ({4} rows, {5} columns)\n'
+                         .format(hds_file, hds.nrow, hds.ncol, grid_definition_file, grid.nrow, grid.ncol))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+
+    if not os.path.isdir(out_dir): os.makedirs(out_dir)
+
+    outfiles = []
+    currentmessage = ''
+    for layer in layers:
+        start = time.time()
+        dh = get_layer_dh(hds, layer, grid)
+
+        outfile = os.path.join(out_dir, 'dh_lyr{0}{1}'.format(layer, RASTER_FORMATS[raster_format]))
+        bscut.remove_file(outfile)
+        if (raster_format == 'asc'):
+            raster_writer.write_ascii_grid(dh, grid, outfile, prj_file)
+        else:
+            raster_writer.write_geotiff(dh, grid, outfile, projection)
+        #
+        outfiles.append(outfile)
+        currentmessage += ('\t{0} ({1:.2f} s)\n'.format(outfile, time.time() - start))
+    # END for over layer
+    hds.close()
+
+    currentmessage += ('\tFinished the rasters of the change in heads.\n'
+                       + bscut.datetime() + '\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return outfiles
+#==============================================================================
+#==============================================================================
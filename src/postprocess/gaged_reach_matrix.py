@@ -0,0 +1,194 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Sparse gaged-reach aggregation matrix.
+
+    The gaged-reach definitions and the 2d -> 3d river reach lookup are
+    compiled into one sparse matrix per (bc_type, stress period), stored as
+    (row, col) coordinate arrays: row is the index of the gaged reach in
+    GagedReaches.gaged_reach_list and col is the bc reach id. The simulated
+    flux of every gaged reach is then
+
+        flux[row] = sum of flux_by_id[col]
+
+    over the entries of the row, which is one np.bincount. The entries are
+    kept in the order of the loops in
+    GagedReaches.calc_gaged_reach_sim_flux, so the sums are added in the
+    same order.
+
+    The matrix is saved to a .npz file with a hash of its sources and is
+    rebuilt only when the definitions or the lookup tables change.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from utilities import run_logger
+
+
+FORMAT_VERSION = 1
+
+
+class GagedReachMatrix:
+
+    def __init__(self, gaged_reach_list, entries, source_hash=''):
+        """ entries: {(bc_type, stress_period): (rows, cols)} """
+        self.gaged_reach_list = list(gaged_reach_list)
+        self.entries = entries
+        self.source_hash = source_hash
+        # Number of bc features in each row; gaged reaches with none
+        # have no flux (as with the dictionary version)
+        self.row_counts = {}
+        for key in self.entries:
+            rows = self.entries[key][0]
+            self.row_counts[key] = np.bincount(rows, minlength=len(self.gaged_reach_list))
+        # END for over key
+
+    @classmethod
+    def build(cls, gaged_reaches, lists_of_3d_ids_from_2d_ids, num_stress_periods, source_hash=''):
+        """ Compile the matrix from a GagedReaches object """
+        rows = {}
+        cols = {}
+        for row, gaged_reach_id in enumerate(gaged_reaches.gaged_reach_list):
+            for bc_type in gaged_reaches.gaged_reach_bc_types[(gaged_reach_id)]:
+                for bc_2d_id in gaged_reaches.gaged_reach_bc_2d_id_list[(gaged_reach_id, bc_type)]:
+                    for stress_period in range(1,num_stress_periods+1):
+                        key = (bc_type, stress_period)
+                        if key not in rows:
+                            rows[key] = []
+                            cols[key] = []
+                        if bc_type == 'riv':
+                            bc_3d_ids = lists_of_3d_ids_from_2d_ids[(bc_type, stress_period)][bc_2d_id]
+                        else:
+                            bc_3d_ids = [bc_2d_id]
+                        rows[key].extend([row]*len(bc_3d_ids))
+                        cols[key].extend(bc_3d_ids)
+                    # END for over stress_period
+                # END for over bc_2d_id
+            # END for over bc_type
+        # END for over row
+
+        entries = {}
+        for key in rows:
+            entries[key] = (np.array(rows[key], dtype=np.int32), np.array(cols[key], dtype=np.int64))
+        # END for over key
+        return cls(gaged_reaches.gaged_reach_list, entries, source_hash)
+
+    def save(self, matrix_file):
+        arrays = {'format_version':np.array([FORMAT_VERSION]),
+                  'source_hash':np.array([self.source_hash]),
+                  'gaged_reach_list':np.array(self.gaged_reach_list)}
+        for key in self.entries:
+            name = '{0}_{1}'.format(key[0], key[1])
+            arrays['rows_' + name] = self.entries[key][0]
+            arrays['cols_' + name] = self.entries[key][1]
+        # END for over key
+        # Write to a temporary file first so concurrent runs never
+        # read a partial file
+        temp_file = matrix_file + '.{}.tmp'.format(os.getpid())
+        with open(temp_file, 'wb') as fout:
+            np.savez(fout, **arrays)
+        if os.path.exists(matrix_file): os.remove(matrix_file)
+        os.rename(temp_file, matrix_file)
+
+    @classmethod
+    def load(cls, matrix_file):
+        with np.load(matrix_file) as data:
+            if (int(data['format_version'][0]) != FORMAT_VERSION): return None
+            entries = {}
+            for name in data.files:
+                if not name.startswith('rows_'): continue
+                bc_type, stress_period = name[5:].rsplit('_', 1)
+                entries[(bc_type, int(stress_period))] = (data[name], data['cols_' + name[5:]])
+            # END for over name
+            return cls([str(item) for item in data['gaged_reach_list']], entries, str(data['source_hash'][0]))
+        #
+
+    def aggregate(self, bc_type, stress_period, bc_ids, fluxes):
+        """ Simulated flux of each gaged reach for one bc type and stress
+            period. bc_ids, fluxes are the arrays parsed from a listing
+            flux block; fluxes may have a second dimension (e.g., one
+            column per scenario).
+
+            Returns (fluxes by gaged reach, rows that have bc features).
+            Raises KeyError with the first bc id that has no flux.
+        """
+        rows, cols = self.entries[(bc_type, stress_period)]
+        fluxes = np.asarray(fluxes, dtype=np.float64)
+        flux_by_id = np.zeros((max(int(cols.max()) if len(cols) else 0,
+                                   int(bc_ids.max()) if len(bc_ids) else 0) + 1,) + fluxes.shape[1:])
+        found = np.zeros(len(flux_by_id), dtype=bool)
+        flux_by_id[bc_ids] = fluxes
+        found[bc_ids] = True
+
+        missing = ~found[cols]
+        if missing.any():
+            raise KeyError(int(cols[np.argmax(missing)]))
+
+        nrow = len(self.gaged_reach_list)
+        values = flux_by_id[cols]
+        if values.ndim == 1:
+            sums = np.bincount(rows, weights=values, minlength=nrow)
+        else:
+            sums = np.column_stack([np.bincount(rows, weights=values[:,i], minlength=nrow)
+                                    for i in range(values.shape[1])])
+        return sums, self.row_counts[(bc_type, stress_period)] > 0
+
+
+def get_source_hash(file_names, num_stress_periods):
+    """ Hash of the matrix sources: file contents (directories are hashed
+        file by file) and the number of stress periods
+    """
+    sha = hashlib.sha1()
+    sha.update('version {0} stress periods {1}'.format(FORMAT_VERSION, num_stress_periods).encode('utf-8'))
+    for file_name in file_names:
+        if os.path.isdir(file_name):
+            paths = [os.path.join(file_name, fname) for fname in sorted(os.listdir(file_name))]
+        else:
+            paths = [file_name]
+        for path in paths:
+            sha.update(os.path.basename(path).encode('utf-8'))
+            with open(path, 'rb') as fin:
+                for chunk in iter(lambda: fin.read(1024*1024), b''):
+                    sha.update(chunk)
+            #
+        # END for over path
+    # END for over file_name
+    return sha.hexdigest()
+
+
+def get_gaged_reach_matrix(matrix_file, source_files, gaged_reaches, lists_of_3d_ids_from_2d_ids,
+                           num_stress_periods, logfile):
+    """ Load the compiled matrix, or build and save it if the sources
+        have changed
+    """
+    source_hash = get_source_hash(source_files, num_stress_periods)
+    if os.path.isfile(matrix_file):
+        try:
+            matrix = GagedReachMatrix.load(matrix_file)
+        except Exception:
+            matrix = None
+        if (matrix is not None and matrix.source_hash == source_hash and
+            matrix.gaged_reach_list == gaged_reaches.gaged_reach_list):
+            return matrix
+    #
+
+    matrix = GagedReachMatrix.build(gaged_reaches, lists_of_3d_ids_from_2d_ids, num_stress_periods, source_hash)
+    try:
+        matrix.save(matrix_file)
+        currentmessage = ('\tGaged-reach matrix compiled to {}\n'.format(matrix_file))
+    except (IOError, OSError) as exc:
+        currentmessage = ('\tWARNING: could not save the gaged-reach matrix to {0} ({1})\n'.format(matrix_file, exc))
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return matrix
@@ -12,6 +12,7 @@ import os
 import arcpy
 # Import internal python scripts
 from utilities import basic_utilities as bscut
+from utilities import run_logger
 
 
 def main(dh_layer_dictionary, currentworkingdir, gis_dir, grid_featureclass, logfile):
@@ -24,13 +25,13 @@ def main(dh_layer_dictionary, currentworkingdir, gis_dir, grid_featureclass, log
     currentmessage = ('\tInitializing dh geoprocessing ...\n'
                       + bscut.datetime() + '\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     # Set the working environment to the cup.gdb
     currentmessage = ('\n\tlinking to the cup geodatabase ...\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     #
     my_gdb = os.path.join(gis_dir, 'cup.gdb')
     arcpy.env.workspace = my_gdb
@@ -50,7 +51,7 @@ def main(dh_layer_dictionary, currentworkingdir, gis_dir, grid_featureclass, log
     # Convert the data into a TableView
     currentmessage = ('\timporting data into an ArcGIS table ...\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     #
     inTable = os.path.join(currentworkingdir, dh_layer_dictionary['datafile']) # The dh data
     outLocation = my_gdb
@@ -61,7 +62,7 @@ def main(dh_layer_dictionary, currentworkingdir, gis_dir, grid_featureclass, log
     # Join the TableView to the gdb field based on common field
     currentmessage = ('\tjoining new table data ...\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     #
     inFeatures = "grid_layer"
     joinField = "ref_ROW_COL"
@@ -74,7 +75,7 @@ def main(dh_layer_dictionary, currentworkingdir, gis_dir, grid_featureclass, log
     currentmessage = ('\tFinished ArcGIS processing of simulated dh field.\n'
                       + bscut.datetime() + '\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     return
 #
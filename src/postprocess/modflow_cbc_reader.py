@@ -0,0 +1,279 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Reader for MODFLOW cell-by-cell budget files (nfseg_auto.cbb).
+
+    The file is memory-mapped and only the record headers are read when it
+    is opened; the data of a record are read when asked for. Each record
+    starts with
+
+        KSTP, KPER, TEXT (16 characters), NCOL, NROW, NLAY
+
+    A full record (NLAY > 0) is followed by NLAY*NROW*NCOL values. In a
+    compact record (NLAY < 0, COMPACT BUDGET in the Output Control file)
+    the header goes on with IMETH, DELT, PERTIM, TOTIM, and the data are:
+
+        IMETH 1   NLAY*NROW*NCOL values
+        IMETH 2   NLIST, then NLIST pairs of (cell number, value)
+        IMETH 3   NROW*NCOL layer numbers, then NROW*NCOL values
+        IMETH 4   NROW*NCOL values of layer 1
+        IMETH 5   NVAL, NVAL-1 auxiliary names (16 characters each),
+                  NLIST, then NLIST records of (cell number, NVAL values)
+
+    Values are single or double precision, as MODFLOW was compiled; the
+    precision is found when the file is opened.
+
+    The list records (IMETH 2 and 5) of the RIVER, DRAIN and GHB packages
+    hold one value per boundary feature, in the order of the package input
+    (the REACH / DRAIN / BOUNDARY numbers of the listing file).
+"""
+
+import os
+
+import numpy as np
+
+
+# Budget terms of the packages used by the Tool
+BC_TYPE_TEXT = {'riv':'RIVER LEAKAGE',
+                'drn':'DRAINS',
+                'ghb':'HEAD DEP BOUNDS',
+                'wel':'WELLS'}
+
+# Flows between cells; not part of the volumetric budget
+INTERNAL_FLOW_TEXT = ['FLOW RIGHT FACE', 'FLOW FRONT FACE', 'FLOW LOWER FACE']
+
+
+class BudgetRecord:
+
+    def __init__(self, kstp, kper, text, ncol, nrow, nlay, imeth=0, delt=0., pertim=0., totim=0.):
+        self.kstp = kstp
+        self.kper = kper
+        self.text = text
+        self.ncol = ncol
+        self.nrow = nrow
+        self.nlay = nlay
+        self.imeth = imeth
+        self.delt = delt
+        self.pertim = pertim
+        self.totim = totim
+        # Set by CellBudgetFile.index_records
+        self.start = 0
+        self.data_start = 0
+        self.end = 0
+        self.nlist = 0
+        self.aux_names = []
+
+    def is_list(self):
+        return self.imeth in [2, 5]
+
+
+class CellBudgetFile:
+
+    def __init__(self, cbc_file_name):
+        self.file_name = cbc_file_name
+        self.size = os.path.getsize(cbc_file_name)
+        if (self.size == 0):
+            raise ValueError('\nERROR:\tThe cell-by-cell budget file {} is empty\n'.format(cbc_file_name))
+        self.data = np.memmap(cbc_file_name, dtype=np.uint8, mode='r')
+
+        self.records = None
+        for real in ['<f4', '<f8']:
+            try:
+                self.records = self.index_records(np.dtype(real))
+            except ValueError:
+                continue
+            self.real = np.dtype(real)
+            break
+        # END for over real
+        if self.records is None:
+            self.close()
+            raise ValueError('\nERROR:\tCould not read the cell-by-cell budget file {}\n'.format(cbc_file_name))
+
+    def close(self):
+        """ Release the memory map (needed on Windows before the file can
+            be deleted or replaced)
+        """
+        self.data = None
+
+    def read_values(self, offset, dtype, count):
+        dtype = np.dtype(dtype)
+        if (offset + dtype.itemsize*count > self.size):
+            raise ValueError('record past the end of the file')
+        return np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+
+    def index_records(self, real):
+        """ Read the record headers, skipping over the data. Raises
+            ValueError if the file does not read with this precision.
+        """
+        records = []
+        offset = 0
+        while offset < self.size:
+            start = offset
+            kstp, kper = self.read_values(offset, '<i4', 2).tolist()
+            text = self.read_values(offset+8, 'S16', 1)[0]
+            ncol, nrow, nlay = self.read_values(offset+24, '<i4', 3).tolist()
+            offset += 36
+            if (kstp < 1 or kper < 1 or ncol < 1 or nrow < 1 or nlay == 0 or
+                not all(32 <= c < 127 for c in bytearray(text))):
+                raise ValueError('not a budget record header')
+            text = text.decode('ascii').strip()
+
+            if (nlay > 0):
+                record = BudgetRecord(kstp, kper, text, ncol, nrow, nlay)
+            else:
+                nlay = -nlay
+                imeth = int(self.read_values(offset, '<i4', 1)[0])
+                delt, pertim, totim = self.read_values(offset+4, real, 3).tolist()
+                offset += 4 + 3*real.itemsize
+                record = BudgetRecord(kstp, kper, text, ncol, nrow, nlay, imeth, delt, pertim, totim)
+            record.start = start
+
+            ncell = ncol*nrow
+            if (record.imeth in [0, 1]):
+                record.data_start = offset
+                offset += ncell*nlay*real.itemsize
+            elif (record.imeth == 2):
+                record.nlist = int(self.read_values(offset, '<i4', 1)[0])
+                offset += 4
+                record.data_start = offset
+                offset += record.nlist*(4 + real.itemsize)
+            elif (record.imeth == 3):
+                record.data_start = offset
+                offset += ncell*(4 + real.itemsize)
+            elif (record.imeth == 4):
+                record.data_start = offset
+                offset += ncell*real.itemsize
+            elif (record.imeth == 5):
+                nval = int(self.read_values(offset, '<i4', 1)[0])
+                offset += 4
+                if (nval < 1): raise ValueError('bad number of values')
+                names = self.read_values(offset, 'S16', nval-1)
+                record.aux_names = [name.decode('ascii', 'replace').strip() for name in names]
+                offset += 16*(nval-1)
+                record.nlist = int(self.read_values(offset, '<i4', 1)[0])
+                offset += 4
+                record.data_start = offset
+                offset += record.nlist*(4 + nval*real.itemsize)
+            else:
+                raise ValueError('unknown IMETH')
+            #
+            if (record.nlist < 0 or offset > self.size):
+                raise ValueError('record past the end of the file')
+            record.end = offset
+            records.append(record)
+        # END while
+        return records
+
+    def get_times(self):
+        """ Sorted list of (kstp, kper) in the file """
+        return sorted(set([(record.kstp, record.kper) for record in self.records]))
+
+    def get_text_names(self):
+        names = []
+        for record in self.records:
+            if record.text not in names: names.append(record.text)
+        # END for over record
+        return names
+
+    def find(self, text, kstp, kper):
+        """ Record of a budget term for a time step, or None """
+        text = text.strip().upper()
+        for record in self.records:
+            if (record.kstp == kstp and record.kper == kper and record.text.upper() == text):
+                return record
+        # END for over record
+        return None
+
+    def list_dtype(self, record):
+        nval = 1 + len(record.aux_names)
+        return np.dtype([('node','<i4'), ('q',self.real,(nval,))])
+
+    def read_list(self, record):
+        """ (cell numbers, values) of a list record. Cell numbers are
+            1-based, (layer-1)*NROW*NCOL + (row-1)*NCOL + col.
+        """
+        if not record.is_list():
+            raise ValueError('\nERROR:\tThe {0} record of {1} is not a list (IMETH {2}).\n'
+                             '\tSave it with the COMPACT BUDGET option of the Output Control file\n'
+                             .format(record.text, self.file_name, record.imeth))
+        values = self.read_values(record.data_start, self.list_dtype(record), record.nlist)
+        return values['node'].astype(np.int64), values['q'][:,0].astype(np.float64)
+
+    def read_array(self, record):
+        """ Values of a record as a (NLAY, NROW, NCOL) array. The values of a
+            list record are added up by cell.
+        """
+        shape = (record.nlay, record.nrow, record.ncol)
+        ncell = record.nrow*record.ncol
+        if (record.imeth in [0, 1]):
+            return self.read_values(record.data_start, self.real, ncell*record.nlay).astype(np.float64).reshape(shape)
+        elif record.is_list():
+            nodes, values = self.read_list(record)
+            return np.bincount(nodes-1, weights=values, minlength=ncell*record.nlay).reshape(shape)
+        elif (record.imeth == 3):
+            layers = self.read_values(record.data_start, '<i4', ncell)
+            values = self.read_values(record.data_start + 4*ncell, self.real, ncell)
+            array = np.zeros(shape)
+            array.reshape(record.nlay, ncell)[layers-1, np.arange(ncell)] = values
+            return array
+        else:
+            array = np.zeros(shape)
+            array[0] = self.read_values(record.data_start, self.real, ncell).reshape(shape[1:])
+            return array
+
+    def read_values_by_record(self, record):
+        """ Cell or feature values of any record (for sums) """
+        if record.is_list():
+            return self.read_list(record)[1]
+        return self.read_array(record).ravel()
+
+    def budget_rates(self, kstp, kper):
+        """ {budget term: (rate in, rate out)} of a time step, as the
+            volumetric budget of the listing file (out rates positive)
+        """
+        rates = {}
+        for record in self.records:
+            if (record.kstp != kstp or record.kper != kper): continue
+            if record.text.upper() in INTERNAL_FLOW_TEXT: continue
+            values = self.read_values_by_record(record)
+            rate_in = float(values[values > 0.].sum())
+            rate_out = float(-values[values < 0.].sum())
+            if record.text in rates:
+                rate_in += rates[record.text][0]
+                rate_out += rates[record.text][1]
+            rates[record.text] = (rate_in, rate_out)
+        # END for over record
+        return rates
+
+
+def combine_budget_files(baseline_cbc, scenario_cbc, cbc_out):
+    """ Join the budget files of the single-stress-period mode: the
+        scenario records are relabeled as stress period 2 and their TOTIM
+        is shifted by the baseline simulation time (as
+        single_stress_period.combine_heads_files).
+    """
+    baseline = CellBudgetFile(baseline_cbc)
+    scenario = CellBudgetFile(scenario_cbc)
+    totim = max([record.totim for record in baseline.records] + [0.])
+    with open(cbc_out,'wb') as fout:
+        fout.write(baseline.data[:baseline.size].tobytes())
+        for record in scenario.records:
+            chunk = np.array(scenario.data[record.start:record.end])
+            chunk[4:8] = np.frombuffer(np.array([record.kper + 1], dtype='<i4').tobytes(), dtype=np.uint8)
+            if (record.imeth > 0):
+                position = 40 + 2*scenario.real.itemsize
+                chunk[position:position+scenario.real.itemsize] = np.frombuffer(
+                    np.array([record.totim + totim], dtype=scenario.real).tobytes(), dtype=np.uint8)
+            fout.write(chunk.tobytes())
+        # END for over record
+    #
+    baseline.close()
+    scenario.close()
+    return
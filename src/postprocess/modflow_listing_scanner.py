@@ -0,0 +1,289 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Single-pass scanner for MODFLOW-NWT listing files.
+
+    The listing file is read once and each block is handed to the
+    consumers registered for it:
+
+        parse_modflow_listing_file_budget.ModflowListing
+                                   volumetric budget
+        sim_q_reach_3d_auto.ModflowListing
+                                   RIVER, DRAIN and GHB flux blocks
+        StressPeriodMarkers        'STRESS PERIOD NO.' lines
+        SolverIterations           NWT iteration counts and convergence
+                                   failures
+
+    A consumer has:
+
+        block_markers      lines that start one of its blocks (leading
+                           blanks and asterisks are ignored when matching)
+        start_block(line)  called for a line that matches a marker.
+                           Returns True if the following lines belong to
+                           the block.
+        block_line(line)   called for each line of the block. Returns False
+                           for the first line that is not part of the block;
+                           that line is then checked against the markers.
+                           Called with '' at the end of the file.
+"""
+
+import os
+import re
+import time
+import warnings
+
+import numpy as np
+
+from utilities import run_logger
+from utilities import process_runner
+
+
+def get_marker_key(line):
+    """ Key of a line in ListingScanner.markers: its first few characters
+        after any blanks and asterisks (e.g., ' ****FAILED TO MEET ...')
+    """
+    return line.lstrip(' *')[:6]
+
+
+class ListingScanner:
+
+    def __init__(self):
+        self.consumers = []
+        self.markers = {}
+
+    def register(self, consumer):
+        """ Add a consumer. Markers are looked up by their first
+            few characters so lines outside blocks cost one dict lookup.
+        """
+        self.consumers.append(consumer)
+        for marker in consumer.block_markers:
+            key = get_marker_key(marker)
+            self.markers.setdefault(key, [])
+            if consumer not in self.markers[key]:
+                self.markers[key].append(consumer)
+        # END for over marker
+
+    def dispatch(self, line):
+        """ Hand a line outside any block to the consumers of its marker.
+            Returns the consumer whose block starts at the line, or None.
+        """
+        consumers = self.markers.get(get_marker_key(line))
+        if consumers is None: return None
+        active = None
+        for consumer in consumers:
+            if consumer.start_block(line) and active is None:
+                active = consumer
+        # END for over consumer
+        return active
+
+    def scan_file(self, in_file):
+        """ Scan an open listing file """
+        active = None
+        for line in in_file:
+            if active is not None:
+                if active.block_line(line): continue
+                active = None
+            active = self.dispatch(line)
+        # END for over line
+        if active is not None:
+            active.block_line('')
+
+    def scan(self, listing_file_name):
+        with open(listing_file_name, 'r') as in_file:
+            self.scan_file(in_file)
+
+
+def parse_fixed_width_block(lines, fields):
+    """ Convert fixed-width fields of all the lines of a block at once.
+
+        fields   list of (start, end, dtype) column slices; end may be None
+                 for the rest of the line
+
+        The lines are copied into one NumPy character array. Each field is
+        cut out as a column, with a blank after every value, and the column
+        is converted by NumPy's text parser. Returns one array per field.
+        If a field does not convert (e.g., an odd line), the lines are
+        converted one at a time so the error is the same as before.
+    """
+    if (len(lines) == 0):
+        return [np.zeros(0, dtype=dtype) for start, end, dtype in fields]
+
+    block = np.array(lines, dtype='S')
+    chars = block.view(np.uint8).reshape(len(lines), block.itemsize)
+    arrays = []
+    for start, end, dtype in fields:
+        if end is None: end = block.itemsize
+        column = np.empty((len(lines), end - start + 1), dtype=np.uint8)
+        column[:,:-1] = chars[:,start:end]
+        column[:,-1] = ord(' ')
+        # Shorter lines are padded with NUL
+        column[column == 0] = ord(' ')
+        # Each line must hold one value
+        blank = (column == ord(' ')) | (column == ord('\n')) | (column == ord('\r')) | (column == ord('\t'))
+        values_per_line = (~blank[:,1:] & blank[:,:-1]).sum(axis=1) + ~blank[:,0]
+        # Text that does not parse stops the NumPy parser early (with a
+        # warning or a ValueError, depending on the version), so a final
+        # 0 is added and must be read as the last value
+        values = []
+        if (values_per_line == 1).all():
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', DeprecationWarning)
+                try:
+                    values = np.fromstring(column.tobytes() + b'0 ', dtype=dtype, sep=' ')
+                except (ValueError, DeprecationWarning):
+                    values = []
+        if (len(values) == len(lines) + 1):
+            values = values[:-1]
+        else:
+            convert = int if np.dtype(dtype).kind == 'i' else float
+            values = np.array([convert(line.rstrip()[start:end]) for line in lines], dtype=dtype)
+        arrays.append(values)
+    # END for over fields
+    return arrays
+
+
+class StressPeriodMarkers:
+    """ Stress periods listed in the file, in order. """
+
+    block_markers = ['STRESS PERIOD NO.']
+
+    def __init__(self):
+        self.stress_periods = []
+
+    def start_block(self, line):
+        if line[:45] == '                            STRESS PERIOD NO.':
+            self.stress_periods.append(int(line[46:50]))
+        return False
+
+
+class SolverIterations:
+    """ MODFLOW-NWT outer and inner iteration counts, by stress period
+        and time step, and the time steps that failed to converge.
+        Uses the last stress period and time step seen in a budget header,
+        unless the convergence failure message gives them.
+        The failure messages are those that stop MODFLOW in
+        process_runner (NONCONVERGENCE_PATTERNS).
+    """
+
+    block_markers = (['STRESS PERIOD NO.',
+                      'NWT REQUIRED',
+                      'AND A TOTAL OF'] +
+                     process_runner.NONCONVERGENCE_PATTERNS)
+
+    time_step_regex = re.compile(r'TIME STEP\s+(\d+)\D+?PERIOD\s+(\d+)')
+
+    def __init__(self):
+        self.stress_period = 0
+        self.time_step = 0
+        self.outer_iterations = {}
+        self.inner_iterations = {}
+        self.failed_to_converge = []
+
+    def start_block(self, line):
+        text = line.strip().strip('*').strip()
+        if text.startswith('STRESS PERIOD NO.'):
+            self.stress_period = int(line[46:50])
+            self.time_step = 0
+        elif text.startswith('NWT REQUIRED'):
+            self.time_step += 1
+            self.outer_iterations[(self.time_step, self.stress_period)] = int(text.split()[2])
+        elif text.startswith('AND A TOTAL OF'):
+            self.inner_iterations[(self.time_step, self.stress_period)] = int(text.split()[4])
+        elif any([text.startswith(pattern) for pattern in process_runner.NONCONVERGENCE_PATTERNS]):
+            match = self.time_step_regex.search(text)
+            if match is None:
+                key = (self.time_step, self.stress_period)
+            else:
+                key = (int(match.group(1)), int(match.group(2)))
+            if key not in self.failed_to_converge:
+                self.failed_to_converge.append(key)
+        return False
+
+    def summary(self):
+        lines = []
+        for key in sorted(self.outer_iterations):
+            lines.append('\t  time step {0}, stress period {1}: {2} outer, {3} inner iterations\n'
+                         .format(key[0], key[1], self.outer_iterations[key],
+                                 self.inner_iterations.get(key, '?')))
+        # END for over key
+        for key in self.failed_to_converge:
+            lines.append('\t  WARNING: the solver did not converge (time step {0}, stress period {1})\n'
+                         .format(key[0], key[1]))
+        # END for over key
+        return ''.join(lines)
+
+
+def main(listfile,
+         budget_out,
+         conversion_factor_for_output,
+         logfile,
+         postproc_deffiles_dQ,
+         postproc_dQ_results_dir,
+         gaged_reach_flux_out,
+         cbcfile=None):
+    """ Read the listing file once and write the global budget changes
+        (parse_modflow_listing_file_budget.py) and the gaged-reach fluxes
+        (sim_q_reach_3d_auto.py).
+
+        When a cell-by-cell budget file (cbcfile) is given, the budget and
+        the RIVER, DRAIN and GHB fluxes are read from it, and the listing
+        file is only scanned for the stress periods and solver iterations.
+    """
+    # Imported here: both modules use this scanner
+    from postprocess import parse_modflow_listing_file_budget
+    from postprocess import sim_q_reach_3d_auto
+    from postprocess import modflow_cbc_reader
+
+    start_time = time.time()
+
+    budget = parse_modflow_listing_file_budget.ModflowListing()
+
+    bc_types = ['drn','riv', 'ghb']
+    bc_id_dict = sim_q_reach_3d_auto.retrieve_id_data_from_lookup_shelf_file(
+        sim_q_reach_3d_auto.get_lookup_file_name(postproc_deffiles_dQ))
+    reaches = sim_q_reach_3d_auto.ModflowListing(None, bc_types, logfile)
+    reaches.bc_reach_id_dict = bc_id_dict['lists_of_3d_ids_by_bc_type_and_stress_period']
+
+    periods = StressPeriodMarkers()
+    solver = SolverIterations()
+
+    scanner = ListingScanner()
+    if cbcfile is None:
+        consumers = [budget, reaches, periods, solver]
+    else:
+        consumers = [periods, solver]
+    for consumer in consumers:
+        scanner.register(consumer)
+    scanner.scan(listfile)
+
+    currentmessage = ('\tListing file scanned in {0:0.1f} seconds ({1} stress periods)\n'
+                      .format(time.time() - start_time, len(periods.stress_periods)) +
+                      solver.summary())
+
+    if cbcfile is not None:
+        start_time = time.time()
+        cbc = modflow_cbc_reader.CellBudgetFile(cbcfile)
+        budget.readCellBudgetFile(cbc)
+        reaches.readCellBudgetFile(cbc, bc_id_dict['lists_of_3d_ids_by_bc_type_and_stress_period'])
+        cbc.close()
+        currentmessage += ('\tBudget and boundary-condition fluxes read from {0} in {1:0.1f} seconds\n'
+                           .format(os.path.basename(cbcfile), time.time() - start_time))
+    #
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    parse_modflow_listing_file_budget.write_budget_changes(budget, budget_out, logfile)
+
+    sim_q_reach_3d_auto.write_gaged_reach_fluxes(reaches, bc_id_dict, bc_types,
+                                                 conversion_factor_for_output, logfile,
+                                                 postproc_deffiles_dQ, postproc_dQ_results_dir,
+                                                 gaged_reach_flux_out)
+
+    return
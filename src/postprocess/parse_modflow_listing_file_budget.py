@@ -21,59 +21,77 @@
 
 import copy
 
+from utilities import run_logger
+from postprocess import modflow_listing_scanner
+
 class ModflowListing:
 
+    # Budget blocks start with this line (see modflow_listing_scanner.py)
+    block_markers = ['  VOLUMETRIC BUDGET FOR ENTIRE MODEL AT END OF TIME STEP']
+
     def __init__(self):
         self.budget_items = {}
         self.budget_differences = {}
         self.activeFluxTerms = {}
         self.extracted_rates = {}
+        self.block_state = None
 
     def openFiles(self,inFileName,outFileName):
         #inFileName = raw_input("\tReceiving name of MODFLOW input file for parsing: ")
         self.inFile = open(inFileName, 'r')
         ##outFileName = inFileName + '.out.csv'
         #outFileName = 'global_budget_change.csv'
+        self.openOutputFile(outFileName)
+
+    def openOutputFile(self,outFileName):
         self.outFile = open(outFileName, 'w')
     
     def parseListingFile(self):
-        while 1:
-            line = self.inFile.readline()
-            if not line:
-                break
-            self.checkForBudgetBlock(line)
+        scanner = modflow_listing_scanner.ListingScanner()
+        scanner.register(self)
+        scanner.scan_file(self.inFile)
         
-    def checkForBudgetBlock(self,line):
-        if line.find("  VOLUMETRIC BUDGET FOR ENTIRE MODEL AT END OF TIME STEP") == 0:
+    def start_block(self,line):
+        """ Start of a budget block for one time step """
+        if line.find(self.block_markers[0]) == 0:
             stress_period = int(line.rstrip()[-3:])
             time_step = int(line.rstrip()[58:61])
             self.activeFluxTerms[(time_step, stress_period)] = set()
-            self.scan_for_flow_block(time_step, stress_period)
-
-    def scan_for_flow_block(self, time_step, stress_period):
-        while 1:
-            line = self.inFile.readline()
-            if not line:
-                break
-            elif line[10:14] == ' IN:':
-                self.parse_budget_sub_block("in", time_step, stress_period)
-                self.parse_in_or_out_totals("in", time_step, stress_period)
+            self.block_time = (time_step, stress_period)
+            self.block_state = ('seek', None)
+            return True
+        return False
+
+    def block_line(self, line):
+        """ Parse one line of a budget block. The IN: and OUT: sub-blocks
+            have a header line, one line per budget item, a blank line, and
+            a totals line. The block ends with the OUT: totals.
+        """
+        time_step, stress_period = self.block_time
+        step, in_or_out = self.block_state
+        if not line or step == 'done':
+            return False
+        elif step == 'seek':
+            if line[10:14] == ' IN:':
+                self.block_state = ('header', 'in')
             elif line[10:14] == 'OUT:':
-                self.parse_budget_sub_block("out", time_step, stress_period)
-                self.parse_in_or_out_totals("out", time_step, stress_period)
-                break
-
-    def parse_budget_sub_block(self, in_or_out, time_step, stress_period):
-        """ Parse an inflow or outflow budget sub-block. """
-        #skip the first (blank) line in budget sub-block
-        line = self.inFile.readline()
-        while 1:
-            line = self.inFile.readline()
+                self.block_state = ('header', 'out')
+        elif step == 'header':
+            #skip the first (blank) line in budget sub-block
+            self.block_state = ('items', in_or_out)
+        elif step == 'items':
             if line == '\n':
-                break
+                self.block_state = ('totals', in_or_out)
             else:
                 line_budget_items = self.parse_budget_line(line, in_or_out, time_step, stress_period)
                 self.store_budget_items(line_budget_items, in_or_out, time_step, stress_period)
+        else:
+            self.parse_in_or_out_totals(line, in_or_out, time_step, stress_period)
+            if in_or_out == 'out':
+                self.block_state = ('done', None)
+            else:
+                self.block_state = ('seek', None)
+        return True
 
     def parse_budget_line(self, line, in_or_out, time_step, stress_period):
         """ Parse one line of a budget sub-block. """
@@ -99,14 +117,35 @@ class ModflowListing:
         self.budget_items[(time_step, stress_period, in_or_out, 'cum', flux_cum_type)] = flux_cum_value
         self.budget_items[(time_step, stress_period, in_or_out, 'rate', flux_rate_type)] = flux_rate_value
 
-    def parse_in_or_out_totals(self, in_or_out, time_step, stress_period):
+    def parse_in_or_out_totals(self, line, in_or_out, time_step, stress_period):
         """ Parse budget totals record for this time step. """
-        line = self.inFile.readline()
         flux_cum_value = float(line[24:39])
         flux_rate_value = float(line[64:80])
         self.budget_items[(time_step, stress_period, in_or_out, 'total_flux_cum')] = flux_cum_value
         self.budget_items[(time_step, stress_period, in_or_out, 'total_flux_rate')] = flux_rate_value
 
+    def readCellBudgetFile(self, cbc):
+        """ Take the budget rates from a cell-by-cell budget file
+            (modflow_cbc_reader.CellBudgetFile) instead of the listing
+            file. Every budget term must be saved to the file.
+        """
+        for time_step, stress_period in cbc.get_times():
+            self.activeFluxTerms[(time_step, stress_period)] = set()
+            total_in = 0.
+            total_out = 0.
+            rates = cbc.budget_rates(time_step, stress_period)
+            for flux_rate_type in rates:
+                rate_in, rate_out = rates[flux_rate_type]
+                self.upDate_list_of_active_flux_terms(flux_rate_type, time_step, stress_period)
+                self.budget_items[(time_step, stress_period, 'in', 'rate', flux_rate_type)] = rate_in
+                self.budget_items[(time_step, stress_period, 'out', 'rate', flux_rate_type)] = rate_out
+                total_in += rate_in
+                total_out += rate_out
+            # END for over flux_rate_type
+            self.budget_items[(time_step, stress_period, 'in', 'total_flux_rate')] = total_in
+            self.budget_items[(time_step, stress_period, 'out', 'total_flux_rate')] = total_out
+        # END for over time_step, stress_period
+
     def compute_sp_diff(self, t1, t2):
         """ Compute inter-stress period differences for all budget components.
             Input: 
@@ -221,6 +260,19 @@ class ModflowListing:
         self.inFile.close()
         self.outFile.close()
 
+def write_budget_changes(a, outfile, logfile):
+    """ Write the budget changes of a listing that has been parsed
+        (e.g., by modflow_listing_scanner.main)
+    """
+    a.openOutputFile(outfile)
+    a.compute_sp_diff((1, 1), (1, 2))
+    a.outputResults((1, 1), (1, 2))    
+    a.outFile.close()
+    currentmessage = ('\n\tGlobal budget changes written')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    return
+
 def main(listfile,outfile,logfile):
     a = ModflowListing()
     a.openFiles(listfile,outfile)
@@ -230,7 +282,7 @@ def main(listfile,outfile,logfile):
     a.close_files()
     currentmessage = ('\n\tProcess complete')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     return
 
 #main()
@@ -8,6 +8,8 @@
 
 # Please report errors and corrections to jwg (at) srwmd.org
 
+from utilities import run_logger
+
 class BudgetChangeSummaryTable:
     """ Class for computing sum of River and Drain Package flux changes that
         were output by the program test.py.
@@ -84,7 +86,7 @@ def main(rivfluxin,outfile,logfile):
     tbl.close_files()
     currentmessage = ('\n\tProcess complete')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     return
 
 #main()
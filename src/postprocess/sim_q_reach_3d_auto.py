@@ -76,10 +76,16 @@
 # Import libraries
 import time
 import shelve
+import numpy as np
 #import sys
 import os
 # Import internal python scripts
 from utilities import basic_utilities as bscut
+from utilities import run_logger
+from postprocess import modflow_listing_scanner
+from postprocess import bc_reach_id_lookup
+from postprocess import gaged_reach_matrix
+from postprocess import modflow_cbc_reader
 
 
 class GagedReaches:
@@ -138,9 +144,8 @@ class GagedReaches:
             except Exception as exc:
                 error_message = ("can't convert {0} to an integer".format(line_list[2]))
                 
-                with open(self.logfile,'a') as lf:
-                    lf.write(error_message)
-                    lf.write('{}\n'.format(exc))
+                run_logger.log(self.logfile, error_message)
+                run_logger.log(self.logfile, '{}\n'.format(exc))
                 
                 raise Exception(error_message)
             
@@ -207,6 +212,34 @@ class GagedReaches:
                                                 stress_period,
                                                 time_step)
 
+    def calc_gaged_reach_sim_flux_from_matrix(self, matrix, bc_flux_arrays, num_stress_periods):
+        """ Compute simulated flux for each gaged-reach and stress period
+            with the compiled gaged-reach matrix (gaged_reach_matrix.py)
+            and the flux arrays of the listing file. Gives the same
+            gaged_reach_sim_fluxes as calc_gaged_reach_sim_flux.
+        """
+        time_step = 1
+        self.gaged_reach_sim_fluxes = {}
+        for bc_type, stress_period in sorted(matrix.entries):
+            if stress_period > num_stress_periods: continue
+            try:
+                bc_ids, fluxes = bc_flux_arrays[(bc_type, stress_period, time_step)]
+                sums, has_flux = matrix.aggregate(bc_type, stress_period, bc_ids, fluxes)
+            except KeyError as exc:
+                bc_3d_id = exc.args[0] if (bc_type, stress_period, time_step) in bc_flux_arrays else '*'
+                error_message = ("key, ({0},{1},{2},{3}) not found! Halting sim_q_reach.py without writing output.".format(bc_type, bc_3d_id, stress_period, time_step))
+
+                run_logger.log(self.logfile, error_message)
+                run_logger.log(self.logfile, '{}\n'.format(exc))
+
+                raise Exception(error_message)
+            # End try-except
+            sums = sums.tolist()
+            for row in np.flatnonzero(has_flux).tolist():
+                self.gaged_reach_sim_fluxes[(matrix.gaged_reach_list[row], bc_type, stress_period, time_step)] = sums[row]
+            # END for over row
+        # END for over bc_type, stress_period
+
     def update_2d_flux(self, bc_reach_fluxes, gaged_reach_id, bc_type, bc_3d_id, stress_period, time_step):
         """ Update simulated flux for a 2d boundary-condition feature group.
         """
@@ -220,9 +253,8 @@ class GagedReaches:
                 
                 error_message = ("key, ({0},{1},{2},{3}) not found! Halting sim_q_reach.py without writing output.".format(bc_type, bc_3d_id, stress_period, time_step))
                 
-                with open(self.logfile,'a') as lf:
-                    lf.write(error_message)
-                    lf.write('{}\n'.format(exc))
+                run_logger.log(self.logfile, error_message)
+                run_logger.log(self.logfile, '{}\n'.format(exc))
                 
                 raise Exception(error_message)
                 
@@ -236,9 +268,8 @@ class GagedReaches:
                 
                 error_message = ("key, ({0},{1},{2},{3}) not found! Halting sim_q_reach.py without writing output.".format(bc_type, bc_3d_id, stress_period, time_step))
                 
-                with open(self.logfile,'a') as lf:
-                    lf.write(error_message)
-                    lf.write('{}\n'.format(exc))
+                run_logger.log(self.logfile, error_message)
+                run_logger.log(self.logfile, '{}\n'.format(exc))
                 
                 raise Exception(error_message)
                 
@@ -302,15 +333,36 @@ class GagedReaches:
 
 class ModflowListing:
 
+    # Lines that start the blocks read by this class
+    # (see modflow_listing_scanner.py)
+    stress_period_marker = '                            STRESS PERIOD NO.'
+    flux_block_markers = {'ghb':"  HEAD DEP BOUNDS   PERIOD",
+                          'drn':"           DRAINS   PERIOD",
+                          'riv':"    RIVER LEAKAGE   PERIOD"}
+    # Flux records: line prefix, columns of the sequence number,
+    # first column of the flux, and the name used in error messages
+    flux_record_fields = {'ghb':(' BOUNDARY', 10, 16, 62, 'GHB'),
+                          'drn':(' DRAIN', 7, 13, 59, 'DRAIN'),
+                          'riv':(' REACH', 7, 13, 58, 'RIVER')}
+
     def __init__(self, modflow_listing_file_name, bc_types, logfile):
-        """ Initialize variables and data structures. """
+        """ Initialize variables and data structures. The listing file
+            name may be None when the listing is read by a
+            modflow_listing_scanner.ListingScanner.
+        """
         self.num_stress_periods_in_listing = 0
         self.bc_types = bc_types
         self.bc_reach_list = {}
         self.init_bc_reach_list()
         self.bc_reach_fluxes = {}
+        # bc ids and fluxes of each block, by (bc_type, stress_period, time_step)
+        self.bc_flux_arrays = {}
         self.logfile = logfile
-        self.openFiles(modflow_listing_file_name)
+        self.block_markers = [self.stress_period_marker] + [self.flux_block_markers[bc_type] for bc_type in bc_types]
+        self.block_type = None
+        self.block_lines = []
+        if modflow_listing_file_name is not None:
+            self.openFiles(modflow_listing_file_name)
 
     def init_bc_reach_list(self):
         """ Initialize the dictionary of bc_reach_ids. """
@@ -328,94 +380,104 @@ class ModflowListing:
             flux values.
         """
         self.bc_reach_id_dict = bc_reach_id_dict
-        while 1:
-            line = self.inFile.readline()
-            if not line:
-                break
-            self.checkForNewStressPeriod(line)
-            if 'drn' in self.bc_types:
-                self.checkForDrainFluxBlock(line)
-            if 'riv' in self.bc_types:
-                self.checkForRiverFluxBlock(line)
-            if 'ghb' in self.bc_types:
-                self.checkForGHBFluxBlock(line)
+        scanner = modflow_listing_scanner.ListingScanner()
+        scanner.register(self)
+        scanner.scan_file(self.inFile)
         self.inFile.close()
 
-    def checkForNewStressPeriod(self, line):
-        """ Check to see if this is the beginning of the listing of information
-            for a new stress period.
+    def start_block(self, line):
+        """ Check for a new stress period or the start of a flux block.
+            Returns True if the following lines are flux records.
         """
-        if line[:45] == '                            STRESS PERIOD NO.':
+        if line[:45] == self.stress_period_marker:
             self.num_stress_periods_in_listing += 1
             self.stress_period = int(line[46:50])
-
-    def checkForGHBFluxBlock(self,line):
-        if line.find("  HEAD DEP BOUNDS   PERIOD") == 0:
-            stress_period = int(line.rstrip()[27:31])
-            time_step = int(line.rstrip()[39:42])
-            self.parseGHBFluxBlock(stress_period,time_step)
-
-    def checkForDrainFluxBlock(self,line):
-        if line.find("           DRAINS   PERIOD") == 0:
-            stress_period = int(line.rstrip()[27:31])
-            time_step = int(line.rstrip()[38:42])
-            self.parseDrainFluxBlock(stress_period,time_step)
-
-    def checkForRiverFluxBlock(self,line):
-        if line.find("    RIVER LEAKAGE   PERIOD") == 0:
-            stress_period = int(line.rstrip()[27:31])
-            time_step = int(line.rstrip()[38:42])
-            self.parseRiverFluxBlock(stress_period,time_step)
-
-    def parseGHBFluxBlock(self,stress_period,time_step):
-        while 1:
-            line = self.inFile.readline()
-            if not line:
-                error_message = ('reached end of file while reading GHB fluxes')
-                with open(self.logfile,'a') as lf: lf.write(error_message)
-                raise ValueError(error_message)
-            elif line[:9] != ' BOUNDARY':
-                break
-            bc_reach_seq_num = int(line.rstrip()[10:16])
-            bc_reach_id = self.bc_reach_id_dict[('ghb',stress_period)][bc_reach_seq_num-1]
-            if stress_period == 1 and time_step == 1:
-                self.bc_reach_list['ghb'].append(bc_reach_id)
-            flux = float(line.rstrip()[62:])
-            self.bc_reach_fluxes[('ghb', bc_reach_id, stress_period, time_step)] = flux
-
-    def parseDrainFluxBlock(self,stress_period,time_step):
-        while 1:
-            line = self.inFile.readline()
-            if not line:
-                error_message = ('reached end of file while reading DRAIN fluxes')
-                with open(self.logfile,'a') as lf: lf.write(error_message)
-                raise ValueError(error_message)
-            elif line[:6] != ' DRAIN':
-                break
-            bc_reach_seq_num = int(line.rstrip()[7:13])
-            bc_reach_id = self.bc_reach_id_dict[('drn',stress_period)][bc_reach_seq_num-1]
-            if stress_period == 1 and time_step == 1:
-                self.bc_reach_list['drn'].append(bc_reach_id)
-            flux = float(line.rstrip()[59:])
-            self.bc_reach_fluxes[('drn', bc_reach_id, stress_period, time_step)] = flux
-
-    def parseRiverFluxBlock(self,stress_period,time_step):
-        while 1:
-            line = self.inFile.readline()
-            if not line:
-                error_message = ('reached end of file while reading RIVER fluxes')
-                with open(self.logfile,'a') as lf: lf.write(error_message)
-                raise ValueError(error_message)
-            elif line[:6] != ' REACH':
-                break
-            bc_reach_seq_num = int(line.rstrip()[7:13])
-            bc_reach_id = self.bc_reach_id_dict[('riv',stress_period)][bc_reach_seq_num-1]
-            if stress_period == 1 and time_step == 1:
-                self.bc_reach_list['riv'].append(bc_reach_id)
-                if bc_reach_id > 40951:
-                    pass
-            flux = float(line.rstrip()[58:])
-            self.bc_reach_fluxes[('riv', bc_reach_id, stress_period, time_step)] = flux
+        elif 'ghb' in self.bc_types and line.find(self.flux_block_markers['ghb']) == 0:
+            self.startFluxBlock('ghb', int(line.rstrip()[27:31]), int(line.rstrip()[39:42]))
+            return True
+        elif 'drn' in self.bc_types and line.find(self.flux_block_markers['drn']) == 0:
+            self.startFluxBlock('drn', int(line.rstrip()[27:31]), int(line.rstrip()[38:42]))
+            return True
+        elif 'riv' in self.bc_types and line.find(self.flux_block_markers['riv']) == 0:
+            self.startFluxBlock('riv', int(line.rstrip()[27:31]), int(line.rstrip()[38:42]))
+            return True
+        return False
+
+    def startFluxBlock(self, bc_type, stress_period, time_step):
+        self.block_type = bc_type
+        self.block_time = (stress_period, time_step)
+        self.block_prefix = self.flux_record_fields[bc_type][0]
+        self.block_lines = []
+
+    def block_line(self, line):
+        """ Collect the flux records of a block. The records are converted
+            together when the block ends.
+        """
+        if line[:len(self.block_prefix)] == self.block_prefix:
+            self.block_lines.append(line)
+            return True
+        elif not line:
+            error_message = ('reached end of file while reading {} fluxes'.format(self.flux_record_fields[self.block_type][4]))
+            run_logger.log(self.logfile, error_message)
+            raise ValueError(error_message)
+        self.parseFluxBlock()
+        return False
+
+    def parseFluxBlock(self):
+        """ Convert the records of a flux block with fixed-width NumPy
+            parsing, and store the fluxes by bc reach id.
+        """
+        bc_type = self.block_type
+        stress_period, time_step = self.block_time
+        prefix, seq_start, seq_end, flux_start, name = self.flux_record_fields[bc_type]
+
+        bc_reach_seq_num, flux = modflow_listing_scanner.parse_fixed_width_block(self.block_lines,
+                                                                                 [(seq_start, seq_end, np.int64),
+                                                                                  (flux_start, None, np.float64)])
+        self.storeFluxes(bc_type, stress_period, time_step, bc_reach_seq_num, flux)
+        self.block_lines = []
+
+    def storeFluxes(self, bc_type, stress_period, time_step, bc_reach_seq_num, flux):
+        """ Store the fluxes of one bc type and time step by bc reach id.
+            bc_reach_seq_num are the 1-based positions of the features in
+            the package input (REACH / DRAIN / BOUNDARY numbers).
+        """
+        bc_reach_ids = np.asarray(self.bc_reach_id_dict[(bc_type,stress_period)])[bc_reach_seq_num-1]
+        self.bc_flux_arrays[(bc_type, stress_period, time_step)] = (bc_reach_ids, flux)
+
+        bc_reach_ids = bc_reach_ids.tolist()
+        if stress_period == 1 and time_step == 1:
+            self.bc_reach_list[bc_type].extend(bc_reach_ids)
+        self.bc_reach_fluxes.update(zip([(bc_type, bc_reach_id, stress_period, time_step) for bc_reach_id in bc_reach_ids],
+                                        flux.tolist()))
+
+    def readCellBudgetFile(self, cbc, bc_reach_id_dict):
+        """ Take the boundary-condition fluxes from a cell-by-cell budget
+            file (modflow_cbc_reader.CellBudgetFile) instead of the listing
+            file. The RIVER, DRAIN and GHB records must be lists (COMPACT
+            BUDGET), which keep one flux per feature in input order.
+        """
+        self.bc_reach_id_dict = bc_reach_id_dict
+        stress_periods = set()
+        for kstp, kper in cbc.get_times():
+            stress_periods.add(kper)
+            for bc_type in self.bc_types:
+                record = cbc.find(modflow_cbc_reader.BC_TYPE_TEXT[bc_type], kstp, kper)
+                if record is None:
+                    error_message = ('\nERROR:\t{0} has no {1} record for time step {2}, stress period {3}\n'
+                                     .format(cbc.file_name, modflow_cbc_reader.BC_TYPE_TEXT[bc_type], kstp, kper))
+                    run_logger.log(self.logfile, error_message)
+                    raise ValueError(error_message)
+                #
+                try:
+                    nodes, flux = cbc.read_list(record)
+                except ValueError as exc:
+                    run_logger.log(self.logfile, str(exc))
+                    raise
+                self.storeFluxes(bc_type, kper, kstp, np.arange(1, len(flux)+1), flux)
+            # END for over bc_type
+        # END for over kstp, kper
+        self.num_stress_periods_in_listing = len(stress_periods)
 
     def close_files(self):
         #self.outFile.close()
@@ -430,7 +492,12 @@ def retrieve_id_data_from_lookup_shelf_file(lookup_bc_reach_id_shelf_file_name):
             boundary-condition type (e.g. River Package, GHB Package, etc.).
 
             (2) dict with lists of 3d bc ids for a given 2d bc id
+
+        A directory of NumPy lookup tables (see bc_reach_id_lookup.py) is
+        read in place of the shelf file.
     """
+    if os.path.isdir(lookup_bc_reach_id_shelf_file_name):
+        return bc_reach_id_lookup.read_lookup_tables(lookup_bc_reach_id_shelf_file_name)
     bc_id_dict = {}
     book = shelve.open(lookup_bc_reach_id_shelf_file_name)
     bc_id_dict['lists_of_3d_ids_by_bc_type_and_stress_period'] = book['reach_ids']
@@ -439,6 +506,14 @@ def retrieve_id_data_from_lookup_shelf_file(lookup_bc_reach_id_shelf_file_name):
     return(bc_id_dict)
 
 
+def get_lookup_file_name(postproc_deffiles_dQ):
+    """ The NumPy lookup tables if they exist, or else the shelf file """
+    lookup_dir = os.path.join(postproc_deffiles_dQ,'lookup_bc_reach_ids_auto')
+    if os.path.isfile(os.path.join(lookup_dir,bc_reach_id_lookup.FORMAT_FILE)):
+        return lookup_dir
+    return os.path.join(postproc_deffiles_dQ,'lookup_bc_reach_ids_auto.shelf')
+
+
 def main(modflow_listing_file_name,
          conversion_factor_for_output_in,
          logfile,
@@ -455,7 +530,7 @@ def main(modflow_listing_file_name,
     
     
     bc_types = ['drn','riv', 'ghb']
-    lookup_bc_reach_id_shelf_file_name = os.path.join(postproc_deffiles_dQ,'lookup_bc_reach_ids_auto.shelf')
+    lookup_bc_reach_id_shelf_file_name = get_lookup_file_name(postproc_deffiles_dQ)
     bc_id_dict = retrieve_id_data_from_lookup_shelf_file(lookup_bc_reach_id_shelf_file_name)
 
     #modflow_input_format = 'free'   # !!! PMB 20201021 -- may be able to delete this line !!!
@@ -465,6 +540,28 @@ def main(modflow_listing_file_name,
     mf = ModflowListing(modflow_listing_file_name, bc_types, logfile)
     mf.parseListingFile(bc_id_dict['lists_of_3d_ids_by_bc_type_and_stress_period'])
 
+    write_gaged_reach_fluxes(mf, bc_id_dict, bc_types, conversion_factor_for_output_in, logfile,
+                             postproc_deffiles_dQ, postproc_dQ_results_dir, gaged_reach_flux_out)
+
+    mf.close_files()
+    elapsed_time = time.time() - start_time
+    
+    currentmessage = ('\tProcess complete\n\tGaged-reach post-processing executed in {0:0.1f} seconds.'.format(elapsed_time))
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    
+    
+    return
+
+# End main
+
+
+def write_gaged_reach_fluxes(mf, bc_id_dict, bc_types, conversion_factor_for_output_in, logfile,
+                             postproc_deffiles_dQ, postproc_dQ_results_dir, gaged_reach_flux_out):
+    """ Shelve the boundary-condition fluxes of a parsed listing file and
+        output the simulated gaged-reach fluxes.
+    """
+
     # shelve results for further postprocessing if second command-line argument is present
     #debug_shelf_file_name = 'temp.shelf'
     if True:
@@ -480,11 +577,20 @@ def main(modflow_listing_file_name,
         book['bc_list'] = mf.bc_reach_list
         book.close()
 
-    # compute the simulated gaged-reach fluxes
-    gaged_reaches = GagedReaches(os.path.join(postproc_deffiles_dQ,'gaged_reach_definitions.csv'), logfile)
-    gaged_reaches.calc_gaged_reach_sim_flux(mf.bc_reach_fluxes,
-                                            mf.num_stress_periods_in_listing,
-                                            bc_id_dict['lists_of_3d_ids_from_2d_ids'])
+    # compute the simulated gaged-reach fluxes: a sparse sum over the
+    # matrix compiled from the gaged-reach definitions and the lookup
+    # tables (rebuilt only when these change)
+    gaged_reach_definitions = os.path.join(postproc_deffiles_dQ,'gaged_reach_definitions.csv')
+    gaged_reaches = GagedReaches(gaged_reach_definitions, logfile)
+    matrix = gaged_reach_matrix.get_gaged_reach_matrix(os.path.join(postproc_deffiles_dQ,'gaged_reach_definitions_matrix.npz'),
+                                                       [gaged_reach_definitions, get_lookup_file_name(postproc_deffiles_dQ)],
+                                                       gaged_reaches,
+                                                       bc_id_dict['lists_of_3d_ids_from_2d_ids'],
+                                                       mf.num_stress_periods_in_listing,
+                                                       logfile)
+    gaged_reaches.calc_gaged_reach_sim_flux_from_matrix(matrix,
+                                                        mf.bc_flux_arrays,
+                                                        mf.num_stress_periods_in_listing)
 
     
     # Output to file
@@ -498,21 +604,11 @@ def main(modflow_listing_file_name,
     except Exception as exc:
         error_message = ("problem converting conversion factor {0}. Are you sure it's a float?\n\n".format(conversion_factor_for_output))
         
-        with open(logfile,'a') as lf:
-            lf.write(error_message)
-            lf.write('{}\n'.format(exc))
+        run_logger.log(logfile, error_message)
+        run_logger.log(logfile, '{}\n'.format(exc))
         
         raise Exception(error_message)
     # End try-except
     
-    mf.close_files()
-    elapsed_time = time.time() - start_time
-    
-    currentmessage = ('\tProcess complete\n\tGaged-reach post-processing executed in {0:0.1f} seconds.'.format(elapsed_time))
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    
-    
     return
 
-# End main
@@ -39,6 +39,8 @@ Please report errors and corrections to Trey Grubbs (jwg (at) srwmd.org)
 
 import os
 
+from utilities import run_logger
+
 class ContributingGages(object):
     """ Class for defining and working with relations between gaging stations
         and their upstream contributing gaging stations.
@@ -167,11 +169,11 @@ def main(logfile,
         
         currentmessage = ('Finished computing cumulative river fluxes!\n\n')
         print (currentmessage)
-        with open(logfile,'a') as lf: lf.write(currentmessage)
+        run_logger.log(logfile, currentmessage)
     else:
         error_message = ("File, {0}, does not exist! Halting execution of sum_sim_q_reach.py\n".format(simulated_delta_bc_fluxes_file_name))
         
-        with open(logfile,'a') as lf: lf.write(error_message)
+        run_logger.log(logfile, error_message)
         
         raise Exception(error_message)
         
@@ -0,0 +1,243 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# GIS results as a GeoPackage (gis_backend=geopackage)
+#
+# Writes the results that the arcpy backend adds to cup.gdb to a
+# GeoPackage, results_gis/cup.gpkg, with the sqlite3 module of Python (no
+# ArcGIS; opened by ArcGIS Pro, QGIS and GDAL):
+#     cup_wells_with_grid_info  withdrawal points (POINT) and their model
+#                               cell, from wells_to_add.csv
+#     dh_lyrs                   change in heads of the mapped layers,
+#                               dh_lyr<n>, by ref_ROW_COL (empty for dry
+#                               and inactive cells; a table without
+#                               geometry)
+#     lake_dh                   area-weighted heads beneath the lakes and
+#                               their change, one row per lake and layer
+#     grid_link                 the shared grid GeoPackage and version
+#                               that dh_lyrs joins to
+# The points are in the grid projection (gis/projections/
+# nfseg_v1_1_grid.prj) and have an R-tree spatial index.
+#
+# The polygons of the model cells are not copied into each run: they are
+# kept once, in the shared grid store (utilities/grid_store.py), and
+# dh_lyrs is joined to its grid_cells layer on ref_ROW_COL. The join is
+# written next to cup.gpkg as an OGR virtual layer, dh_lyrs.vrt, that
+# QGIS and GDAL open as the cells with their dh. (In ArcGIS, join the
+# dh_lyrs table to the grid_cells layer on ref_ROW_COL.)
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import os
+import re
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from utilities import basic_utilities as bscut
+from utilities import run_logger
+from utilities import grid_index
+from utilities import geopackage
+from utilities import grid_store
+from process_heads import modflow_heads_file
+from postprocess import dh_rasters
+
+
+# Field that joins dh_lyrs to the cells of the grid store
+JOIN_FIELD = 'ref_ROW_COL'
+
+# OGR virtual layer of the cells with their dh (<layer> is repeated per
+# mapped layer)
+VRT_TEMPLATE = '''<OGRVRTDataSource>
+  <OGRVRTLayer name="dh_lyrs">
+    <SrcDataSource>{grid_file}</SrcDataSource>
+    <SrcSQL dialect="OGRSQL">SELECT {grid_layer}.{join} AS {join}, {fields} FROM {grid_layer} LEFT JOIN '{gpkg_file}'.dh_lyrs d ON {grid_layer}.{join} = d.{join}</SrcSQL>
+  </OGRVRTLayer>
+</OGRVRTDataSource>
+'''
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Table contents
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def column_type(values):
+    """ SQLite type of a column of text values """
+    for convert, sql_type in [(int, 'INTEGER'), (float, 'DOUBLE')]:
+        try:
+            [convert(value) for value in values]
+            return convert, sql_type
+        except ValueError:
+            continue
+    # END for over convert
+    return (lambda value: value), 'TEXT'
+
+def read_wells(wells_to_add):
+    """ Coordinates, column names and SQLite types, and rows of the
+        other columns of wells_to_add.csv
+    """
+    with open(wells_to_add,'r') as fin:
+        header = [item.strip().lower() for item in fin.readline().rstrip().split(',')]
+        records = [[item.strip() for item in line.rstrip().split(',')] for line in fin if line.strip() != '']
+    #
+    ix, iy = header.index('xcoord'), header.index('ycoord')
+    x = np.array([float(record[ix]) for record in records])
+    y = np.array([float(record[iy]) for record in records])
+
+    columns = []
+    values = []
+    for i, name in enumerate(header):
+        if i in (ix, iy): continue
+        convert, sql_type = column_type([record[i] for record in records])
+        columns.append((name, sql_type))
+        values.append([convert(record[i]) for record in records])
+    # END for over name
+    return x, y, columns, list(zip(*values)) if values else [() for record in records]
+
+def read_lake_heads(lake_files):
+    """ (lake set, layer, lake id, head SP1, head SP2, change) of the
+        <lake set>_layer_<n>.txt files of the heads stage
+    """
+    rows = []
+    for lake_file in lake_files:
+        match = re.match(r'(.*)_layer_(\d+)\.txt$', os.path.basename(lake_file))
+        with open(lake_file,'r') as fin:
+            fin.readline()
+            for line in fin:
+                items = line.split()
+                if (len(items) < 4): continue
+                rows.append((match.group(1), int(match.group(2)), items[0],
+                             float(items[1]), float(items[2]), float(items[3])))
+            # END for over line
+        #
+    # END for over lake_file
+    return rows
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Virtual layer joining dh_lyrs to the shared cells
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def write_vrt(vrt_file, grid_file, gpkg_file, layers):
+    """ The paths are absolute, so the link holds while the run and the
+        grid store stay where they are
+    """
+    fields = ', '.join(['d.dh_lyr{0} AS dh_lyr{0}'.format(layer) for layer in layers])
+    with open(vrt_file,'w') as fout:
+        fout.write(VRT_TEMPLATE.format(grid_file=escape(os.path.abspath(grid_file)),
+                                       gpkg_file=escape(os.path.abspath(gpkg_file)),
+                                       grid_layer=grid_store.GRID_LAYER, join=JOIN_FIELD,
+                                       fields=fields))
+    #
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+#==============================================================================
+#
+# MAIN PROGRAM
+#
+#==============================================================================
+
+def main(wells_to_add, hds_file, layers, lake_files, grid_definition_file, prj_file,
+         store_dir, gpkg_file, logfile):
+
+    currentmessage = ('\tWriting the GIS results to a GeoPackage ...\n'
+                      + bscut.datetime() + '\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    if not os.path.isfile(grid_definition_file):
+        error_message = ('\nERROR:\tThe model grid definition file, {}, is missing. The GeoPackage '
+                         'cannot be written without it\n'.format(grid_definition_file))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+    grid = grid_index.GridIndex.read(grid_definition_file)
+    projection = grid_index.Projection(prj_file)
+
+    # Withdrawal points
+    x, y, well_columns, well_rows = read_wells(wells_to_add)
+    well_blobs = geopackage.point_blobs(x, y)
+    well_envelopes = np.column_stack([x, x, y, y])
+
+    # Change in heads of the cells in the grid feature class
+    hds = modflow_heads_file.HeadsFile(hds_file)
+    if ((hds.nrow, hds.ncol) != (grid.nrow, grid.ncol)):
+        hds.close()
+        error_message = ('\nERROR:\tThe heads file {0} ({1} rows, {2} columns) does not match the grid '
+                         'definition {3} ({4} rows, {5} columns)\n'
+                         .format(hds_file, hds.nrow, hds.ncol, grid_definition_file, grid.nrow, grid.ncol))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+    rows, cols = grid_store.get_cells(grid)
+    dh = np.column_stack([dh_rasters.get_layer_dh(hds, layer, grid)[rows-1, cols-1] for layer in layers])
+    hds.close()
+    values = np.empty((len(rows), len(layers)+1), dtype=object)
+    values[:,0] = grid_store.get_row_col(rows, cols)
+    values[:,1:] = dh.astype(np.float64)
+    values[:,1:][np.isnan(dh)] = None
+    dh_rows = values.tolist()
+
+    lake_rows = read_lake_heads(lake_files)
+
+    # The shared cells, written once per grid version
+    grid_file, version = grid_store.GridStore(store_dir).get(grid, grid_definition_file, projection,
+                                                             prj_file, logfile)
+
+    def write_tables(db):
+        geopackage.add_attributes(db, 'dh_lyrs',
+                                  [(JOIN_FIELD, 'TEXT UNIQUE')]
+                                  + [('dh_lyr{}'.format(layer), 'DOUBLE') for layer in layers],
+                                  dh_rows, 'Simulated change in heads (SP2 - SP1) by model cell')
+        geopackage.add_features(db, 'cup_wells_with_grid_info', 'POINT', well_columns,
+                                well_blobs, well_envelopes, well_rows, 'Withdrawal points')
+        geopackage.add_rtree_triggers(db, 'cup_wells_with_grid_info')
+        geopackage.add_attributes(db, 'lake_dh',
+                                  [('lake_set', 'TEXT'), ('layer', 'INTEGER'), ('lake_id', 'TEXT'),
+                                   ('head_sp1', 'DOUBLE'), ('head_sp2', 'DOUBLE'), ('dh', 'DOUBLE')],
+                                  lake_rows, 'Area-weighted heads beneath the lakes')
+        geopackage.add_attributes(db, 'grid_link',
+                                  [('grid_file', 'TEXT'), ('grid_version', 'TEXT'),
+                                   ('grid_layer', 'TEXT'), ('join_field', 'TEXT')],
+                                  [(grid_file, version, grid_store.GRID_LAYER, JOIN_FIELD)],
+                                  'Shared model cells that dh_lyrs joins to')
+    #
+    geopackage.write_new(gpkg_file, projection, prj_file, write_tables)
+
+    vrt_file = os.path.join(os.path.dirname(gpkg_file), 'dh_lyrs.vrt')
+    write_vrt(vrt_file, grid_file, gpkg_file, layers)
+
+    currentmessage = ('\t{0}: {1} withdrawal points, dh of {2} cells, {3} lake heads\n'
+                      .format(gpkg_file, len(well_blobs), len(dh_rows), len(lake_rows))
+                      + '\t{0}: the cells of grid version {1} with their dh\n'.format(vrt_file, version)
+                      + '\tFinished the GeoPackage.\n' + bscut.datetime() + '\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return
+#==============================================================================
+#==============================================================================
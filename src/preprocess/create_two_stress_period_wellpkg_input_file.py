@@ -8,10 +8,16 @@
 
 # Please report errors and corrections to jwg (at) srwmd.org
 
-#import shutil
+import shutil
 #import sys
 import os
 
+from utilities import run_logger
+
+# Name of the parameter that holds the stress-period 1 wells in the
+# external (OPEN/CLOSE) version of the Well Package input file
+SP1_PARAMETER_NAME = 'SP1_WELLS'
+
 class WellPkgInputFile(object):
     """ This is a Python class for parsing and updating MODFLOW-200x Well Package
         input files.
@@ -48,6 +54,42 @@ class WellPkgInputFile(object):
         self.number_of_parameters_sp1 = 0
         self.data_records_sp1 = stress_period_file.readlines()
         stress_period_file.close()
+
+    def parse_stress_period_record_count(self, stress_period_file_name):
+        """ Read only the number of stress-period 1 records (first line of
+            the stress-period file). Used when the records themselves are
+            referenced through an external file instead of being copied.
+        """
+        stress_period_file = open(stress_period_file_name, 'r')
+        line = stress_period_file.readline()
+        self.num_records_sp1 = int(line.strip().split()[0])
+        self.number_of_parameters_sp1 = 0
+        stress_period_file.close()
+
+    def create_external_stress_period_file(self, stress_period_file_name, external_file_name):
+        """ Write the stress-period 1 records, without the leading count
+            line, to a file that MODFLOW can read with OPEN/CLOSE. The file
+            is shared by all runs, so it is only rewritten when it is older
+            than the stress-period file, and it is renamed into place so a
+            concurrent run never sees a partial file.
+        """
+        if (os.path.isfile(external_file_name) and
+            os.path.getmtime(external_file_name) >= os.path.getmtime(stress_period_file_name)):
+            return False
+        temp_file_name = '{0}.{1}.tmp'.format(external_file_name, os.getpid())
+        stress_period_file = open(stress_period_file_name, 'r')
+        stress_period_file.readline()
+        temp_file = open(temp_file_name, 'w')
+        shutil.copyfileobj(stress_period_file, temp_file, 1024*1024)
+        temp_file.close()
+        stress_period_file.close()
+        try:
+            if os.path.isfile(external_file_name): os.remove(external_file_name)
+            os.rename(temp_file_name, external_file_name)
+        except OSError:
+            # Another run created it first
+            os.remove(temp_file_name)
+        return True
    
     def parse_new_wells_input_file(self, new_wells_file_name):
         """ Parse a .csv file with containing layer, row, column, and
@@ -106,7 +148,76 @@ class WellPkgInputFile(object):
         output_file.writelines(self.new_wells_records)
         output_file.close()
 
-def main(output_file_name, preproc_deffiles_wellpkg_update, workingdir, logfile):
+    def create_two_stress_period_input_file_external(self, outfile_name, external_file_name):
+        """ Create a two-stress period Well Package input file in which the
+            stress-period 1 wells are defined once as a Q parameter whose
+            list is read from external_file_name with OPEN/CLOSE. Stress
+            period 1 only activates the parameter; stress period 2 lists
+            the new withdrawal points and activates the parameter again.
+            Only the header and the new-well records are written per run.
+            
+            external_file_name is written as given. It is expected to be
+            located in the MODFLOW working directory (no PATH).
+        """
+        for line in self.comment_and_parameter_flag_lines:
+            if line.strip().upper().startswith('PARAMETER'):
+                raise ValueError('\nERROR:\tThe Well Package header already defines parameters.\n' +
+                                 '\tUse the inline Well Package mode.\n\n')
+        output_file = open(outfile_name, 'w')
+        output_file.writelines(self.comment_and_parameter_flag_lines)
+        output_file.write("PARAMETER {0:>9}{1:>10}\n".format(1, self.num_records_sp1))
+        output_file.write("{0:>10}{1:>10}\n".format(self.max_active_wells, self.well_cbc_unit))
+        output_file.write("{0:<10}{1:>10}{2:>10}{3:>10}\n".format(SP1_PARAMETER_NAME, 'Q', '1.0', self.num_records_sp1))
+        output_file.write("OPEN/CLOSE {0}\n".format(external_file_name))
+        output_file.write("{0:>10}{1:>10}\n".format(0, 1))
+        output_file.write("{0}\n".format(SP1_PARAMETER_NAME))
+        output_file.write("{0:>10}{1:>10}\n".format(len(self.new_wells_records), 1))
+        output_file.writelines(self.new_wells_records)
+        output_file.write("{0}\n".format(SP1_PARAMETER_NAME))
+        output_file.close()
+
+    def create_one_stress_period_input_file(self, outfile_name, new_wells = True):
+        """ Create a one-stress period Well Package input file with the
+            stress-period 1 wells and, if new_wells is True, the new
+            withdrawal points. Used for the single-stress-period run mode,
+            where the baseline (stress-period 1) results are simulated
+            separately.
+        """
+        new_wells_records = []
+        if new_wells: new_wells_records = self.new_wells_records
+        output_file = open(outfile_name, 'w')
+        output_file.writelines(self.comment_and_parameter_flag_lines)
+        output_file.write("{0:>10}{1:>10}\n".format(self.max_active_wells, self.well_cbc_unit))
+        output_file.write("{0:>10}{1:>10}\n".format(self.num_records_sp1 + len(new_wells_records),
+                                                     self.number_of_parameters_sp1))
+        output_file.writelines(self.data_records_sp1)
+        output_file.writelines(new_wells_records)
+        output_file.close()
+
+    def create_one_stress_period_input_file_external(self, outfile_name, external_file_name, new_wells = True):
+        """ Same as create_one_stress_period_input_file, but the stress-period 1
+            wells are read from external_file_name with OPEN/CLOSE (see
+            create_two_stress_period_input_file_external).
+        """
+        for line in self.comment_and_parameter_flag_lines:
+            if line.strip().upper().startswith('PARAMETER'):
+                raise ValueError('\nERROR:\tThe Well Package header already defines parameters.\n' +
+                                 '\tUse the inline Well Package mode.\n\n')
+        new_wells_records = []
+        if new_wells: new_wells_records = self.new_wells_records
+        output_file = open(outfile_name, 'w')
+        output_file.writelines(self.comment_and_parameter_flag_lines)
+        output_file.write("PARAMETER {0:>9}{1:>10}\n".format(1, self.num_records_sp1))
+        output_file.write("{0:>10}{1:>10}\n".format(self.max_active_wells, self.well_cbc_unit))
+        output_file.write("{0:<10}{1:>10}{2:>10}{3:>10}\n".format(SP1_PARAMETER_NAME, 'Q', '1.0', self.num_records_sp1))
+        output_file.write("OPEN/CLOSE {0}\n".format(external_file_name))
+        output_file.write("{0:>10}{1:>10}\n".format(len(new_wells_records), 1))
+        output_file.writelines(new_wells_records)
+        output_file.write("{0}\n".format(SP1_PARAMETER_NAME))
+        output_file.close()
+
+def main(output_file_name, preproc_deffiles_wellpkg_update, workingdir, logfile, mode='inline',
+         stress_periods=2, new_wells=True):
     """ Program for creating a two-stress period Well Package input file, by:
             (1) reading an existing Well Package input file with one stress
                 period,
@@ -115,25 +226,68 @@ def main(output_file_name, preproc_deffiles_wellpkg_update, workingdir, logfile)
                 the wells represented in (1)
             (3) output a two-stress period Well Package input file.
             
+            mode = 'inline' (default) copies the stress-period 1 records
+                   into both stress periods of the output file
+            mode = 'external' references the stress-period 1 records
+                   through an OPEN/CLOSE file shared by all runs
+            
+            stress_periods = 1 writes a one-stress period file instead, for
+                   the single-stress-period run mode. With new_wells=False
+                   the file only has the stress-period 1 wells (the
+                   baseline) and wells_to_add.csv is not read.
+            
+            Returns the list of external files referenced by the output
+            file. These must be available in the MODFLOW working directory.
+            
             Use at your own risk.
             Please contact Trey Grubbs, jwg@srwmd.org, if any errors are found.
 
     """
     ##output_file_name = 'nfseg.wel'
     #output_file_name = sys.argv[1]
+    stress_period_file_name = os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_stress_period_01_records_nfseg.asc')
+    external_file_name = os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_stress_period_01_list_nfseg.asc')
+    external_files = []
+    
     wellpkg = WellPkgInputFile(new_injection_wells = False)
     wellpkg.parse_header(os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_header_nfseg.asc'))
-    wellpkg.parse_stress_period(os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_stress_period_01_records_nfseg.asc'))
-    wellpkg.parse_new_wells_input_file(os.path.join(workingdir,'wells_to_add.csv'))
-    wellpkg.update_max_active_wells()
-    wellpkg.create_two_stress_period_input_file(output_file_name)
+    if (mode == 'inline'):
+        wellpkg.parse_stress_period(stress_period_file_name)
+    elif (mode == 'external'):
+        wellpkg.parse_stress_period_record_count(stress_period_file_name)
+        if wellpkg.create_external_stress_period_file(stress_period_file_name, external_file_name):
+            currentmessage = ('\tCreated the shared stress-period 1 well list: {}\n'.format(external_file_name))
+            print (currentmessage)
+            run_logger.log(logfile, currentmessage)
+        external_files.append(external_file_name)
+    else:
+        error_message = ('\nERROR:\tWell Package mode, ' + mode +
+                         ', is not recognized. Options are external or inline.\n\n')
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    if new_wells:
+        wellpkg.parse_new_wells_input_file(os.path.join(workingdir,'wells_to_add.csv'))
+        wellpkg.update_max_active_wells()
+    else:
+        wellpkg.new_wells_records = []
+    if (stress_periods == 1 and mode == 'inline'):
+        wellpkg.create_one_stress_period_input_file(output_file_name, new_wells)
+    elif (stress_periods == 1):
+        wellpkg.create_one_stress_period_input_file_external(output_file_name,
+                                                             os.path.basename(external_file_name),
+                                                             new_wells)
+    elif (mode == 'inline'):
+        wellpkg.create_two_stress_period_input_file(output_file_name)
+    else:
+        wellpkg.create_two_stress_period_input_file_external(output_file_name,
+                                                             os.path.basename(external_file_name))
     
-    currentmessage = ('\tCreated new Well Package input file\n')
+    currentmessage = ('\tCreated new Well Package input file ({0} mode, {1} stress period(s))\n'.format(mode,stress_periods))
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
-    return
+    return external_files
 #main()
 
         
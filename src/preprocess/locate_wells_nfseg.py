@@ -0,0 +1,202 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+# Find the model (row, col) of the withdrawal points without ArcGIS.
+#
+# Replaces the event layer / Project / CopyFeatures / Intersect_analysis
+# sequence of update_wellpkg_nfseg_v3.py with a NumPy projection and grid
+# lookup (utilities/grid_index.py). wells_to_add.csv is written with the
+# same columns as arcpy.ExportXYv_stats:
+#
+#     XCoord,YCoord,WELLID,LAYER,ROW,COL,Q_CFD
+#
+# where XCoord, YCoord are the projected (grid projection) coordinates.
+#
+# The grid origin, rotation and cell size are read from a grid definition
+# file, input_and_definition_files/preproc/nfseg_v1_1_grid_definition.txt.
+# If the file does not exist, it is derived from the grid feature class in
+# cup.gdb (this fallback needs arcpy) and saved for later runs.
+#==============================================================================
+
+
+
+import os
+
+from utilities import grid_index
+from utilities import run_logger
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Derive the grid definition file from the grid
+# feature class (row, col fields and cell centroids)
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def derive_grid_definition(grid_featureclass, definition_file, logfile):
+    try:
+        import arcpy
+    except ImportError:
+        error_message = ('\nERROR:\tThe model grid definition file, ' + definition_file + ', is missing.\n'
+                         '\tIt can only be derived from the grid feature class with arcpy, which is not\n'
+                         '\tavailable. Restore the file from the Tool distribution.\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    # end try
+    if not arcpy.Exists(grid_featureclass):
+        error_message = ('\nERROR:\tThe model grid definition file, ' + definition_file + ', is missing,\n'
+                         '\tand the grid feature class to derive it from, ' + grid_featureclass +
+                         ', does not exist.\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+
+    currentmessage = ('\tThe model grid definition file is missing. Deriving it from ' + grid_featureclass +
+                      ' . . .\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    rows, cols, x, y = [], [], [], []
+    with arcpy.da.SearchCursor(grid_featureclass, ['row','col','SHAPE@XY']) as cursor:
+        for row, col, xy in cursor:
+            rows.append(row)
+            cols.append(col)
+            x.append(xy[0])
+            y.append(xy[1])
+        # END for over cursor
+    #
+
+    grid = grid_index.fit_grid_index(rows, cols, x, y)
+    grid.write(definition_file, 'Derived from ' + os.path.basename(grid_featureclass))
+
+    currentmessage = ('\tGrid definition saved to {0}\n\t({1} rows, {2} columns, cell size {3}, rotation {4} degrees)\n'
+                      .format(definition_file, grid.nrow, grid.ncol, grid.cell_size, grid.rotation))
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return grid
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Add the located wells to cup.gdb for the map
+# (cup_wells_with_grid_info, as written by
+# update_wellpkg_nfseg_v3.py)
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def add_wells_to_gdb(wells_to_add, gis_dir, grid_featureclass_proj, logfile):
+    import arcpy
+
+    cup_gdb = os.path.join(gis_dir,'cup.gdb')
+    arcpy.env.workspace = cup_gdb
+
+    cup_wells_layer = 'cup_wells_layer'
+    outFeatures = os.path.join(cup_gdb, 'cup_wells_with_grid_info')
+
+    if arcpy.Exists(cup_wells_layer):
+        arcpy.Delete_management(cup_wells_layer)
+    arcpy.MakeXYEventLayer_management(wells_to_add, 'XCoord', 'YCoord', cup_wells_layer, grid_featureclass_proj)
+
+    if arcpy.Exists(outFeatures):
+        arcpy.Delete_management(outFeatures)
+    arcpy.CopyFeatures_management(cup_wells_layer, outFeatures)
+
+    currentmessage = ('\tWithdrawal points saved to ' + outFeatures + '\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Main
+#
+# SpatialReference        .prj file of the input coordinates
+# grid_featureclass_proj  .prj file of the model grid
+# grid_definition_file    grid_index definition of the model grid
+# grid_featureclass       grid feature class, used only if
+#                         grid_definition_file does not exist
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def main(SpatialReference, workingdir, grid_featureclass_proj, grid_definition_file,
+         grid_featureclass, logfile):
+
+    currentmessage = ("\n\tLocating withdrawal points in the model grid . . .\n")
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    if os.path.isfile(grid_definition_file):
+        grid = grid_index.GridIndex.read(grid_definition_file)
+    else:
+        grid = derive_grid_definition(grid_featureclass, grid_definition_file, logfile)
+    #
+
+    in_Table = os.path.join(workingdir, 'withdrawal_point_locations_and_rates.csv')
+    csvOutputFile = os.path.join(workingdir, 'wells_to_add.csv')
+
+    # Header: WellKey,WellId,XCoord,YCoord,layer,Q_cfd
+    with open(in_Table,'r') as fin:
+        header = [item.strip().lower() for item in fin.readline().rstrip().split(',')]
+        records = [line.rstrip().split(',') for line in fin if line.strip() != '']
+    #
+    index_lookup = dict([(header[i], i) for i in range(len(header))])
+
+    x = [float(record[index_lookup['xcoord']]) for record in records]
+    y = [float(record[index_lookup['ycoord']]) for record in records]
+
+    currentmessage = ("\t{0} withdrawal points imported\n".format(len(records)))
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    # Project to the grid projection and find the cells
+    x, y = grid_index.project(x, y,
+                              grid_index.Projection(SpatialReference),
+                              grid_index.Projection(grid_featureclass_proj))
+    rows, cols = grid.locate(x, y)
+
+    # Points outside the grid are dropped, as by the intersection
+    outside = 0
+    with open(csvOutputFile,'w') as fout:
+        fout.write('XCoord,YCoord,WELLID,LAYER,ROW,COL,Q_CFD\n')
+        for i in range(len(records)):
+            if (rows[i] == 0):
+                outside += 1
+                currentmessage = ('\tWARNING: withdrawal point {} is outside the model grid and is not added\n'
+                                  .format(records[i][index_lookup['wellid']]))
+                print (currentmessage)
+                run_logger.log(logfile, currentmessage)
+                continue
+            #
+            fout.write('{0!r},{1!r},{2},{3},{4},{5},{6}\n'.format(float(x[i]), float(y[i]),
+                                                             records[i][index_lookup['wellid']],
+                                                             records[i][index_lookup['layer']],
+                                                             rows[i], cols[i],
+                                                             records[i][index_lookup['q_cfd']]))
+        # END for over i
+    #
+
+    currentmessage = ("\n\tFinished (row, col) identification for {} withdrawal points\n\n"
+                      .format(len(records)-outside))
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return
+#  END DEF
@@ -10,6 +10,8 @@
 
 import os
 
+from utilities import run_logger
+
 class CreateFilesForCUPProcessing(object):
     """ Python class for reading a comma-delimited ascii file with withdrawal-
         point data and converting it into a form that can be used for subsequent
@@ -81,7 +83,7 @@ class CreateFilesForCUPProcessing(object):
                 #print(sum_mgd, sum_cfd)
                 curmsg = ('{0}, {1}\n'.format(sum_mgd, sum_cfd))
                 print (curmsg)
-                with open(self.logf,'a') as lf: lf.write(curmsg)
+                run_logger.log(self.logf, curmsg)
                 output_record.append('{0}'.format(rate_cfd))
                 output_records.append(output_record)
             except TypeError:
@@ -115,12 +117,12 @@ class CreateFilesForCUPProcessing(object):
         #print ("This is where the file is written, cfd, mgd", self.sum_cfd, self.sum_mgd)
         curmsg = ("This is where the file is written, cfd, mgd {0}, {1}\n".format(self.sum_cfd, self.sum_mgd))
         print (curmsg)
-        with open(self.logf,'a') as lf: lf.write(curmsg)
+        run_logger.log(self.logf, curmsg)
         output_string = '{0},{1}'.format(self.cup_id,self.sum_mgd)
         #print ("This is the string printed:", output_string)
         curmsg = ("This is the string printed: {}\n".format(output_string))
         print (curmsg)
-        with open(self.logf,'a') as lf: lf.write(curmsg)
+        run_logger.log(self.logf, curmsg)
         output_file.write(output_string)
         output_file.close()
 
@@ -136,7 +138,7 @@ def main(in_file, workingdir, mgd2cfd, logfile):
     
     currentmessage = ('\tProcess complete\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     return
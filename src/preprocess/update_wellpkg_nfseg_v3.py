@@ -31,12 +31,14 @@
 import os
 import arcpy
 
+from utilities import run_logger
+
 
 def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featureclass_proj, logfile):
     
     currentmessage = ("\n\tInitializing process for intersecting withdrawal locations with model grid (takes a few seconds) . . .\n")
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     # Define the cup geodatabase and grid feature class
     cup_gdb = os.path.join(gis_dir,'cup.gdb')
@@ -60,7 +62,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     # Make the XY event layer...
     currentmessage = ("\tCleaning out old cup well event layer")
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     if arcpy.Exists(cup_wells_layer_state_plane_north):
         arcpy.Delete_management(cup_wells_layer_state_plane_north)
@@ -69,7 +71,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     # Make the XY event layer...
     currentmessage = ("\tImporting x,y coordinates for withdrawal points")
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     # syntax: MakeXYEventLayer_management (table, in_x_field, in_y_field, out_layer, {spatial_reference}, {in_z_field})
     #arcpy.MakeXYEventLayer_management(in_Table, x_coords, y_coords, cup_wells_layer, grid_featureclass_proj)
     arcpy.MakeXYEventLayer_management(in_Table, x_coords, y_coords, cup_wells_layer_state_plane_north, SpatialReference)
@@ -81,7 +83,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     number_of_withdrawl_points = arcpy.GetCount_management(cup_wells_layer_state_plane_north)
     currentmessage = ("\t{0} withdrawal points imported\n".format(number_of_withdrawl_points))
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     # ---------------------------------------------
@@ -98,7 +100,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     
     currentmessage = ('\tWithdrawal points projected\n\tSaving to feature class\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     # Save to a feature class
     if arcpy.Exists(cupWells_fc):
@@ -107,7 +109,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     
     currentmessage = ("\tSaved feature class\n")
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     # ---------------------------------------------
     
@@ -135,7 +137,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     
     currentmessage = ("\tIntersecting withdrawal point locations with model grid ...\n")
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     # Find Model Row,Column points
@@ -150,7 +152,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     
     currentmessage = ('\tIntersection complete\n\tExporting well(s) row,column,layer information to .csv file ...\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     # Export to a .csv file
@@ -162,7 +164,7 @@ def main(SpatialReference, workingdir, gis_dir, grid_featureclass, grid_featurec
     
     currentmessage = ("\n\tFinished (row, col) identification for withdrawal points\n\n")
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     return
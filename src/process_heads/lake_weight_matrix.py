@@ -0,0 +1,191 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Sparse lake weight matrix.
+
+    A lake file (WaterBodiesFrom*.dat: header line, then LakeID, row, col,
+    AreaRatio for each lake cell) is compiled into a sparse (lake x cell)
+    matrix, stored as coordinate arrays: the lake index of each entry, its
+    model row and column, and its area ratio. The area-weighted head of
+    every lake is then
+
+        head[lake] = sum of AreaRatio * head[row, col]
+
+    over the entries of the lake. The heads of all the layers and time
+    steps are gathered at the lake cells at once, and the products are
+    added up with one np.add.at into a (lake x layer) table. The sums are
+    done in single precision, entry by entry in the order of the lake file,
+    as in nfseg_extract_modelwide_and_lake_hds.f08, so the tables are the
+    same to the last digit.
+
+    Several lake files can be stacked into one matrix (LakeWeightMatrix.stack)
+    so the heads are read once for all of them.
+
+    The matrix is saved to a .npz file next to the lake file, with a hash
+    of the lake file, and is rebuilt only when the lake file changes.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from utilities import run_logger
+
+
+FORMAT_VERSION = 1
+
+
+class LakeWeightMatrix:
+
+    def __init__(self, labels, lakes, rows, cols, ratios, source_hash=''):
+        """ labels: lake ids in order of first appearance; lakes: index of
+            the lake of each entry in labels; rows, cols: 1-based model
+            cells; ratios: area ratios (float32)
+        """
+        self.labels = list(labels)
+        self.lakes = np.asarray(lakes, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.ratios = np.asarray(ratios, dtype=np.float32)
+        self.source_hash = source_hash
+
+    @classmethod
+    def build(cls, lake_file, source_hash=''):
+        """ Compile the matrix from a lake file """
+        labels = []
+        lake_index = {}
+        lakes, rows, cols, ratios = [], [], [], []
+        with open(lake_file,'r') as fin:
+            fin.readline()
+            for line in fin:
+                items = line.replace(',',' ').split()
+                if (len(items) == 0): continue
+                if (len(items) < 4):
+                    raise ValueError('\nERROR:\tProblem reading the lake file {0}, line: {1}\n'.format(lake_file, line.rstrip()))
+                label = str(int(items[0]))
+                if label not in lake_index:
+                    lake_index[label] = len(labels)
+                    labels.append(label)
+                lakes.append(lake_index[label])
+                rows.append(int(items[1]))
+                cols.append(int(items[2]))
+                ratios.append(float(items[3]))
+            # END for over line
+        #
+        return cls(labels, lakes, rows, cols, ratios, source_hash)
+
+    @classmethod
+    def stack(cls, matrices):
+        """ One matrix with the lakes of all the matrices, in order """
+        offsets = np.cumsum([0] + [len(matrix.labels) for matrix in matrices])
+        return cls(sum([matrix.labels for matrix in matrices], []),
+                   np.concatenate([matrix.lakes + offsets[i] for i, matrix in enumerate(matrices)]),
+                   np.concatenate([matrix.rows for matrix in matrices]),
+                   np.concatenate([matrix.cols for matrix in matrices]),
+                   np.concatenate([matrix.ratios for matrix in matrices]))
+
+    def save(self, matrix_file):
+        arrays = {'format_version':np.array([FORMAT_VERSION]),
+                  'source_hash':np.array([self.source_hash]),
+                  'labels':np.array(self.labels),
+                  'lakes':self.lakes,
+                  'rows':self.rows,
+                  'cols':self.cols,
+                  'ratios':self.ratios}
+        # Write to a temporary file first so concurrent runs never
+        # read a partial file
+        temp_file = matrix_file + '.{}.tmp'.format(os.getpid())
+        with open(temp_file, 'wb') as fout:
+            np.savez(fout, **arrays)
+        if os.path.exists(matrix_file): os.remove(matrix_file)
+        os.rename(temp_file, matrix_file)
+
+    @classmethod
+    def load(cls, matrix_file):
+        with np.load(matrix_file) as data:
+            if (int(data['format_version'][0]) != FORMAT_VERSION): return None
+            return cls([str(item) for item in data['labels']], data['lakes'], data['rows'],
+                       data['cols'], data['ratios'], str(data['source_hash'][0]))
+        #
+
+    def check_grid(self, nrow, ncol):
+        """ Raises ValueError if a lake cell is outside the model grid """
+        outside = (self.rows < 1) | (self.rows > nrow) | (self.cols < 1) | (self.cols > ncol)
+        if outside.any():
+            i = int(np.argmax(outside))
+            raise ValueError('\nERROR:\tLake {0} cell (row {1}, col {2}) is outside the {3} x {4} model grid\n'
+                             .format(self.labels[self.lakes[i]], self.rows[i], self.cols[i], nrow, ncol))
+        #
+
+    def weighted_heads(self, hds, times):
+        """ Area-weighted heads of every lake for every layer and time step
+            of a HeadsFile, as a float32 array (lake, time, layer).
+            times: list of (kper, kstp)
+        """
+        self.check_grid(hds.nrow, hds.ncol)
+        cells = (self.rows-1)*hds.ncol + (self.cols-1)
+
+        # Heads at the lake cells, one column per (time, layer)
+        columns = [(kper, kstp, lay) for kper, kstp in times for lay in range(1, hds.nlay+1)]
+        products = np.empty((len(cells), len(columns)), dtype=np.float32)
+        for j, (kper, kstp, lay) in enumerate(columns):
+            products[:,j] = hds.get_layer(kper, lay, kstp).ravel()[cells]
+        # END for over j
+        products *= self.ratios[:,np.newaxis]
+
+        sums = np.zeros((len(self.labels), len(columns)), dtype=np.float32)
+        np.add.at(sums, self.lakes, products)
+        return sums.reshape(len(self.labels), len(times), hds.nlay)
+
+
+def get_source_hash(lake_file):
+    sha = hashlib.sha1()
+    sha.update('version {}'.format(FORMAT_VERSION).encode('utf-8'))
+    with open(lake_file, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(1024*1024), b''):
+            sha.update(chunk)
+    #
+    return sha.hexdigest()
+
+
+def get_matrix_file_name(lake_file, matrix_dir):
+    return os.path.join(matrix_dir, os.path.splitext(os.path.basename(lake_file))[0] + '_weights.npz')
+
+
+def get_lake_weight_matrix(lake_file, matrix_dir, logfile):
+    """ Load the compiled matrix of a lake file from matrix_dir, or build
+        and save it if the lake file has changed. With matrix_dir None,
+        the matrix is built and not saved.
+    """
+    source_hash = get_source_hash(lake_file)
+    if matrix_dir is None:
+        return LakeWeightMatrix.build(lake_file, source_hash)
+
+    matrix_file = get_matrix_file_name(lake_file, matrix_dir)
+    if os.path.isfile(matrix_file):
+        try:
+            matrix = LakeWeightMatrix.load(matrix_file)
+        except Exception:
+            matrix = None
+        if (matrix is not None and matrix.source_hash == source_hash):
+            return matrix
+    #
+
+    matrix = LakeWeightMatrix.build(lake_file, source_hash)
+    try:
+        matrix.save(matrix_file)
+        currentmessage = ('\tLake weight matrix compiled to {}\n'.format(matrix_file))
+    except (IOError, OSError) as exc:
+        currentmessage = ('\tWARNING: could not save the lake weight matrix to {0} ({1})\n'.format(matrix_file, exc))
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return matrix
@@ -0,0 +1,253 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+#==============================================================================
+# Memory-mapped reader for the binary MODFLOW heads file (nfseg_auto.hds),
+# and the model-wide dH and lake head tables of
+# nfseg_extract_modelwide_and_lake_hds.f08, computed with NumPy.
+#
+# Each record of the heads file is
+#
+#     KSTP, KPER, PERTIM, TOTIM, TEXT (16 characters), NCOL, NROW, ILAY
+#
+# followed by NROW*NCOL values in row major order, in single or double
+# precision. Only the record headers are read when the file is opened;
+# get_layer() returns a read-only view of one layer in the memory map,
+# so nothing is copied until the values are used.
+#
+# The dH and lake head tables follow the Fortran program: the differences
+# and the area-weighted sums are computed in single precision, in the same
+# order, and the numbers are written with the Fortran G0.d and F0.d edit
+# descriptors (format_g0, format_f0).
+#==============================================================================
+
+import os
+
+import numpy as np
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Heads file
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class HeadsFile(object):
+
+    def __init__(self, hds_file):
+        self.file_name = hds_file
+        self.size = os.path.getsize(hds_file)
+        if (self.size == 0):
+            raise ValueError('\nERROR:\tThe heads file {} is empty\n'.format(hds_file))
+        self.data = np.memmap(hds_file, dtype=np.uint8, mode='r')
+
+        self.records = None
+        for real in ['<f4', '<f8']:
+            try:
+                self.index_records(np.dtype(real))
+            except ValueError:
+                continue
+            break
+        # END for over real
+        if self.records is None:
+            self.close()
+            raise ValueError('\nERROR:\tCould not read the binary heads file {}\n'.format(hds_file))
+
+    def close(self):
+        """ Release the memory map (needed on Windows before the file can
+            be deleted or replaced)
+        """
+        self.data = None
+
+    def index_records(self, real):
+        """ Find the offset of the values of every (kstp, kper, layer).
+            Raises ValueError if the file does not read with this precision.
+        """
+        header = np.dtype([('kstp','<i4'), ('kper','<i4'), ('pertim',real), ('totim',real),
+                           ('text','S16'), ('ncol','<i4'), ('nrow','<i4'), ('ilay','<i4')])
+        records = {}
+        texts = set()
+        nrow = ncol = nlay = 0
+        offset = 0
+        while offset < self.size:
+            if (offset + header.itemsize > self.size):
+                raise ValueError('record past the end of the file')
+            values = np.frombuffer(self.data, dtype=header, count=1, offset=offset)[0]
+            kstp, kper, ilay = int(values['kstp']), int(values['kper']), int(values['ilay'])
+            record_ncol, record_nrow = int(values['ncol']), int(values['nrow'])
+            text = values['text']
+            if (kstp < 1 or kper < 1 or ilay < 1 or record_ncol < 1 or record_nrow < 1 or
+                not all(32 <= c < 127 for c in bytearray(text))):
+                raise ValueError('not a heads record header')
+            if (nrow == 0):
+                nrow, ncol = record_nrow, record_ncol
+            elif (record_nrow != nrow or record_ncol != ncol):
+                raise ValueError('the grid size changes')
+            offset += header.itemsize
+            records[(kstp, kper, ilay)] = offset
+            texts.add(text.decode('ascii').strip())
+            nlay = max(nlay, ilay)
+            offset += nrow*ncol*real.itemsize
+        # END while
+        if (offset != self.size):
+            raise ValueError('record past the end of the file')
+
+        self.real = real
+        self.records = records
+        self.texts = texts
+        self.nrow = nrow
+        self.ncol = ncol
+        self.nlay = nlay
+
+    def get_times(self):
+        """ Sorted list of (kstp, kper) in the file """
+        return sorted(set([(kstp, kper) for kstp, kper, ilay in self.records]))
+
+    def get_layer(self, kper, layer, kstp=1):
+        """ Read-only (NROW, NCOL) view of the heads of a layer. The values
+            are float32 for a single-precision file.
+        """
+        try:
+            offset = self.records[(kstp, kper, layer)]
+        except KeyError:
+            raise ValueError('\nERROR:\t{0} has no heads for layer {1}, stress period {2}, time step {3}\n'
+                             .format(self.file_name, layer, kper, kstp))
+        return np.frombuffer(self.data, dtype=self.real, count=self.nrow*self.ncol,
+                             offset=offset).reshape(self.nrow, self.ncol)
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Fortran edit descriptors
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def format_g0(value, d):
+    """ value written with the Fortran G0.d edit descriptor: F editing
+        with d significant digits for 0.1 <= |value| < 10**d, otherwise
+        E editing (0.ddddddE+e, with as many exponent digits as needed,
+        as gfortran writes it). As in gfortran, the limits are compared
+        in the precision of value (pass NumPy float32 values for REAL*4).
+    """
+    real = type(value) if isinstance(value, np.floating) else np.float64
+    magnitude = abs(real(value))
+    if (magnitude != magnitude): return 'NaN'
+    sign = '-' if np.signbit(value) else ''
+    if np.isinf(magnitude): return sign + 'Infinity'
+    if (magnitude == 0.):
+        return sign + '0.' + '0'*(d-1)
+
+    # F editing if 0.1 - 0.5*10**(-d-1) <= |value| < 10**d - 0.5; the
+    # number of decimals is d-e for 10**(e-1) - ... <= |value| < 10**e - ...
+    half = real(0.5)
+    exp_d = real(10)**d
+    if (magnitude < real(0.1) - real(0.1)*half/exp_d or magnitude >= exp_d - half):
+        mantissa = '%.*e' % (d-1, float(magnitude))
+        exponent = int(mantissa[mantissa.index('e')+1:]) + 1
+        digits = mantissa[0] + mantissa[2:mantissa.index('e')]
+        text = '0.{0}E{1}{2}'.format(digits, '-' if exponent < 0 else '+', abs(exponent))
+    else:
+        e = 0
+        while (magnitude >= real(10)**e - half*real(10)**e/exp_d):
+            e += 1
+        # END while
+        decimals = d-e
+        text = '%.*f' % (decimals, float(magnitude))
+        if (decimals == 0): text += '.'
+    return sign + text
+
+
+def format_f0(value, d):
+    """ value written with the Fortran F0.d edit descriptor (no zero
+        before the decimal point)
+    """
+    text = '%.*f' % (d, float(value))
+    if text.startswith('0.'): return text[1:]
+    if text.startswith('-0.'): return '-' + text[2:]
+    return text
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Model-wide change in heads, DH = per_b - per_a,
+# for every layer (delta_head_modelwide)
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def write_delta_heads(hds, deltaH_file, per_b=2, stp_b=1, per_a=1, stp_a=1):
+
+    layers = range(1, hds.nlay+1)
+
+    # One layer of differences at a time; the numbers are formatted
+    # once for each distinct value (most cells do not change)
+    dh_index = np.empty((hds.nlay, hds.nrow*hds.ncol), dtype=np.int64)
+    dh_text = []
+    for i, lay in enumerate(layers):
+        head_diff = hds.get_layer(per_b, lay, stp_b) - hds.get_layer(per_a, lay, stp_a)
+        values, index = np.unique(head_diff.ravel(), return_inverse=True)
+        dh_index[i] = index + len(dh_text)
+        dh_text.extend([format_g0(value, 6) for value in values])
+    # END for over lay
+
+    with open(deltaH_file,'w') as fout:
+        fout.write('row_col,' + ','.join(['dh_lyr{}'.format(lay) for lay in layers]) + '\n')
+        for row in range(hds.nrow):
+            columns = dh_index[:, row*hds.ncol:(row+1)*hds.ncol].T.tolist()
+            fout.write(''.join(['{0}_{1},{2}\n'.format(row+1, col+1, ','.join([dh_text[j] for j in columns[col]]))
+                                for col in range(hds.ncol)]))
+        # END for over row
+    #
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Tables of the area-weighted heads beneath the
+# lakes of a lake file and their change
+# (avg_lakehead_n_diff). One table,
+# <prefix>_layer_<n>.txt, per layer. The heads are
+# computed with lake_weight_matrix.py.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def write_lake_heads(lake_heads, labels, outfile_prefix):
+    """ lake_heads: float32 (lake, time, layer) array of the heads at the
+        times a and b (LakeWeightMatrix.weighted_heads). Returns the output
+        file names.
+    """
+    outfiles = []
+    for i_lay in range(lake_heads.shape[2]):
+        head_diff = lake_heads[:,1,i_lay] - lake_heads[:,0,i_lay]
+
+        outfile = '{0}_layer_{1}.txt'.format(outfile_prefix, i_lay+1)
+        with open(outfile,'w') as fout:
+            fout.write('LakeID Head_SP1 Head_SP2 SP2-SP1\n')
+            for i in range(len(labels)):
+                fout.write('{0} {1} {2} {3}\n'.format(labels[i],
+                                                     format_f0(lake_heads[i,0,i_lay], 7),
+                                                     format_f0(lake_heads[i,1,i_lay], 7),
+                                                     format_g0(head_diff[i], 8)))
+            # END for over i
+        #
+        outfiles.append(outfile)
+    # END for over i_lay
+
+    return outfiles
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -24,14 +24,16 @@ Created on Wed Dec 23 16:14:55 2020
 #import sys
 import os
 import numpy as np
-import subprocess
 from copy import deepcopy as dc
 from collections import OrderedDict
 # Import internal python scripts
 #src_dir = os.path.join(os.getcwd(),'../..')
 #sys.path.insert(0,src_dir)
-from utilities import mydefinitions as mydef
 from utilities import basic_utilities as bscut
+from utilities import run_logger
+from utilities import process_runner
+from process_heads import modflow_heads_file
+from process_heads import lake_weight_matrix
 
 
 
@@ -63,63 +65,101 @@ def calc_dh (code_dir, input_countrol_file, runmode, logfile):
     #input_countrol_file = 'hds_processing_control_file.txt'
     
     
-    errlist = mydef.ErrorListValues()
+    # The output is checked for error keywords as it arrives
+    # (and written to the log when processing heads)
+    result = process_runner.run([program,'-in',input_countrol_file,'-runmode',runmode], logfile,
+                                log_output=(runmode == 'run'))
+    
+    # Raise an exception if an error occurs
+    #   - Check for error keywords
+    #   - Check the subprocess returncode
+    #   - Check if any output was given to stderr
+    if result.failed():
+        currentmessage= ('ERROR:\t' +
+                         'There was a problem running {}!\n'.format(program) +
+                         '\tBelow is the report:\n' +
+                         'Error code: {}\n'.format(result.returncode) +
+                         'Standard Out:\n{}\n'.format(result.stdout()))
+        print(currentmessage)
+        run_logger.log(logfile, currentmessage)
+        error_message = result.stderr()
+        run_logger.log(logfile, '{}'.format(error_message))
+        raise ValueError(error_message)
+    #
+    
+    # All went well
+    if (runmode == 'readonly'):
+        return result.stdout()
+    return
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Calculate the model-wide change in heads and the
+# area-weighted heads beneath lakes with NumPy
+# (modflow_heads_file.py) instead of the Fortran
+# program. Writes the same files as calc_dh with
+# runmode 'run'. The lake files are compiled into
+# sparse weight matrices, cached in matrix_dir.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def calc_dh_numpy (input_countrol_file, logfile, matrix_dir=None):
+    
+    hds_file, dHfile, WBfilesets = read_control_file_settings(input_countrol_file)
     
     try:
-        # Define the executable process
-        # The [] contains: [executable, option_arg_1, option_arg_2, etc.]
-        # p = subprocess.Popen([exe,argument_list],
-        #                      stdout = subprocess.PIPE,
-        #                      stdin = subprocess.PIPE,
-        #                      stderr = subprocess.PIPE)
-        p = subprocess.Popen([program,'-in',input_countrol_file,'-runmode',runmode],
-                             stdout = subprocess.PIPE,
-                             stdin = subprocess.PIPE,
-                             stderr = subprocess.PIPE)
-        
-        # Execute the code with any command-line arguments
-        # Syntax:
-        #       p.communicate(stdin) -- if stdin is needed
-        #       p.communicate() -- if no stdin is needed
-        # Returns a tuple (stdoutdata, stderrdata)
-        standardout, standarderror = p.communicate()
-        
-        # Raise an exception if an error occurs
-        #   - Check for error keywords
-        #   - Check the subprocess returncode
-        #   - Check if any output was given to stderr
-        error_flag = False
-        for erritem in errlist.ErrorList:
-            stdoutindex = standardout.find(erritem)
-            stderrindex = standardout.find(erritem)
-            #print ('Stdoutindex {}; Stderrindex {}\n'.format(stdoutindex,stderrindex))
-            if (stdoutindex != -1 or stderrindex != -1):
-                error_flag=True
-                break
-            # END if
-        # END for over erritem
-        if (p.returncode != 0 or standarderror or error_flag):
-            currentmessage= ('ERROR:\t' +
-                             'There was a problem running {}!\n' +
-                             '\tBelow is the report:\n' +
-                             'Error code: {}\n'.format(program,p.returncode) +
-                             'Standard Out:\n{}\n'.format(standardout))
-            print(currentmessage)
-            with open(logfile,'a') as lf: lf.write(currentmessage)
-            error_message = standarderror
-            raise ValueError(error_message)
-    except ValueError as VError:
-        #raise
-        with open(logfile,'a') as lf: lf.write('{}'.format(VError))
-        raise ValueError(VError)
-        
-    else: # All went well. Print output and move on
-        if (runmode == 'run'):
-            with open(logfile,'a') as lf: lf.write('{}\n'.format(standardout))
-            return
-        elif (runmode == 'readonly'):
-            return standardout
-    # END try
+        hds = modflow_heads_file.HeadsFile(hds_file)
+    except (IOError, OSError, ValueError) as exc:
+        error_message = ('\nERROR:\tProblem reading the heads file {0}\n{1}\n'.format(hds_file, exc))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+    
+    if (hds.texts != set(['HEAD'])):
+        error_message = ('\nERROR:\tData in {0} is not designated as HEAD ({1})\n'
+                         .format(hds_file, ', '.join(sorted(hds.texts))))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+    
+    currentmessage = ('\tHeads file: {0} ({1} layers, {2} rows, {3} columns, {4} time steps)\n'
+                      .format(hds_file, hds.nlay, hds.nrow, hds.ncol, len(hds.get_times())))
+    
+    modflow_heads_file.write_delta_heads(hds, dHfile)
+    currentmessage += ('\tdH file: {}\n'.format(dHfile))
+    
+    # Heads beneath the lakes of all the lake files at once:
+    # one (lake x cell) matrix for all, SP1 and SP2
+    matrices = [lake_weight_matrix.get_lake_weight_matrix(WBfile_in, matrix_dir, logfile)
+                for WBfile_in, WBprefix in WBfilesets]
+    try:
+        lake_heads = lake_weight_matrix.LakeWeightMatrix.stack(matrices).weighted_heads(hds, [(1,1), (2,1)])
+    except ValueError as exc:
+        error_message = ('\nERROR:\tProblem with the lake files\n{}\n'.format(exc))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        raise ValueError(error_message)
+    #
+    hds.close()
+    
+    first = 0
+    for (WBfile_in, WBprefix), matrix in zip(WBfilesets, matrices):
+        nlakes = len(matrix.labels)
+        modflow_heads_file.write_lake_heads(lake_heads[first:first+nlakes], matrix.labels, WBprefix)
+        first += nlakes
+        currentmessage += ('\tCurrent Lake File: {0}  NumLakes {1}  LakeCells {2}\n'
+                           .format(WBfile_in, nlakes, len(matrix.lakes)))
+    #
+    
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    
+    return
 # ooooooooooooooooooooooooooooooooooooooooooooooooooooo
 
 
@@ -187,6 +227,58 @@ def get_input_output_fnames(code_dir, input_countrol_file, runmode, modlayers, l
 
 
 
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read the input-control file directly, without
+# running the Fortran program, and return the same
+# filenames as get_input_output_fnames.
+#
+# Used to declare the outputs of the heads
+# processing before it is run (e.g., for caching).
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+def read_input_control_file(input_countrol_file, modlayers):
+    
+    hds_file, dHfile, WBfilesets = read_control_file_settings(input_countrol_file)
+    
+    WBfiles_in = {}
+    WBfiles_out = {}
+    for i, (WBfile_in, WBprefix) in enumerate(WBfilesets):
+        label = 'WB_{}'.format(i+1)
+        WBfiles_in[label] = WBfile_in
+        WBfiles_out[label] = ['{}_layer_{}.txt'.format(WBprefix,lay) for lay in modlayers]
+    #
+    
+    return dHfile,WBfiles_in,WBfiles_out
+
+def read_control_file_settings(input_countrol_file):
+    """ Return the heads file (the first one listed, as in the Fortran
+        program), the dH file, and the (lake input file, output prefix)
+        of each fileset
+    """
+    hds_file = ''
+    dHfile = ''
+    WBfilesets = []
+    with open(input_countrol_file,'r') as fin:
+        for line in fin:
+            line = line.split()
+            if (len(line)==0 or line[0].startswith('#')): continue
+            
+            if (line[:2] == ['set','HeadsFile'] and len(line)>3):
+                if (hds_file == ''): hds_file = line[3]
+            elif (line[:2] == ['set','Delta_Heads_Prefix'] and len(line)>2):
+                dHfile = '{}_all_layers.csv'.format(line[2])
+            elif (line[0] == 'fileset' and len(line)>2):
+                WBfilesets.append((line[1],line[2]))
+            #
+        #
+    #
+    
+    return hds_file,dHfile,WBfilesets
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
 # xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
 #
 # Reformat space delimited dh data for each model
@@ -307,7 +399,8 @@ def organize_dh_modlayers(dHfile, uselayers):
 #
 #==============================================================================
 
-def main(input_countrol_file, modlayers, uselayers, code_dir, postproc_deffiles_lakef, results_postproc_dh, logfile):
+def main(input_countrol_file, modlayers, uselayers, code_dir, postproc_deffiles_lakef, results_postproc_dh, logfile,
+         heads_reader='numpy'):
     
     # Change the working directory to where heads processing takes place.
     # Change back when done.
@@ -320,8 +413,11 @@ def main(input_countrol_file, modlayers, uselayers, code_dir, postproc_deffiles_
     # output to work with existing scripts that
     # add data to geodatabases.
     #---------------------------------------------------
-    runmode = 'readonly'
-    dHfile,WBfiles_in,WBfiles_out = get_input_output_fnames(code_dir, input_countrol_file, runmode, modlayers, logfile)
+    if (heads_reader == 'fortran'):
+        runmode = 'readonly'
+        dHfile,WBfiles_in,WBfiles_out = get_input_output_fnames(code_dir, input_countrol_file, runmode, modlayers, logfile)
+    else:
+        dHfile,WBfiles_in,WBfiles_out = read_input_control_file(input_countrol_file, modlayers)
     
     #print (dHfile,WBfiles_out)
     
@@ -332,10 +428,13 @@ def main(input_countrol_file, modlayers, uselayers, code_dir, postproc_deffiles_
                            ,lakef
                            ,logfile)): continue
     
-    # Run the program again, but this time process model heads
-    #     -- model-wide dH and heads beneath lakes
-    runmode = 'run'
-    calc_dh(code_dir, input_countrol_file, runmode, logfile)
+    # Process model heads -- model-wide dH and heads beneath lakes
+    # (with the Fortran program, run it again, this time processing heads)
+    if (heads_reader == 'fortran'):
+        runmode = 'run'
+        calc_dh(code_dir, input_countrol_file, runmode, logfile)
+    else:
+        calc_dh_numpy(input_countrol_file, logfile, postproc_deffiles_lakef)
     
     
     # Reformat the dH file to csv for import into gdb
@@ -354,7 +453,7 @@ def main(input_countrol_file, modlayers, uselayers, code_dir, postproc_deffiles_
     
     currentmessage = ('\n\t. . . Done processing heads!\n\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     # Done here -- move back to the main working directory
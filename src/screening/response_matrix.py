@@ -0,0 +1,390 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Linear response matrix for screening CUP withdrawals
+#
+# For each unit-withdrawal location (layer, row, col) the matrix holds
+# the simulated change in flow at every gaged station listed in
+# station_number_and_names_20210218.csv and the change in area-weighted
+# head beneath every lake of the WaterBodies*.dat sets, per cubic foot
+# per day of withdrawal. The responses are built offline with
+# build_response_matrix.py (one MODFLOW run per location).
+#
+# Screening superposes the responses of the wells of a CUP, scaled by
+# their withdrawal rates, and writes the delta_q_summary and lake head
+# tables in the same format as the full Tool. The results are
+# approximate: the model is only close to linear (e.g., drains and
+# rivers that go dry), and wells at locations without a response use
+# the response of the nearest location in the same layer. Wells farther
+# than max_distance (model cells) from every location in their layer are
+# not screened: the run fails, and they need the full model. The
+# location used for each well, and its distance, are written to a table.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import csv
+import os
+
+import numpy as np
+
+from utilities import run_logger
+from postprocess import create_delta_q_report_PMB
+
+
+# Header of the lake head tables written by nfseg_extract_modelwide_and_lake_hds
+LAKE_TABLE_HEADER = 'LakeID Head_SP1 Head_SP2 SP2-SP1\n'
+
+# Columns of the table of the response used for each well
+WELL_TABLE_HEADER = ['LAYER', 'ROW', 'COL', 'Q_CFD', 'RESPONSE_LAYER', 'RESPONSE_ROW', 'RESPONSE_COL',
+                     'DISTANCE_CELLS', 'STATUS']
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read the results of one Tool run
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def read_station_fluxes(station_file, qr_file, qs_file):
+    """ Return the station list (dictionaries, see create_delta_q_report_PMB)
+        and the stress period 1 and 2 fluxes of each station (cfs)
+    """
+    gages = create_delta_q_report_PMB.ContributingGages()
+    gages.parse_station_numbers_and_names_file(station_file)
+    gages.parse_simualted_qr_file(qr_file)
+    gages.parse_simualted_qs_file(qs_file)
+
+    flux_sp1 = []
+    flux_sp2 = []
+    for station in gages.station_list:
+        flux_sp1.append(gages.sim_fluxes[(station['number'],'total_sim_flux_sp1',station['reach_type'])])
+        flux_sp2.append(gages.sim_fluxes[(station['number'],'total_sim_flux_sp2',station['reach_type'])])
+    # END for over station
+
+    return gages.station_list, np.array(flux_sp1), np.array(flux_sp2)
+
+
+def read_lake_table(lake_table_file):
+    """ Return the lake ids and the stress period 1 and 2 heads of a lake
+        head table (<prefix>_layer_<n>.txt)
+    """
+    lake_ids = []
+    head_sp1 = []
+    head_sp2 = []
+    with open(lake_table_file,'r') as fin:
+        fin.readline()
+        for line in fin:
+            items = line.split()
+            if (len(items) < 3): continue
+            lake_ids.append(items[0])
+            head_sp1.append(float(items[1]))
+            head_sp2.append(float(items[2]))
+        # END for over line
+    #
+    return lake_ids, np.array(head_sp1), np.array(head_sp2)
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Response matrix
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class ResponseMatrix(object):
+    """ Unit responses of station flows and lake heads to withdrawals.
+
+        locations      (n,3) layer, row, col of each unit withdrawal
+        dq             (n, number of stations) change in flow, cfs per cfd
+        dh             (n, number of lake rows) change in head, ft per cfd
+        station_*      station number, name, WMD and baseline flow (cfs)
+        lake_*         table prefix, layer, lake id and baseline head of
+                       each row of the lake head tables
+    """
+
+    def __init__(self, unit_rate_cfd=1.0):
+        self.unit_rate_cfd = float(unit_rate_cfd)
+        self.locations = np.zeros((0,3), dtype=np.int32)
+        self.dq = None
+        self.dh = None
+        self.station_number = []
+        self.station_name = []
+        self.station_wmd = []
+        self.station_reach_type = []
+        self.station_base = None
+        self.lake_prefix = []
+        self.lake_layer = []
+        self.lake_id = []
+        self.lake_base = None
+
+    # ---------------------------------------
+    # Build
+    # ---------------------------------------
+    def set_baseline(self, station_list, station_base, lake_tables):
+        """ Define the stations and lakes, and their baseline values.
+            lake_tables is a list of (prefix, layer, lake_ids, heads).
+        """
+        self.station_number = [station['number'] for station in station_list]
+        self.station_name = [station['name'] for station in station_list]
+        self.station_wmd = [station['WMD'] for station in station_list]
+        self.station_reach_type = [station['reach_type'] for station in station_list]
+        self.station_base = np.asarray(station_base, dtype=np.float64)
+
+        self.lake_prefix = []
+        self.lake_layer = []
+        self.lake_id = []
+        lake_base = []
+        for prefix, layer, lake_ids, heads in lake_tables:
+            self.lake_prefix.extend([prefix]*len(lake_ids))
+            self.lake_layer.extend([layer]*len(lake_ids))
+            self.lake_id.extend(lake_ids)
+            lake_base.extend(heads)
+        # END for over prefix
+        self.lake_base = np.asarray(lake_base, dtype=np.float64)
+
+        self.dq = np.zeros((0,len(self.station_number)))
+        self.dh = np.zeros((0,len(self.lake_id)))
+
+    def add_response(self, location, station_flux, lake_heads):
+        """ Add the results of a unit withdrawal at location (layer, row, col).
+            station_flux and lake_heads are the stress period 2 values, in
+            the order of the baseline.
+        """
+        station_flux = np.asarray(station_flux, dtype=np.float64)
+        lake_heads = np.asarray(lake_heads, dtype=np.float64)
+        if (station_flux.shape != self.station_base.shape or
+            lake_heads.shape != self.lake_base.shape):
+            raise ValueError('\nERROR:\tThe response at {0} does not match the stations and lakes of the matrix\n'
+                             .format(location))
+
+        index = self.find_location(*location)[0]
+        dq = (station_flux - self.station_base) / self.unit_rate_cfd
+        dh = (lake_heads - self.lake_base) / self.unit_rate_cfd
+        if (index is not None and tuple(self.locations[index]) == tuple(location)):
+            # Replace an existing response
+            self.dq[index] = dq
+            self.dh[index] = dh
+        else:
+            self.locations = np.vstack([self.locations, np.array([location], dtype=np.int32)])
+            self.dq = np.vstack([self.dq, dq])
+            self.dh = np.vstack([self.dh, dh])
+        # END if
+
+    # ---------------------------------------
+    # Storage
+    # ---------------------------------------
+    def save(self, matrix_file):
+        temp_file = '{0}.{1}.tmp.npz'.format(matrix_file, os.getpid())
+        np.savez_compressed(temp_file,
+                            unit_rate_cfd=np.array(self.unit_rate_cfd),
+                            locations=self.locations,
+                            dq=self.dq,
+                            dh=self.dh,
+                            station_number=np.array(self.station_number),
+                            station_name=np.array(self.station_name),
+                            station_wmd=np.array(self.station_wmd),
+                            station_reach_type=np.array(self.station_reach_type),
+                            station_base=self.station_base,
+                            lake_prefix=np.array(self.lake_prefix),
+                            lake_layer=np.array(self.lake_layer, dtype=np.int32),
+                            lake_id=np.array(self.lake_id),
+                            lake_base=self.lake_base)
+        if os.path.isfile(matrix_file): os.remove(matrix_file)
+        os.rename(temp_file, matrix_file)
+
+    @classmethod
+    def load(cls, matrix_file):
+        data = np.load(matrix_file)
+        matrix = cls(float(data['unit_rate_cfd']))
+        matrix.locations = data['locations']
+        matrix.dq = data['dq']
+        matrix.dh = data['dh']
+        matrix.station_number = [str(item) for item in data['station_number']]
+        matrix.station_name = [str(item) for item in data['station_name']]
+        matrix.station_wmd = [str(item) for item in data['station_wmd']]
+        matrix.station_reach_type = [str(item) for item in data['station_reach_type']]
+        matrix.station_base = data['station_base']
+        matrix.lake_prefix = [str(item) for item in data['lake_prefix']]
+        matrix.lake_layer = [int(item) for item in data['lake_layer']]
+        matrix.lake_id = [str(item) for item in data['lake_id']]
+        matrix.lake_base = data['lake_base']
+        data.close()
+        return matrix
+
+    # ---------------------------------------
+    # Screening
+    # ---------------------------------------
+    def find_location(self, layer, row, col):
+        """ Index of the response for (layer, row, col), the location
+            itself or the nearest location in the same layer, and its
+            distance in model cells (0 for an exact match). Returns
+            (None, None) if the layer has none.
+        """
+        in_layer = np.nonzero(self.locations[:,0] == layer)[0]
+        if (len(in_layer) == 0): return None, None
+        distance = np.hypot(self.locations[in_layer,1] - row,
+                            self.locations[in_layer,2] - col)
+        nearest = np.argmin(distance)
+        return in_layer[nearest], float(distance[nearest])
+
+    def superpose(self, wells, max_distance=None):
+        """ Sum the responses of wells, a list of (layer, row, col, q_cfd)
+            withdrawals. Returns (station flux change, lake head change,
+            matches), where matches has the (index of the nearest
+            response, distance in cells) of each well. Wells farther than
+            max_distance from every location are not added.
+        """
+        dq = np.zeros(len(self.station_number))
+        dh = np.zeros(len(self.lake_id))
+        matches = []
+        for layer, row, col, q_cfd in wells:
+            index, distance = self.find_location(layer, row, col)
+            if index is None:
+                raise ValueError('\nERROR:\tThe response matrix has no locations in layer {}\n'.format(layer))
+            matches.append((index, distance))
+            if (max_distance is not None and distance > max_distance): continue
+            dq += q_cfd * self.dq[index]
+            dh += q_cfd * self.dh[index]
+        # END for over layer
+        return dq, dh, matches
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Write the screening results in the format of
+# the full Tool results
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def write_delta_q_summary(matrix, station_flux_change, cup_id_and_rate_file, DQ_summary_out):
+
+    gages = create_delta_q_report_PMB.ContributingGages()
+    gages.read_file_with_cup_id_and_amount(cup_id_and_rate_file)
+    gages.station_list = []
+    for i in range(len(matrix.station_number)):
+        station = {'number':matrix.station_number[i],
+                   'name':matrix.station_name[i],
+                   'reach_type':matrix.station_reach_type[i],
+                   'WMD':matrix.station_wmd[i]}
+        gages.station_list.append(station)
+        gages.sim_fluxes[(station['number'],'total_sim_flux_sp1',station['reach_type'])] = matrix.station_base[i]
+        gages.sim_fluxes[(station['number'],'total_sim_flux_sp2',station['reach_type'])] = (matrix.station_base[i] +
+                                                                                           station_flux_change[i])
+    # END for over i
+    gages.generate_station_flux_ouput()
+    gages.output_fluxes(DQ_summary_out)
+
+
+def write_well_table(matrix, wells, matches, max_distance, wells_out):
+    """ Table of the response location used for each well """
+    with open(wells_out,'w') as fout:
+        fout.write(','.join(WELL_TABLE_HEADER) + '\n')
+        for (layer, row, col, q_cfd), (index, distance) in zip(wells, matches):
+            if (distance > max_distance): status = 'not screened, more than {} cells away'.format(max_distance)
+            elif (distance == 0): status = 'exact'
+            else: status = 'nearest'
+            fout.write('{0},{1},{2},{3},{4},{5},{6},{7:.2f},{8}\n'
+                       .format(layer, row, col, q_cfd, matrix.locations[index,0], matrix.locations[index,1],
+                               matrix.locations[index,2], distance, status))
+        # END for over layer
+    #
+
+
+def write_lake_tables(matrix, lake_head_change, results_postproc_dh):
+
+    lake_prefix = np.array(matrix.lake_prefix)
+    lake_layer = np.array(matrix.lake_layer)
+    output_files = []
+    for prefix, layer in sorted(set(zip(matrix.lake_prefix, matrix.lake_layer))):
+        rows = np.nonzero((lake_prefix == prefix) & (lake_layer == layer))[0]
+        output_file = os.path.join(results_postproc_dh,'{0}_layer_{1}.txt'.format(prefix,layer))
+        with open(output_file,'w') as fout:
+            fout.write(LAKE_TABLE_HEADER)
+            for i in rows:
+                fout.write('{0} {1:.7f} {2:.7f} {3:.8g}\n'.format(matrix.lake_id[i],
+                                                                  matrix.lake_base[i],
+                                                                  matrix.lake_base[i] + lake_head_change[i],
+                                                                  lake_head_change[i]))
+            # END for over i
+        #
+        output_files.append(output_file)
+    # END for over prefix
+    return output_files
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+#==============================================================================
+#
+# MAIN PROGRAM
+#
+# Screen the wells in wells_to_add.csv (LAYER, ROW, COL, Q_CFD; written
+# by update_wellpkg_nfseg.py) with the response matrix in matrix_file.
+# The response used for each well is written to wells_out. Returns False,
+# without the reports, if a well is farther than max_distance model cells
+# from every response location in its layer.
+#
+#==============================================================================
+
+def main(matrix_file, wells_to_add, cup_id_and_rate_file, DQ_summary_out, results_postproc_dh,
+         wells_out, max_distance, logfile):
+
+    matrix = ResponseMatrix.load(matrix_file)
+
+    wells = []
+    with open(wells_to_add,'r') as fin:
+        for record in csv.DictReader(fin):
+            wells.append((int(record['LAYER']), int(record['ROW']), int(record['COL']),
+                          float(record['Q_CFD'])))
+        # END for over record
+    #
+
+    station_flux_change, lake_head_change, matches = matrix.superpose(wells, max_distance)
+    write_well_table(matrix, wells, matches, max_distance, wells_out)
+
+    n_far = len([index for index, distance in matches if distance > max_distance])
+    if (n_far > 0):
+        error_message = ('\nERROR:\t{0} well(s) are more than {1} model cells from every response location '
+                         'in their layer, so the response matrix cannot screen them (see {2}). Run the full '
+                         'model, or add the locations to the response matrix.\n'
+                         .format(n_far, max_distance, wells_out))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    n_nearest = len([index for index, distance in matches if distance > 0])
+
+    write_delta_q_summary(matrix, station_flux_change, cup_id_and_rate_file, DQ_summary_out)
+    lake_tables = write_lake_tables(matrix, lake_head_change, results_postproc_dh)
+
+    currentmessage = ('\n\tScreened {0} well(s) with {1} unit responses\n'.format(len(wells), len(matrix.locations)) +
+                      '\tWrote {0} and {1} lake head tables\n'.format(os.path.basename(DQ_summary_out), len(lake_tables)))
+    if (n_nearest > 0):
+        currentmessage += ('\tWARNING: {0} well(s) are not at a response location; the nearest location '
+                           'in the same layer, at most {1:.1f} cells away, was used (see {2})\n'
+                           .format(n_nearest, max([distance for index, distance in matches]),
+                                   os.path.basename(wells_out)))
+    currentmessage += ('\tScreening results are approximate. Run the full model for permits near a threshold.\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+
+    return True
+#==============================================================================
+#==============================================================================
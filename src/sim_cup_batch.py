@@ -0,0 +1,365 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Non-interactive batch driver for the NFSEG WUP Tool
+#
+# Runs every job listed in a manifest file through a bounded pool of
+# worker processes. Each job is a full sim_cup_main.py run with its
+# own results directory and logfile. A summary table with the exit
+# status of every job is printed and written to file when done.
+#
+# Usage (from the top-level directory of the tool):
+#
+#     python src\sim_cup_batch.py <manifest.csv> [-n NUMBER_OF_PROCESSES]
+#                                  [--screen RESPONSE_MATRIX]
+#
+# Manifest format (comma-delimited, one job per line):
+#
+#     input_file,projection,options
+#     user_input_files\sim_cup_input_example_srwmd.csv,SRWMD,
+#     user_input_files\sim_cup_input_example_sjrwmd.csv,2,overwrite=no
+#
+#     - input_file  the User input csv file. Relative PATHs are
+#                   relative to the directory holding the manifest.
+#     - projection  SRWMD, SJRWMD, 1 or 2 (same as the interactive prompt)
+#     - options     optional, key=value pairs separated by ';'
+#                   (see RUN_OPTION_DEFAULTS in sim_cup_main.py)
+#
+#     Blank lines and lines starting with '#' are ignored.
+#
+# WARNING:  This tool uses python libraries from ArcGIS - arcpy
+#           arcpy from version ArcGIS 10.6 or newer is required
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# IMPORT ALL LIBRARIES
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
+
+import argparse
+import csv
+import multiprocessing
+import ntpath
+import os
+import sys
+import time
+import traceback
+
+import sim_cup_main
+from utilities import mydefinitions as mydef
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# FUNCTIONS
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Parse the options column of a manifest record
+#    'key1=value1;key2=value2' --> {key1:value1, key2:value2}
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def parse_options(option_string):
+
+    options = {}
+
+    for item in option_string.split(';'):
+        item = item.strip()
+        if not item: continue
+
+        if '=' not in item:
+            error_message = ('\nERROR:\tThe manifest option, ' + item +
+                             ', is not of the form key=value.\n\n')
+            raise ValueError(error_message)
+        # END if
+
+        key, value = item.split('=',1)
+        options[key.strip().lower()] = value.strip()
+    # END for over item
+
+    # Check the keys now rather than when the job runs
+    sim_cup_main.get_run_options(options)
+
+    return options
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read the manifest file and return the list of jobs
+#
+# Each job is a dictionary. Jobs that cannot be run
+# are returned with status INVALID and a message.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def read_manifest(manifest_file):
+
+    mydef.checkfileexist(manifest_file)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+    jobs = []
+    results_dirnames = {}
+
+    with open(manifest_file,'r') as fin:
+        for irecord,record in enumerate(csv.reader(fin)):
+
+            # Skip blank lines, comments, and the header
+            if (not record or not ''.join(record).strip()): continue
+            if record[0].strip().startswith('#'): continue
+            if (irecord==0 and record[0].strip().lower()=='input_file'): continue
+
+            # Pad missing columns
+            record = [item.strip() for item in record] + ['','','']
+            input_file, projection, option_string = record[:3]
+
+            if not os.path.isabs(input_file):
+                input_file = os.path.join(manifest_dir,input_file)
+            #
+
+            job = {'job_number':(len(jobs) + 1),
+                   'input_file':input_file,
+                   'projection':projection,
+                   'options':{},
+                   'status':'PENDING',
+                   'message':'',
+                   'elapsed':0.0,
+                   'results_dir':'',
+                   'logfile':''}
+            jobs.append(job)
+
+            basename, results_dirname = sim_cup_main.get_results_dirname(input_file)
+            job['results_dir'] = results_dirname
+            job['logfile'] = os.path.join(results_dirname,(basename + '.log'))
+
+            # Check everything that can be checked before
+            # any of the jobs are started
+            try:
+                job['options'] = parse_options(option_string)
+                mydef.checkfileexist(input_file)
+                if projection not in sim_cup_main.ALLOWED_PROJ:
+                    error_message = ('\nERROR:\tProjection, ' + projection +
+                                     ', is not one of ' +
+                                     ', '.join(sim_cup_main.ALLOWED_PROJ) + '\n')
+                    raise ValueError(error_message)
+                # END if
+                if results_dirname in results_dirnames:
+                    error_message = ('\nERROR:\tJob {0} writes to the same results directory as job {1}:\n\t{2}\n'
+                                     .format(job['job_number'],results_dirnames[results_dirname],results_dirname))
+                    raise ValueError(error_message)
+                # END if
+            except ValueError as VError:
+                job['status'] = 'INVALID'
+                job['message'] = ' '.join(str(VError).split())
+            else:
+                results_dirnames[results_dirname] = job['job_number']
+            # END try
+        # END for over record
+    #
+
+    return jobs
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Worker process functions
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def run_job(job):
+
+    job = dict(job)
+    start_time = time.time()
+
+    try:
+        success = sim_cup_main.run_cup_simulation(job['input_file'],
+                                                  job['projection'],
+                                                  options=job['options'])
+    except Exception:
+        # Unexpected errors should not take down the pool
+        job['status'] = 'ERROR'
+        job['message'] = traceback.format_exc().strip().split('\n')[-1]
+        if os.path.isdir(job['results_dir']):
+            with open(job['logfile'],'a') as lf: lf.write('\n{}\n'.format(traceback.format_exc()))
+        #
+    else:
+        if success:
+            job['status'] = 'OK'
+        else:
+            job['status'] = 'FAILED'
+            job['message'] = 'see logfile'
+        # END if
+    # END try
+
+    job['elapsed'] = time.time() - start_time
+
+    return job
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Print and write the summary table
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def write_summary(jobs, summary_file, total_elapsed):
+
+    fmt = '{0:>5}  {1:<40}  {2:<10}  {3:<8}  {4:>10}  {5}\n'
+
+    summary = ('\n\n' +
+               'xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox\n\n' +
+               '        --                 BATCH SUMMARY                  --\n\n' +
+               fmt.format('Job','Input file','Projection','Status','Minutes','Message / logfile'))
+    for job in jobs:
+        if (job['status']=='OK'): note = job['logfile']
+        else: note = job['message']
+        summary += fmt.format(job['job_number'],
+                              ntpath.basename(job['input_file'])[:40],
+                              job['projection'],
+                              job['status'],
+                              '{0:.1f}'.format(job['elapsed']/60.0),
+                              note)
+    # END for over job
+
+    n_ok = len([job for job in jobs if job['status']=='OK'])
+    summary += ('\n\t{0} of {1} jobs completed successfully.'.format(n_ok,len(jobs)) +
+                '\n\tTotal elapsed time: {0:.1f} minutes' .format(total_elapsed/60.0) +
+                '\n\tSummary written to: {0}\n\n'.format(summary_file))
+    print (summary)
+
+    with open(summary_file,'w') as fout:
+        fout.write('job_number,input_file,projection,options,status,elapsed_seconds,results_dir,logfile,message\n')
+        for job in jobs:
+            options = ';'.join(['{0}={1}'.format(key,job['options'][key]) for key in sorted(job['options'])])
+            fout.write('{0},"{1}",{2},"{3}",{4},{5:.1f},"{6}","{7}","{8}"\n'.format(
+                job['job_number'],job['input_file'],job['projection'],options,
+                job['status'],job['elapsed'],job['results_dir'],job['logfile'],
+                job['message'].replace('"',"'")))
+        # END for over job
+    #
+
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Run all jobs in the manifest
+#
+# Returns the list of jobs with their final status
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def run_batch(manifest_file, nprocesses=None, screen_matrix=None):
+
+    start_time = time.time()
+
+    jobs = read_manifest(manifest_file)
+    runnable = [job for job in jobs if job['status']=='PENDING']
+
+    # Screening mode for every job (unless the manifest sets its own matrix)
+    if screen_matrix:
+        for job in runnable:
+            job['options'].setdefault('screen_matrix', os.path.abspath(screen_matrix))
+    # END if
+
+    if nprocesses is None: nprocesses = multiprocessing.cpu_count()
+    nprocesses = max(1,min(nprocesses,len(runnable)))
+
+    currentmessage = ('\n\nBatch manifest:  {0}\n'.format(manifest_file) +
+                      '\t{0} jobs read, {1} runnable, {2} worker processes\n\n'.format(len(jobs),len(runnable),nprocesses))
+    print (currentmessage)
+
+    finished = {}
+    if runnable:
+        # One process per job keeps arcpy and the working directory
+        # of one run from leaking into the next (maxtasksperchild=1)
+        pool = multiprocessing.Pool(processes=nprocesses,
+                                    maxtasksperchild=1)
+        try:
+            for job in pool.imap_unordered(run_job,runnable):
+                finished[job['job_number']] = job
+                print ('\n\t***\tJob {0} finished with status {1} ({2} of {3} done)\t***\n'
+                       .format(job['job_number'],job['status'],len(finished),len(runnable)))
+            # END for over job
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            print ('\n\nBatch interrupted. Unfinished jobs are marked NOT RUN.\n')
+        # end try
+        pool.join()
+    # END if
+
+    for ijob,job in enumerate(jobs):
+        if job['job_number'] in finished:
+            jobs[ijob] = finished[job['job_number']]
+        elif (job['status']=='PENDING'):
+            job['status'] = 'NOT RUN'
+        # END if
+    # END for over job
+
+    manifest_base = '.'.join(ntpath.basename(manifest_file).split('.')[:-1])
+    summary_file = os.path.join(sim_cup_main.results_main_dir,(manifest_base + '_batch_summary.csv'))
+    write_summary(jobs, summary_file, time.time() - start_time)
+
+    return jobs
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# MAIN PROGRAM
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Run NFSEG WUP Tool jobs listed in a manifest file.')
+    parser.add_argument('manifest',
+                        help='csv file with one job per line: input_file,projection,options')
+    parser.add_argument('-n','--nprocesses',type=int,default=None,
+                        help='number of jobs to run at the same time (default: number of cores)')
+    parser.add_argument('--screen',metavar='MATRIX',default=None,
+                        help='screen the jobs with this response matrix instead of running MODFLOW')
+    args = parser.parse_args(argv)
+
+    mydef.introbanner()
+
+    try:
+        jobs = run_batch(args.manifest, args.nprocesses, args.screen)
+    except ValueError as VError:
+        print ('\n{}'.format(VError))
+        return 1
+    # end try
+
+    if [job for job in jobs if job['status']!='OK']: return 1
+
+    return 0
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+if __name__ == '__main__':
+    # Needed for the Windows (spawn) process start method
+    multiprocessing.freeze_support()
+    sys.exit(main())
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# END SCRIPT
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
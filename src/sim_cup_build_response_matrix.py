@@ -0,0 +1,375 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Build the response matrix used by the screening mode
+#
+# Simulates a unit withdrawal at each location of a locations file and
+# stores the resulting changes in station flows and lake heads (see
+# src/screening/response_matrix.py). Runs use the single-stress-period
+# mode, so the baseline is simulated once and reused from the stage
+# cache. Completed locations are also restored from the cache, so an
+# interrupted build can simply be started again.
+#
+# Usage (from the top-level directory of the tool):
+#
+#     python src\sim_cup_build_response_matrix.py <locations.csv> <matrix.npz>
+#                [--unit-rate-mgd RATE] [-n NUMBER_OF_PROCESSES]
+#
+# Locations file format (comma-delimited with a header line):
+#
+#     LAYER,ROW,COL
+#     3,521,266
+#
+# Each location is a full MODFLOW run. The matrix only needs the
+# locations where CUP wells are expected (e.g., a coarse lattice in the
+# withdrawal layers); wells elsewhere use the nearest location.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# IMPORT ALL LIBRARIES
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import traceback
+
+import sim_cup_main
+from utilities import basic_utilities as bscut
+from utilities import mydefinitions as mydef
+from utilities import stage_cache
+from preprocess import create_two_stress_period_wellpkg_input_file
+from postprocess import sim_q_reach_3d_auto
+from postprocess import sum_sim_q_reach
+from process_heads import process_model_and_lake_heads
+from screening import response_matrix
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# FUNCTIONS
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read the unit-withdrawal locations
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def read_locations(locations_file):
+
+    locations = []
+    with open(locations_file,'r') as fin:
+        for record in csv.DictReader(fin):
+            location = (int(record['LAYER']), int(record['ROW']), int(record['COL']))
+            if location not in locations: locations.append(location)
+        # END for over record
+    #
+    return locations
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Simulate a unit withdrawal at one location
+#
+# The run directory has the same layout as the
+# results directory of a Tool run.
+#
+# Returns the run directory, or None on failure.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def simulate_unit_withdrawal(location, unit_rate_cfd, build_dir):
+
+    cur_working_dir = sim_cup_main.cur_working_dir
+    layer, row, col = location
+    run_dir = os.path.join(build_dir,'L{0}_R{1}_C{2}'.format(layer,row,col))
+    logfile = os.path.join(run_dir,'logfile.txt')
+
+    # Definition files
+    input_def_file_loc = os.path.join(cur_working_dir,'input_and_definition_files')
+    preproc_deffiles_wellpkg_update = os.path.join(input_def_file_loc,'preproc','wellpkg_update')
+    postproc_deffiles_dh = os.path.join(input_def_file_loc,'postproc','dh')
+    postproc_deffiles_dQ = os.path.join(input_def_file_loc,'postproc','dQ')
+    postproc_deffiles_lakef = os.path.join(input_def_file_loc,'postproc','nfseg_avg_lake_hds','lake_files')
+    model_dir = os.path.join(cur_working_dir,'model_update')
+    phexe_dir = os.path.join(cur_working_dir,'src','process_heads')
+
+    # Run directories
+    results_preproc_wellpkg_update = os.path.join(run_dir,'preproc','wellpkg_update')
+    results_postproc_budget = os.path.join(run_dir,'postproc','budget')
+    results_postproc_dh = os.path.join(run_dir,'postproc','dh')
+    results_postproc_dQ = os.path.join(run_dir,'postproc','dQ')
+    for dirname in [results_preproc_wellpkg_update, results_postproc_budget,
+                    results_postproc_dh, results_postproc_dQ]:
+        if not os.path.isdir(dirname): os.makedirs(dirname)
+    #
+
+    with open(logfile,'w') as lf: lf.write('Unit withdrawal at layer {0}, row {1}, col {2}\n'.format(layer,row,col))
+
+    input_countrol_file_n_path = os.path.join(results_postproc_dh,'hds_processing_control_file.txt')
+    if not (bscut.copyfile(os.path.join(postproc_deffiles_dh,'hds_processing_control_file.txt'),
+                           input_countrol_file_n_path,
+                           logfile)): return None
+    for fname in ['upstream_gage_numbers.csv','station_number_and_names_20210218.csv']:
+        if not (bscut.copyfile(os.path.join(postproc_deffiles_dQ,fname),
+                               os.path.join(results_postproc_dQ,fname),
+                               logfile)): return None
+    # END for over fname
+
+    # The well, in the format written by update_wellpkg_nfseg.py
+    wells_to_add = os.path.join(results_preproc_wellpkg_update,'wells_to_add.csv')
+    with open(wells_to_add,'w') as fout:
+        fout.write('LAYER,ROW,COL,Q_CFD\n')
+        fout.write('{0},{1},{2},{3}\n'.format(layer,row,col,unit_rate_cfd))
+    #
+
+    run_options = sim_cup_main.get_run_options({'stress_periods':'1'})
+    cache = stage_cache.StageCache(os.path.join(cur_working_dir,'cache'), run_options['cache_size_gb'])
+    pipeline = stage_cache.StageGraph(run_dir, logfile, cache)
+
+    wel_file = os.path.join(results_preproc_wellpkg_update,'nfseg_auto.wel')
+    listfile = os.path.join(results_postproc_budget,'nfseg_auto.lst')
+    gaged_reach_flux_out = os.path.join(results_postproc_dQ,'gaged_reach_fluxes.asc')
+    gaged_flux_sum_output = os.path.join(results_postproc_dQ,'gaged_fluxes_sum.csv')
+
+    pipeline.add(stage_cache.Stage('wellpkg',
+                                   create_two_stress_period_wellpkg_input_file.main,
+                                   args=[wel_file, preproc_deffiles_wellpkg_update,
+                                         results_preproc_wellpkg_update, logfile],
+                                   kwargs={'mode':run_options['wellpkg_mode'],
+                                           'stress_periods':1},
+                                   inputs=[wells_to_add,
+                                           os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_header_nfseg.asc'),
+                                           os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_stress_period_01_records_nfseg.asc')],
+                                   outputs=[wel_file],
+                                   params={'mode':run_options['wellpkg_mode'],
+                                           'stress_periods':1}))
+
+    sim_cup_main.add_single_period_model_stages(pipeline, wel_file, model_dir, model_dir,
+                                                preproc_deffiles_wellpkg_update, run_dir,
+                                                results_postproc_dQ, results_postproc_dh, listfile,
+                                                run_options, logfile)
+
+    pipeline.add(stage_cache.Stage('reach_fluxes',
+                                   sim_q_reach_3d_auto.main,
+                                   args=[listfile, mydef.ConvFactors().sec2day, logfile,
+                                         postproc_deffiles_dQ, results_postproc_dQ,
+                                         gaged_reach_flux_out],
+                                   inputs=[listfile,
+                                           sim_q_reach_3d_auto.get_lookup_file_name(postproc_deffiles_dQ),
+                                           os.path.join(postproc_deffiles_dQ,'gaged_reach_definitions.csv')],
+                                   outputs=[gaged_reach_flux_out],
+                                   params={'sec2day':mydef.ConvFactors().sec2day}))
+
+    pipeline.add(stage_cache.Stage('reach_sums',
+                                   sum_sim_q_reach.main,
+                                   args=[logfile, results_postproc_dQ,
+                                         gaged_reach_flux_out, gaged_flux_sum_output],
+                                   inputs=[gaged_reach_flux_out,
+                                           os.path.join(results_postproc_dQ,'upstream_gage_numbers.csv')],
+                                   outputs=[gaged_flux_sum_output]))
+
+    all_model_layers = [1,2,3,4,5,6,7]
+    dHfile,WBfiles_in,WBfiles_out = process_model_and_lake_heads.read_input_control_file(input_countrol_file_n_path,
+                                                                                         all_model_layers)
+    heads_outputs = [os.path.join(results_postproc_dh,dHfile)]
+    for label in sorted(WBfiles_out):
+        heads_outputs.extend([os.path.join(results_postproc_dh,fname) for fname in WBfiles_out[label]])
+    #
+    pipeline.add(stage_cache.Stage('heads',
+                                   process_model_and_lake_heads.main,
+                                   args=[input_countrol_file_n_path, all_model_layers,
+                                         [1,3,5], phexe_dir,
+                                         postproc_deffiles_lakef, results_postproc_dh,
+                                         logfile],
+                                   inputs=([input_countrol_file_n_path,
+                                            os.path.join(results_postproc_dh,'nfseg_auto.hds')] +
+                                           [os.path.join(postproc_deffiles_lakef,WBfiles_in[label]) for label in sorted(WBfiles_in)]),
+                                   outputs=heads_outputs,
+                                   params={'modlayers':all_model_layers,
+                                           'uselayers':[1,3,5]}))
+
+    if not pipeline.run(): return None
+
+    return run_dir
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read the station flows and lake heads of a unit run
+#
+# Returns (station list, station flows SP1, SP2,
+#          lake tables SP1, lake heads SP2)
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def read_unit_results(run_dir):
+
+    results_postproc_dh = os.path.join(run_dir,'postproc','dh')
+    results_postproc_dQ = os.path.join(run_dir,'postproc','dQ')
+
+    station_list, flux_sp1, flux_sp2 = response_matrix.read_station_fluxes(
+        os.path.join(results_postproc_dQ,'station_number_and_names_20210218.csv'),
+        os.path.join(results_postproc_dQ,'gaged_reach_fluxes.asc'),
+        os.path.join(results_postproc_dQ,'gaged_fluxes_sum.csv'))
+
+    all_model_layers = [1,2,3,4,5,6,7]
+    dHfile,WBfiles_in,WBfiles_out = process_model_and_lake_heads.read_input_control_file(
+        os.path.join(results_postproc_dh,'hds_processing_control_file.txt'), all_model_layers)
+
+    lake_tables = []
+    lake_heads_sp2 = []
+    for label in sorted(WBfiles_out):
+        for fname, layer in zip(WBfiles_out[label], all_model_layers):
+            lake_ids, head_sp1, head_sp2 = response_matrix.read_lake_table(os.path.join(results_postproc_dh,fname))
+            prefix = fname[:-len('_layer_{}.txt'.format(layer))]
+            lake_tables.append((prefix, layer, lake_ids, head_sp1))
+            lake_heads_sp2.extend(head_sp2)
+        # END for over fname
+    # END for over label
+
+    return station_list, flux_sp1, flux_sp2, lake_tables, lake_heads_sp2
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Run one location in a worker process
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def run_location(job):
+
+    location, unit_rate_cfd, build_dir = job
+    try:
+        run_dir = simulate_unit_withdrawal(location, unit_rate_cfd, build_dir)
+    except Exception:
+        print (traceback.format_exc())
+        run_dir = None
+    # end try
+
+    return location, run_dir
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Build the response matrix
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def build_response_matrix(locations_file, matrix_file, unit_rate_mgd=1.0, nprocesses=None):
+
+    locations = read_locations(locations_file)
+    if not locations:
+        print ('\nERROR:\tThe locations file {} lists no locations (LAYER,ROW,COL lines after the header). '
+               'The response matrix was not written.\n'.format(locations_file))
+        return False
+    #
+    unit_rate_cfd = unit_rate_mgd * mydef.ConvFactors().mgd2cfd
+    build_dir = os.path.splitext(os.path.abspath(matrix_file))[0] + '_runs'
+    if not os.path.isdir(build_dir): os.makedirs(build_dir)
+
+    if nprocesses is None: nprocesses = multiprocessing.cpu_count()
+    nprocesses = max(1, min(nprocesses, len(locations)))
+
+    currentmessage = ('\nBuilding the response matrix for {0} location(s), unit withdrawal {1} mgd, {2} process(es)\n'
+                      .format(len(locations), unit_rate_mgd, nprocesses))
+    print (currentmessage)
+
+    jobs = [(location, unit_rate_cfd, build_dir) for location in locations]
+    run_dirs = {}
+    
+    def report(location, run_dir):
+        run_dirs[location] = run_dir
+        status = 'OK' if run_dir is not None else 'FAILED'
+        print ('\tLocation {0}: {1} ({2} of {3})'.format(location, status, len(run_dirs), len(jobs)))
+    
+    # The first location runs alone so the baseline is simulated once
+    # and is in the stage cache for the other locations
+    report(*run_location(jobs[0]))
+    
+    pool = multiprocessing.Pool(processes=nprocesses, maxtasksperchild=1)
+    try:
+        for location, run_dir in pool.imap_unordered(run_location, jobs[1:]):
+            report(location, run_dir)
+        # END for over location
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    # end try
+
+    matrix = response_matrix.ResponseMatrix(unit_rate_cfd)
+    n_failed = 0
+    for location in locations:
+        if run_dirs.get(location) is None:
+            n_failed += 1
+            continue
+        station_list, flux_sp1, flux_sp2, lake_tables, lake_heads_sp2 = read_unit_results(run_dirs[location])
+        if matrix.station_base is None: matrix.set_baseline(station_list, flux_sp1, lake_tables)
+        matrix.add_response(location, flux_sp2, lake_heads_sp2)
+    # END for over location
+
+    if (matrix.station_base is None):
+        print ('\nERROR:\tNo location was simulated. The response matrix was not written.\n')
+        return False
+
+    matrix.save(matrix_file)
+
+    currentmessage = ('\nResponse matrix written to {0}\n\t{1} location(s), {2} failed (see the logfiles in {3})\n'
+                      .format(matrix_file, len(matrix.locations), n_failed, build_dir))
+    print (currentmessage)
+
+    return (n_failed == 0)
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# MAIN PROGRAM
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Build the response matrix for the screening mode')
+    parser.add_argument('locations', help='csv file with LAYER,ROW,COL of the unit withdrawals')
+    parser.add_argument('matrix', help='response matrix file to write (.npz)')
+    parser.add_argument('--unit-rate-mgd', type=float, default=1.0,
+                        help='unit withdrawal rate in mgd (default 1.0)')
+    parser.add_argument('-n', '--nprocesses', type=int, default=None,
+                        help='number of MODFLOW runs at a time (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    if build_response_matrix(args.locations, args.matrix, args.unit_rate_mgd, args.nprocesses): return 0
+    return 1
+
+if __name__=='__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# END SCRIPT
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
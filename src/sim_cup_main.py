@@ -18,7 +18,6 @@
 import errno
 import os
 import ntpath
-import zipfile
 #import numpy
 #from copy import deepcopy as dc
 #import itertools
@@ -63,83 +62,187 @@ src_postprocess_dir = os.path.join(src_dir,'postprocess')
 # ---------------   Import utilities
 from utilities import basic_utilities as bscut
 from utilities import mydefinitions as mydef
+from utilities import model_workspace
+from utilities import stage_cache
+from utilities import single_stress_period as sngsp
+from utilities import run_logger
+from utilities import run_trace
+from utilities import modflow_adapter
+from utilities import artifact_store
+from utilities import gis_backends
+from utilities import grid_index
 
 # ---------------   Import preprocess
 from preprocess import process_withdrawal_point_input_file
-from preprocess import update_wellpkg_nfseg_v3 as update_wellpkg_nfseg
 from preprocess import create_two_stress_period_wellpkg_input_file
 
 # ---------------   Import postprocess
-from postprocess import parse_modflow_listing_file_budget
 from postprocess import river_drain_and_ghb_flux_changes
 from postprocess import sim_q_reach_3d_auto
+from postprocess import modflow_listing_scanner
+from postprocess import modflow_cbc_reader
 from postprocess import sum_sim_q_reach
 from postprocess import create_delta_q_report_PMB
+from postprocess import dh_rasters
 #from postprocess import ReadModflowFloatArrays
-from postprocess import make_ArcGIS_table_from_csv
+
+# The stages that use arcpy (locate_wells_nfseg, update_wellpkg_nfseg_v3 and
+# make_ArcGIS_table_from_csv) are imported when they run; see
+# utilities/gis_backends.py
 
 # ---------------   Import process_heads
 from process_heads import process_model_and_lake_heads
 
+# ---------------   Import screening
+from screening import response_matrix
+
+# ---------------   Run-time defaults
+# Projections accepted from the User or from a batch manifest
+ALLOWED_PROJ = ['SRWMD','SJRWMD','1','2']
+
+# Options that may be supplied with each run (e.g., from a batch manifest).
+# All values are kept as strings so they can be read directly from file.
+#    overwrite      :  replace preexisting results with the same jobname (yes/no)
+#    keep_workspace :  keep the MODFLOW run workspace, <results>/model_run,
+#                      after a successful run (yes/no)
+#    wellpkg_mode   :  inline   = stress period 1 wells are copied into
+#                                 the wel file for both stress periods
+#                      external = stress period 1 wells are read by MODFLOW
+#                                 from a shared file (OPEN/CLOSE). Not the
+#                                 default until its results have been
+#                                 compared with those of inline
+#    use_cache      :  reuse the outputs of stages whose inputs have not
+#                      changed since an earlier run (yes/no)
+#    cache_size_gb  :  size limit of the stage cache; least recently used
+#                      results are removed first
+#    screen_matrix  :  response matrix file (see src/screening). When given,
+#                      the changes in flow and lake heads are estimated from
+#                      the matrix instead of running MODFLOW. No GIS
+#                      results are written, so arcpy is not loaded
+#                      with locate_wells=numpy
+#    screen_max_distance :  wells farther than this many model cells from
+#                      every location of the response matrix in their
+#                      layer are not screened (the screening fails)
+#    stress_periods :  2 = simulate the baseline (stress period 1) and the
+#                          new wells (stress period 2) in one MODFLOW run
+#                      1 = simulate the baseline on its own (reused from the
+#                          stage cache) and the new wells as a one-stress
+#                          period run
+#    locate_wells   :  arcpy = intersect the wells with the grid feature
+#                              class in ArcGIS
+#                      numpy = find the model cells of the wells with
+#                              utilities/grid_index.py, without ArcGIS.
+#                              Not the default until its cells have been
+#                              compared with those of arcpy
+#    gis_backend    :  arcpy      = add the well locations and the head
+#                                   change tables to the geodatabase,
+#                                   results_gis/cup.gdb
+#                      geopackage = write them, and the lake heads, to a
+#                                   GeoPackage, results_gis/cup.gpkg,
+#                                   without ArcGIS (the model cells are
+#                                   shared, in cache/grid_store)
+#                      none       = no GIS output (reports only)
+#                      arcpy is not loaded with geopackage or none and
+#                      locate_wells=numpy
+#    dh_rasters     :  tif  = write the change in heads of the mapped layers
+#                             as GeoTIFF rasters, results_gis/dh_rasters
+#                      asc  = as ESRI ASCII grids; only for a grid
+#                             without rotation, so not for the NFSEG
+#                             grid (rotated 25 degrees)
+#                      none = no rasters
+#                      Left out, with a warning, if the grid definition
+#                      file is missing and arcpy is not available
+#    flux_source    :  listing = read the budget and the RIVER, DRAIN and
+#                                GHB fluxes from the listing file
+#                      cbc     = read them from the binary cell-by-cell
+#                                budget file, nfseg_auto.cbb
+#    heads_reader   :  numpy   = read the binary heads file with
+#                                process_heads/modflow_heads_file.py
+#                      fortran = nfseg_extract_modelwide_and_lake_hds.exe
+#    modflow_timeout_min :  stop MODFLOW if it runs longer than this many
+#                      minutes (0 = no limit)
+#    modflow_adapter :  how to run MODFLOW: the name of an adapter file in
+#                      input_and_definition_files/modflow (mfnwt_jd,
+#                      mfnwt, fake_modflow) or the PATH to one
+#    postproc_processes :  number of worker processes for the postprocessing
+#                      after MODFLOW (budget, flow and heads reports run
+#                      side by side; 1 = one after another)
+RUN_OPTION_DEFAULTS = {'overwrite':'yes',
+                       'keep_workspace':'no',
+                       'wellpkg_mode':'inline',
+                       'use_cache':'yes',
+                       'cache_size_gb':'20',
+                       'stress_periods':'2',
+                       'screen_matrix':'',
+                       'screen_max_distance':'5',
+                       'locate_wells':'arcpy',
+                       'gis_backend':'arcpy',
+                       'dh_rasters':'tif',
+                       'flux_source':'listing',
+                       'heads_reader':'numpy',
+                       'modflow_timeout_min':'360',
+                       'modflow_adapter':'mfnwt_jd',
+                       'postproc_processes':'3'}
+
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 #
-# MAIN PROGRAM
+# FUNCTIONS
 #
 #xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
 
-# Print the banner
-mydef.introbanner()
-
 
-usermessage_1 = 'Please supply an input csv file name: '
-usermessage_rest = 'More? Please supply another input csv file name (input "exit" if done): '
-
-loopcount = 0
-continueloop = True
-
-exit_message = ['exit','EXIT','Exit']
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Merge User supplied run options with the defaults
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
 
-while continueloop:
-    
-    # Increment the tracker
-    loopcount = loopcount + 1
+def get_run_options(options=None):
     
-    # ---------------------------------------
-    # Receive user input from the command-line
-    #     ARG_1 = USER_SUPPLIED_INPUT_FILE
-    #     ARG_2 = SRWMD or SJRWMD
-    # * SRWMD or SJRWMD use different map projections.
-    # * The User should select the option that matches
-    # * the map projection used when obtaining
-    # * the X,Y coordinats of the potential wells.
-    #
-    # NOTE: PROGRAM WILL EXIT WHEN USER
-    #       SPECIFIES AN exit_message
-    # ---------------------------------------
-    # SET INPUT_FILE=sim_cup_input_DD_MSDOS.csv
-    # SET INPUT_FILE="sim_cup_input_DD.csv"
+    run_options = dict(RUN_OPTION_DEFAULTS)
     
-    if (loopcount==1): INPUT_FILE = raw_input(usermessage_1)
-    elif (loopcount>1):
-        INPUT_FILE = raw_input(usermessage_rest)
-    #
+    if options is None: return run_options
     
-    # Set continueloop = False if an exit message was input
-    for iexit in exit_message:
-        if (INPUT_FILE==iexit):
-            continueloop = False
-            break
+    for key in options:
+        if key not in RUN_OPTION_DEFAULTS:
+            error_message = ('\nERROR:\tThe run option, ' + key +
+                             ', is not recognized.\n' +
+                             '\tOptions are: ' + ', '.join(sorted(RUN_OPTION_DEFAULTS)) + '\n\n')
+            raise ValueError(error_message)
         # END if
-    # END for over item
-    
-    # Check if we need to break out of the while loop
-    if not continueloop: break
+        run_options[key] = str(options[key]).strip()
+    # END for over key
     
+    return run_options
+
+def option_is_true(value):
+    return (str(value).strip().lower() in ['y','yes','true','1','on'])
+
+def get_modflow_timeout(run_options):
+    """ MODFLOW time limit in seconds, or None for no limit """
+    minutes = float(run_options['modflow_timeout_min'])
+    if (minutes <= 0.): return None
+    return minutes*60.
+
+def get_modflow_adapter_file(run_options):
+    """ The adapter file of the modflow_adapter option """
+    if os.path.isfile(run_options['modflow_adapter']): return os.path.abspath(run_options['modflow_adapter'])
+    return os.path.join(cur_working_dir,'input_and_definition_files','modflow',
+                        run_options['modflow_adapter'] + '.txt')
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Parse the input file to construct the jobname
+# and the results directory name
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def get_results_dirname(INPUT_FILE):
     
-    # =====================================================
-    # Parse input file to construct output report filenames
-    # Define the log file name
-    # =====================================================
     # Remove the extension from the filename and capture the basename
     # A '.' is put back in for all other (non-suffix) components that are split
     # The base filename gets extracted from the path if the input file
@@ -150,87 +253,379 @@ while continueloop:
     results_dirname = (basename + '_results')
     results_dirname = os.path.join(results_main_dir,results_dirname)
     
-    # Ask before creating a new results directory
-    usermessage_2 = '\nPrexisting results with the jobname {} will be overwritten. Proceed? ( Y = yes , N = no )\n'.format(results_dirname)
-    OVERWRITE = 'Y'
-    OVERWRITE = raw_input(usermessage_2)
-    if (OVERWRITE=='N' or OVERWRITE=='n' or OVERWRITE=='no' or OVERWRITE=='NO' or OVERWRITE=='No'):
-        # Give the user a message and move to a new iteration
-        print ('\n\nSkipping this job and moving to the next...\n\n')
-        continue
-    elif (OVERWRITE=='Y' or OVERWRITE=='y' or OVERWRITE=='yes' or OVERWRITE=='YES' or OVERWRITE=='Yes'):
-        print ('\n\nCreating or replacing {}\n\n'.format(results_dirname))
-        if os.path.isdir(results_dirname):
-            # The directory already exists -- replace it
-            shutil.rmtree(results_dirname,ignore_errors=True)
-            try:
-                # Sometimes the deletion takes too long and throws an error
-                # when making a new directory...
-                # This try statement slows it down to finish removing
-                # the directory before trying again to make it.
-                os.mkdir(results_dirname)
-            except WindowsError as wexc: # !!! May need to correct this PMB
-                #WindowsError: [Error 183] Cannot create a file when that file already exists:
+    return basename, results_dirname
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Create or replace the results directory
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def make_results_dir(results_dirname):
+    
+    if os.path.isdir(results_dirname):
+        # The directory already exists -- replace it
+        shutil.rmtree(results_dirname,onerror=bscut.remove_readonly)
+        try:
+            # Sometimes the deletion takes too long and throws an error
+            # when making a new directory...
+            # This try statement slows it down to finish removing
+            # the directory before trying again to make it.
+            os.mkdir(results_dirname)
+        except WindowsError as wexc: # !!! May need to correct this PMB
+            #WindowsError: [Error 183] Cannot create a file when that file already exists:
+            # Try deleting again
+            shutil.rmtree(results_dirname,onerror=bscut.remove_readonly)
+            os.mkdir(results_dirname)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+            else:
                 # Try deleting again
-                shutil.rmtree(results_dirname,ignore_errors=True)
+                shutil.rmtree(results_dirname,onerror=bscut.remove_readonly)
                 os.mkdir(results_dirname)
-            except OSError as exc:
-                if exc.errno != errno.EEXIST:
-                    raise
-                else:
-                    # Try deleting again
-                    shutil.rmtree(results_dirname,ignore_errors=True)
-                    os.mkdir(results_dirname)
-                #
             #
-        elif not os.path.isdir(results_dirname):
-            # The directory doesn't exist, make it now
-            os.mkdir(results_dirname)
         #
+    elif not os.path.isdir(results_dirname):
+        # The directory doesn't exist, make it now
+        os.mkdir(results_dirname)
+    #
+    
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Execute MODFLOW in a private workspace and copy the
+# results to the postprocessing directories
+#
+# The shared model directory is only read. Its input
+# files are linked into workspace_dir, so concurrent
+# runs (see sim_cup_batch.py) do not interfere.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def execute_model(wel_file, wel_external_files, model_dir, mfexe_dir, workspace_dir,
+                  output_files, keep_workspace, logfile, stress_period=None, timeout=None,
+                  adapter_file=None):
+    
+    currentmessage = ('\n\nExecuting model . . .\n' +
+                      '\t--- first stage the model files in a run workspace ---\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    
+    nam_fname = 'nfseg_auto_2009.nam'
+    
+    workspace = model_workspace.ModelWorkspace(model_dir, workspace_dir, nam_fname, logfile)
+    workspace.stage()
+    
+    # Run only one of the stress periods (single-stress-period mode)
+    if stress_period is not None: workspace.make_single_stress_period(stress_period)
+    
+    # Add the new wel file, and the shared files it references, to the workspace
+    workspace.add_file(wel_file, 'nfseg_auto.wel')
+    for external_file in wel_external_files:
+        workspace.add_file(external_file, os.path.basename(external_file))
+    #
+    
+    currentmessage = ('\nExecuting modflow. This may take a few moments . . .\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    
+    nam_file = workspace.path(nam_fname)
+    
+    # The MODFLOW executable and how it is run
+    if adapter_file is not None:
+        adapter = modflow_adapter.read_adapter_file(adapter_file)
     else:
-        print ('\n\nOption not recognized, please try again...\n\n')
+        adapter = None
+    #
+    
+    # The workspace is kept when MODFLOW fails for troubleshooting
+    if not bscut.modflow(mfexe_dir,workspace.workspace_dir,nam_file,logfile,timeout,adapter): return False
+    
+    # Link MODFLOW results to the results directories. Hard
+    # links, not symbolic links: the workspace is removed next
+    for fname, file_out in output_files:
+        try:
+            bscut.link_or_copy(workspace.path(fname), file_out, symlink=False)
+        except (IOError, OSError) as err:
+            error_message = ('\nERROR:\tUnable to copy the MODFLOW output file, ' +
+                             workspace.path(fname) + '\n\t{}\n\n'.format(err))
+            print (error_message)
+            run_logger.log(logfile, error_message)
+            return False
+        # end try
+    #
+    
+    if not keep_workspace: workspace.cleanup()
+    
+    return True
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Combine the baseline (stress period 1) and scenario
+# results of the single-stress-period mode into the
+# listing and heads files of a two-stress period run
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def combine_baseline_results(baseline_dir, scenario_dir, results_postproc_dQ,
+                             results_postproc_dh, listfile, logfile, cbcfile=None):
+    
+    currentmessage = ('\nCombining the baseline and scenario results . . .\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    
+    sngsp.combine_listing_files(os.path.join(baseline_dir,'nfseg_auto.lst'),
+                                os.path.join(scenario_dir,'nfseg_auto.lst'),
+                                listfile)
+    
+    bscut.link_or_copy(listfile, os.path.join(results_postproc_dQ,'nfseg_auto.lst'), symlink=False)
+    
+    sngsp.combine_heads_files(os.path.join(baseline_dir,'nfseg_auto.hds'),
+                              os.path.join(scenario_dir,'nfseg_auto.hds'),
+                              os.path.join(results_postproc_dh,'nfseg_auto.hds'))
+    
+    if cbcfile is not None:
+        modflow_cbc_reader.combine_budget_files(os.path.join(baseline_dir,'nfseg_auto.cbb'),
+                                                os.path.join(scenario_dir,'nfseg_auto.cbb'),
+                                                cbcfile)
+    #
+    
+    return True
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Add the MODFLOW stages of the single-stress-period
+# mode to a pipeline: baseline Well Package and
+# baseline run (both reused from the stage cache),
+# scenario run, and the combined results
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def add_single_period_model_stages(pipeline, wel_file, model_dir, mfexe_dir,
+                                   preproc_deffiles_wellpkg_update, results_dirname,
+                                   results_postproc_dQ, results_postproc_dh, listfile,
+                                   run_options, logfile, cbcfile=None):
+    
+    model_workspace_dir = os.path.join(results_dirname,'model_run')
+    wellpkg_header = os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_header_nfseg.asc')
+    wellpkg_sp1_records = os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_stress_period_01_records_nfseg.asc')
+    
+    # The baseline is the same for every run: with the stage cache it
+    # is simulated once for each version of the model and well files
+    baseline_dir = os.path.join(results_dirname,'model_baseline')
+    scenario_dir = os.path.join(results_dirname,'model_scenario')
+    baseline_wel_file = os.path.join(baseline_dir,'nfseg_auto.wel')
+    for dirname in [baseline_dir, scenario_dir]:
+        if not os.path.isdir(dirname): os.makedirs(dirname)
     #
     
+    # MODFLOW output files kept from the baseline and scenario runs
+    model_output_fnames = ['nfseg_auto.lst', 'nfseg_auto.hds']
+    if cbcfile is not None: model_output_fnames.append('nfseg_auto.cbb')
+    
+    adapter_file = get_modflow_adapter_file(run_options)
+    
+    pipeline.add(stage_cache.Stage('baseline_wellpkg',
+                                   create_two_stress_period_wellpkg_input_file.main,
+                                   args=[baseline_wel_file, preproc_deffiles_wellpkg_update,
+                                         baseline_dir, logfile],
+                                   kwargs={'mode':run_options['wellpkg_mode'],
+                                           'stress_periods':1,
+                                           'new_wells':False},
+                                   inputs=[wellpkg_header, wellpkg_sp1_records],
+                                   outputs=[baseline_wel_file],
+                                   params={'mode':run_options['wellpkg_mode']},
+                                   message=('\nCreating the baseline (stress period 1) wellpkg . . .\n')))
+    
+    pipeline.add(stage_cache.Stage('baseline_modflow',
+                                   execute_model,
+                                   args=[baseline_wel_file, stage_cache.StageResult('baseline_wellpkg'),
+                                         model_dir, mfexe_dir, model_workspace_dir,
+                                         [(fname,os.path.join(baseline_dir,fname)) for fname in model_output_fnames],
+                                         option_is_true(run_options['keep_workspace']),
+                                         logfile],
+                                   kwargs={'stress_period':1,
+                                           'timeout':get_modflow_timeout(run_options),
+                                           'adapter_file':adapter_file},
+                                   inputs=[baseline_wel_file, stage_cache.StageResult('baseline_wellpkg'), model_dir,
+                                           adapter_file],
+                                   outputs=[os.path.join(baseline_dir,fname) for fname in model_output_fnames],
+                                   params={'stress_period':1},
+                                   message=('\nSimulating the baseline (stress period 1) . . .\n')))
+    
+    pipeline.add(stage_cache.Stage('modflow',
+                                   execute_model,
+                                   args=[wel_file, stage_cache.StageResult('wellpkg'),
+                                         model_dir, mfexe_dir, model_workspace_dir,
+                                         [(fname,os.path.join(scenario_dir,fname)) for fname in model_output_fnames],
+                                         option_is_true(run_options['keep_workspace']),
+                                         logfile],
+                                   kwargs={'stress_period':2,
+                                           'timeout':get_modflow_timeout(run_options),
+                                           'adapter_file':adapter_file},
+                                   inputs=[wel_file, stage_cache.StageResult('wellpkg'), model_dir,
+                                           adapter_file],
+                                   outputs=[os.path.join(scenario_dir,fname) for fname in model_output_fnames],
+                                   params={'stress_period':2}))
+    
+    pipeline.add(stage_cache.Stage('combine_baseline',
+                                   combine_baseline_results,
+                                   args=[baseline_dir, scenario_dir, results_postproc_dQ,
+                                         results_postproc_dh, listfile, logfile],
+                                   kwargs={'cbcfile':cbcfile},
+                                   inputs=([os.path.join(baseline_dir,fname) for fname in model_output_fnames] +
+                                           [os.path.join(scenario_dir,fname) for fname in model_output_fnames]),
+                                   outputs=[os.path.join(results_postproc_dQ,'nfseg_auto.lst'),
+                                            os.path.join(results_postproc_dh,'nfseg_auto.hds'),
+                                            listfile] + ([cbcfile] if cbcfile is not None else [])))
+    
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Report the results files at the end of a run
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def finalize_run(results_dirname, output_fnames, logfile):
+    
+    currentmessage = ('\n\nResults directory location and name:\n\t' +
+                      results_dirname + '\n\n'
+                      'CSV filenames output to results directory:\n\t' +
+                      '\n\t'.join(output_fnames) + '\n\n' +
+                      'Log output written to:\n\t' +
+                      logfile)
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    
+    
+    currentmessage = ('\n\n\n' +
+                      '\t\txoxoxoxoxoxoxoxoxoxoxoxox\n\n' +
+                      '\t\t-- PROCESSING COMPLETE --\n\n' +
+                      '\t\txoxoxoxoxoxoxoxoxoxoxoxox\n\n\n' +
+                      'If no Error or Warning messages appeared ' +
+                      'then the simulation was successful!\n\n\n')
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
+    
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Process a single User input file from start to finish
+#
+# Inputs:
+#    - INPUT_FILE     the User supplied well input csv file
+#    - PROJECTION     SRWMD, SJRWMD, 1 or 2
+#    - options        dict of run options (see RUN_OPTION_DEFAULTS)
+#
+# Returns True when the run finished, False otherwise.
+# Error messages are written to the run logfile.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def run_cup_simulation(INPUT_FILE, PROJECTION, options=None):
+    
+    # The run log is buffered (utilities/run_logger.py)
+    # and the stages are timed (utilities/run_trace.py);
+    # write them out however the run ends
+    trace = run_trace.RunTrace(ntpath.basename(INPUT_FILE))
+    try:
+        with trace.span('run', 'run') as span_info:
+            success = simulate_input_file(INPUT_FILE, PROJECTION, options, trace)
+            if not success: span_info['status'] = 'failed'
+        #
+        return success
+    finally:
+        if trace.trace_file is not None: trace.write()
+        run_logger.stop_all()
+    # end try
+
+def simulate_input_file(INPUT_FILE, PROJECTION, options=None, trace=None):
+    
+    run_options = get_run_options(options)
+    
+    # =====================================================
+    # Parse input file to construct output report filenames
+    # Define the log file name
+    # =====================================================
+    basename, results_dirname = get_results_dirname(INPUT_FILE)
+    
+    if (os.path.isdir(results_dirname) and not option_is_true(run_options['overwrite'])):
+        # Give the user a message and move on
+        print ('\n\nResults for {} already exist. Skipping this job...\n\n'.format(results_dirname))
+        return False
+    #
+    
+    print ('\n\nCreating or replacing {}\n\n'.format(results_dirname))
+    make_results_dir(results_dirname)
+    
     # Name the logfile that will capture all events
     # Replace existing logfile or start a new one
     logfile = (os.path.join(results_dirname, (basename+'.log') ) )
     if os.path.isfile(logfile): os.remove(logfile)
+    if os.path.isfile(os.path.join(results_dirname, (basename+'.jsonl'))):
+        os.remove(os.path.join(results_dirname, (basename+'.jsonl')))
+    run_logger.start(logfile)
+    
+    # Stage timing tables (see run_trace.py)
+    if trace is not None:
+        trace.trace_file = os.path.join(results_dirname, (basename+'_trace.json'))
+        trace.summary_file = os.path.join(results_dirname, (basename+'_stage_times.csv'))
     # -----------------------------------------------------
     
     
     # Start log file with the banner
-    with open(logfile,'a') as lf: lf.write('{}\n'.format(mydef.logbanner()))
+    run_logger.log(logfile, '{}\n'.format(mydef.logbanner()))
     
     
     # Check that the User-Input filename exists
-    # Print the ERROR and Move to the next loop iteration
-    # if there is a problem
+    # Print the ERROR and return if there is a problem
     try:
         mydef.checkfileexist(INPUT_FILE)
     except ValueError as VError:
         #raise
         print ('\n{}'.format(VError))
-        with open(logfile,'a') as lf: lf.write('\n{}'.format(VError))
-        continue # Continue to next iteration
+        run_logger.log(logfile, '\n{}'.format(VError))
+        return False
     else:
         pass
     # end try
-
-    PROJECTION = raw_input('\nPlease input the map projection type used - in all caps - or the associated number\n' +
-                        '(options are 1=SRWMD or 2=SJRWMD. Different names result in a poetic exit): ')
-    # PROJECTION = raw_input("Please input the map projection type used in all caps (options are SRWMD or SJRWMD. Different names result in a poetic exit): ")
-    # PROJECTION = 'SRWMD'
-
-    ALLOWED_PROJ = ['SRWMD','SJRWMD','1','2']
-
+    
     # Check that the user supplied an acceptable PROJECTION
     try:
         mydef.projcheck(PROJECTION,ALLOWED_PROJ)
     except ValueError as VError:
         #raise
         print ('\n{}'.format(VError))
-        with open(logfile,'a') as lf: lf.write('\n{}'.format(VError))
-        continue # Continue to next iteration
+        run_logger.log(logfile, '\n{}'.format(VError))
+        return False
     else:
         # Incase of numeral input, reset the PROJECTION to appropriate district name
         if (PROJECTION == '1'): PROJECTION = 'SRWMD'
@@ -239,7 +634,7 @@ while continueloop:
         currentmessage = ('\nUser supplied input file:  ' + INPUT_FILE +
                           '\nProjection type:  ' + PROJECTION + '\n\n')
         print (currentmessage)
-        with open(logfile,'a') as lf: lf.write(currentmessage)
+        run_logger.log(logfile, currentmessage)
     # end if
 
     # Set the map projection based on the user option
@@ -251,6 +646,7 @@ while continueloop:
     # =======================================
     
     
+
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     #
     # SETUP THE NEW RESULTS DIRECTORY AND ASSIGN PATHs
@@ -260,8 +656,8 @@ while continueloop:
     # Copy the input file to the results directory
     currentmessage = ('\n\nCopy the User input file:\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    if not (bscut.copyfile(INPUT_FILE, os.path.join(results_dirname,ntpath.basename(INPUT_FILE)), logfile)): continue
+    run_logger.log(logfile, currentmessage)
+    if not (bscut.copyfile(INPUT_FILE, os.path.join(results_dirname,ntpath.basename(INPUT_FILE)), logfile)): return False
     
     
     # =====================================================
@@ -281,6 +677,13 @@ while continueloop:
     # Process heads executable directory
     phexe_dir = os.path.join(cur_working_dir,'src','process_heads')
     
+    # Stage cache directory (shared by all runs)
+    cache_dir = os.path.join(cur_working_dir,'cache')
+    
+    # Artifact store of the stage cache; also keeps the extracted
+    # geodatabase
+    artifacts = artifact_store.ArtifactStore(os.path.join(cache_dir,'objects'))
+    
     # Preprocessing working directory
     preproc_cwd = os.path.join(cur_working_dir,'preproc','wellpkg_update')
     #preproc_cwd = os.path.join(cur_working_dir,'results')
@@ -303,6 +706,11 @@ while continueloop:
     #
     #preproc_deffiles_wellpkg_update = os.path.join(preproc_deffiles_dir,'wellpkg_update.zip')
     preproc_deffiles_wellpkg_update = os.path.join(preproc_deffiles_dir,'wellpkg_update')
+    #
+    # Grid origin, rotation and cell size for locate_wells=numpy,
+    # the dh rasters and the GeoPackage. Derived again from the
+    # grid feature class (with arcpy) only if it is missing.
+    preproc_deffiles_grid_definition = os.path.join(preproc_deffiles_dir,'nfseg_v1_1_grid_definition.txt')
     
     postproc_deffiles_dir = os.path.join(input_def_file_loc,'postproc')
     #
@@ -378,18 +786,18 @@ while continueloop:
     input_countrol_file_n_path = os.path.join(results_postproc_dh,input_countrol_file)
     if not (bscut.copyfile(os.path.join(postproc_deffiles_dh,input_countrol_file),
                            input_countrol_file_n_path,
-                           logfile)): continue
+                           logfile)): return False
     #
     # Copy some Reference Lake list files to the output directory for the User
     if not (bscut.copyfile(os.path.join(postproc_deffiles_lakef,'WaterBodiesFromJohnGoodList.csv'),
                            os.path.join(results_postproc_dh,'WaterBodiesFromJohnGoodList.csv'),
-                           logfile)): continue
+                           logfile)): return False
     if not (bscut.copyfile(os.path.join(postproc_deffiles_lakef,'WaterBodiesFromTreyList.csv'),
                            os.path.join(results_postproc_dh,'WaterBodiesFromTreyList.csv'),
-                           logfile)): continue
+                           logfile)): return False
     if not (bscut.copyfile(os.path.join(postproc_deffiles_lakef,'WaterBodiesFromVitoList.csv'),
                            os.path.join(results_postproc_dh,'WaterBodiesFromVitoList.csv'),
-                           logfile)): continue
+                           logfile)): return False
     #
     
     
@@ -397,17 +805,17 @@ while continueloop:
     os.mkdir(results_postproc_dQ)
     if not (bscut.copyfile(os.path.join(postproc_deffiles_dQ,'gaged_reach_definitions.csv'),
                            os.path.join(results_postproc_dQ,'gaged_reach_definitions.csv'),
-                           logfile)): continue
+                           logfile)): return False
     # The shelf file can be referenced from the deffiles location -- no need to copy
     #if not (bscut.copyfile(os.path.join(postproc_deffiles_dQ,'lookup_bc_reach_ids_auto.shelf'),
     #                       os.path.join(results_postproc_dQ,'lookup_bc_reach_ids_auto.shelf'),
     #                       logfile)): continue
     if not (bscut.copyfile(os.path.join(postproc_deffiles_dQ,'station_number_and_names_20210218.csv'),
                            os.path.join(results_postproc_dQ,'station_number_and_names_20210218.csv'),
-                           logfile)): continue
+                           logfile)): return False
     if not (bscut.copyfile(os.path.join(postproc_deffiles_dQ,'upstream_gage_numbers.csv'),
                            os.path.join(results_postproc_dQ,'upstream_gage_numbers.csv'),
-                           logfile)): continue
+                           logfile)): return False
     
     
     # ---------------
@@ -415,14 +823,20 @@ while continueloop:
     #----------------
     os.mkdir(results_gis)
     
-    with zipfile.ZipFile(gis_ref_cupgdb,'r') as zip_ref:
-        zip_ref.extractall(results_gis)
+    # Extracted once into the artifact store, then reflinked or
+    # copied (the geodatabase is written to, so it is never
+    # hard linked). Only needed where arcpy writes to it, or to
+    # derive the grid definition. Screening writes no GIS results.
+    if ((run_options['gis_backend'] == 'arcpy' and not run_options['screen_matrix'])
+        or run_options['locate_wells'] == 'arcpy'
+        or not os.path.isfile(preproc_deffiles_grid_definition)):
+        artifacts.extract(gis_ref_cupgdb, results_gis, writable=True)
     #
     
     # Copy template dh.mxd to results directory
     if not (bscut.copyfile(os.path.join(gis_dir,gis_ref_mxd),
                            os.path.join(results_gis,gis_ref_mxd),
-                           logfile)): continue
+                           logfile)): return False
     
     os.mkdir(results_gisproj)
     # Define the name for a new set of grid feature classes
@@ -435,10 +849,10 @@ while continueloop:
     # Copy relevant projection files to the new results directory
     if not (bscut.copyfile(os.path.join(gis_ref_projections,(mapproj+'.prj')),
                            mapprojection,
-                           logfile)): continue
+                           logfile)): return False
     if not (bscut.copyfile(os.path.join(gis_ref_projections,(grid_featureclass_name+'.prj')),
                            grid_featureclass_proj,
-                           logfile)): continue
+                           logfile)): return False
     
     # _____________________________________________________
     # -----------------------------------------------------
@@ -467,7 +881,7 @@ while continueloop:
                       DQ_summary_out_fname + '\n\t' +
                       D_global_budget_out_fname + '\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     
     # Delete previous versions of the output files, if they exist
@@ -478,234 +892,485 @@ while continueloop:
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     #
-    # PREPROCESS
+    # DEFINE THE PIPELINE STAGES
+    #
+    # Every step is declared with the files it reads and writes. The
+    # stages are run in order by a StageGraph. When use_cache is set, a
+    # stage whose inputs and parameters match a previous run restores
+    # its outputs from the cache instead of running again.
     #
     #xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
     
+    if option_is_true(run_options['use_cache']):
+        cache = stage_cache.StageCache(cache_dir, run_options['cache_size_gb'])
+    else:
+        cache = None
+    #
+    if (run_options['stress_periods'] not in ['1','2']):
+        error_message = ('\nERROR:\tstress_periods must be 1 or 2, not ' +
+                         run_options['stress_periods'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    stress_periods = int(run_options['stress_periods'])
+    #
+    if (run_options['locate_wells'] not in gis_backends.get_backends('locate_wells')):
+        error_message = ('\nERROR:\tlocate_wells must be numpy or arcpy, not ' +
+                         run_options['locate_wells'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    if (run_options['gis_backend'] not in ['none'] + gis_backends.get_backends('gis_tables')):
+        error_message = ('\nERROR:\tgis_backend must be arcpy, geopackage or none, not ' +
+                         run_options['gis_backend'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    if (run_options['dh_rasters'] not in ['none'] + sorted(dh_rasters.RASTER_FORMATS)):
+        error_message = ('\nERROR:\tdh_rasters must be tif, asc or none, not ' +
+                         run_options['dh_rasters'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    if (run_options['flux_source'] not in ['listing','cbc']):
+        error_message = ('\nERROR:\tflux_source must be listing or cbc, not ' +
+                         run_options['flux_source'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    try:
+        get_modflow_timeout(run_options)
+    except ValueError:
+        error_message = ('\nERROR:\tmodflow_timeout_min must be a number of minutes, not ' +
+                         run_options['modflow_timeout_min'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    try:
+        modflow_adapter.read_adapter_file(get_modflow_adapter_file(run_options))
+    except (IOError, ValueError) as err:
+        error_message = ('\nERROR:\tUnable to read the MODFLOW adapter, ' +
+                         run_options['modflow_adapter'] + '\n\t{}\n\n'.format(err))
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    if not (run_options['postproc_processes'].isdigit() and int(run_options['postproc_processes']) > 0):
+        error_message = ('\nERROR:\tpostproc_processes must be a positive whole number, not ' +
+                         run_options['postproc_processes'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    try:
+        screen_max_distance = float(run_options['screen_max_distance'])
+        if (screen_max_distance < 0): raise ValueError
+    except ValueError:
+        error_message = ('\nERROR:\tscreen_max_distance must be a number of model cells, not ' +
+                         run_options['screen_max_distance'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    if (run_options['heads_reader'] not in ['numpy','fortran']):
+        error_message = ('\nERROR:\theads_reader must be numpy or fortran, not ' +
+                         run_options['heads_reader'] + '\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    # The grid definition, used by locate_wells=numpy, the dh
+    # rasters and the GeoPackage, is shipped with the definition
+    # files. If it is missing, it can only be derived from the grid
+    # feature class with arcpy (the grid_definition stage below).
+    # The dh rasters are extra results: without the grid definition
+    # and arcpy they are left out, not the run.
+    derive_grid_definition = False
+    write_dh_rasters = (run_options['dh_rasters'] != 'none')
+    if not os.path.isfile(preproc_deffiles_grid_definition):
+        needs_grid = (run_options['locate_wells'] == 'numpy' or run_options['gis_backend'] == 'geopackage')
+        if gis_backends.is_available('arcpy'):
+            if (needs_grid or write_dh_rasters):
+                derive_grid_definition = True
+                currentmessage = ('\nWARNING:\tThe model grid definition file, ' + preproc_deffiles_grid_definition +
+                                  ', is missing. It will be derived from the grid feature class with arcpy.\n')
+                print (currentmessage)
+                run_logger.log(logfile, currentmessage)
+            # END if
+        elif needs_grid:
+            error_message = ('\nERROR:\tThe model grid definition file, ' + preproc_deffiles_grid_definition +
+                             ', is missing, and it cannot be derived from the grid feature class ' +
+                             'without arcpy. It is needed for locate_wells=numpy and ' +
+                             'gis_backend=geopackage.\n\n')
+            print (error_message)
+            run_logger.log(logfile, error_message)
+            return False
+        elif write_dh_rasters:
+            write_dh_rasters = False
+            currentmessage = ('\nWARNING:\tThe model grid definition file, ' + preproc_deffiles_grid_definition +
+                              ', is missing, and it cannot be derived without arcpy. The dh rasters ' +
+                              'will not be written.\n')
+            print (currentmessage)
+            run_logger.log(logfile, currentmessage)
+        # END if
+    # END if
+    #
+    # An ESRI ASCII grid cannot be rotated, and the NFSEG grid is
+    if (write_dh_rasters and run_options['dh_rasters'] == 'asc' and
+        os.path.isfile(preproc_deffiles_grid_definition) and
+        grid_index.GridIndex.read(preproc_deffiles_grid_definition).rotation != 0.):
+        error_message = ('\nERROR:\tdh_rasters=asc needs a grid without rotation, and the grid in ' +
+                         preproc_deffiles_grid_definition + ' is rotated. Use dh_rasters=tif ' +
+                         '(GeoTIFF keeps the rotation) or none.\n\n')
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        return False
+    #
+    if (stress_periods == 1 and cache is None):
+        currentmessage = ('\nWARNING:\tThe stage cache is off, so the baseline is simulated ' +
+                          'again for this run (stress_periods=1)\n')
+        print (currentmessage)
+        run_logger.log(logfile, currentmessage)
+    #
+    #
+    pipeline = stage_cache.StageGraph(results_dirname, logfile, cache, trace,
+                                      processes=int(run_options['postproc_processes']))
+    
+    
     # =====================================================
+    # PREPROCESS
     # Process the input csv file
     # =====================================================
-
-    currentmessage = ('\n\nCreating wellpkg with cup withdrawals . . .\n\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-
-
+    
     # Define the wel file since it's used multiple times
     wel_file = os.path.join(results_preproc_wellpkg_update,'nfseg_auto.wel')
-
+    wells_to_add = os.path.join(results_preproc_wellpkg_update,'wells_to_add.csv')
+    preproc_cup_id_n_rate = os.path.join(results_preproc_wellpkg_update,'cup_id_and_rate.csv')
+    wellpkg_header = os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_header_nfseg.asc')
+    wellpkg_sp1_records = os.path.join(preproc_deffiles_wellpkg_update,'wellpkg_stress_period_01_records_nfseg.asc')
+    
     # Delete files that will be created again, if they exist
     bscut.deletefile(wel_file,logfile)
     bscut.deletefile(os.path.join(results_preproc_wellpkg_update,'wells_to_add.txt.xml'),logfile)
-    bscut.deletefile(os.path.join(results_preproc_wellpkg_update,'wells_to_add.csv'),logfile)
+    bscut.deletefile(wells_to_add,logfile)
     bscut.deletefile(os.path.join(results_preproc_wellpkg_update,'withdrawal_point_locations_and_rates.csv'),logfile)
-
-
-    currentmessage = ('\nStarting process_withdrawal_point_input_file.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    process_withdrawal_point_input_file.main(INPUT_FILE,results_preproc_wellpkg_update,
-                                             mydef.ConvFactors().mgd2cfd,logfile)
-
-    currentmessage = ('\nStarting update_wellpkg_nfseg_modified.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    # Argument provides the correct map projection
-    update_wellpkg_nfseg.main(mapprojection, results_preproc_wellpkg_update,
-                              results_gis, grid_featureclass_name, grid_featureclass_proj,
-                              logfile)
-
-
-
-    currentmessage = ('\nStarting create_two_stress_period_wellpkg_input_file.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    create_two_stress_period_wellpkg_input_file.main(wel_file,
-                                                     preproc_deffiles_wellpkg_update,
-                                                     results_preproc_wellpkg_update,
-                                                     logfile)
-
-    #    Finished creating well pkg.
-
-    # Print out the date and time of processing
-    print (bscut.datetime())
-    with open(logfile,'a') as lf: lf.write('{}'.format(bscut.datetime()))
-    # -----------------------------------------------------
-
-
-    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    #
-    # SETUP AND RUN MODFLOW
+    
+    pipeline.add(stage_cache.Stage('withdrawal_points',
+                                   process_withdrawal_point_input_file.main,
+                                   args=[INPUT_FILE, results_preproc_wellpkg_update,
+                                         mydef.ConvFactors().mgd2cfd, logfile],
+                                   inputs=[INPUT_FILE],
+                                   outputs=[os.path.join(results_preproc_wellpkg_update,'withdrawal_point_locations_and_rates.csv'),
+                                            preproc_cup_id_n_rate],
+                                   params={'mgd2cfd':mydef.ConvFactors().mgd2cfd},
+                                   message=('\n\nCreating wellpkg with cup withdrawals . . .\n\n' +
+                                            '\nStarting process_withdrawal_point_input_file.py . . .\n')))
+    
+    # A missing grid definition (see the checks above) is derived
+    # from the grid feature class before the stages that read it,
+    # which depend on it through their inputs.
+    # Not cacheable: writes to the definition files
+    if derive_grid_definition:
+        pipeline.add(stage_cache.Stage('grid_definition',
+                                       gis_backends.get_function('grid_definition','arcpy'),
+                                       args=[os.path.join(results_gis,'cup.gdb',grid_featureclass_name),
+                                             preproc_deffiles_grid_definition, logfile],
+                                       outputs=[preproc_deffiles_grid_definition],
+                                       cacheable=False,
+                                       message=('\n\nDeriving the model grid definition . . .\n')))
     #
-    #xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
-
-    currentmessage = ('\n\nExecuting model . . .\n' +
-                      '\t--- first delete old files (if they exist) ---\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-
-    # Delete files that will be created again, if they exist
-    bscut.deletefile(os.path.join(model_dir,'nfseg_auto.lst'),logfile)
-    bscut.deletefile(os.path.join(model_dir,'nfseg_auto.cbb'),logfile)
-    bscut.deletefile(os.path.join(model_dir,'nfseg_auto.cbw'),logfile)
-    bscut.deletefile(os.path.join(model_dir,'nfseg_auto.crc'),logfile)
-    bscut.deletefile(os.path.join(model_dir,'nfseg_auto.hds'),logfile)
-    bscut.deletefile(os.path.join(model_dir,'nfseg_auto.ddn'),logfile)
-    bscut.deletefile(os.path.join(model_dir,'nfseg_auto.wel'),logfile)
-
-    # Copy the new wel file to the model directory
-    # TODO: Change for modflow to somehow use the same file as what is output in previous step -- no duplication.
-    #       move instead of copy?
-    if not (bscut.copyfile(wel_file, os.path.join(model_dir,'nfseg_auto.wel'), logfile)): continue
-
-    currentmessage = ('\nExecuting modflow. This may take a few moments . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-
-    nam_file = os.path.join(model_dir,'nfseg_auto_2009.nam')
     
-    if not bscut.modflow(mfexe_dir,model_dir,nam_file,logfile): continue
+    # Argument provides the correct map projection
+    if (run_options['locate_wells'] == 'numpy'):
+        
+        withdrawal_points = os.path.join(results_preproc_wellpkg_update,'withdrawal_point_locations_and_rates.csv')
+        pipeline.add(stage_cache.Stage('locate_wells',
+                                       gis_backends.get_function('locate_wells','numpy'),
+                                       args=[mapprojection, results_preproc_wellpkg_update,
+                                             grid_featureclass_proj, preproc_deffiles_grid_definition,
+                                             os.path.join(results_gis,'cup.gdb',grid_featureclass_name),
+                                             logfile],
+                                       inputs=[withdrawal_points, mapprojection, grid_featureclass_proj,
+                                               preproc_deffiles_grid_definition],
+                                       outputs=[wells_to_add],
+                                       depends=['withdrawal_points'],
+                                       message=('\nStarting locate_wells_nfseg.py . . .\n')))
+        
+        # Not cacheable: the well locations are written to cup.gdb
+        # (not when screening, which writes no GIS results)
+        if (run_options['gis_backend'] == 'arcpy' and not run_options['screen_matrix']):
+            pipeline.add(stage_cache.Stage('wells_to_gdb',
+                                           gis_backends.get_function('wells_to_gdb','arcpy'),
+                                           args=[wells_to_add, results_gis, grid_featureclass_proj, logfile],
+                                           inputs=[wells_to_add],
+                                           cacheable=False))
+        #
+    else:
+        # Not cacheable: the well locations are also written to cup.gdb
+        pipeline.add(stage_cache.Stage('locate_wells',
+                                       gis_backends.get_function('locate_wells','arcpy'),
+                                       args=[mapprojection, results_preproc_wellpkg_update,
+                                             results_gis, grid_featureclass_name, grid_featureclass_proj,
+                                             logfile],
+                                       outputs=[wells_to_add],
+                                       depends=['withdrawal_points'],
+                                       cacheable=False,
+                                       message=('\nStarting update_wellpkg_nfseg_modified.py . . .\n')))
+    #
     
     # -----------------------------------------------------
+    # Screening mode: estimate the changes in flow and lake
+    # heads from the response matrix instead of running
+    # MODFLOW, and skip the rest of the pipeline
+    # -----------------------------------------------------
+    if run_options['screen_matrix']:
+        screen_wells_out_fname = basename + '_screening_wells.csv'
+        pipeline.add(stage_cache.Stage('screen',
+                                       response_matrix.main,
+                                       args=[run_options['screen_matrix'], wells_to_add,
+                                             preproc_cup_id_n_rate, DQ_summary_out,
+                                             results_postproc_dh,
+                                             os.path.join(results_dirname,screen_wells_out_fname),
+                                             screen_max_distance, logfile],
+                                       inputs=[run_options['screen_matrix'], wells_to_add,
+                                               preproc_cup_id_n_rate],
+                                       outputs=[DQ_summary_out,
+                                                os.path.join(results_dirname,screen_wells_out_fname)],
+                                       cacheable=False,
+                                       message=('\n\nScreening with the response matrix . . .\n')))
+        
+        if not pipeline.run(): return False
+        
+        finalize_run(results_dirname, [DQ_summary_out_fname, screen_wells_out_fname], logfile)
+        return True
+    # END if
     
+    # Returns the files referenced by the wel file (OPEN/CLOSE) that MODFLOW needs
+    pipeline.add(stage_cache.Stage('wellpkg',
+                                   create_two_stress_period_wellpkg_input_file.main,
+                                   args=[wel_file, preproc_deffiles_wellpkg_update,
+                                         results_preproc_wellpkg_update, logfile],
+                                   kwargs={'mode':run_options['wellpkg_mode'],
+                                           'stress_periods':stress_periods},
+                                   inputs=[wells_to_add, wellpkg_header, wellpkg_sp1_records],
+                                   outputs=[wel_file],
+                                   params={'mode':run_options['wellpkg_mode'],
+                                           'stress_periods':stress_periods},
+                                   message=('\nStarting create_two_stress_period_wellpkg_input_file.py . . .\n')))
+    # -----------------------------------------------------
     
-    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    #
-    # POSTPROCESS
-    #
-    #xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
-    
-    # Copy MODFLOW results to postprocessing directories
-    if not (bscut.copyfile(os.path.join(model_dir,'nfseg_auto.lst')
-                           ,os.path.join(results_postproc_dQ,'nfseg_auto.lst')
-                           ,logfile)): continue
     
-    if not (bscut.copyfile(os.path.join(model_dir,'nfseg_auto.hds')
-                           ,os.path.join(results_postproc_dh,'nfseg_auto.hds')
-                           ,logfile)): continue
+    # =====================================================
+    # SETUP AND RUN MODFLOW
+    # =====================================================
     
     # Define a name for the list file output from MODFLOW after it is copied
     # to the results directory
     listfile = os.path.join(results_postproc_budget,'nfseg_auto.lst')
+    # The cell-by-cell budget file is kept only when the fluxes are read from it
+    if (run_options['flux_source'] == 'cbc'):
+        cbcfile = os.path.join(results_postproc_budget,'nfseg_auto.cbb')
+    else:
+        cbcfile = None
+    #
+    
+    # Each run gets its own copy of the model directory
+    model_workspace_dir = os.path.join(results_dirname,'model_run')
+    
+    if (stress_periods == 2):
+        model_output_files = [('nfseg_auto.lst',os.path.join(results_postproc_dQ,'nfseg_auto.lst')),
+                              ('nfseg_auto.hds',os.path.join(results_postproc_dh,'nfseg_auto.hds')),
+                              ('nfseg_auto.lst',listfile)]
+        if cbcfile is not None: model_output_files.append(('nfseg_auto.cbb',cbcfile))
+        pipeline.add(stage_cache.Stage('modflow',
+                                       execute_model,
+                                       args=[wel_file, stage_cache.StageResult('wellpkg'),
+                                             model_dir, mfexe_dir, model_workspace_dir,
+                                             model_output_files,
+                                             option_is_true(run_options['keep_workspace']),
+                                             logfile],
+                                       kwargs={'timeout':get_modflow_timeout(run_options),
+                                               'adapter_file':get_modflow_adapter_file(run_options)},
+                                       inputs=[wel_file, stage_cache.StageResult('wellpkg'), model_dir,
+                                               get_modflow_adapter_file(run_options)],
+                                       outputs=[file_out for fname, file_out in model_output_files]))
+    else:
+        add_single_period_model_stages(pipeline, wel_file, model_dir, mfexe_dir,
+                                       preproc_deffiles_wellpkg_update, results_dirname,
+                                       results_postproc_dQ, results_postproc_dh, listfile,
+                                       run_options, logfile, cbcfile=cbcfile)
+    # END if
+    # -----------------------------------------------------
     
-    # The results directory
-    if not (bscut.copyfile(os.path.join(model_dir,'nfseg_auto.lst')
-                           ,listfile
-                           ,logfile)): continue
+    
+    # =====================================================
+    # POSTPROCESS
+    # =====================================================
     
     # ---------------------------------------
-    # Generate the budget check reports
+    # Read the listing file once for the
+    # budget check and the gaged-reach fluxes
     # ---------------------------------------
-
-    currentmessage = ('\n\nGenerate budget check reports . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
     
     # Name output files that will be recreated
     budoutput = D_global_budget_out
     rivfluxoutput = os.path.join(results_postproc_budget,'global_river_plus_drain_flux_changes.asc')
-    
+    gaged_reach_flux_out = os.path.join(results_postproc_dQ,'gaged_reach_fluxes.asc')
     
     # Delete files that will be created again, if they exist
     bscut.deletefile(budoutput,logfile)
     bscut.deletefile(rivfluxoutput,logfile)
     
+    pipeline.add(stage_cache.Stage('scan_listing',
+                                   modflow_listing_scanner.main,
+                                   args=[listfile, budoutput, mydef.ConvFactors().sec2day, logfile,
+                                         postproc_deffiles_dQ, results_postproc_dQ,
+                                         gaged_reach_flux_out],
+                                   kwargs={'cbcfile':cbcfile},
+                                   inputs=[listfile,
+                                           sim_q_reach_3d_auto.get_lookup_file_name(postproc_deffiles_dQ),
+                                           os.path.join(postproc_deffiles_dQ,'gaged_reach_definitions.csv')] +
+                                          ([cbcfile] if cbcfile is not None else []),
+                                   outputs=[budoutput, gaged_reach_flux_out],
+                                   params={'sec2day':mydef.ConvFactors().sec2day,
+                                           'flux_source':run_options['flux_source']},
+                                   parallel=True,
+                                   message=('\n\nGenerate budget check and flow reports . . .\n' +
+                                            '\nStarting modflow_listing_scanner.py . . .\n')))
     
-    currentmessage = ('\nStarting parse_modflow_listing_file_budget.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    parse_modflow_listing_file_budget.main(listfile, budoutput, logfile)
-    
-    currentmessage = ('\nStarting river_drain_and_ghb_flux_changes.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    river_drain_and_ghb_flux_changes.main(budoutput, rivfluxoutput, logfile)
+    # ---------------------------------------
+    # Generate the budget check reports
+    # ---------------------------------------
     
+    pipeline.add(stage_cache.Stage('river_flux_changes',
+                                   river_drain_and_ghb_flux_changes.main,
+                                   args=[budoutput, rivfluxoutput, logfile],
+                                   inputs=[budoutput],
+                                   outputs=[rivfluxoutput],
+                                   parallel=True,
+                                   message=('\nStarting river_drain_and_ghb_flux_changes.py . . .\n')))
     # =======================================
     
     
     # ---------------------------------------
     # Generate the change in flow reports
     # ---------------------------------------
-
-    currentmessage = ('\n\ngenerate simulated river and spring flux change reports . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-
+    
     # Define some intermediate output filenames
     temp_shelf = os.path.join(results_postproc_dQ,'temp.shelf')
     cup_id_n_rate = os.path.join(results_postproc_dQ,'cup_id_and_rate.csv')
+    gaged_flux_sum_output = os.path.join(results_postproc_dQ,'gaged_fluxes_sum.csv')
     
     # Delete files that will be created again, if they exist
     bscut.deletefile(temp_shelf,logfile)
     bscut.deletefile(cup_id_n_rate,logfile)
     
-    if not (bscut.copyfile(os.path.join(results_preproc_wellpkg_update,'cup_id_and_rate.csv')
-                           , cup_id_n_rate
-                           , logfile)): continue
-    
-    currentmessage = ('\nStarting sim_q_reach_3d_auto.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    gaged_reach_flux_out = os.path.join(results_postproc_dQ,'gaged_reach_fluxes.asc')
-    
-    sim_q_reach_3d_auto.main(listfile,
-                             mydef.ConvFactors().sec2day,
-                             logfile,
-                             postproc_deffiles_dQ,
-                             results_postproc_dQ,
-                             gaged_reach_flux_out)
+    pipeline.add(stage_cache.Stage('copy_cup_id_and_rate',
+                                   bscut.copyfile,
+                                   args=[preproc_cup_id_n_rate, cup_id_n_rate, logfile],
+                                   outputs=[cup_id_n_rate],
+                                   depends=['withdrawal_points'],
+                                   cacheable=False,
+                                   parallel=True,
+                                   message=('\n\ngenerate simulated river and spring flux change reports . . .\n')))
+    
+    pipeline.add(stage_cache.Stage('reach_sums',
+                                   sum_sim_q_reach.main,
+                                   args=[logfile, results_postproc_dQ,
+                                         gaged_reach_flux_out, gaged_flux_sum_output],
+                                   inputs=[gaged_reach_flux_out,
+                                           os.path.join(results_postproc_dQ,'upstream_gage_numbers.csv')],
+                                   outputs=[gaged_flux_sum_output],
+                                   parallel=True,
+                                   message=('\nStarting sum_sim_q_reach.py . . .\n')))
+    
+    pipeline.add(stage_cache.Stage('dq_report',
+                                   create_delta_q_report_PMB.main,
+                                   args=[logfile, results_postproc_dQ, cup_id_n_rate,
+                                         gaged_reach_flux_out, gaged_flux_sum_output,
+                                         DQ_summary_out],
+                                   inputs=[cup_id_n_rate, gaged_reach_flux_out, gaged_flux_sum_output,
+                                           os.path.join(results_postproc_dQ,'station_number_and_names_20210218.csv')],
+                                   outputs=[DQ_summary_out],
+                                   parallel=True,
+                                   message=('\nStarting create_delta_q_report.py . . .\n')))
+    # =======================================
     
-    currentmessage = ('\nStarting sum_sim_q_reach.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    gaged_flux_sum_output = os.path.join(results_postproc_dQ,'gaged_fluxes_sum.csv')
-#    sum_sim_q_reach.main(logfile,
-#                         postproc_deffiles_dQ,
-#                         gaged_reach_flux_out,
-#                         gaged_flux_sum_output)
-    sum_sim_q_reach.main(logfile,
-                         results_postproc_dQ,
-                         gaged_reach_flux_out,
-                         gaged_flux_sum_output)
     
-
-    currentmessage = ('\nStarting create_delta_q_report.py . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-#    create_delta_q_report.main(logfile,
-#                               postproc_deffiles_dQ,
-#                               cup_id_n_rate,
-#                               gaged_reach_flux_out,
-#                               gaged_flux_sum_output,
-#                               DQ_summary_out)
-    create_delta_q_report_PMB.main(logfile,
-                               results_postproc_dQ,
-                               cup_id_n_rate,
-                               gaged_reach_flux_out,
-                               gaged_flux_sum_output,
-                               DQ_summary_out)
-    # =======================================
-
-
     # ---------------------------------------
     # Process model-wide and area-averaged
     # lake heads and change in heads
     # ---------------------------------------
     
-    currentmessage = ('\n\nProcessing model-wide and area-averaged lake heads . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
     all_model_layers = [1,2,3,4,5,6,7]
     model_layers_to_use = [1,3,5]
     
-    dh_layer_dictionary = process_model_and_lake_heads.main(input_countrol_file_n_path,
-                                                            all_model_layers,
-                                                            model_layers_to_use,
-                                                            phexe_dir,
-                                                            postproc_deffiles_lakef,
-                                                            results_postproc_dh,
-                                                            logfile)
+    # The output filenames are set in the input control file
+    dHfile,WBfiles_in,WBfiles_out = process_model_and_lake_heads.read_input_control_file(input_countrol_file_n_path,
+                                                                                         all_model_layers)
+    heads_outputs = [os.path.join(results_postproc_dh,dHfile)]
+    for label in sorted(WBfiles_out):
+        heads_outputs.extend([os.path.join(results_postproc_dh,fname) for fname in WBfiles_out[label]])
+    #
+    heads_inputs = [input_countrol_file_n_path, os.path.join(results_postproc_dh,'nfseg_auto.hds')]
+    if (run_options['heads_reader'] == 'fortran'):
+        heads_inputs.append(os.path.join(phexe_dir,'nfseg_extract_modelwide_and_lake_hds.exe'))
+    #
+    
+    pipeline.add(stage_cache.Stage('heads',
+                                   process_model_and_lake_heads.main,
+                                   args=[input_countrol_file_n_path, all_model_layers,
+                                         model_layers_to_use, phexe_dir,
+                                         postproc_deffiles_lakef, results_postproc_dh,
+                                         logfile],
+                                   kwargs={'heads_reader':run_options['heads_reader']},
+                                   inputs=(heads_inputs +
+                                           [os.path.join(postproc_deffiles_lakef,WBfiles_in[label]) for label in sorted(WBfiles_in)]),
+                                   outputs=heads_outputs,
+                                   params={'modlayers':all_model_layers,
+                                           'uselayers':model_layers_to_use,
+                                           'heads_reader':run_options['heads_reader']},
+                                   parallel=True,
+                                   message=('\n\nProcessing model-wide and area-averaged lake heads . . .\n')))
+    # =======================================
+    
+    
+    # ---------------------------------------
+    # Rasters of the change in heads of the
+    # mapped layers, for any GIS (no join to the
+    # grid feature class). Left out if the grid
+    # definition is missing and cannot be derived
+    # (see the checks above).
+    # ---------------------------------------
+    if write_dh_rasters:
+        results_gis_rasters = os.path.join(results_gis,'dh_rasters')
+        raster_ext = dh_rasters.RASTER_FORMATS[run_options['dh_rasters']]
+        raster_outputs = [os.path.join(results_gis_rasters,'dh_lyr{0}{1}'.format(lay, raster_ext))
+                          for lay in model_layers_to_use]
+        if (run_options['dh_rasters'] == 'asc'):
+            raster_outputs.extend([os.path.join(results_gis_rasters,'dh_lyr{}.prj'.format(lay))
+                                   for lay in model_layers_to_use])
+        #
+        pipeline.add(stage_cache.Stage('dh_rasters',
+                                       dh_rasters.main,
+                                       args=[os.path.join(results_postproc_dh,'nfseg_auto.hds'),
+                                             model_layers_to_use, preproc_deffiles_grid_definition,
+                                             grid_featureclass_proj, results_gis_rasters,
+                                             run_options['dh_rasters'], logfile],
+                                       inputs=[os.path.join(results_postproc_dh,'nfseg_auto.hds'),
+                                               preproc_deffiles_grid_definition, grid_featureclass_proj],
+                                       outputs=raster_outputs,
+                                       params={'uselayers':model_layers_to_use,
+                                               'dh_rasters':run_options['dh_rasters']},
+                                       parallel=True,
+                                       message=('\n\nWriting the dh rasters . . .\n')))
+    #
     # =======================================
     
     
@@ -733,21 +1398,59 @@ while continueloop:
     # Outputs:
     #    - updated gdb
     #
+    # Not cacheable: the results are written to cup.gdb
+    #
+    # With gis_backend=geopackage the well locations,
+    # the dH fields and the lake heads are written to
+    # cup.gpkg instead (no arcpy), keyed by model
+    # cell, with dh_lyrs.vrt linking the dH to the
+    # shared cells of the grid store. Not cacheable
+    # either: writing it costs less than keeping a
+    # copy for every run.
     # ---------------------------------------
-    currentmessage = ('\n\nGenerate simulated head change maps . . .\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    make_ArcGIS_table_from_csv.main(dh_layer_dictionary,
-                                    results_postproc_dh,
-                                    results_gis,
-                                    grid_featureclass_name,
-                                    logfile)
-
-
+    if (run_options['gis_backend'] == 'arcpy'):
+        pipeline.add(stage_cache.Stage('gis',
+                                       gis_backends.get_function('gis_tables','arcpy'),
+                                       args=[stage_cache.StageResult('heads'),
+                                             results_postproc_dh, results_gis,
+                                             grid_featureclass_name, logfile],
+                                       cacheable=False,
+                                       message=('\n\nGenerate simulated head change maps . . .\n')))
+    elif (run_options['gis_backend'] == 'geopackage'):
+        lake_outputs = [os.path.join(results_postproc_dh,fname)
+                        for label in sorted(WBfiles_out) for fname in WBfiles_out[label]]
+        pipeline.add(stage_cache.Stage('gis',
+                                       gis_backends.get_function('gis_tables','geopackage'),
+                                       args=[wells_to_add, os.path.join(results_postproc_dh,'nfseg_auto.hds'),
+                                             model_layers_to_use, lake_outputs,
+                                             preproc_deffiles_grid_definition, grid_featureclass_proj,
+                                             os.path.join(cache_dir,'grid_store'),
+                                             os.path.join(results_gis,'cup.gpkg'), logfile],
+                                       inputs=[preproc_deffiles_grid_definition],
+                                       outputs=[os.path.join(results_gis,'cup.gpkg'),
+                                                os.path.join(results_gis,'dh_lyrs.vrt')],
+                                       depends=['heads'],
+                                       cacheable=False,
+                                       parallel=True,
+                                       message=('\n\nWriting the GIS results to a GeoPackage . . .\n')))
+    #
+    # =======================================
+    
+    
+    # =====================================================
+    # RUN THE PIPELINE
+    # =====================================================
+    
+    if not pipeline.run(): return False
+    
     currentmessage = ('\n\tMaps generated\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    # =======================================
+    run_logger.log(logfile, currentmessage)
+    
+    # Print out the date and time of processing
+    print (bscut.datetime())
+    run_logger.log(logfile, '{}'.format(bscut.datetime()))
+    # -----------------------------------------------------
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     #
@@ -760,28 +1463,114 @@ while continueloop:
     # Finalize the current Process Iteration
     # =====================================================
     
-    currentmessage = ('\n\nResults directory location and name:\n\t' +
-                      results_dirname + '\n\n'
-                      'CSV filenames output to results directory:\n\t' +
-                      DQ_summary_out_fname + '\n\t' +
-                      D_global_budget_out_fname + '\n\n' +
-                      'Log output written to:\n\t' +
-                      logfile)
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    finalize_run(results_dirname, [DQ_summary_out_fname, D_global_budget_out_fname], logfile)
+    # -----------------------------------------------------
+    
+    return True
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# MAIN PROGRAM
+#
+#xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxo
+
+def main():
     
+    # Print the banner
+    mydef.introbanner()
     
-    currentmessage = ('\n\n\n' +
-                      '\t\txoxoxoxoxoxoxoxoxoxoxoxox\n\n' +
-                      '\t\t-- PROCESSING COMPLETE --\n\n' +
-                      '\t\txoxoxoxoxoxoxoxoxoxoxoxox\n\n\n' +
-                      'If no Error or Warning messages appeared ' +
-                      'then the simulation was successful!\n\n\n')
-    print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
-    # -----------------------------------------------------
     
-# END while over continueloop
+    usermessage_1 = 'Please supply an input csv file name: '
+    usermessage_rest = 'More? Please supply another input csv file name (input "exit" if done): '
+    
+    loopcount = 0
+    continueloop = True
+    
+    exit_message = ['exit','EXIT','Exit']
+    
+    while continueloop:
+        
+        # Increment the tracker
+        loopcount = loopcount + 1
+        
+        # ---------------------------------------
+        # Receive user input from the command-line
+        #     ARG_1 = USER_SUPPLIED_INPUT_FILE
+        #     ARG_2 = SRWMD or SJRWMD
+        # * SRWMD or SJRWMD use different map projections.
+        # * The User should select the option that matches
+        # * the map projection used when obtaining
+        # * the X,Y coordinats of the potential wells.
+        #
+        # NOTE: PROGRAM WILL EXIT WHEN USER
+        #       SPECIFIES AN exit_message
+        #
+        # For non-interactive runs see sim_cup_batch.py
+        # ---------------------------------------
+        # SET INPUT_FILE=sim_cup_input_DD_MSDOS.csv
+        # SET INPUT_FILE="sim_cup_input_DD.csv"
+        
+        if (loopcount==1): INPUT_FILE = raw_input(usermessage_1)
+        elif (loopcount>1):
+            INPUT_FILE = raw_input(usermessage_rest)
+        #
+        
+        # Set continueloop = False if an exit message was input
+        for iexit in exit_message:
+            if (INPUT_FILE==iexit):
+                continueloop = False
+                break
+            # END if
+        # END for over item
+        
+        # Check if we need to break out of the while loop
+        if not continueloop: break
+        
+        
+        basename, results_dirname = get_results_dirname(INPUT_FILE)
+        
+        # Ask before creating a new results directory
+        usermessage_2 = '\nPrexisting results with the jobname {} will be overwritten. Proceed? ( Y = yes , N = no )\n'.format(results_dirname)
+        OVERWRITE = 'Y'
+        OVERWRITE = raw_input(usermessage_2)
+        if (OVERWRITE=='N' or OVERWRITE=='n' or OVERWRITE=='no' or OVERWRITE=='NO' or OVERWRITE=='No'):
+            # Give the user a message and move to a new iteration
+            print ('\n\nSkipping this job and moving to the next...\n\n')
+            continue
+        elif not (OVERWRITE=='Y' or OVERWRITE=='y' or OVERWRITE=='yes' or OVERWRITE=='YES' or OVERWRITE=='Yes'):
+            print ('\n\nOption not recognized, please try again...\n\n')
+            continue
+        #
+        
+        # Check that the User-Input filename exists before asking
+        # for the projection. The run repeats the check and logs it.
+        try:
+            mydef.checkfileexist(INPUT_FILE)
+        except ValueError as VError:
+            print ('\n{}'.format(VError))
+            continue # Continue to next iteration
+        # end try
+        
+        PROJECTION = raw_input('\nPlease input the map projection type used - in all caps - or the associated number\n' +
+                            '(options are 1=SRWMD or 2=SJRWMD. Different names result in a poetic exit): ')
+        # PROJECTION = raw_input("Please input the map projection type used in all caps (options are SRWMD or SJRWMD. Different names result in a poetic exit): ")
+        # PROJECTION = 'SRWMD'
+        
+        run_cup_simulation(INPUT_FILE, PROJECTION)
+        
+    # END while over continueloop
+    
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+if __name__ == '__main__':
+    main()
 #pause ()
 #exit()
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -0,0 +1,305 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Content addressed store of files (artifacts)
+#
+# Each file is kept once, named by the sha1 of its contents, and is placed
+# in the results directories as a link instead of a copy:
+#     put()      add a file to the store
+#     link()     place an artifact at a PATH
+#     open()     read an artifact
+#     extract()  place the files of a zip archive, extracted only once
+#
+# Artifacts are read-only and are linked with, in order of preference,
+#     a reflink  copy-on-write clone (Linux, on btrfs or XFS): an
+#                independent file that shares the data blocks
+#     a hard link  the same file; read-only, like the artifact
+#     a copy     e.g., across drives
+# Files that will be changed (writable=True, e.g., the geodatabase), and
+# files smaller than LINK_MIN_SIZE (the reports, which the User may edit;
+# copying them costs little), are only reflinked or copied.
+#
+# Store layout (store_dir):
+#     <sha1[:2]>/<sha1>           file contents
+#     trees/<sha1>.json           files of an extracted zip archive,
+#                                 by the sha1 of the archive
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import zipfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import basic_utilities as bscut
+
+
+# ioctl request of the Linux reflink (FICLONE)
+FICLONE = 0x40049409
+
+# Smallest file that is hard linked (bytes)
+LINK_MIN_SIZE = 1024*1024
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# File helpers
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def file_hash(file_name):
+    """ sha1 of the file contents """
+    sha = hashlib.sha1()
+    with open(file_name,'rb') as fin:
+        while True:
+            block = fin.read(1024*1024)
+            if not block: break
+            sha.update(block)
+        # END while
+    #
+    return sha.hexdigest()
+
+def make_read_only(file_name):
+    os.chmod(file_name, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+
+def make_writable(file_name):
+    os.chmod(file_name, os.stat(file_name).st_mode | stat.S_IWRITE)
+
+def reflink(file_in, file_out):
+    """ Copy-on-write clone of file_in. Raises OSError where it is not
+        supported (other systems and file systems, or across drives).
+    """
+    if (fcntl is None or not sys.platform.startswith('linux')):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported on this system')
+    try:
+        with open(file_in,'rb') as fin:
+            with open(file_out,'wb') as fout:
+                fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+            #
+        #
+    except (IOError, OSError) as err:
+        bscut.remove_file(file_out)
+        raise OSError(err.errno, 'Unable to reflink {}'.format(file_in))
+    # end try
+    shutil.copystat(file_in, file_out)
+    return
+
+def clone(file_in, file_out):
+    """ Writable copy of file_in: a reflink where possible, otherwise a
+        copy. Returns the method used: 'reflink' or 'copy'
+    """
+    try:
+        reflink(file_in, file_out)
+        method = 'reflink'
+    except OSError:
+        shutil.copy2(file_in, file_out)
+        method = 'copy'
+    # end try
+    make_writable(file_out)
+    return method
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Artifact store
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class ArtifactStore(object):
+    """ Content addressed store of files. Safe to share between
+        concurrent runs: every file is written to a temporary name and
+        renamed into place.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = os.path.abspath(store_dir)
+        self.trees_dir = os.path.join(self.store_dir,'trees')
+        for dirname in [self.store_dir, self.trees_dir]:
+            self.makedirs(dirname)
+        #
+
+    def makedirs(self, dirname):
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created by a concurrent run
+                if not os.path.isdir(dirname): raise
+        # END if
+
+    def rename(self, temp_file_name, file_name):
+        """ Move a temporary file into place. Returns False if a
+            concurrent run got there first.
+        """
+        try:
+            os.rename(temp_file_name, file_name)
+            return True
+        except OSError:
+            # Windows will not rename over an existing file
+            bscut.remove_file(temp_file_name)
+            return False
+        # end try
+
+    def object_path(self, digest):
+        return os.path.join(self.store_dir, digest[:2], digest)
+
+    def contains(self, digest):
+        return os.path.isfile(self.object_path(digest))
+
+    def put(self, file_name, digest=None, link=False):
+        """ Add a file to the store and return its sha1.
+
+            With link=True a large file itself becomes the artifact (a
+            hard link, where possible), so it is read-only afterwards and
+            must not be changed. Otherwise the file is reflinked or copied.
+        """
+        if digest is None: digest = file_hash(file_name)
+        object_file = self.object_path(digest)
+        if os.path.isfile(object_file): return digest
+
+        self.makedirs(os.path.dirname(object_file))
+        temp_file_name = '{0}.{1}.tmp'.format(object_file, os.getpid())
+        bscut.remove_file(temp_file_name)
+        linked = False
+        if (link and os.path.getsize(file_name) >= LINK_MIN_SIZE):
+            try:
+                bscut.hardlink(file_name, temp_file_name)
+                linked = True
+            except (OSError, IOError, AttributeError):
+                pass
+        # END if
+        if not linked: clone(file_name, temp_file_name)
+        make_read_only(temp_file_name)
+        self.rename(temp_file_name, object_file)
+        return digest
+
+    def link(self, digest, file_out, writable=False):
+        """ Place an artifact at file_out, replacing any file there.
+            Returns the method used: 'reflink', 'hardlink' or 'copy'
+        """
+        object_file = self.object_path(digest)
+        out_dir = os.path.dirname(file_out)
+        if (out_dir and not os.path.isdir(out_dir)): os.makedirs(out_dir)
+        bscut.remove_file(file_out)
+
+        try:
+            reflink(object_file, file_out)
+            make_writable(file_out)
+            return 'reflink'
+        except OSError:
+            pass
+        # end try
+
+        if (not writable and os.path.getsize(object_file) >= LINK_MIN_SIZE):
+            # Removing a linked file on Windows clears the read-only
+            # flag of the artifact as well
+            make_read_only(object_file)
+            try:
+                bscut.hardlink(object_file, file_out)
+                return 'hardlink'
+            except (OSError, IOError, AttributeError):
+                pass
+        # END if
+
+        shutil.copy2(object_file, file_out)
+        make_writable(file_out)
+        return 'copy'
+
+    def open(self, digest, mode='rb'):
+        """ Open an artifact for reading """
+        return open(self.object_path(digest), mode)
+
+    # ---------------------------------------
+    # Zip archives
+    # ---------------------------------------
+    def get_tree(self, zip_digest):
+        """ (relative name, sha1) of the files of an extracted archive,
+            or None if it has not been extracted (or a file is missing)
+        """
+        try:
+            with open(os.path.join(self.trees_dir, zip_digest + '.json'),'r') as fin:
+                tree = json.load(fin)
+        except (IOError, OSError, ValueError):
+            return None
+        # end try
+        for relative_name, digest in tree:
+            if not self.contains(digest): return None
+        #
+        return tree
+
+    def get_tree_digests(self):
+        """ sha1 of every file of the extracted archives """
+        digests = set()
+        for fname in os.listdir(self.trees_dir):
+            if not fname.endswith('.json'): continue
+            try:
+                with open(os.path.join(self.trees_dir, fname),'r') as fin:
+                    digests.update([digest for relative_name, digest in json.load(fin)])
+            except (IOError, OSError, ValueError):
+                pass
+            # end try
+        # END for over fname
+        return digests
+
+    def extract(self, zip_file, out_dir, writable=False, zip_digest=None):
+        """ Place the files of a zip archive in out_dir. The archive is
+            extracted into the store the first time it is seen.
+            Returns the number of files placed with each method.
+        """
+        if zip_digest is None: zip_digest = file_hash(zip_file)
+        tree = self.get_tree(zip_digest)
+
+        if tree is None:
+            temp_dir = os.path.join(self.trees_dir, '{0}.{1}.tmp'.format(zip_digest, os.getpid()))
+            if os.path.isdir(temp_dir): shutil.rmtree(temp_dir)
+            with zipfile.ZipFile(zip_file,'r') as zip_ref:
+                zip_ref.extractall(temp_dir)
+            #
+            tree = []
+            for dirpath, dirnames, filenames in os.walk(temp_dir):
+                dirnames.sort()
+                for fname in sorted(filenames):
+                    file_name = os.path.join(dirpath, fname)
+                    relative_name = os.path.relpath(file_name, temp_dir).replace('\\','/')
+                    tree.append([relative_name, self.put(file_name, link=True)])
+                # END for over fname
+            # END for over dirpath
+            shutil.rmtree(temp_dir, onerror=bscut.remove_readonly)
+
+            temp_file_name = os.path.join(self.trees_dir, '{0}.json.{1}.tmp'.format(zip_digest, os.getpid()))
+            with open(temp_file_name,'w') as fout:
+                json.dump(tree, fout, indent=1)
+            #
+            self.rename(temp_file_name, os.path.join(self.trees_dir, zip_digest + '.json'))
+        # END if
+
+        methods = {'reflink':0, 'hardlink':0, 'copy':0}
+        for relative_name, digest in tree:
+            methods[self.link(digest, os.path.join(out_dir, *relative_name.split('/')), writable)] += 1
+        # END for over relative_name
+        return methods
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
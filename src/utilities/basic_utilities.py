@@ -14,12 +14,15 @@
 
 import os
 import shutil
+import stat
 import time
-import subprocess
 #from contextlib import contextmanager  # for setting up cd()
 #import glob
 
 import mydefinitions as mydef
+import process_runner
+import modflow_adapter
+import run_logger
 #import text_blocks_and_errors as mytxterr
 
 
@@ -87,12 +90,45 @@ def deletefile(file_name,logfile):
     if os.path.isfile(file_name):
         currentmessage = ('Deleting: ' + file_name + '\n')
         print (currentmessage)
-        with open(logfile,'a') as lf: lf.write('{}\n'.format(currentmessage))
-        os.remove(file_name)
+        run_logger.log(logfile, '{}\n'.format(currentmessage))
+        remove_file(file_name)
     else:
         currentmessage = ('Nothing to delete: ' + file_name + '\n')
         print (currentmessage)
-        with open(logfile,'a') as lf: lf.write('{}\n'.format(currentmessage))
+        run_logger.log(logfile, '{}\n'.format(currentmessage))
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Remove files linked from the artifact store
+#
+# They are read-only, and Windows will not remove a
+# read-only file until the flag is cleared.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def remove_file(file_name):
+    if not os.path.lexists(file_name): return
+    try:
+        os.remove(file_name)
+    except OSError:
+        os.chmod(file_name, os.stat(file_name).st_mode | stat.S_IWRITE)
+        os.remove(file_name)
+    # end try
+    return
+
+def remove_readonly(func, path, exc_info):
+    """ onerror handler of shutil.rmtree """
+    try:
+        os.chmod(path, os.stat(path).st_mode | stat.S_IWRITE)
+        func(path)
+    except OSError:
+        pass
+    # end try
     return
 
 # ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -112,7 +148,7 @@ def copyfile(file_in,file_out,logfile):
         mydef.checkfileexist(file_in)
     except ValueError as VError:
         #raise
-        with open(logfile,'a') as lf: lf.write('{}'.format(VError))
+        run_logger.log(logfile, '{}'.format(VError))
         return False
     else:
         try:
@@ -123,20 +159,71 @@ def copyfile(file_in,file_out,logfile):
                             file_in +
                             ', does not exist.\n\tNo file to copy!\n\n')
             #raise IOError(error_message)
-            with open(logfile,'a') as lf:
-                lf.write(error_message)
-                lf.write('{}\n'.format(IOErr))
+            run_logger.log(logfile, error_message)
+            run_logger.log(logfile, '{}\n'.format(IOErr))
             
             return False
         except Exception as exc:
             #raise
-            with open(logfile,'a') as lf: lf.write('{}'.format(exc))
+            run_logger.log(logfile, '{}'.format(exc))
             return False
     return True
 
 # ooooooooooooooooooooooooooooooooooooooooooooooooooooo
 
 
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Link files instead of copying them where possible
+#
+# Tries a hard link, then a symbolic link (unless
+# symlink=False), and finally falls back to a copy
+# (e.g., across drives).
+# Returns the method used: 'hardlink', 'symlink' or 'copy'
+#
+# NOTE: A hard link shares the file contents with the
+#       original. Only link files that will not be
+#       modified in place.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def hardlink(file_in,file_out):
+    if hasattr(os,'link'):
+        os.link(file_in,file_out)
+    elif (os.name=='nt'):
+        # Python 2.7 on Windows has no os.link
+        import ctypes
+        if not ctypes.windll.kernel32.CreateHardLinkW(u'{}'.format(file_out),u'{}'.format(file_in),None):
+            raise ctypes.WinError()
+    else:
+        raise OSError('Hard links are not supported on this system')
+    return
+
+def link_or_copy(file_in,file_out,symlink=True):
+    
+    remove_file(file_out)
+    
+    try:
+        hardlink(file_in,file_out)
+        return 'hardlink'
+    except (OSError, IOError, AttributeError):
+        pass
+    
+    if (symlink and hasattr(os,'symlink')):
+        try:
+            os.symlink(os.path.abspath(file_in),file_out)
+            return 'symlink'
+        except (OSError, IOError, NotImplementedError):
+            pass
+    #
+    
+    shutil.copy2(file_in,file_out)
+    
+    return 'copy'
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
 
 # xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
 #
@@ -144,89 +231,74 @@ def copyfile(file_in,file_out,logfile):
 #
 # xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
 
-def modflow(code_dir,model_dir,nam_file,logfile):
+def modflow(code_dir,model_dir,nam_file,logfile,timeout=None,adapter=None):
     
-    # Setup the full PATH to the executable
-    #exe = os.path.join(code_dir,'MODFLOW-NWT_64.exe')  # original
-    exe = os.path.join(code_dir,'mfnwt_jd.exe')  # switch to jd version
-    
-    # Change the working directory to where all the model
-    # files are located, then run MODFLOW.
-    # Change back when done.
-    prevdir = os.getcwd()
-    cd(model_dir)
+    # The executable, its arguments and standard input are
+    # given by the adapter (modflow_adapter.py). By default,
+    # the jd version of MODFLOW-NWT in code_dir is run with
+    # these input data lines
+    # nfseg_complex.nam
+    # y
+    # 2
+    # nfseg_sh.2009_2009.hds
+    # 23
+    # 2
+    # 1
+    if adapter is None: adapter = modflow_adapter.get_default_adapter()
+    command = adapter.get_command(code_dir,nam_file)
     
-    errlist = mydef.ErrorListValues()
+    currentmessage = ('\nRunning MODFLOW ({0}): {1}\n'.format(adapter.name,' '.join(command)))
+    print (currentmessage)
+    run_logger.log(logfile, currentmessage)
     
+    # Run MODFLOW in the directory where all the model
+    # files are located. The output is written to the log as
+    # MODFLOW runs, and MODFLOW is stopped at the first error
+    # message, if the solver does not converge, or after
+    # timeout seconds.
     try:
-        # Define the executable process
-        # The [] contains: [executable, option_arg_1, option_arg_2, etc.]
-        # Original
-#        p = subprocess.Popen([exe,nam_file],
-#                                stdout = subprocess.PIPE,
-#                                stdin = subprocess.PIPE,
-#                                stderr = subprocess.PIPE)
-        # Switch to jd version
-        # nfseg_complex.nam
-        # y
-        # 2
-        # nfseg_sh.2009_2009.hds
-        # 23
-        # 2
-        # 1
-        p = subprocess.Popen([exe],
-                                stdout = subprocess.PIPE,
-                                stdin = subprocess.PIPE,
-                                stderr = subprocess.PIPE)
-        
-        # Input data lines into Modflow
-        p.stdin.write('{}\n'.format(nam_file))
-        p.stdin.write('{}\n'.format('y'))
-        p.stdin.write('{}\n'.format(2))
-        p.stdin.write('{}\n'.format('nfseg_sh.2009_2009.hds'))
-        p.stdin.write('{}\n'.format(23))
-        p.stdin.write('{}\n'.format(2))
-        p.stdin.write('{}\n'.format(1))
-        
-        # Execute the code with any command-line arguments
-        # Syntax: p.communicate(stdin)
-        # Returns a tuple (stdoutdata, stderrdata)
-        standardout, standarderror = p.communicate()
-        
-        # Raise an exception if an error occurs
-        #   - Check for error keywords
-        #   - Check the subprocess returncode
-        #   - Check if any output was given to stderr
-        # TODO: Change the stderrindex to look like many2one
-        error_flag = False
-        for erritem in errlist.ErrorList:
-            stdoutindex = standardout.find(erritem)
-            stderrindex = standardout.find(erritem)
-            #print ('Stdoutindex {}; Stderrindex {}\n'.format(stdoutindex,stderrindex))
-            if (stdoutindex != -1 or stderrindex != -1):
-                error_flag=True
-                break
-            # END if
-        # END for over erritem
-        if (p.returncode != 0 or standarderror or error_flag):
-            currentmessage= ('ERROR:\t' +
-                             'There was a problem running MODFLOW!\n' +
-                             '\tBelow is the report:\n' +
-                             'Error code: {}\n'.format(p.returncode) +
-                             'Standard Out:\n{}\n'.format(standardout))
-            with open(logfile,'a') as lf: lf.write(currentmessage)
-            error_message = standarderror
-            raise ValueError(error_message)
-    except ValueError as VError:
-        #raise
-        with open(logfile,'a') as lf: lf.write('{}'.format(VError))
+        result = process_runner.run(command, logfile,
+                                    stdin_lines=adapter.get_stdin(code_dir,nam_file),
+                                    cwd=model_dir,
+                                    timeout=timeout,
+                                    abort_patterns=adapter.abort_patterns,
+                                    echo=True)
+    except OSError as err:
+        currentmessage= ('ERROR:\t' +
+                         'Unable to start MODFLOW, {0}\n'.format(command[0]) +
+                         '\t{0}\n'.format(err))
+        print (currentmessage)
+        run_logger.log(logfile, currentmessage)
+        return False
+    # end try
+    
+    # Error if
+    #   - an error keyword or non-convergence was found
+    #   - the time limit was reached
+    #   - the subprocess returncode is nonzero
+    #   - any output was given to stderr
+    if result.failed():
+        currentmessage= ('ERROR:\t' +
+                         'There was a problem running MODFLOW!\n' +
+                         '\tBelow is the report:\n' +
+                         'Error code: {}\n'.format(result.returncode))
+        if result.abort_reason is not None:
+            currentmessage += ('MODFLOW was stopped because {}\n'.format(result.abort_reason))
+        currentmessage += ('Standard Error:\n{}\n'.format(result.stderr()))
+        print (currentmessage)
+        run_logger.log(logfile, currentmessage)
         return False
-    else: # All went well. Print output and move on
-        print ('{}\n'.format(standardout))
-        with open(logfile,'a') as lf: lf.write('{}\n'.format(standardout))
-    # END try
+    #
     
-    cd(prevdir)
+    # Error if an expected output file was not written
+    missing_outputs = adapter.get_missing_outputs(model_dir)
+    if (len(missing_outputs) > 0):
+        currentmessage= ('ERROR:\t' +
+                         'MODFLOW did not write ' + ', '.join(missing_outputs) + '\n')
+        print (currentmessage)
+        run_logger.log(logfile, currentmessage)
+        return False
+    #
     
     return True
 
@@ -244,7 +316,7 @@ def many2one(code_dir, file_in, many2one_log, results_dir, logfile):
     
     currentmessage = ('\n\nEntering PEST many2one\n\t--- Deleting preexisting output files prior to processing ---\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     #layer1_simHeads_sp1 = os.path.join(postproc_dh_cwd,'layer1_simHeads_sp1.asc')
     #layer3_simHeads_sp1 = os.path.join(postproc_dh_cwd,'layer3_simHeads_sp1.asc')
@@ -289,77 +361,36 @@ def many2one(code_dir, file_in, many2one_log, results_dir, logfile):
     #
     
     
-    # Change the working directory to where all the model
-    # files are located, then run many2one.
-    # Change back when done.
-    prevdir = os.getcwd()
-    cd(results_dir)
-    
-    
-    # Setup the full PATH to the executable
+    # Run many2one in results_dir with file_in as its input.
+    # The output is checked for error keywords as it arrives.
     exe = os.path.join(code_dir,'many2one.exe')
     
-    errlist = mydef.ErrorListValues()
+    result = process_runner.run([exe], logfile, stdin_file=file_in, cwd=results_dir, log_output=False)
     
-    try:
-        # Define the executable process
-        # The [] contains: [executable, option_arg_1, option_arg_2, etc.]
-        #stdin = subprocess.PIPE,
-        with open(file_in,'r') as fin:
-            p = subprocess.Popen([exe],
-                                 stdout = subprocess.PIPE,
-                                 stdin = fin,
-                                 stderr = subprocess.PIPE)
-        
-        
-        # Execute the code with any command-line arguments
-        # Syntax: p.communicate(stdin)
-        # Returns a tuple (stdoutdata, stderrdata)
-        standardout, standarderror = p.communicate()
-        
-        
-        # Raise an exception if an error occurs
-        #   - Check for error keywords
-        #   - Check the subprocess returncode
-        #   - Check if any output was given to stderr
-        error_flag = False
-        for erritem in errlist.ErrorList:
-            stdoutindex = standardout.find(erritem)
-            stderrindex = standarderror.find(erritem)
-            #print ('Stdoutindex {}; Stderrindex {}\n'.format(stdoutindex,stderrindex))
-            if (stdoutindex != -1 or stderrindex != -1):
-                error_flag=True
-                break
-            # END if
-        # END for over erritem
-        if (p.returncode != 0 or error_flag):
-            currentmessage= ('ERROR:\t' +
-                             'There was a problem running the ' +
-                             'PEST utility many2one!\n' +
-                             '\tBelow is the report:\n' +
-                             'Error code: {}\n'.format(p.returncode) +
-                             'Standard Out:\n{}\n'.format(standardout))
-            print (currentmessage)
-            with open(logfile,'a') as lf: lf.write('{}'.format(currentmessage))
-            error_message = standarderror
-            raise ValueError(error_message)
-    except ValueError as VError:
-        #raise
-        with open(logfile,'a') as lf: lf.write('{}'.format(VError))
+    # Error if
+    #   - an error keyword was found
+    #   - the subprocess returncode is nonzero
+    if result.failed(check_stderr=False):
+        currentmessage= ('ERROR:\t' +
+                         'There was a problem running the ' +
+                         'PEST utility many2one!\n' +
+                         '\tBelow is the report:\n' +
+                         'Error code: {}\n'.format(result.returncode) +
+                         'Standard Out:\n{}\n'.format(result.stdout()))
+        print (currentmessage)
+        run_logger.log(logfile, '{}'.format(currentmessage))
+        run_logger.log(logfile, '{}'.format(result.stderr()))
         return False
-    else: # All went well. Write the output to the logfiles and move on
-        with open(many2one_log,'w') as fout:
-            fout.write('{}\n'.format(standardout))
-        #
-        #with open(logfile,'a') as lf: lf.write('{}\n'.format(standardout))
-        
-        currentmessage = ('\n\tmany2one successful!\toutput written to: {}'.format(many2one_log))
-        #print (currentmessage)
-        with open(logfile,'a') as lf: lf.write('{}\n'.format(currentmessage))
-        
-    # END try
+    #
     
-    cd(prevdir)
+    # All went well. Write the output to the logfiles and move on
+    with open(many2one_log,'w') as fout:
+        fout.write('{}\n'.format(result.stdout()))
+    #
+    
+    currentmessage = ('\n\tmany2one successful!\toutput written to: {}'.format(many2one_log))
+    #print (currentmessage)
+    run_logger.log(logfile, '{}\n'.format(currentmessage))
     
     return True
 
@@ -377,7 +408,7 @@ def twoarray(code_dir, file_in, twoarraylog, results_dir, logfile):
     
     currentmessage = ('\n\nEntering PEST twoarray\n\t--- Deleting preexisting output files prior to processing ---\n')
     print (currentmessage)
-    with open(logfile,'a') as lf: lf.write(currentmessage)
+    run_logger.log(logfile, currentmessage)
     
     #dh_lyr1 = os.path.join(postproc_dh_cwd,'dh_lyr1.asc')
     #dh_lyr3 = os.path.join(postproc_dh_cwd,'dh_lyr3.asc')
@@ -411,77 +442,36 @@ def twoarray(code_dir, file_in, twoarraylog, results_dir, logfile):
     #
     
     
-    # Change the working directory to where all the model
-    # files are located, then run twoarray.
-    # Change back when done.
-    prevdir = os.getcwd()
-    cd(results_dir)
-    
-    
-    # Setup the full PATH to the executable
+    # Run twoarray in results_dir with file_in as its input.
+    # The output is checked for error keywords as it arrives.
     exe = os.path.join(code_dir,'twoarray.exe')
     
-    errlist = mydef.ErrorListValues()
+    result = process_runner.run([exe], logfile, stdin_file=file_in, cwd=results_dir, log_output=False)
     
-    try:
-        # Define the executable process
-        # The [] contains: [executable, option_arg_1, option_arg_2, etc.]
-        #stdin = subprocess.PIPE,
-        with open(file_in,'r') as fin:
-            p = subprocess.Popen([exe],
-                                 stdout = subprocess.PIPE,
-                                 stdin = fin,
-                                 stderr = subprocess.PIPE)
-        
-        
-        # Execute the code with any command-line arguments
-        # Syntax: p.communicate(stdin)
-        # Returns a tuple (stdoutdata, stderrdata)
-        standardout, standarderror = p.communicate()
-        
-        
-        # Raise an exception if an error occurs
-        #   - Check for error keywords
-        #   - Check the subprocess returncode
-        #   - Check if any output was given to stderr
-        error_flag = False
-        for erritem in errlist.ErrorList:
-            stdoutindex = standardout.find(erritem)
-            stderrindex = standarderror.find(erritem)
-            #print ('Stdoutindex {}; Stderrindex {}\n'.format(stdoutindex,stderrindex))
-            if (stdoutindex != -1 or stderrindex != -1):
-                error_flag=True
-                break
-            # END if
-        # END for over erritem
-        if (p.returncode != 0 or error_flag):
-            currentmessage= ('ERROR:\t' +
-                             'There was a problem running the ' +
-                             'PEST utility twoarray!\n' +
-                             '\tBelow is the report:\n' +
-                             'Error code: {}\n'.format(p.returncode) +
-                             'Standard Out:\n{}\n'.format(standardout))
-            print (currentmessage)
-            with open(logfile,'a') as lf: lf.write('{}'.format(currentmessage))
-            error_message = standarderror
-            raise ValueError(error_message)
-    except ValueError as VError:
-        #raise
-        with open(logfile,'a') as lf: lf.write('{}'.format(VError))
+    # Error if
+    #   - an error keyword was found
+    #   - the subprocess returncode is nonzero
+    if result.failed(check_stderr=False):
+        currentmessage= ('ERROR:\t' +
+                         'There was a problem running the ' +
+                         'PEST utility twoarray!\n' +
+                         '\tBelow is the report:\n' +
+                         'Error code: {}\n'.format(result.returncode) +
+                         'Standard Out:\n{}\n'.format(result.stdout()))
+        print (currentmessage)
+        run_logger.log(logfile, '{}'.format(currentmessage))
+        run_logger.log(logfile, '{}'.format(result.stderr()))
         return False
-    else: # All went well. Write the output to the logfiles and move on
-        with open(twoarraylog,'w') as fout:
-            fout.write('{}\n'.format(standardout))
-        #
-        #with open(logfile,'a') as lf: lf.write('{}\n'.format(standardout))
-        
-        currentmessage = ('\n\ttwoarray successful!\toutput written to: {}'.format(twoarraylog))
-        #print (currentmessage)
-        with open(logfile,'a') as lf: lf.write('{}\n'.format(currentmessage))
-        
-    # END try
-    
-    cd(prevdir)
+    #
+    
+    # All went well. Write the output to the logfiles and move on
+    with open(twoarraylog,'w') as fout:
+        fout.write('{}\n'.format(result.stdout()))
+    #
+    
+    currentmessage = ('\n\ttwoarray successful!\toutput written to: {}'.format(twoarraylog))
+    #print (currentmessage)
+    run_logger.log(logfile, '{}\n'.format(currentmessage))
     
     return True
 
@@ -0,0 +1,110 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Startup benchmark of the Tool
+#
+#     python src/utilities/check_import_time.py [limit seconds] [repeats]
+#
+# Imports the entry modules of the Tool (sim_cup_main, sim_cup_batch) in a
+# new Python, as a run does before the first prompt, and reports the time
+# taken and the number of modules loaded. Fails (exit status 1) if
+#     - an entry module imports arcpy (see utilities/gis_backends.py), or
+#     - the fastest of the repeats takes longer than the limit
+#       (default 1 second)
+# Run it after changing the imports of the Tool.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import json
+import os
+import subprocess
+import sys
+
+import gis_backends
+
+
+# Modules imported at the start of a run
+ENTRY_MODULES = ['sim_cup_main', 'sim_cup_batch']
+
+# Default limit (seconds)
+IMPORT_TIME_LIMIT = 1.0
+
+# Run in the new Python: time each entry module and the modules it brings in
+TIMING_CODE = '''
+import json, sys, time
+sys.path.insert(0, 'src')
+before = set(sys.modules)
+result = {'modules':{}}
+for name in %r:
+    start = time.time()
+    __import__(name)
+    result['modules'][name] = time.time() - start
+result['total'] = sum(result['modules'].values())
+result['loaded'] = sorted(set(sys.modules) - before)
+sys.stdout.write('\\n' + json.dumps(result))
+'''
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Time the imports in a new Python
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def time_imports(tool_dir, modules=ENTRY_MODULES):
+    """ {'total': seconds, 'modules': {name: seconds}, 'loaded': [names]} """
+    # The Tool is run from its top directory, as python src/sim_cup_main.py
+    output = subprocess.check_output([sys.executable, '-c', TIMING_CODE % (modules,)],
+                                     cwd=tool_dir)
+    if not isinstance(output, str): output = output.decode('utf-8')
+    return json.loads(output.strip().splitlines()[-1])
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+def main(argv=None):
+
+    if argv is None: argv = sys.argv[1:]
+    limit = float(argv[0]) if len(argv) > 0 else IMPORT_TIME_LIMIT
+    repeats = int(argv[1]) if len(argv) > 1 else 3
+    tool_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    # The first import also compiles the modules; keep the fastest
+    results = [time_imports(tool_dir) for i in range(repeats)]
+    best = min(results, key=lambda result: result['total'])
+
+    print ('\nImport time of the Tool (fastest of {} runs)\n'.format(repeats))
+    for name in ENTRY_MODULES:
+        print ('\t{0:<20s} {1:8.3f} s'.format(name, best['modules'][name]))
+    #
+    print ('\t{0:<20s} {1:8.3f} s   (limit {2:.3f} s)'.format('total', best['total'], limit))
+    print ('\t{0} modules loaded\n'.format(len(best['loaded'])))
+
+    failed = False
+    heavy = gis_backends.get_loaded_heavy_modules(best['loaded'])
+    if heavy:
+        print ('ERROR:\tModules loaded at startup that should only be loaded by the stages that use them: ' +
+               ', '.join(heavy) + '\n\tSee utilities/gis_backends.py\n')
+        failed = True
+    #
+    if (best['total'] > limit):
+        print ('ERROR:\tThe Tool took longer than {:.3f} s to import\n'.format(limit))
+        failed = True
+    #
+    if not failed: print ('OK\n')
+    return 1 if failed else 0
+
+if __name__=='__main__':
+    sys.exit(main())
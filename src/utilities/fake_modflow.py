@@ -0,0 +1,151 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Stand-in for MODFLOW that replays recorded results
+#
+#     python fake_modflow.py <name file> <fixture directory>
+#
+# Run in the model directory (as MODFLOW is), it copies the recorded output
+# files in the fixture directory (e.g., nfseg_auto.lst, nfseg_auto.hds and
+# nfseg_auto.cbb from an earlier run) to the LIST and DATA files of the same
+# name in the name file, and reports a normal termination. The whole Tool
+# can then be run, and the postprocessing timed, without the MODFLOW
+# executable (see input_and_definition_files/modflow/fake_modflow.txt).
+#
+# The fixtures are the outputs of a real MODFLOW run (tens of megabytes,
+# so they are not kept in the repository). Record them from the
+# workspace of a run made with keep_workspace=yes:
+#
+#     python fake_modflow.py --record <results>/model_run <fixture directory>
+#
+# which copies the LIST and DATA output files of the name file in the
+# workspace and writes where and when they were recorded, with their
+# sizes and sha1, to recorded_from.txt in the fixture directory.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import datetime
+import glob
+import hashlib
+import os
+import shutil
+import sys
+
+
+# Provenance of the fixtures, written by --record
+RECORD_FILE = 'recorded_from.txt'
+
+
+def get_nam_file_outputs(nam_file):
+    """ (file type, file name) of the LIST and DATA files of a name file
+        (not the DATA files that are read, with status OLD)
+    """
+    outputs = []
+    with open(nam_file,'r') as fin:
+        for line in fin:
+            items = line.split()
+            if (len(items) < 3 or items[0].startswith('#')): continue
+            if (len(items) > 3 and items[3].upper() == 'OLD'): continue
+            if (items[0].upper() == 'LIST' or items[0].upper().startswith('DATA')):
+                outputs.append((items[0].upper(), items[2]))
+            # END if
+        # END for over line
+    #
+    return outputs
+
+
+def get_sha1(fname):
+    sha = hashlib.sha1()
+    with open(fname,'rb') as fin:
+        for block in iter(lambda: fin.read(1048576), b''):
+            sha.update(block)
+        # END for over block
+    #
+    return sha.hexdigest()
+
+
+def record(workspace_dir, fixture_dir):
+    """ Copy the outputs of the MODFLOW run in a kept workspace to the
+        fixture directory
+    """
+    nam_files = glob.glob(os.path.join(workspace_dir,'*.nam'))
+    if (len(nam_files) != 1):
+        sys.stderr.write('Expected one name file in {0}, found {1}\n'.format(workspace_dir, len(nam_files)))
+        return 1
+    #
+    outputs = [fname for ftype, fname in get_nam_file_outputs(nam_files[0])
+               if os.path.isfile(os.path.join(workspace_dir,fname))]
+    if not outputs:
+        sys.stderr.write('No MODFLOW output files in {}\n'.format(workspace_dir))
+        return 1
+    #
+    if not os.path.isdir(fixture_dir): os.makedirs(fixture_dir)
+
+    lines = ['# Recorded by fake_modflow.py --record, {}\n'.format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M')),
+             '# from the MODFLOW run in {}\n'.format(os.path.abspath(workspace_dir)),
+             '# file, bytes, sha1\n']
+    for fname in outputs:
+        fixture = os.path.join(fixture_dir,os.path.basename(fname))
+        shutil.copyfile(os.path.join(workspace_dir,fname), fixture)
+        lines.append('{0}, {1}, {2}\n'.format(os.path.basename(fname), os.path.getsize(fixture), get_sha1(fixture)))
+        print (' Recorded {}'.format(fixture))
+    # END for over fname
+    with open(os.path.join(fixture_dir,RECORD_FILE),'w') as fout:
+        fout.writelines(lines)
+    #
+    return 0
+
+
+def main(argv=None):
+
+    if argv is None: argv = sys.argv[1:]
+    if (len(argv) == 3 and argv[0] == '--record'):
+        return record(argv[1], argv[2])
+    if (len(argv) != 2):
+        sys.stderr.write('usage: fake_modflow.py <name file> <fixture directory>\n'
+                         '       fake_modflow.py --record <model_run directory> <fixture directory>\n')
+        return 2
+    #
+    nam_file, fixture_dir = argv
+
+    print (' fake MODFLOW: replaying the recorded results in {}'.format(fixture_dir))
+    if os.path.isfile(os.path.join(fixture_dir,RECORD_FILE)):
+        with open(os.path.join(fixture_dir,RECORD_FILE),'r') as fin:
+            print (' ' + ' '.join([fin.readline().strip('# \n') for i in range(2)]))
+        #
+    # END if
+    print (' Using NAME file: {}'.format(nam_file))
+
+    replayed = []
+    for ftype, fname in get_nam_file_outputs(nam_file):
+        fixture = os.path.join(fixture_dir,os.path.basename(fname))
+        if not os.path.isfile(fixture):
+            if (ftype == 'LIST'):
+                sys.stderr.write('No recorded listing file, {}\n'.format(fixture))
+                return 1
+            continue
+        # END if
+        shutil.copyfile(fixture, fname)
+        replayed.append(fname)
+    # END for over ftype
+
+    for fname in replayed:
+        print (' Replayed {}'.format(fname))
+    #
+    print ('')
+    print (' Normal termination of simulation')
+    return 0
+
+if __name__=='__main__':
+    sys.exit(main())
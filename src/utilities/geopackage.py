@@ -0,0 +1,268 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# GeoPackage files written with the sqlite3 module of Python
+#
+# Writes OGC GeoPackages (Encoding Standard 1.2.1,
+# http://www.geopackage.org/spec121) without GDAL or ArcGIS:
+#     write_new()         a new GeoPackage, written in one transaction
+#                         to a temporary file that is renamed into place
+#     add_features()      a feature table, its contents entry and its
+#                         R-tree spatial index
+#     add_attributes()    a table without geometry
+# Geometries are packed for many features at once with NumPy
+# (point_blobs, cell_polygons). All features are in the model grid
+# projection, srs_id GRID_SRS_ID.
+#
+# Used by grid_store.py (the shared model cells) and
+# postprocess/write_geopackage.py (the GIS results of a run).
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import os
+import sqlite3
+
+import numpy as np
+
+import basic_utilities as bscut
+
+
+# srs_id of the grid projection in the GeoPackage
+GRID_SRS_ID = 100000
+
+# Geometry blobs: GeoPackage header ('GP', version 0, flags, srs_id),
+# then little-endian WKB. Flags: little-endian, with an envelope
+# [minx, maxx, miny, maxy] for polygons
+POINT_BLOB = np.dtype([('magic','S2'), ('version','u1'), ('flags','u1'), ('srs_id','<i4'),
+                       ('order','u1'), ('type','<u4'), ('xy','<f8',(2,))])
+POLYGON_BLOB = np.dtype([('magic','S2'), ('version','u1'), ('flags','u1'), ('srs_id','<i4'),
+                         ('envelope','<f8',(4,)),
+                         ('order','u1'), ('type','<u4'), ('nrings','<u4'), ('npoints','<u4'),
+                         ('xy','<f8',(5,2))])
+
+# GeoPackage tables (Annex C)
+GPKG_TABLES = [
+    '''CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY,
+       organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL,
+       definition TEXT NOT NULL, description TEXT)''',
+    '''CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,
+       identifier TEXT UNIQUE, description TEXT DEFAULT '',
+       last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+       min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+       CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))''',
+    '''CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+       geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+       CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+       CONSTRAINT uk_gc_table_name UNIQUE (table_name),
+       CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+       CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))''',
+    '''CREATE TABLE gpkg_extensions (table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+       definition TEXT NOT NULL, scope TEXT NOT NULL,
+       CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))''']
+
+WGS84_WKT = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+             'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+             'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+             'AUTHORITY["EPSG","4326"]]')
+
+# R-tree index triggers (Annex F.3); <t> table, <c> geometry column
+RTREE_TRIGGERS = [
+    '''CREATE TRIGGER rtree_<t>_<c>_insert AFTER INSERT ON <t>
+       WHEN (new.<c> NOT NULL AND NOT ST_IsEmpty(NEW.<c>))
+       BEGIN INSERT OR REPLACE INTO rtree_<t>_<c> VALUES (NEW.fid,
+       ST_MinX(NEW.<c>), ST_MaxX(NEW.<c>), ST_MinY(NEW.<c>), ST_MaxY(NEW.<c>)); END''',
+    '''CREATE TRIGGER rtree_<t>_<c>_update1 AFTER UPDATE OF <c> ON <t>
+       WHEN OLD.fid = NEW.fid AND (NEW.<c> NOTNULL AND NOT ST_IsEmpty(NEW.<c>))
+       BEGIN INSERT OR REPLACE INTO rtree_<t>_<c> VALUES (NEW.fid,
+       ST_MinX(NEW.<c>), ST_MaxX(NEW.<c>), ST_MinY(NEW.<c>), ST_MaxY(NEW.<c>)); END''',
+    '''CREATE TRIGGER rtree_<t>_<c>_update2 AFTER UPDATE OF <c> ON <t>
+       WHEN OLD.fid = NEW.fid AND (NEW.<c> ISNULL OR ST_IsEmpty(NEW.<c>))
+       BEGIN DELETE FROM rtree_<t>_<c> WHERE id = OLD.fid; END''',
+    '''CREATE TRIGGER rtree_<t>_<c>_update3 AFTER UPDATE ON <t>
+       WHEN OLD.fid != NEW.fid AND (NEW.<c> NOTNULL AND NOT ST_IsEmpty(NEW.<c>))
+       BEGIN DELETE FROM rtree_<t>_<c> WHERE id = OLD.fid;
+       INSERT OR REPLACE INTO rtree_<t>_<c> VALUES (NEW.fid,
+       ST_MinX(NEW.<c>), ST_MaxX(NEW.<c>), ST_MinY(NEW.<c>), ST_MaxY(NEW.<c>)); END''',
+    '''CREATE TRIGGER rtree_<t>_<c>_update4 AFTER UPDATE ON <t>
+       WHEN OLD.fid != NEW.fid AND (NEW.<c> ISNULL OR ST_IsEmpty(NEW.<c>))
+       BEGIN DELETE FROM rtree_<t>_<c> WHERE id IN (OLD.fid, NEW.fid); END''',
+    '''CREATE TRIGGER rtree_<t>_<c>_delete AFTER DELETE ON <t>
+       WHEN old.<c> NOT NULL
+       BEGIN DELETE FROM rtree_<t>_<c> WHERE id = OLD.fid; END''']
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Geometry blobs of many features at once
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def split_blobs(records):
+    """ One sqlite3 BLOB per record of a structured array """
+    data = records.tobytes()
+    size = records.dtype.itemsize
+    return [sqlite3.Binary(data[i*size:(i+1)*size]) for i in range(len(records))]
+
+def point_blobs(x, y, srs_id=GRID_SRS_ID):
+    records = np.zeros(len(x), dtype=POINT_BLOB)
+    records['magic'] = b'GP'
+    records['flags'] = 1
+    records['srs_id'] = srs_id
+    records['order'] = 1
+    records['type'] = 1
+    records['xy'][:,0] = x
+    records['xy'][:,1] = y
+    return split_blobs(records)
+
+def cell_polygons(grid, rows, cols, srs_id=GRID_SRS_ID):
+    """ Blobs and [minx, maxx, miny, maxy] envelopes of the cells
+        (row, col) of a grid_index.GridIndex
+    """
+    angle = np.radians(grid.rotation)
+    records = np.zeros(len(rows), dtype=POLYGON_BLOB)
+    records['magic'] = b'GP'
+    records['flags'] = 3
+    records['srs_id'] = srs_id
+    records['order'] = 1
+    records['type'] = 3
+    records['nrings'] = 1
+    records['npoints'] = 5
+
+    # Corners counter-clockwise from the upper-left, then closed
+    for i, (du, dv) in enumerate([(0,0), (0,1), (1,1), (1,0), (0,0)]):
+        u = (cols - 1 + du) * grid.cell_size
+        v = (rows - 1 + dv) * grid.cell_size
+        records['xy'][:,i,0] = grid.x_origin + u*np.cos(angle) + v*np.sin(angle)
+        records['xy'][:,i,1] = grid.y_origin + u*np.sin(angle) - v*np.cos(angle)
+    # END for over i
+    records['envelope'][:,0] = records['xy'][:,:,0].min(axis=1)
+    records['envelope'][:,1] = records['xy'][:,:,0].max(axis=1)
+    records['envelope'][:,2] = records['xy'][:,:,1].min(axis=1)
+    records['envelope'][:,3] = records['xy'][:,:,1].max(axis=1)
+    return split_blobs(records), records['envelope']
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# GeoPackage tables
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def create_geopackage(db, projection, prj_file):
+    """ The GeoPackage tables, and the spatial reference systems """
+    db.execute('PRAGMA application_id = 1196444487')  # 'GPKG'
+    db.execute('PRAGMA user_version = 10201')
+    for sql in GPKG_TABLES:
+        db.execute(sql)
+    #
+    with open(prj_file,'r') as fin: wkt = fin.read().strip()
+    db.executemany('INSERT INTO gpkg_spatial_ref_sys VALUES (?,?,?,?,?,?)',
+                   [('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined',
+                     'undefined cartesian coordinate reference system'),
+                    ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined',
+                     'undefined geographic coordinate reference system'),
+                    ('WGS 84 geodetic', 4326, 'EPSG', 4326, WGS84_WKT,
+                     'longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid'),
+                    (projection.name, GRID_SRS_ID, 'NONE', GRID_SRS_ID, wkt,
+                     'model grid projection, ' + os.path.basename(prj_file))])
+    return
+
+def add_features(db, table, geometry_type, columns, blobs, envelopes, rows, description):
+    """ A feature table with one row per blob, and its R-tree index. The
+        index triggers are added by add_rtree_triggers.
+    """
+    db.execute('CREATE TABLE {0} (fid INTEGER PRIMARY KEY AUTOINCREMENT, geom {1}{2})'
+               .format(table, geometry_type, ''.join([', {0} {1}'.format(name, sql_type)
+                                                      for name, sql_type in columns])))
+    db.executemany('INSERT INTO {0} VALUES (?,?{1})'.format(table, ',?'*len(columns)),
+                   [(i+1, blob) + tuple(row) for i, (blob, row) in enumerate(zip(blobs, rows))])
+
+    if (len(blobs) > 0):
+        bounds = (float(envelopes[:,0].min()), float(envelopes[:,2].min()),
+                  float(envelopes[:,1].max()), float(envelopes[:,3].max()))
+    else:
+        bounds = (None, None, None, None)
+    #
+    db.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, description, '
+               'min_x, min_y, max_x, max_y, srs_id) VALUES (?,?,?,?,?,?,?,?,?)',
+               (table, 'features', table, description) + bounds + (GRID_SRS_ID,))
+    db.execute('INSERT INTO gpkg_geometry_columns VALUES (?,?,?,?,0,0)',
+               (table, 'geom', geometry_type, GRID_SRS_ID))
+
+    # The index is filled here (the triggers need the ST_ functions of
+    # a GIS, so they are added afterwards)
+    db.execute('CREATE VIRTUAL TABLE rtree_{}_geom USING rtree(id, minx, maxx, miny, maxy)'.format(table))
+    db.executemany('INSERT INTO rtree_{}_geom VALUES (?,?,?,?,?)'.format(table),
+                   [(i+1,) + tuple(envelope) for i, envelope in enumerate(envelopes.tolist())])
+    db.execute('INSERT INTO gpkg_extensions VALUES (?,?,?,?,?)',
+               (table, 'geom', 'gpkg_rtree_index',
+                'http://www.geopackage.org/spec121/#extension_rtree', 'write-only'))
+    return
+
+def add_rtree_triggers(db, table):
+    """ Keep the R-tree index up to date when the features are edited in
+        a GIS. Added last: the triggers use ST_ functions that only a GIS
+        provides, so the rows of the table cannot be changed here after.
+    """
+    for sql in RTREE_TRIGGERS:
+        db.execute(sql.replace('<t>', table).replace('<c>', 'geom'))
+    #
+    return
+
+def add_attributes(db, table, columns, rows, description):
+    """ A table without geometry """
+    db.execute('CREATE TABLE {0} (fid INTEGER PRIMARY KEY AUTOINCREMENT{1})'
+               .format(table, ''.join([', {0} {1}'.format(name, sql_type) for name, sql_type in columns])))
+    db.executemany('INSERT INTO {0} ({1}) VALUES ({2})'
+                   .format(table, ', '.join([name for name, sql_type in columns]), ','.join('?'*len(columns))),
+                   rows)
+    db.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, description) '
+               'VALUES (?,?,?,?)', (table, 'attributes', table, description))
+    return
+
+def write_new(gpkg_file, projection, prj_file, write_tables, replace=True):
+    """ Write a GeoPackage: write_tables(db) adds the tables to the new
+        GeoPackage, all in one transaction, in a temporary file that
+        replaces gpkg_file when complete. With replace=False an existing
+        gpkg_file (e.g., written by a concurrent run) is kept.
+    """
+    temp_file_name = '{0}.{1}.tmp'.format(gpkg_file, os.getpid())
+    bscut.remove_file(temp_file_name)
+    # Transactions are started and committed here, not by sqlite3
+    db = sqlite3.connect(temp_file_name, isolation_level=None)
+    try:
+        db.execute('BEGIN')
+        create_geopackage(db, projection, prj_file)
+        write_tables(db)
+        db.execute('COMMIT')
+    except:
+        db.close()
+        bscut.remove_file(temp_file_name)
+        raise
+    # end try
+    db.close()
+    if replace: bscut.remove_file(gpkg_file)
+    try:
+        os.rename(temp_file_name, gpkg_file)
+    except OSError:
+        # Windows will not rename over an existing file
+        bscut.remove_file(temp_file_name)
+        if replace: raise
+    # end try
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -0,0 +1,123 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# GIS backends of the stages
+#
+# The stages that can use ArcGIS are looked up here by task and backend
+# instead of being imported by sim_cup_main.py. Importing arcpy takes many
+# seconds (and checks out a licence), so the module of a stage is only
+# imported when the stage runs: runs that do not use an arcpy backend
+# (e.g., locate_wells=numpy with gis_backend=geopackage or none, or
+# screening with locate_wells=numpy) never load arcpy.
+#
+#     task              backend      stage function
+#     locate_wells      numpy        preprocess/locate_wells_nfseg.py
+#                       arcpy        preprocess/update_wellpkg_nfseg_v3.py
+#     wells_to_gdb      arcpy        preprocess/locate_wells_nfseg.py
+#     grid_definition   arcpy        preprocess/locate_wells_nfseg.py
+#     gis_tables        arcpy        postprocess/make_ArcGIS_table_from_csv.py
+#                       geopackage   postprocess/write_geopackage.py
+#
+# See utilities/check_import_time.py for the startup benchmark.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import importlib
+import pkgutil
+
+
+# Stage functions, as 'module:function', by task and backend
+BACKENDS = {'locate_wells':{'numpy':'preprocess.locate_wells_nfseg:main',
+                            'arcpy':'preprocess.update_wellpkg_nfseg_v3:main'},
+            'wells_to_gdb':{'arcpy':'preprocess.locate_wells_nfseg:add_wells_to_gdb'},
+            'grid_definition':{'arcpy':'preprocess.locate_wells_nfseg:derive_grid_definition'},
+            'gis_tables':{'arcpy':'postprocess.make_ArcGIS_table_from_csv:main',
+                          'geopackage':'postprocess.write_geopackage:main'}}
+
+# Modules that must not be imported at startup
+HEAVY_MODULES = ['arcpy']
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Stage function imported on its first call
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class LazyFunction(object):
+    """ Stands in for a stage function until it is called. It has the
+        __name__ of the function (used in the stage cache keys), and can be
+        sent to the postprocessing worker processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.module_name, self.__name__ = path.split(':')
+        self.func = None
+
+    def load(self):
+        if self.func is None:
+            module = importlib.import_module(self.module_name)
+            self.func = getattr(module, self.__name__)
+        #
+        return self.func
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __getstate__(self):
+        # The module is imported again in the worker process
+        return {'path':self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __repr__(self):
+        return '<LazyFunction {}>'.format(self.path)
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Registry lookups
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def get_backends(task):
+    """ Names of the backends of a task """
+    return sorted(BACKENDS.get(task, {}))
+
+def get_function(task, backend='arcpy'):
+    """ The stage function of a task, imported when it is first called """
+    if backend not in BACKENDS.get(task, {}):
+        error_message = ('\nERROR:\tThere is no {0} backend for {1}. Backends are: {2}\n'
+                         .format(backend, task, ', '.join(get_backends(task))))
+        raise ValueError(error_message)
+    #
+    return LazyFunction(BACKENDS[task][backend])
+
+def is_available(backend):
+    """ True if the module of a backend can be imported, found without
+        importing it
+    """
+    if backend in HEAVY_MODULES: return pkgutil.find_loader(backend) is not None
+    return True
+
+def get_loaded_heavy_modules(modules):
+    """ The HEAVY_MODULES found in modules (e.g., sys.modules) """
+    return [name for name in HEAVY_MODULES if name in modules]
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
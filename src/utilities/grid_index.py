@@ -0,0 +1,400 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Model grid index without ArcGIS
+#
+# The NFSEG grid is a regular lattice in NAD_1983_Albers. A GridIndex
+# holds the upper-left corner, rotation and cell size of the grid and
+# finds the (row, col) of any number of points at once with NumPy.
+#
+# Points in the User projections (SRWMD state plane feet, SJRWMD UTM
+# meters) are projected to the grid projection with the ellipsoidal
+# formulas of Snyder (1987), Map Projections--A Working Manual, USGS
+# Professional Paper 1395. The projection parameters are read from the
+# .prj files in gis/projections. All projections of the Tool use the
+# GRS 1980 ellipsoid and no datum transformation is applied, which
+# matches arcpy.Project_management as called by update_wellpkg_nfseg.
+#
+# The cells found here have not yet been compared with those of the arcpy
+# intersection for a set of wells, so locate_wells=arcpy is still the
+# default. The grid definition shipped with the Tool fits the cell
+# polygons of the lake shapefiles to 0.15 mm, but its missing cells were
+# not checked against the grid feature class.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import re
+
+import numpy as np
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Projection definitions from .prj (ESRI WKT) files
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class Projection(object):
+    """ Parameters of a projected coordinate system read from a .prj file
+    """
+
+    def __init__(self, prj_file):
+        with open(prj_file,'r') as fin: wkt = fin.read()
+
+        self.name = re.search(r'PROJCS\["([^"]+)"', wkt).group(1)
+        self.projection = re.search(r'PROJECTION\["([^"]+)"\]', wkt).group(1).lower()
+
+        self.datum = re.search(r'DATUM\["([^"]+)"', wkt).group(1)
+        spheroid = re.search(r'SPHEROID\["[^"]*",([-0-9.eE+]+),([-0-9.eE+]+)\]', wkt)
+        self.a = float(spheroid.group(1))
+        self.inverse_flattening = float(spheroid.group(2))
+        f = 1./self.inverse_flattening
+        self.e2 = 2.*f - f*f
+        self.e = np.sqrt(self.e2)
+
+        self.parameters = {}
+        for name, value in re.findall(r'PARAMETER\["([^"]+)",([-0-9.eE+]+)\]', wkt):
+            self.parameters[name.lower()] = float(value)
+        #
+
+        # The linear unit is the last UNIT of the PROJCS
+        self.unit = float(re.findall(r'UNIT\["[^"]+",([-0-9.eE+]+)\]', wkt)[-1])
+
+        if self.projection not in ['albers', 'lambert_conformal_conic', 'transverse_mercator']:
+            raise ValueError('\nERROR:\tProjection {0} of {1} is not supported\n'.format(self.projection, prj_file))
+
+    def parameter(self, name, default=0.):
+        return self.parameters.get(name, default)
+
+    # ---------------------------------------
+    # Ellipsoid functions (Snyder notation)
+    # ---------------------------------------
+    def m(self, phi):
+        return np.cos(phi) / np.sqrt(1. - self.e2*np.sin(phi)**2)
+
+    def q(self, phi):
+        e = self.e
+        sin_phi = np.sin(phi)
+        return (1. - self.e2) * (sin_phi / (1. - self.e2*sin_phi**2) -
+                                 (1./(2.*e)) * np.log((1. - e*sin_phi) / (1. + e*sin_phi)))
+
+    def t(self, phi):
+        e = self.e
+        sin_phi = np.sin(phi)
+        return np.tan(np.pi/4. - phi/2.) / ((1. - e*sin_phi) / (1. + e*sin_phi))**(e/2.)
+
+    # ---------------------------------------
+    # Projected <--> geographic (radians)
+    # ---------------------------------------
+    def to_geographic(self, x, y):
+        """ Longitude and latitude (radians) of projected coordinates """
+        x = (np.asarray(x, dtype=np.float64) * self.unit - self.parameter('false_easting')*self.unit)
+        y = (np.asarray(y, dtype=np.float64) * self.unit - self.parameter('false_northing')*self.unit)
+        if (self.projection == 'lambert_conformal_conic'): return self.lcc_inverse(x, y)
+        if (self.projection == 'transverse_mercator'): return self.tm_inverse(x, y)
+        return self.albers_inverse(x, y)
+
+    def from_geographic(self, lon, lat):
+        """ Projected coordinates of longitude and latitude (radians) """
+        if (self.projection == 'lambert_conformal_conic'): x, y = self.lcc_forward(lon, lat)
+        elif (self.projection == 'transverse_mercator'): x, y = self.tm_forward(lon, lat)
+        else: x, y = self.albers_forward(lon, lat)
+        x = (x + self.parameter('false_easting')*self.unit) / self.unit
+        y = (y + self.parameter('false_northing')*self.unit) / self.unit
+        return x, y
+
+    # ---------------------------------------
+    # Albers equal-area conic
+    # ---------------------------------------
+    def albers_constants(self):
+        phi1 = np.radians(self.parameter('standard_parallel_1'))
+        phi2 = np.radians(self.parameter('standard_parallel_2'))
+        phi0 = np.radians(self.parameter('latitude_of_origin'))
+        m1, m2 = self.m(phi1), self.m(phi2)
+        q1, q2, q0 = self.q(phi1), self.q(phi2), self.q(phi0)
+        n = (m1**2 - m2**2) / (q2 - q1)
+        C = m1**2 + n*q1
+        rho0 = self.a * np.sqrt(C - n*q0) / n
+        return n, C, rho0
+
+    def albers_forward(self, lon, lat):
+        n, C, rho0 = self.albers_constants()
+        rho = self.a * np.sqrt(C - n*self.q(lat)) / n
+        theta = n * (lon - np.radians(self.parameter('central_meridian')))
+        return rho*np.sin(theta), rho0 - rho*np.cos(theta)
+
+    def albers_inverse(self, x, y):
+        n, C, rho0 = self.albers_constants()
+        rho = np.sqrt(x**2 + (rho0 - y)**2)
+        theta = np.arctan2(x, rho0 - y)
+        q = (C - (rho*n/self.a)**2) / n
+        # Iterate for the latitude (Snyder eq. 3-16)
+        lat = np.arcsin(q/2.)
+        for i in range(10):
+            sin_lat = np.sin(lat)
+            lat = lat + ((1. - self.e2*sin_lat**2)**2 / (2.*np.cos(lat)) *
+                         (q/(1. - self.e2) - sin_lat/(1. - self.e2*sin_lat**2) +
+                          (1./(2.*self.e)) * np.log((1. - self.e*sin_lat)/(1. + self.e*sin_lat))))
+        # END for over i
+        return theta/n + np.radians(self.parameter('central_meridian')), lat
+
+    # ---------------------------------------
+    # Lambert conformal conic (2 standard parallels)
+    # ---------------------------------------
+    def lcc_constants(self):
+        phi1 = np.radians(self.parameter('standard_parallel_1'))
+        phi2 = np.radians(self.parameter('standard_parallel_2'))
+        phi0 = np.radians(self.parameter('latitude_of_origin'))
+        m1, m2 = self.m(phi1), self.m(phi2)
+        t1, t2, t0 = self.t(phi1), self.t(phi2), self.t(phi0)
+        n = (np.log(m1) - np.log(m2)) / (np.log(t1) - np.log(t2))
+        F = m1 / (n * t1**n)
+        rho0 = self.a * F * t0**n
+        return n, F, rho0
+
+    def lcc_forward(self, lon, lat):
+        n, F, rho0 = self.lcc_constants()
+        rho = self.a * F * self.t(lat)**n
+        theta = n * (lon - np.radians(self.parameter('central_meridian')))
+        return rho*np.sin(theta), rho0 - rho*np.cos(theta)
+
+    def lcc_inverse(self, x, y):
+        n, F, rho0 = self.lcc_constants()
+        rho = np.sign(n) * np.sqrt(x**2 + (rho0 - y)**2)
+        theta = np.arctan2(x, rho0 - y)
+        t = (rho / (self.a*F))**(1./n)
+        lat = np.pi/2. - 2.*np.arctan(t)
+        for i in range(10):
+            sin_lat = np.sin(lat)
+            lat = np.pi/2. - 2.*np.arctan(t * ((1. - self.e*sin_lat)/(1. + self.e*sin_lat))**(self.e/2.))
+        # END for over i
+        return theta/n + np.radians(self.parameter('central_meridian')), lat
+
+    # ---------------------------------------
+    # Transverse Mercator
+    # ---------------------------------------
+    def meridian_distance(self, lat):
+        e2 = self.e2
+        return self.a * ((1. - e2/4. - 3.*e2**2/64. - 5.*e2**3/256.) * lat -
+                         (3.*e2/8. + 3.*e2**2/32. + 45.*e2**3/1024.) * np.sin(2.*lat) +
+                         (15.*e2**2/256. + 45.*e2**3/1024.) * np.sin(4.*lat) -
+                         (35.*e2**3/3072.) * np.sin(6.*lat))
+
+    def tm_forward(self, lon, lat):
+        k0 = self.parameter('scale_factor', 1.)
+        ep2 = self.e2 / (1. - self.e2)
+        N = self.a / np.sqrt(1. - self.e2*np.sin(lat)**2)
+        T = np.tan(lat)**2
+        C = ep2 * np.cos(lat)**2
+        A = (lon - np.radians(self.parameter('central_meridian'))) * np.cos(lat)
+        M = self.meridian_distance(lat)
+        M0 = self.meridian_distance(np.radians(self.parameter('latitude_of_origin')))
+        x = k0*N*(A + (1. - T + C)*A**3/6. + (5. - 18.*T + T**2 + 72.*C - 58.*ep2)*A**5/120.)
+        y = k0*(M - M0 + N*np.tan(lat)*(A**2/2. + (5. - T + 9.*C + 4.*C**2)*A**4/24. +
+                                          (61. - 58.*T + T**2 + 600.*C - 330.*ep2)*A**6/720.))
+        return x, y
+
+    def tm_inverse(self, x, y):
+        k0 = self.parameter('scale_factor', 1.)
+        e2 = self.e2
+        ep2 = e2 / (1. - e2)
+        M0 = self.meridian_distance(np.radians(self.parameter('latitude_of_origin')))
+        M = M0 + y/k0
+        mu = M / (self.a*(1. - e2/4. - 3.*e2**2/64. - 5.*e2**3/256.))
+        e1 = (1. - np.sqrt(1. - e2)) / (1. + np.sqrt(1. - e2))
+        lat1 = (mu + (3.*e1/2. - 27.*e1**3/32.)*np.sin(2.*mu) +
+                (21.*e1**2/16. - 55.*e1**4/32.)*np.sin(4.*mu) +
+                (151.*e1**3/96.)*np.sin(6.*mu) + (1097.*e1**4/512.)*np.sin(8.*mu))
+        C1 = ep2*np.cos(lat1)**2
+        T1 = np.tan(lat1)**2
+        N1 = self.a / np.sqrt(1. - e2*np.sin(lat1)**2)
+        R1 = self.a*(1. - e2) / (1. - e2*np.sin(lat1)**2)**1.5
+        D = x / (N1*k0)
+        lat = lat1 - (N1*np.tan(lat1)/R1)*(D**2/2. -
+                                           (5. + 3.*T1 + 10.*C1 - 4.*C1**2 - 9.*ep2)*D**4/24. +
+                                           (61. + 90.*T1 + 298.*C1 + 45.*T1**2 - 252.*ep2 - 3.*C1**2)*D**6/720.)
+        lon = (np.radians(self.parameter('central_meridian')) +
+               (D - (1. + 2.*T1 + C1)*D**3/6. +
+                (5. - 2.*C1 + 28.*T1 - 3.*C1**2 + 8.*ep2 + 24.*T1**2)*D**5/120.) / np.cos(lat1))
+        return lon, lat
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Project points from one .prj coordinate system
+# to another
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def project(x, y, from_projection, to_projection):
+    lon, lat = from_projection.to_geographic(x, y)
+    return to_projection.from_geographic(lon, lat)
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Regular model grid
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class GridIndex(object):
+    """ Regular grid of nrow x ncol square cells.
+
+        x_origin, y_origin   upper-left corner of cell (1,1), in the grid
+                             projection
+        rotation             counter-clockwise rotation of the rows from
+                             the x axis, degrees
+        missing_cells        (row, col) of cells that are not in the grid
+                             feature class. Points in these cells are not
+                             located, as with the arcpy intersection.
+
+        Rows are numbered from the top (north), columns from the left.
+    """
+
+    def __init__(self, x_origin, y_origin, cell_size, nrow, ncol, rotation=0., missing_cells=()):
+        self.x_origin = float(x_origin)
+        self.y_origin = float(y_origin)
+        self.cell_size = float(cell_size)
+        self.nrow = int(nrow)
+        self.ncol = int(ncol)
+        self.rotation = float(rotation)
+        self.missing = np.zeros((self.nrow+1, self.ncol+1), dtype=bool)
+        for row, col in missing_cells:
+            self.missing[row, col] = True
+        #
+
+    @classmethod
+    def read(cls, definition_file):
+        """ Read a grid definition file. Lines are 'set <name> <value>' or
+            'missing <row> <col>'; '#' starts a comment.
+        """
+        values = {}
+        missing_cells = []
+        with open(definition_file,'r') as fin:
+            for line in fin:
+                items = line.split()
+                if (len(items) < 3 or items[0].startswith('#')): continue
+                if (items[0] == 'set'): values[items[1]] = items[2]
+                elif (items[0] == 'missing'): missing_cells.append((int(items[1]), int(items[2])))
+            # END for over line
+        #
+        return cls(values['x_origin'], values['y_origin'], values['cell_size'],
+                   values['nrow'], values['ncol'], values.get('rotation', 0.), missing_cells)
+
+    def write(self, definition_file, comment=''):
+        with open(definition_file,'w') as fout:
+            fout.write('# Model grid definition for grid_index.py\n')
+            if comment: fout.write('# {}\n'.format(comment))
+            fout.write('set x_origin {!r}\n'.format(self.x_origin))
+            fout.write('set y_origin {!r}\n'.format(self.y_origin))
+            fout.write('set cell_size {!r}\n'.format(self.cell_size))
+            fout.write('set rotation {!r}\n'.format(self.rotation))
+            fout.write('set nrow {}\n'.format(self.nrow))
+            fout.write('set ncol {}\n'.format(self.ncol))
+            rows, cols = np.nonzero(self.missing[1:,1:])
+            for row, col in zip(rows+1, cols+1):
+                fout.write('missing {0} {1}\n'.format(row, col))
+            # END for over row
+        #
+
+    def to_grid(self, x, y):
+        """ Distance of points along the rows (u) and down the columns (v)
+            from the upper-left corner
+        """
+        angle = np.radians(self.rotation)
+        dx = np.asarray(x, dtype=np.float64) - self.x_origin
+        dy = np.asarray(y, dtype=np.float64) - self.y_origin
+        u = dx*np.cos(angle) + dy*np.sin(angle)
+        v = dx*np.sin(angle) - dy*np.cos(angle)
+        return u, v
+
+    def locate(self, x, y):
+        """ 1-based (row, col) arrays of the cells holding the points.
+            Points outside the grid or in missing cells get (0, 0).
+        """
+        u, v = self.to_grid(x, y)
+        col = np.floor(u / self.cell_size).astype(np.int64) + 1
+        row = np.floor(v / self.cell_size).astype(np.int64) + 1
+        inside = (row >= 1) & (row <= self.nrow) & (col >= 1) & (col <= self.ncol)
+        row = np.where(inside, row, 0)
+        col = np.where(inside, col, 0)
+        inside &= ~self.missing[row, col]
+        return np.where(inside, row, 0), np.where(inside, col, 0)
+
+    def cell_center(self, row, col):
+        """ Coordinates of the centers of cells (row, col) """
+        angle = np.radians(self.rotation)
+        u = (np.asarray(col, dtype=np.float64) - 0.5) * self.cell_size
+        v = (np.asarray(row, dtype=np.float64) - 0.5) * self.cell_size
+        x = self.x_origin + u*np.cos(angle) + v*np.sin(angle)
+        y = self.y_origin + u*np.sin(angle) - v*np.cos(angle)
+        return x, y
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Fit a GridIndex to the (row, col) and center
+# coordinates of the cells of a grid feature class
+#
+# x = x0 + (col-0.5)*A + (row-0.5)*B
+# y = y0 + (col-0.5)*B - (row-0.5)*A
+#
+# with A = cell_size*cos(rotation) and
+#      B = cell_size*sin(rotation), by least squares.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def fit_grid_index(rows, cols, x, y, tolerance=0.01):
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    u = cols - 0.5
+    v = rows - 0.5
+    n = len(rows)
+
+    # Unknowns: x0, y0, A, B
+    matrix = np.zeros((2*n, 4))
+    matrix[:n,0] = 1.
+    matrix[:n,2] = u
+    matrix[:n,3] = v
+    matrix[n:,1] = 1.
+    matrix[n:,2] = -v
+    matrix[n:,3] = u
+    rhs = np.concatenate([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    solution = np.linalg.lstsq(matrix, rhs, rcond=None)[0]
+    x0, y0, A, B = solution
+
+    residual = np.abs(matrix.dot(solution) - rhs).max()
+    if (residual > tolerance):
+        raise ValueError('\nERROR:\tThe grid cells are not a regular lattice ' +
+                         '(largest misfit {} map units)\n'.format(residual))
+    #
+
+    nrow, ncol = rows.max(), cols.max()
+    present = np.zeros((nrow+1, ncol+1), dtype=bool)
+    present[rows, cols] = True
+    missing_rows, missing_cols = np.nonzero(~present[1:,1:])
+
+    return GridIndex(x0, y0, np.hypot(A, B), nrow, ncol, np.degrees(np.arctan2(B, A)),
+                     zip(missing_rows+1, missing_cols+1))
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -0,0 +1,140 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Shared store of the model grid geometry
+#
+# The polygons of the model cells are the same for every run, so they are
+# kept once, in a read-only GeoPackage shared by all runs, instead of in
+# the results of each run. The runs write only their values, keyed by
+# ref_ROW_COL (<row>_<col>), and link them to the shared cells (see
+# postprocess/write_geopackage.py).
+#
+# A GeoPackage is written for each version of the grid, the sha1 of the
+# grid definition file (grid_index.py) and of the .prj file of the grid
+# projection, so a changed grid gets a new file and the results of older
+# runs still link to the cells they were computed on:
+#
+#     <store_dir>/nfseg_grid_<version>.gpkg
+#         grid_cells    model cells (POLYGON): row, col, ref_ROW_COL,
+#                       with an R-tree spatial index
+#
+# Writing the R-tree index of the ~530,000 cells takes SQLite about 20
+# seconds, once per version. Versions that no run links to may be deleted.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import hashlib
+import os
+
+import numpy as np
+
+import run_logger
+import geopackage
+import artifact_store
+
+
+# Layer of the model cells
+GRID_LAYER = 'grid_cells'
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Grid store
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class GridStore(object):
+
+    def __init__(self, store_dir):
+        self.store_dir = os.path.abspath(store_dir)
+        if not os.path.isdir(self.store_dir):
+            try:
+                os.makedirs(self.store_dir)
+            except OSError:
+                # Created by a concurrent run
+                if not os.path.isdir(self.store_dir): raise
+        # END if
+
+    def get_version(self, grid_definition_file, prj_file):
+        sha = hashlib.sha1()
+        for file_name in [grid_definition_file, prj_file]:
+            with open(file_name,'rb') as fin: sha.update(fin.read())
+        #
+        return sha.hexdigest()[:16]
+
+    def get_grid_file(self, version):
+        return os.path.join(self.store_dir, 'nfseg_grid_{}.gpkg'.format(version))
+
+    def get(self, grid, grid_definition_file, projection, prj_file, logfile):
+        """ The GeoPackage of the cells of a grid_index.GridIndex, written
+            if it is not in the store. Returns (file name, version)
+        """
+        # The version is the hash of the definition files
+        for file_name in [grid_definition_file, prj_file]:
+            if not os.path.isfile(file_name):
+                error_message = ('\nERROR:\tThe grid store needs {0}, which is missing. The model grid '
+                                 'definition is kept in input_and_definition_files/preproc, and the grid '
+                                 'projection in gis/projections\n'.format(file_name))
+                print (error_message)
+                run_logger.log(logfile, error_message)
+                raise ValueError(error_message)
+            # END if
+        # END for over file_name
+        version = self.get_version(grid_definition_file, prj_file)
+        grid_file = self.get_grid_file(version)
+        if os.path.isfile(grid_file): return grid_file, version
+
+        currentmessage = ('\tAdding version {0} of the model grid to the grid store, {1} ...\n'
+                          .format(version, self.store_dir))
+        print (currentmessage)
+        run_logger.log(logfile, currentmessage)
+
+        rows, cols = get_cells(grid)
+        blobs, envelopes = geopackage.cell_polygons(grid, rows, cols)
+        cell_rows = zip(rows.tolist(), cols.tolist(), get_row_col(rows, cols))
+
+        def write_tables(db):
+            geopackage.add_features(db, GRID_LAYER, 'POLYGON',
+                                    [('row', 'INTEGER'), ('col', 'INTEGER'), ('ref_ROW_COL', 'TEXT')],
+                                    blobs, envelopes, cell_rows,
+                                    'Model cells, grid version {}'.format(version))
+            geopackage.add_rtree_triggers(db, GRID_LAYER)
+        #
+        geopackage.write_new(grid_file, projection, prj_file, write_tables, replace=False)
+        artifact_store.make_read_only(grid_file)
+
+        return grid_file, version
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Cells of the grid, in the order of the store
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def get_cells(grid):
+    """ 1-based (row, col) arrays of the cells in the grid feature class,
+        by row
+    """
+    rows, cols = np.nonzero(~grid.missing[1:,1:])
+    return rows+1, cols+1
+
+def get_row_col(rows, cols):
+    """ ref_ROW_COL keys of cells """
+    return ['{0}_{1}'.format(row, col) for row, col in zip(rows.tolist(), cols.tolist())]
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -0,0 +1,187 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import os
+import shutil
+
+import basic_utilities as bscut
+import run_logger
+import single_stress_period as sngsp
+
+
+# Files written by (or for) a single run. These are never staged from the
+# shared model directory, even if an older version of the Tool left them there.
+RUN_FILES = ['nfseg_auto.wel',
+             'nfseg_auto.lst',
+             'nfseg_auto.cbb',
+             'nfseg_auto.cbw',
+             'nfseg_auto.crc',
+             'nfseg_auto.hds',
+             'nfseg_auto.ddn']
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Per-run MODFLOW workspace
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class ModelWorkspace(object):
+    """ Private sandbox directory for one MODFLOW run.
+
+        The read-only model inputs in the shared model directory (nam, dis,
+        riv, drn, starting heads, ...) are hard linked into the sandbox, or
+        symbolically linked or copied where hard links are not possible.
+        Run specific files (the wel file) are added with add_file(), and
+        MODFLOW writes its output to the sandbox, so the shared model
+        directory is never modified and runs can execute side by side.
+
+        Output files listed in the name file and the files in RUN_FILES
+        are not staged. MODFLOW may open those for writing, which would
+        overwrite the shared copy, and the copies of the other runs,
+        through a hard link. The outputs are the LIST file and every DATA
+        file not opened OLD (REPLACE, UNKNOWN or no status; as in
+        fake_modflow.py), and any other file opened with REPLACE: DATA
+        files that are read must be opened OLD.
+    """
+
+    def __init__(self, model_dir, workspace_dir, nam_file, logfile, run_files=RUN_FILES):
+        self.model_dir = os.path.abspath(model_dir)
+        self.workspace_dir = os.path.abspath(workspace_dir)
+        self.nam_file = nam_file
+        self.logfile = logfile
+        self.excluded = set([fname.lower() for fname in run_files])
+        self.excluded.update(self.get_nam_file_outputs())
+        self.link_counts = {'hardlink':0, 'symlink':0, 'copy':0}
+
+    def get_nam_file_outputs(self):
+        """ Return the lower case names of the output files in the name file
+        """
+        outputs = set()
+        nam_file = os.path.join(self.model_dir,self.nam_file)
+        if not os.path.isfile(nam_file): return outputs
+
+        with open(nam_file,'r') as fin:
+            for line in fin:
+                items = line.split()
+                if (len(items) < 3 or items[0].startswith('#')): continue
+                ftype = items[0].upper()
+                status = items[3].upper() if (len(items) > 3) else ''
+                if (ftype=='LIST' or status=='REPLACE' or
+                    (ftype.startswith('DATA') and status!='OLD')):
+                    outputs.add(os.path.normpath(items[2]).lower())
+                # END if
+            # END for over line
+        #
+        return outputs
+
+    def stage(self):
+        """ Create the workspace and link the shared model inputs into it
+        """
+        if os.path.isdir(self.workspace_dir):
+            shutil.rmtree(self.workspace_dir,onerror=bscut.remove_readonly)
+        #
+        os.makedirs(self.workspace_dir)
+
+        for dirpath, dirnames, filenames in os.walk(self.model_dir):
+            relative_dir = os.path.relpath(dirpath,self.model_dir)
+            if (relative_dir=='.'): relative_dir = ''
+
+            # Do not recurse into the workspace if it is located
+            # inside the model directory
+            dirnames[:] = [d for d in dirnames
+                           if os.path.join(dirpath,d) != self.workspace_dir]
+
+            for dname in dirnames:
+                os.mkdir(os.path.join(self.workspace_dir,relative_dir,dname))
+            #
+
+            for fname in filenames:
+                relative_name = os.path.join(relative_dir,fname)
+                if os.path.normpath(relative_name).lower() in self.excluded: continue
+
+                method = bscut.link_or_copy(os.path.join(dirpath,fname),
+                                            os.path.join(self.workspace_dir,relative_name))
+                self.link_counts[method] += 1
+            # END for over fname
+        # END for over dirpath
+
+        currentmessage = ('\nStaged model workspace: {0}\n'.format(self.workspace_dir) +
+                          '\t{0} hard links, {1} symbolic links, {2} copies\n'.format(
+                              self.link_counts['hardlink'],
+                              self.link_counts['symlink'],
+                              self.link_counts['copy']))
+        print (currentmessage)
+        run_logger.log(self.logfile, currentmessage)
+
+        return
+
+    def get_nam_file_entry(self, ftype):
+        """ Name of the file of type ftype (e.g., DIS) in the name file
+        """
+        with open(os.path.join(self.model_dir,self.nam_file),'r') as fin:
+            for line in fin:
+                items = line.split()
+                if (len(items) < 3 or items[0].startswith('#')): continue
+                if (items[0].upper()==ftype.upper()): return items[2]
+            # END for over line
+        #
+        return None
+
+    def make_single_stress_period(self, stress_period):
+        """ Rewrite the DIS and OC files in the workspace for a one-stress
+            period run of stress_period (see single_stress_period.py).
+            The links to the shared copies are replaced, never written to.
+        """
+        for ftype, make_file in [('DIS', sngsp.make_single_period_dis),
+                                 ('OC', sngsp.make_single_period_oc)]:
+            fname = self.get_nam_file_entry(ftype)
+            if fname is None: continue
+            file_out = self.path(fname)
+            bscut.remove_file(file_out)
+            make_file(os.path.join(self.model_dir,fname), file_out, stress_period)
+        # END for over ftype
+
+        currentmessage = ('\tWorkspace set up for a single stress period (stress period {0})\n'.format(stress_period))
+        run_logger.log(self.logfile, currentmessage)
+
+        return
+
+    def add_file(self, file_in, fname):
+        """ Add a run specific input file to the workspace under the name fname
+        """
+        method = bscut.link_or_copy(file_in,self.path(fname))
+
+        currentmessage = ('\tAdded {0} to the workspace ({1})\n'.format(fname,method))
+        run_logger.log(self.logfile, currentmessage)
+
+        return
+
+    def path(self, fname):
+        """ Full PATH of a file in the workspace
+        """
+        return os.path.join(self.workspace_dir,fname)
+
+    def cleanup(self):
+        """ Remove the workspace and everything in it. Removing links
+            leaves the shared model inputs untouched.
+        """
+        shutil.rmtree(self.workspace_dir,onerror=bscut.remove_readonly)
+
+        currentmessage = ('\nRemoved model workspace: {0}\n'.format(self.workspace_dir))
+        run_logger.log(self.logfile, currentmessage)
+
+        return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -0,0 +1,184 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# How to run MODFLOW
+#
+# An adapter file names the MODFLOW executable, its command line arguments,
+# the lines it reads from standard input, and the files a successful run
+# must leave in the model directory. The files are kept in
+# input_and_definition_files/modflow and use the format of the other
+# control files of the Tool:
+#
+#     set Executable {exe_dir}/mfnwt_jd.exe
+#
+#     begin Arguments
+#     arg {nam_name}
+#     end Arguments
+#
+#     begin Stdin
+#     line {nam_file}
+#     line y
+#     end Stdin
+#
+#     begin Outputs
+#     file nfseg_auto.lst
+#     end Outputs
+#
+#     begin Abort_Patterns
+#     pattern FAILED TO MEET SOLVER CONVERGENCE CRITERIA
+#     end Abort_Patterns
+#
+# Everything after the keyword (set Executable, arg, line, file, pattern)
+# is the value, spaces included. The values may use the fields
+#     {exe_dir}        the MODFLOW executable directory of the Tool
+#     {adapter_dir}    the directory of the adapter file
+#     {utilities_dir}  this directory (src/utilities)
+#     {python}         the Python running the Tool
+#     {nam_file}       full PATH of the name file
+#     {nam_name}       file name of the name file
+# An executable without a directory is looked up on the system PATH.
+# Without an Abort_Patterns section, MODFLOW-NWT's non-convergence
+# messages are used (process_runner.NONCONVERGENCE_PATTERNS).
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import os
+import sys
+
+import process_runner
+
+
+# Sections of an adapter file and the keyword of their lines
+SECTIONS = {'Arguments':'arg',
+            'Stdin':'line',
+            'Outputs':'file',
+            'Abort_Patterns':'pattern'}
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# MODFLOW executable adapter
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class ModflowAdapter(object):
+
+    def __init__(self, name, executable, arguments=(), stdin_lines=(), outputs=(),
+                 abort_patterns=None, adapter_dir=''):
+        self.name = name
+        self.executable = executable
+        self.arguments = list(arguments)
+        self.stdin_lines = list(stdin_lines)
+        self.outputs = list(outputs)
+        if abort_patterns is None: abort_patterns = process_runner.NONCONVERGENCE_PATTERNS
+        self.abort_patterns = list(abort_patterns)
+        self.adapter_dir = adapter_dir
+
+    def get_fields(self, exe_dir, nam_file):
+        return {'exe_dir':exe_dir,
+                'adapter_dir':self.adapter_dir,
+                'utilities_dir':os.path.dirname(os.path.abspath(__file__)),
+                'python':sys.executable,
+                'nam_file':nam_file,
+                'nam_name':os.path.basename(nam_file)}
+
+    def get_command(self, exe_dir, nam_file):
+        """ The executable and its arguments """
+        fields = self.get_fields(exe_dir, nam_file)
+        executable = self.executable.format(**fields)
+        # An executable without a directory is found on the system PATH
+        if (os.path.dirname(executable) != ''): executable = os.path.normpath(executable)
+        return [executable] + [argument.format(**fields) for argument in self.arguments]
+
+    def get_stdin(self, exe_dir, nam_file):
+        """ Lines written to standard input """
+        fields = self.get_fields(exe_dir, nam_file)
+        return [line.format(**fields) for line in self.stdin_lines]
+
+    def get_missing_outputs(self, model_dir):
+        """ Expected output files that are not in model_dir """
+        return [fname for fname in self.outputs
+                if not os.path.isfile(os.path.join(model_dir,fname))]
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read an adapter file
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def read_adapter_file(adapter_file):
+
+    name = os.path.splitext(os.path.basename(adapter_file))[0]
+    executable = None
+    values = dict([(section, []) for section in SECTIONS])
+    found = set()
+    section = None
+
+    with open(adapter_file,'r') as fin:
+        for line_number, line in enumerate(fin):
+            items = line.strip().split(None,1)
+            if (len(items)==0 or items[0].startswith('#')): continue
+
+            if (items[0] == 'begin' and len(items)>1 and items[1].strip() in SECTIONS):
+                section = items[1].strip()
+                found.add(section)
+            elif (items[0] == 'end'):
+                section = None
+            elif (section is not None and items[0] == SECTIONS[section] and len(items)>1):
+                values[section].append(items[1])
+            elif (items[0] == 'set' and line.split()[1:2] == ['Executable'] and len(line.split())>2):
+                executable = line.strip().split(None,2)[2]
+            else:
+                error_message = ('\nERROR:\tUnable to read line {0} of the MODFLOW adapter file {1}:\n\t{2}\n'
+                                 .format(line_number+1, adapter_file, line.strip()))
+                raise ValueError(error_message)
+            # END if
+        # END for over line
+    #
+
+    if executable is None:
+        error_message = ('\nERROR:\tThe MODFLOW adapter file {0} does not set the Executable\n'
+                         .format(adapter_file))
+        raise ValueError(error_message)
+    #
+
+    return ModflowAdapter(name, executable,
+                          arguments=values['Arguments'],
+                          stdin_lines=values['Stdin'],
+                          outputs=values['Outputs'],
+                          abort_patterns=values['Abort_Patterns'] if 'Abort_Patterns' in found else None,
+                          adapter_dir=os.path.dirname(os.path.abspath(adapter_file)))
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# The adapter used when none is given: the jd version of
+# MODFLOW-NWT, as the Tool has always run it (the same as
+# input_and_definition_files/modflow/mfnwt_jd.txt)
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def get_default_adapter():
+    return ModflowAdapter('mfnwt_jd',
+                          os.path.join('{exe_dir}','mfnwt_jd.exe'),
+                          stdin_lines=['{nam_file}','y','2','nfseg_sh.2009_2009.hds','23','2','1'])
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -0,0 +1,264 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Run an external program (MODFLOW, the Fortran and PEST utilities) and
+# stream its output
+#
+# Standard out and standard error are read line by line, by one thread
+# each, as the program writes them. Every line is checked against one
+# compiled pattern of the error keywords (mydefinitions.ErrorListValues)
+# and, optionally, written to the log as it arrives. The program is
+# stopped as soon as an error line appears, when it fails to converge
+# (for MODFLOW-NWT, abort_patterns=NONCONVERGENCE_PATTERNS), or when it
+# runs past the time limit, instead of running to the end first.
+#
+# The ArcGIS Python is 2.7, which has no asyncio, so the pipes are read
+# with threads.
+#
+# The CPU time and peak memory of the program are measured as it exits
+# and added to the open spans of run_trace.py: on Windows from the
+# process handle (GetProcessTimes and GetProcessMemoryInfo, through
+# ctypes), elsewhere from resource.getrusage(RUSAGE_CHILDREN) around the
+# wait. They are None where they cannot be measured.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import mydefinitions as mydef
+import run_logger
+import run_trace
+
+
+# Messages of MODFLOW-NWT when the solver does not converge
+NONCONVERGENCE_PATTERNS = ['FAILED TO MEET SOLVER CONVERGENCE CRITERIA',
+                           'FAILED TO CONVERGE',
+                           'FAILURE TO CONVERGE']
+
+
+def get_error_regex(extra_patterns=()):
+    """ One compiled pattern matching any of the error keywords """
+    patterns = list(mydef.ErrorListValues().ErrorList) + list(extra_patterns)
+    return re.compile('|'.join([re.escape(pattern) for pattern in patterns]))
+
+
+class ProcessResult(object):
+
+    def __init__(self):
+        self.returncode = None
+        self.stdout_lines = []
+        self.stderr_lines = []
+        # First line that matched an error pattern, and why the
+        # program was stopped (None if it ran to the end)
+        self.error_line = None
+        self.abort_reason = None
+        # CPU time (seconds) and peak memory (bytes) of the program,
+        # None where they could not be measured
+        self.cpu_time = None
+        self.peak_rss = None
+
+    def stdout(self):
+        return ''.join(self.stdout_lines)
+
+    def stderr(self):
+        return ''.join(self.stderr_lines)
+
+    def failed(self, check_stderr=True):
+        """ True for a nonzero return code, an error line, a stopped
+            program, or (with check_stderr) any output to standard error
+        """
+        return (self.returncode != 0 or self.error_line is not None or
+                self.abort_reason is not None or (check_stderr and len(self.stderr_lines) > 0))
+
+
+def kill(p):
+    try:
+        p.kill()
+    except OSError:
+        # Already ended
+        pass
+
+
+def get_windows_usage(p):
+    """ (CPU time in seconds, peak working set in bytes) of a program
+        on Windows, read from its handle after it exits and before
+        Popen.wait() releases it; None where they cannot be read
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    class FILETIME(ctypes.Structure):
+        _fields_ = [('low', wintypes.DWORD), ('high', wintypes.DWORD)]
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    cpu_time = peak_rss = None
+    try:
+        handle = wintypes.HANDLE(int(p._handle))
+        # INFINITE: the times are final once the process has exited
+        ctypes.windll.kernel32.WaitForSingleObject(handle, wintypes.DWORD(0xFFFFFFFF))
+
+        creation, exited, kernel, user = FILETIME(), FILETIME(), FILETIME(), FILETIME()
+        if ctypes.windll.kernel32.GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exited),
+                                                  ctypes.byref(kernel), ctypes.byref(user)):
+            # 100-nanosecond units
+            cpu_time = sum([(filetime.high << 32) + filetime.low for filetime in (kernel, user)])*1.e-7
+        #
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            peak_rss = counters.PeakWorkingSetSize
+    except (AttributeError, OSError, ValueError):
+        pass
+    # end try
+    return cpu_time, peak_rss
+
+
+def wait(p):
+    """ Wait for a program to exit. Returns (return code, CPU time in
+        seconds, peak memory in bytes), the last two None where they
+        cannot be measured.
+    """
+    if (os.name == 'nt'):
+        cpu_time, peak_rss = get_windows_usage(p)
+        return p.wait(), cpu_time, peak_rss
+    if resource is None:
+        return p.wait(), None, None
+
+    # The Tool waits for its programs one at a time, so the change in
+    # the counters of the finished children is this program
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    returncode = p.wait()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = round((after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime), 3)
+    # ru_maxrss is the largest child so far (kilobytes, bytes on macOS):
+    # the peak of this program only if it raised it
+    scale = 1 if (sys.platform == 'darwin') else 1024
+    peak_rss = after.ru_maxrss*scale if (after.ru_maxrss > before.ru_maxrss) else None
+    return returncode, cpu_time, peak_rss
+
+
+def read_lines(stream, name, lines):
+    for line in iter(stream.readline, ''):
+        lines.put((name, line))
+    # END for over line
+    stream.close()
+    lines.put((name, None))
+
+
+def run(args, logfile, stdin_lines=None, stdin_file=None, cwd=None, timeout=None,
+        abort_patterns=(), log_output=True, echo=False):
+    """ Run a program and return a ProcessResult.
+
+        stdin_lines   lines to write to standard input, or
+        stdin_file    a file to read standard input from
+        timeout       wall-clock limit in seconds (None for no limit)
+        abort_patterns  patterns, besides the error keywords, that stop
+                      the program
+        log_output    write the output lines to the logfile as they arrive
+        echo          print the output lines as they arrive
+    """
+    error_regex = get_error_regex()
+    abort_regex = get_error_regex(abort_patterns)
+
+    result = ProcessResult()
+    fin = open(stdin_file,'r') if stdin_file is not None else None
+    try:
+        p = subprocess.Popen(args,
+                             stdout = subprocess.PIPE,
+                             stdin = fin if fin is not None else subprocess.PIPE,
+                             stderr = subprocess.PIPE,
+                             cwd = cwd,
+                             universal_newlines = True)
+    finally:
+        if fin is not None: fin.close()
+    #
+
+    if fin is None:
+        try:
+            if stdin_lines: p.stdin.write(''.join(['{}\n'.format(line) for line in stdin_lines]))
+            p.stdin.close()
+        except (IOError, OSError):
+            # The program ended without reading its input; the
+            # output tells why
+            pass
+    #
+
+    lines = queue.Queue()
+    readers = [threading.Thread(target=read_lines, args=(p.stdout, 'stdout', lines)),
+               threading.Thread(target=read_lines, args=(p.stderr, 'stderr', lines))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    # END for over reader
+
+    deadline = None if not timeout else time.time() + timeout
+    open_streams = 2
+    while open_streams > 0:
+        try:
+            name, line = lines.get(timeout=1.)
+        except queue.Empty:
+            name = None
+        # end try
+        if (deadline is not None and time.time() > deadline and result.abort_reason is None):
+            result.abort_reason = 'it ran longer than the time limit of {} seconds'.format(timeout)
+            kill(p)
+        #
+        if name is None: continue
+        if line is None:
+            open_streams -= 1
+            continue
+        #
+        if (name == 'stdout'): result.stdout_lines.append(line)
+        else: result.stderr_lines.append(line)
+        if echo: print (line.rstrip('\n'))
+        if log_output: run_logger.log(logfile, line)
+
+        if (result.abort_reason is None and abort_regex.search(line)):
+            if error_regex.search(line):
+                result.error_line = line.strip()
+                result.abort_reason = 'of the error message: {}'.format(result.error_line)
+            else:
+                result.abort_reason = 'the solver did not converge: {}'.format(line.strip())
+            kill(p)
+        # END if
+    # END while
+
+    result.returncode, result.cpu_time, result.peak_rss = wait(p)
+    run_trace.add_child_usage(result.cpu_time, result.peak_rss)
+    return result
@@ -0,0 +1,281 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Rasters of model grid arrays without ArcGIS
+#
+# Writes an (nrow, ncol) NumPy array of a regular model grid (a GridIndex,
+# see grid_index.py) as
+#     write_ascii_grid()  an ESRI ASCII grid (.asc), with the .prj file of
+#                         the grid projection beside it; only for a grid
+#                         without rotation (not the NFSEG grid)
+#     write_geotiff()     a tiled, deflate compressed, float32 GeoTIFF
+#                         (.tif), georeferenced with GeoTIFF keys built
+#                         from the .prj file
+# Both are read by ArcGIS, QGIS and GDAL. Row 1 of the array is the top
+# (north) row of the grid. Cells set to nodata are shown as empty.
+#
+# GeoTIFF: TIFF 6.0 with the GeoTIFF 1.0 tags; the projections of
+# grid_index.Projection (Albers, Lambert conformal conic and transverse
+# Mercator) are written as user-defined projected coordinate systems.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import shutil
+import struct
+import zlib
+
+import numpy as np
+
+
+# Value of the cells without data
+NODATA = -9999.
+
+# GeoTIFF tile size (pixels) and zlib compression level
+TILE_SIZE = 256
+COMPRESS_LEVEL = 6
+
+# TIFF field types: (code, struct format)
+SHORT = (3, 'H')
+LONG = (4, 'L')
+DOUBLE = (12, 'd')
+ASCII = (2, 's')
+
+# GeoTIFF codes
+USER_DEFINED = 32767
+COORD_TRANS = {'albers':11, 'lambert_conformal_conic':8, 'transverse_mercator':1}
+LINEAR_UNITS = {1.0:9001, 0.3048:9002, 0.3048006096012192:9003}
+
+# GeoKeys of the projection parameters: (key, .prj parameter) by projection
+PROJECTION_KEYS = {'albers':[(3078, 'standard_parallel_1'),
+                             (3079, 'standard_parallel_2'),
+                             (3080, 'central_meridian'),
+                             (3081, 'latitude_of_origin'),
+                             (3082, 'false_easting'),
+                             (3083, 'false_northing')],
+                   'lambert_conformal_conic':[(3078, 'standard_parallel_1'),
+                                              (3079, 'standard_parallel_2'),
+                                              (3084, 'central_meridian'),
+                                              (3085, 'latitude_of_origin'),
+                                              (3086, 'false_easting'),
+                                              (3087, 'false_northing')],
+                   'transverse_mercator':[(3080, 'central_meridian'),
+                                          (3081, 'latitude_of_origin'),
+                                          (3082, 'false_easting'),
+                                          (3083, 'false_northing'),
+                                          (3092, 'scale_factor')]}
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Number formatting (each distinct value once)
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def format_rows(values, fmt='{:.7g}'):
+    """ Lines of space separated numbers, one per row of values """
+    unique, index = np.unique(values, return_inverse=True)
+    text = [fmt.format(value) for value in unique.tolist()]
+    index = index.reshape(values.shape).tolist()
+    return [' '.join([text[i] for i in row]) for row in index]
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# ESRI ASCII grid
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def write_ascii_grid(values, grid, out_file, prj_file=None, nodata=NODATA):
+    """ ASCII grids have no rotation: the grid must not be rotated """
+    if (grid.rotation != 0.):
+        error_message = ('\nERROR:\tThe grid is rotated ({} degrees); an ASCII grid cannot be. '
+                         'Write a GeoTIFF instead\n'.format(grid.rotation))
+        raise ValueError(error_message)
+    #
+    values = np.where(np.isnan(values), nodata, values)
+
+    with open(out_file,'w') as fout:
+        fout.write('ncols {}\n'.format(grid.ncol))
+        fout.write('nrows {}\n'.format(grid.nrow))
+        fout.write('xllcorner {!r}\n'.format(grid.x_origin))
+        fout.write('yllcorner {!r}\n'.format(grid.y_origin - grid.nrow*grid.cell_size))
+        fout.write('cellsize {!r}\n'.format(grid.cell_size))
+        fout.write('NODATA_value {!r}\n'.format(nodata))
+        fout.write('\n'.join(format_rows(values)) + '\n')
+    #
+    if prj_file is not None:
+        shutil.copyfile(prj_file, out_file[:out_file.rfind('.')] + '.prj')
+    #
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# GeoTIFF
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def get_geokeys(projection):
+    """ GeoKeyDirectoryTag, GeoDoubleParamsTag and GeoAsciiParamsTag
+        values of a grid_index.Projection
+    """
+    short_keys = [(1024, 1),            # GTModelTypeGeoKey: projected
+                  (1025, 1),            # GTRasterTypeGeoKey: PixelIsArea
+                  (2054, 9102),         # GeogAngularUnitsGeoKey: degree
+                  (3072, USER_DEFINED), # ProjectedCSTypeGeoKey
+                  (3074, USER_DEFINED), # ProjectionGeoKey
+                  (3075, COORD_TRANS[projection.projection])]
+    double_keys = []
+
+    if (projection.datum == 'D_North_American_1983'):
+        short_keys.append((2048, 4269))  # GeographicTypeGeoKey: NAD83
+    else:
+        short_keys.extend([(2048, USER_DEFINED), (2050, USER_DEFINED), (2056, USER_DEFINED)])
+        double_keys.extend([(2057, projection.a), (2059, projection.inverse_flattening)])
+    #
+
+    # ProjLinearUnitsGeoKey
+    for unit, code in LINEAR_UNITS.items():
+        if (abs(projection.unit - unit) < 1.e-9):
+            short_keys.append((3076, code))
+            break
+    else:
+        short_keys.append((3076, USER_DEFINED))
+        double_keys.append((3077, projection.unit))
+    # END for over unit
+
+    for key, name in PROJECTION_KEYS[projection.projection]:
+        double_keys.append((key, projection.parameter(name, 1. if name == 'scale_factor' else 0.)))
+    #
+
+    # PCSCitationGeoKey
+    citation = projection.name + '|'
+    ascii_keys = [(3073, citation)]
+
+    entries = ([(key, 0, 1, value) for key, value in short_keys] +
+               [(key, 34736, 1, i) for i, (key, value) in enumerate(double_keys)] +
+               [(key, 34737, len(citation), 0) for key, citation in ascii_keys])
+    entries.sort()
+
+    directory = [1, 1, 0, len(entries)]
+    for entry in entries:
+        directory.extend(entry)
+    #
+    return directory, [value for key, value in double_keys], citation
+
+def get_georeference_tags(grid):
+    """ Pixel to grid projection tags: scale and tie point, or a
+        transformation matrix where the grid is rotated
+    """
+    if (grid.rotation == 0.):
+        return [(33550, DOUBLE, [grid.cell_size, grid.cell_size, 0.]),
+                (33922, DOUBLE, [0., 0., 0., grid.x_origin, grid.y_origin, 0.])]
+    #
+    angle = np.radians(grid.rotation)
+    cos = grid.cell_size*np.cos(angle)
+    sin = grid.cell_size*np.sin(angle)
+    return [(34264, DOUBLE, [cos, sin, 0., grid.x_origin,
+                             sin, -cos, 0., grid.y_origin,
+                             0., 0., 0., 0.,
+                             0., 0., 0., 1.])]
+
+def pack_ifd(tags, ifd_offset):
+    """ Bytes of an image file directory (IFD) at ifd_offset, followed by
+        the values that do not fit in the entries
+    """
+    tags = sorted(tags, key=lambda tag: tag[0])
+    data_offset = ifd_offset + 2 + 12*len(tags) + 4
+    entries = []
+    data = []
+    for tag, (code, fmt), values in tags:
+        if (fmt == 's'):
+            packed = values.encode('ascii') + b'\0'
+            count = len(packed)
+        else:
+            packed = struct.pack('<{0}{1}'.format(len(values), fmt), *values)
+            count = len(values)
+        #
+        if (len(packed) <= 4):
+            entries.append(struct.pack('<HHL', tag, code, count) + packed.ljust(4, b'\0'))
+        else:
+            entries.append(struct.pack('<HHLL', tag, code, count, data_offset))
+            if (len(packed) % 2): packed += b'\0'
+            data.append(packed)
+            data_offset += len(packed)
+        # END if
+    # END for over tag
+    return struct.pack('<H', len(tags)) + b''.join(entries) + struct.pack('<L', 0) + b''.join(data)
+
+def write_geotiff(values, grid, out_file, projection, nodata=NODATA, tile_size=TILE_SIZE):
+    """ Single band float32 GeoTIFF of values (nrow, ncol) """
+    nrow, ncol = values.shape
+    values = np.where(np.isnan(values), nodata, values).astype('<f4')
+
+    # Tiles are whole: pad the last row and column of tiles with nodata
+    tile_rows = -(-nrow // tile_size)
+    tile_cols = -(-ncol // tile_size)
+    padded = np.full((tile_rows*tile_size, tile_cols*tile_size), nodata, dtype='<f4')
+    padded[:nrow,:ncol] = values
+
+    offsets = []
+    byte_counts = []
+    with open(out_file,'wb') as fout:
+        fout.write(b'II' + struct.pack('<HL', 42, 0))
+        for i in range(tile_rows):
+            for j in range(tile_cols):
+                tile = padded[i*tile_size:(i+1)*tile_size, j*tile_size:(j+1)*tile_size]
+                compressed = zlib.compress(tile.tobytes(), COMPRESS_LEVEL)
+                offsets.append(fout.tell())
+                byte_counts.append(len(compressed))
+                fout.write(compressed)
+            # END for over j
+        # END for over i
+
+        # The IFD starts on a word boundary
+        if (fout.tell() % 2): fout.write(b'\0')
+        ifd_offset = fout.tell()
+
+        geokeys, geodoubles, geoascii = get_geokeys(projection)
+        tags = [(256, LONG, [ncol]),                # ImageWidth
+                (257, LONG, [nrow]),                # ImageLength
+                (258, SHORT, [32]),                 # BitsPerSample
+                (259, SHORT, [8]),                  # Compression: deflate
+                (262, SHORT, [1]),                  # PhotometricInterpretation
+                (277, SHORT, [1]),                  # SamplesPerPixel
+                (284, SHORT, [1]),                  # PlanarConfiguration
+                (322, LONG, [tile_size]),           # TileWidth
+                (323, LONG, [tile_size]),           # TileLength
+                (324, LONG, offsets),               # TileOffsets
+                (325, LONG, byte_counts),           # TileByteCounts
+                (339, SHORT, [3]),                  # SampleFormat: float
+                (34735, SHORT, geokeys),            # GeoKeyDirectoryTag
+                (34736, DOUBLE, geodoubles),        # GeoDoubleParamsTag
+                (34737, ASCII, geoascii),           # GeoAsciiParamsTag
+                (42113, ASCII, '{!r}'.format(nodata))]  # GDAL_NODATA
+        tags.extend(get_georeference_tags(grid))
+        fout.write(pack_ifd(tags, ifd_offset))
+
+        # Point the header at the IFD
+        fout.seek(4)
+        fout.write(struct.pack('<L', ifd_offset))
+    #
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
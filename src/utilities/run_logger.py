@@ -0,0 +1,228 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Buffered run logger.
+
+    All the modules of the Tool write their messages with
+
+        run_logger.log(logfile, currentmessage)
+
+    When a RunLogger has been started for the logfile (run_cup_simulation
+    starts one for each run), the message is kept in memory and the log is
+    written in one go when a stage starts or ends, every flush_interval
+    seconds, when the buffer is full, or right away for an ERROR message.
+    Each message is also written, with its time, stage, process and thread,
+    as one JSON line to <logfile without extension>.jsonl beside the log.
+    Without a RunLogger the message is appended to the logfile directly,
+    so the modules work the same way on their own.
+
+    Writes from several threads are serialized by a lock. Worker processes
+    send their messages to the logger of the parent process through a
+    queue: call RunLogger.get_queue() in the parent and pass
+    run_logger.init_worker with the queue as the initializer of the worker
+    pool.
+"""
+
+import atexit
+import datetime
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+
+# Loggers started in this process, by logfile
+loggers = {}
+
+# Queue to the parent process logger (set in worker processes)
+worker_queue = None
+
+# Stage run by this worker process (see set_worker_stage)
+worker_stage = None
+
+
+def get_key(logfile):
+    return os.path.normcase(os.path.abspath(logfile))
+
+
+def get_level(message):
+    if 'ERROR' in message: return 'error'
+    if 'WARNING' in message: return 'warning'
+    return 'info'
+
+
+class RunLogger(object):
+
+    def __init__(self, logfile, json_file=None, flush_interval=2., max_buffer=500):
+        self.logfile = logfile
+        if json_file is None:
+            json_file = os.path.splitext(logfile)[0] + '.jsonl'
+        self.json_file = json_file
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.start_time = time.time()
+        # A forked worker process inherits a copy of the logger
+        # that it must not use (its timer thread is not running)
+        self.pid = os.getpid()
+        self.stage = ''
+        self.buffer = []
+        self.lock = threading.RLock()
+        self.closed = threading.Event()
+        self.queue = None
+        self.listener = None
+
+        self.timer = threading.Thread(target=self.flush_periodically)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def write(self, message, level=None, stage=None, pid=None, thread=None, timestamp=None, event=None):
+        """ Buffer a message for the log """
+        if level is None: level = get_level(message)
+        if timestamp is None: timestamp = time.time()
+        record = {'time':datetime.datetime.fromtimestamp(timestamp).isoformat(),
+                  'elapsed':round(timestamp - self.start_time, 3),
+                  'stage':self.stage if stage is None else stage,
+                  'level':level,
+                  'pid':os.getpid() if pid is None else pid,
+                  'thread':threading.current_thread().name if thread is None else thread,
+                  'message':message.strip()}
+        if event is not None: record['event'] = event
+        with self.lock:
+            self.buffer.append((message, record))
+            if (level == 'error' or len(self.buffer) >= self.max_buffer): self.flush()
+        #
+
+    def flush(self):
+        """ Write the buffered messages to the log and the JSON-lines file """
+        with self.lock:
+            if not self.buffer: return
+            buffer, self.buffer = self.buffer, []
+            with open(self.logfile,'a') as lf:
+                lf.write(''.join([message for message, record in buffer]))
+            with open(self.json_file,'a') as jf:
+                jf.write(''.join([json.dumps(record) + '\n' for message, record in buffer]))
+        #
+
+    def flush_periodically(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+        # END while
+
+    def set_stage(self, stage, event):
+        """ Mark a stage boundary (event: start, end, cached, failed) and
+            write the buffered messages
+        """
+        with self.lock:
+            if (event == 'start'): self.stage = stage
+            self.write('', level='stage', stage=stage, event=event)
+            self.flush()
+            if (event != 'start'): self.stage = ''
+        #
+
+    def get_queue(self):
+        """ Queue for the messages of worker processes """
+        with self.lock:
+            if self.queue is None:
+                self.queue = multiprocessing.Queue()
+                self.listener = threading.Thread(target=self.listen)
+                self.listener.daemon = True
+                self.listener.start()
+            #
+        return self.queue
+
+    def listen(self):
+        while True:
+            item = self.queue.get()
+            if item is None: break
+            logfile, message, level, stage, pid, thread, timestamp = item
+            logger = get_logger(logfile)
+            if logger is None:
+                with open(logfile,'a') as lf: lf.write(message)
+            else:
+                logger.write(message, level, stage, pid, thread, timestamp)
+        # END while
+
+    def close(self):
+        self.closed.set()
+        if self.queue is not None:
+            self.queue.put(None)
+            self.listener.join()
+            self.queue = None
+        self.flush()
+
+
+def start(logfile, **kwargs):
+    """ Start buffering the messages of a logfile. Returns the RunLogger. """
+    key = get_key(logfile)
+    if key in loggers: return loggers[key]
+    loggers[key] = RunLogger(logfile, **kwargs)
+    return loggers[key]
+
+
+def stop(logfile):
+    """ Write out and stop the logger of a logfile (if one was started) """
+    logger = get_logger(logfile)
+    if logger is not None:
+        loggers.pop(get_key(logfile))
+        logger.close()
+    #
+
+
+def stop_all():
+    for key in list(loggers):
+        logger = loggers.pop(key)
+        if (logger.pid == os.getpid()): logger.close()
+    # END for over key
+
+atexit.register(stop_all)
+
+
+def init_worker(queue):
+    """ Initializer of worker processes: send messages to the parent """
+    global worker_queue
+    worker_queue = queue
+
+
+def set_worker_stage(stage):
+    """ Tag the messages of this worker process with the stage it runs """
+    global worker_stage
+    worker_stage = stage
+
+
+def get_logger(logfile):
+    """ The logger of logfile started in this process, or None """
+    logger = loggers.get(get_key(logfile))
+    if (logger is not None and logger.pid == os.getpid()): return logger
+    return None
+
+
+def log(logfile, message):
+    """ Write a message to a logfile """
+    logger = get_logger(logfile)
+    if logger is not None:
+        logger.write(message)
+    elif worker_queue is not None:
+        worker_queue.put((logfile, message, get_level(message), worker_stage, os.getpid(),
+                          threading.current_thread().name, time.time()))
+    else:
+        with open(logfile,'a') as lf: lf.write(message)
+    #
+
+
+def flush(logfile):
+    logger = get_logger(logfile)
+    if logger is not None: logger.flush()
+
+
+def set_stage(logfile, stage, event):
+    """ Mark a stage boundary in the log of logfile (see RunLogger.set_stage) """
+    logger = get_logger(logfile)
+    if logger is not None: logger.set_stage(stage, event)
@@ -0,0 +1,268 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Timing and resource use of the stages of a run
+#
+# A span records, from its start to its end:
+#     wall time
+#     CPU time of the Tool (user + system)
+#     CPU time of the child processes that finished during the span
+#         (MODFLOW, the Fortran programs), from
+#         resource.getrusage(RUSAGE_CHILDREN)
+#     peak resident memory of the Tool and of its largest child process
+#         (high-water marks at the end of the span)
+#     bytes read and written by the Tool
+#
+# The resource module is not available on Windows, where os.times()
+# reports no child times. There the programs run by process_runner.py
+# are measured from their process handles as they exit and passed to
+# add_child_usage(), and the memory and I/O numbers of the Tool are read
+# with psutil if it is installed. A number that cannot be measured (a
+# program that could not be measured, no psutil) is left blank, not 0.
+#
+# RunTrace.write() saves the spans as a Chrome trace (open it in
+# chrome://tracing or https://ui.perfetto.dev) and as a csv table.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Resource use of the current process
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+# Totals of the child processes measured by process_runner in this
+# process: CPU time, number that could not be measured, largest peak
+# memory
+child_usage = {'cpu':0., 'unmeasured':0, 'peak_rss':None}
+child_usage_lock = threading.Lock()
+
+
+def add_child_usage(cpu_time, peak_rss):
+    """ Add a finished child process (None for a value that could not
+        be measured)
+    """
+    with child_usage_lock:
+        if cpu_time is None: child_usage['unmeasured'] += 1
+        else: child_usage['cpu'] += cpu_time
+        if (peak_rss is not None and
+            (child_usage['peak_rss'] is None or peak_rss > child_usage['peak_rss'])):
+            child_usage['peak_rss'] = peak_rss
+    #
+
+
+def get_io_bytes():
+    """ (bytes read, bytes written) by this process, or (None, None) """
+    if os.path.isfile('/proc/self/io'):
+        counters = {}
+        with open('/proc/self/io','r') as fin:
+            for line in fin:
+                name, value = line.split(':')
+                counters[name] = int(value)
+            # END for over line
+        #
+        return counters.get('rchar'), counters.get('wchar')
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    #
+    return None, None
+
+
+def get_peak_rss():
+    """ (peak resident memory of this process, of its largest finished
+        child process) in bytes, or None where it is not available
+    """
+    if resource is not None:
+        # ru_maxrss is in kilobytes, except on macOS (bytes)
+        scale = 1 if (sys.platform == 'darwin') else 1024
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss*scale)
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', None), child_usage['peak_rss']
+    return None, child_usage['peak_rss']
+
+
+def get_usage():
+    """ Snapshot of the resource counters """
+    if resource is not None:
+        usage_self = resource.getrusage(resource.RUSAGE_SELF)
+        usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = usage_self.ru_utime + usage_self.ru_stime
+        child_cpu = usage_children.ru_utime + usage_children.ru_stime
+    else:
+        times = os.times()
+        cpu = times[0] + times[1]
+        # Zero on Windows: taken from the measured children instead
+        child_cpu = None
+    #
+    read_bytes, write_bytes = get_io_bytes()
+    with child_usage_lock:
+        measured_child_cpu, unmeasured_children = child_usage['cpu'], child_usage['unmeasured']
+    #
+    return {'wall':time.time(),
+            'cpu':cpu,
+            'child_cpu':child_cpu,
+            'measured_child_cpu':measured_child_cpu,
+            'unmeasured_children':unmeasured_children,
+            'read_bytes':read_bytes,
+            'write_bytes':write_bytes}
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Spans of a run
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+SUMMARY_COLUMNS = ['name', 'category', 'status', 'wall_s', 'cpu_s', 'child_cpu_s',
+                   'peak_rss_mb', 'child_peak_rss_mb', 'read_mb', 'written_mb']
+
+
+class RunTrace(object):
+
+    def __init__(self, name, trace_file=None, summary_file=None):
+        self.name = name
+        self.trace_file = trace_file
+        self.summary_file = summary_file
+        self.start_time = time.time()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, category='stage'):
+        """ Measure the enclosed code. Set the 'status' item of the yielded
+            dictionary (e.g., 'cached', 'failed'); any other items are
+            saved with the span.
+        """
+        info = {'status':'ok'}
+        start = get_usage()
+        try:
+            yield info
+        except Exception:
+            info['status'] = 'failed'
+            raise
+        finally:
+            self.add_span(name, category, start, get_usage(), info)
+        # end try
+
+    def add_span(self, name, category, start, end, info, thread=None, peak_rss=None):
+        """ Save a span measured with get_usage(). A span measured in a
+            worker process gives the worker's name as thread and its
+            get_peak_rss() as peak_rss.
+        """
+        if peak_rss is None: peak_rss = get_peak_rss()
+        peak_rss, child_peak_rss = peak_rss
+        if thread is None: thread = threading.current_thread().name
+
+        def difference(item, scale=1.):
+            if (start[item] is None or end[item] is None): return None
+            return round((end[item] - start[item])/scale, 3)
+
+        def megabytes(value):
+            return None if (value is None) else round(value/1048576., 1)
+
+        child_cpu_s = difference('child_cpu')
+        if (child_cpu_s is None and difference('unmeasured_children') == 0):
+            # Every child process of the span was measured
+            child_cpu_s = difference('measured_child_cpu')
+
+        span = {'name':name,
+                'category':category,
+                'status':info.get('status', 'ok'),
+                'start':start['wall'],
+                'thread':thread,
+                'wall_s':difference('wall'),
+                'cpu_s':difference('cpu'),
+                'child_cpu_s':child_cpu_s,
+                'peak_rss_mb':megabytes(peak_rss),
+                'child_peak_rss_mb':megabytes(child_peak_rss),
+                'read_mb':difference('read_bytes', 1048576.),
+                'written_mb':difference('write_bytes', 1048576.),
+                'args':dict([(key, info[key]) for key in info if key != 'status'])}
+        with self.lock:
+            self.spans.append(span)
+        #
+
+    def get_trace_events(self):
+        """ Spans as Chrome trace complete events (times in microseconds) """
+        pid = os.getpid()
+        threads = {}
+        events = [{'name':'process_name', 'ph':'M', 'pid':pid, 'tid':0,
+                   'args':{'name':self.name}}]
+        for span in sorted(self.spans, key=lambda item: item['start']):
+            if span['thread'] not in threads:
+                threads[span['thread']] = len(threads)
+                events.append({'name':'thread_name', 'ph':'M', 'pid':pid, 'tid':threads[span['thread']],
+                               'args':{'name':span['thread']}})
+            args = dict(span['args'])
+            for column in SUMMARY_COLUMNS[2:]:
+                if span[column] is not None: args[column] = span[column]
+            # END for over column
+            events.append({'name':span['name'],
+                           'cat':span['category'],
+                           'ph':'X',
+                           'ts':int(round((span['start'] - self.start_time)*1.e6)),
+                           'dur':int(round(span['wall_s']*1.e6)),
+                           'pid':pid,
+                           'tid':threads[span['thread']],
+                           'args':args})
+        # END for over span
+        return events
+
+    def write(self, trace_file=None, summary_file=None):
+        """ Save the Chrome trace and the summary table (by default to
+            the files given when the trace was made)
+        """
+        if trace_file is None: trace_file = self.trace_file
+        if summary_file is None: summary_file = self.summary_file
+        with self.lock:
+            with open(trace_file,'w') as fout:
+                json.dump({'traceEvents':self.get_trace_events(), 'displayTimeUnit':'ms'}, fout)
+            #
+            with open(summary_file,'w') as fout:
+                fout.write(','.join(SUMMARY_COLUMNS) + '\n')
+                for span in sorted(self.spans, key=lambda item: item['start']):
+                    fout.write(','.join(['' if span[column] is None else str(span[column])
+                                         for column in SUMMARY_COLUMNS]) + '\n')
+                # END for over span
+            #
+        #
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
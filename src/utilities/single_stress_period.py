@@ -0,0 +1,241 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Single-stress-period run mode
+#
+# Stress period 1 of every Tool run is the unchanged NFSEG 2009 baseline.
+# In the single-stress-period mode the baseline is run once as a one-stress
+# period model (and reused from the stage cache), and each scenario is run
+# as a one-stress period model with the new wells added.
+#
+# The baseline and scenario outputs are then combined into a listing file
+# and a heads file that look like the output of the two-stress period
+# model (the scenario is labeled as stress period 2), so the postprocessing
+# scripts are used unchanged.
+#
+# Assumes, as the Tool does, that only the Well Package differs between
+# the stress periods: the other stress-period packages are read for one
+# stress period only.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import os
+import re
+import shutil
+import struct
+
+
+# Stress-period labels in the MODFLOW listing file, e.g.
+#     STRESS PERIOD NO.    1, LENGTH = ...
+#     RIVER LEAKAGE   PERIOD   1   STEP   1
+#     ... AT END OF TIME STEP    1, STRESS PERIOD    1
+LISTING_PERIOD_PATTERN = re.compile(r'(PERIOD(?:\s+NO\.)?\s+)(\d+)(?!\d)')
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Read the data lines of a MODFLOW input file,
+# keeping track of comment lines
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def is_data_line(line):
+    return (line.strip() != '' and not line.lstrip().startswith('#'))
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Discretization file with one stress period
+#
+# The first data line holds NLAY NROW NCOL NPER ITMUNI
+# LENUNI, and the last NPER data lines hold the stress
+# period records (PERLEN NSTP TSMULT Ss/Tr). Only the
+# record of stress_period is kept.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def make_single_period_dis(dis_in, dis_out, stress_period):
+
+    with open(dis_in,'r') as fin: lines = fin.readlines()
+
+    data_lines = [i for i in range(len(lines)) if is_data_line(lines[i])]
+    header_index = data_lines[0]
+    items = lines[header_index].split()
+    nper = int(items[3])
+    if (stress_period < 1 or stress_period > nper):
+        error_message = ('\nERROR:\tStress period {0} is not in {1} ({2} stress periods)\n'
+                         .format(stress_period, dis_in, nper))
+        raise ValueError(error_message)
+    #
+
+    period_lines = data_lines[-nper:]
+    keep_line = period_lines[stress_period-1]
+
+    items[3] = '1'
+    lines[header_index] = ''.join(['{0:>10}'.format(item) for item in items]) + '\n'
+
+    with open(dis_out,'w') as fout:
+        for i in range(len(lines)):
+            if (i in period_lines and i != keep_line): continue
+            fout.write(lines[i])
+        # END for over i
+    #
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Output Control file with one stress period
+#
+# For words-format OC files, only the PERIOD blocks of
+# stress_period are kept, renumbered as stress period 1.
+# Numeric-format files are copied unchanged (records
+# for later stress periods are simply not read).
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def make_single_period_oc(oc_in, oc_out, stress_period):
+
+    with open(oc_in,'r') as fin: lines = fin.readlines()
+
+    output = []
+    keep = True
+    for line in lines:
+        items = line.split()
+        if (len(items) > 1 and items[0].upper() == 'PERIOD'):
+            keep = (int(items[1]) == stress_period)
+            if keep: line = re.sub(r'(?i)(PERIOD\s+)\d+', r'\g<1>1', line, count=1)
+        #
+        if keep: output.append(line)
+    # END for over line
+
+    with open(oc_out,'w') as fout: fout.writelines(output)
+
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Combine the baseline and scenario listing files.
+# The scenario stress period 1 is relabeled as stress
+# period 2.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def relabel_listing_line(line, stress_period):
+    if 'PERIOD' not in line: return line
+
+    def replace(match):
+        number = match.group(2)
+        if (int(number) != 1): return match.group(0)
+        # Keep the width so fixed-column parsers still work
+        return match.group(1)[:len(match.group(1))-(len(str(stress_period))-len(number))] + str(stress_period)
+
+    return LISTING_PERIOD_PATTERN.sub(replace, line)
+
+
+def combine_listing_files(baseline_lst, scenario_lst, lst_out):
+
+    with open(lst_out,'w') as fout:
+        with open(baseline_lst,'r') as fin:
+            shutil.copyfileobj(fin, fout, 1024*1024)
+        #
+        with open(scenario_lst,'r') as fin:
+            for line in fin:
+                fout.write(relabel_listing_line(line, 2))
+            # END for over line
+        #
+    #
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Combine the baseline and scenario binary heads files.
+#
+# Each record is a header (KSTP, KPER, PERTIM, TOTIM,
+# TEXT, NCOL, NROW, ILAY) followed by NCOL*NROW values,
+# in single or double precision. The scenario records
+# are relabeled as stress period 2 and their TOTIM is
+# shifted by the baseline simulation time.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def get_heads_file_precision(hds_file):
+    """ Return (real format, real size) of a binary heads file """
+    size = os.path.getsize(hds_file)
+    with open(hds_file,'rb') as fin: first = fin.read(52)
+
+    for real, nbytes in [('f',4), ('d',8)]:
+        header_size = 8 + 2*nbytes + 16 + 12
+        if (len(first) < header_size): continue
+        ncol, nrow, ilay = struct.unpack('<3i', first[header_size-12:header_size])
+        if (ncol < 1 or nrow < 1 or ilay < 1 or ncol*nrow > 1e8): continue
+        if (size % (header_size + ncol*nrow*nbytes) == 0): return real, nbytes
+    # END for over real
+
+    raise ValueError('\nERROR:\tCould not read the binary heads file {}\n'.format(hds_file))
+
+
+def read_heads_records(fin, real, nbytes):
+    """ Generator of (header values, array bytes) for each record """
+    header_format = '<2i2{0}16s3i'.format(real)
+    header_size = struct.calcsize(header_format)
+    while True:
+        header = fin.read(header_size)
+        if (len(header) < header_size): break
+        values = list(struct.unpack(header_format, header))
+        ncol, nrow = values[5], values[6]
+        yield values, fin.read(ncol*nrow*nbytes)
+    # END while
+
+
+def combine_heads_files(baseline_hds, scenario_hds, hds_out):
+
+    real, nbytes = get_heads_file_precision(baseline_hds)
+    header_format = '<2i2{0}16s3i'.format(real)
+
+    totim = 0.
+    with open(hds_out,'wb') as fout:
+        with open(baseline_hds,'rb') as fin:
+            for values, data in read_heads_records(fin, real, nbytes):
+                totim = values[3]
+                fout.write(struct.pack(header_format, *values))
+                fout.write(data)
+            # END for over values
+        #
+        with open(scenario_hds,'rb') as fin:
+            for values, data in read_heads_records(fin, real, nbytes):
+                values[1] = values[1] + 1
+                values[3] = values[3] + totim
+                fout.write(struct.pack(header_format, *values))
+                fout.write(data)
+            # END for over values
+        #
+    #
+    return
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
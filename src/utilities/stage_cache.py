@@ -0,0 +1,893 @@
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#
+# Stage graph and content-hash cache for the Tool pipeline
+#
+# Each pipeline step is declared as a Stage with the files it reads
+# (inputs), the files it writes (outputs), and any parameters that
+# change its results. The cache key of a stage is the hash of the
+# contents of its inputs, its parameters, and the source of its code
+# (the module of the stage function and every Tool module it imports),
+# so editing the code of a stage retires its cache entries. When a key
+# is found in the cache the outputs are restored from the cache instead
+# of running the stage.
+#
+# Cache layout (cache_dir):
+#     objects/<sha1[:2]>/<sha1>   output file contents, stored once
+#                                 (an artifact_store.ArtifactStore)
+#     stages/<key>.json           outputs and return value of a stage
+#     file_hashes.json            hashes of files by PATH, size and
+#                                 modification time (avoids rehashing
+#                                 large unchanged files)
+#
+# Stages marked parallel (the postprocessing after MODFLOW) are run in a
+# pool of worker processes, each as soon as the stages it depends on have
+# finished, so independent branches run at the same time. Other stages
+# run in the Tool's process, one at a time, after every stage before them
+# has finished (e.g., the GIS stage, which writes to the geodatabase).
+#
+# A stage that raises an error fails alone: the error is logged (a
+# ValueError by its message, any other with its traceback), the stages
+# that depend on it are not run, and the independent stages still
+# running finish. The status of every stage is logged when a run fails.
+#
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import ast
+import hashlib
+import json
+import multiprocessing
+import os
+import stat
+import sys
+import time
+import traceback
+
+import artifact_store
+import basic_utilities as bscut
+import run_logger
+import run_trace
+
+
+# Placeholder used for the run directory in cache keys and cached results,
+# so identical runs in different results directories share cache entries
+RUN_ROOT = '<RUN_ROOT>'
+
+
+def get_error_message(name):
+    """ Message, with the traceback, of an unexpected error raised by a
+        stage (call in the except clause)
+    """
+    return ('\nERROR:\tStage {0} failed with an unexpected error:\n{1}\n'
+            .format(name, traceback.format_exc()))
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Stage definitions
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class StageResult(object):
+    """ Placeholder for the return value of an earlier stage. Can be used
+        in the args, kwargs, and inputs of a later stage.
+    """
+    def __init__(self, stage_name):
+        self.stage_name = stage_name
+
+
+class Stage(object):
+    """ One step of the pipeline.
+
+        name       unique stage name
+        func       module-level function to call as func(*args, **kwargs).
+                   A return value of False marks the stage as failed.
+        inputs     files or directories whose contents determine the results
+        outputs    files written by the stage
+        params     dictionary of parameters that change the results
+        message    printed and logged when the stage starts
+        cacheable  False for stages with side effects outside their
+                   declared outputs (e.g., geodatabase updates)
+        version    increase when the results change without a change to
+                   the Tool's code (e.g., a new build of a Fortran
+                   program). Changes to the source of the stage's module
+                   and of the Tool modules it imports are found by
+                   get_code_hash().
+        depends    names of stages that must run first. Stages that
+                   write one of the inputs are added automatically.
+        parallel   True if the stage may run in a worker process at the
+                   same time as other parallel stages: its inputs and
+                   dependencies are complete, and func, its arguments
+                   and its return value can be pickled
+    """
+    def __init__(self, name, func, args=(), kwargs=None, inputs=(), outputs=(),
+                 params=None, message='', cacheable=True, version=1, depends=(),
+                 parallel=False):
+        self.name = name
+        self.func = func
+        self.args = list(args)
+        self.kwargs = dict(kwargs or {})
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = dict(params or {})
+        self.message = message
+        self.cacheable = cacheable
+        self.version = version
+        self.depends = list(depends)
+        self.parallel = parallel
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Replace the run directory with RUN_ROOT (and back)
+# in strings, lists and dictionaries
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def relocate(value, old_root, new_root):
+    if isinstance(value, dict):
+        return dict([(key, relocate(value[key], old_root, new_root)) for key in value])
+    elif isinstance(value, (list, tuple)):
+        return [relocate(item, old_root, new_root) for item in value]
+    elif isinstance(value, type(u'')) or isinstance(value, str):
+        if value.startswith(old_root): return new_root + value[len(old_root):]
+    return value
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Hash of the source of a stage function
+#
+# The imports are read from the source (ast), not by
+# importing the modules, so the stages whose modules load
+# arcpy (gis_backends.LazyFunction) are not imported to
+# look up a cache entry.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+# Directory of the Tool's packages (src)
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code hashes by module file, for this process (the source does not
+# change during a run)
+code_hashes = {}
+
+
+def get_module_file(module_name, from_dir):
+    """ .py file of a Tool module, next to the importing module (implicit
+        relative import) or below SOURCE_DIR, or None
+    """
+    parts = module_name.split('.')
+    for base_dir in [from_dir, SOURCE_DIR]:
+        path = os.path.join(base_dir, *parts)
+        for file_name in [path + '.py', os.path.join(path, '__init__.py')]:
+            if os.path.isfile(file_name): return os.path.normcase(os.path.abspath(file_name))
+        # END for over file_name
+    # END for over base_dir
+    return None
+
+
+def get_function_file(func):
+    """ Source file of the module of a stage function, or None """
+    if hasattr(func, 'module_name'):
+        # A gis_backends.LazyFunction, not imported yet
+        return get_module_file(func.module_name, SOURCE_DIR)
+    module = sys.modules.get(getattr(func, '__module__', None))
+    file_name = getattr(module, '__file__', None)
+    if file_name is None: return None
+    if file_name.endswith(('.pyc', '.pyo')): file_name = file_name[:-1]
+    if not os.path.isfile(file_name): return None
+    return os.path.normcase(os.path.abspath(file_name))
+
+
+def get_imported_files(file_name, source):
+    """ Source files of the Tool modules imported anywhere in a module
+        (other modules, e.g. numpy and arcpy, are not followed)
+    """
+    try:
+        tree = ast.parse(source, file_name)
+    except SyntaxError:
+        return []
+    #
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend([alias.name for alias in node.names])
+        elif (isinstance(node, ast.ImportFrom) and node.module):
+            names.append(node.module)
+            names.extend([node.module + '.' + alias.name for alias in node.names])
+        # END if
+    # END for over node
+    from_dir = os.path.dirname(file_name)
+    files = [get_module_file(name, from_dir) for name in names]
+    return [imported for imported in files if imported is not None]
+
+
+def get_code_hash(func):
+    """ sha1 of the source of the module of a stage function and of the
+        Tool modules it imports, directly or through other modules.
+        None if the source of the function is not found.
+    """
+    file_name = get_function_file(func)
+    if file_name is None: return None
+    if file_name in code_hashes: return code_hashes[file_name]
+
+    sources = {}
+    remaining = [file_name]
+    while remaining:
+        module_file = remaining.pop()
+        if module_file in sources: continue
+        with open(module_file,'rb') as fin:
+            # Line endings depend on the checkout
+            sources[module_file] = fin.read().replace(b'\r\n', b'\n')
+        #
+        remaining.extend(get_imported_files(module_file, sources[module_file]))
+    # END while
+
+    sha = hashlib.sha1()
+    for module_file in sorted(sources):
+        relative_name = os.path.relpath(module_file, SOURCE_DIR).replace('\\','/')
+        sha.update(relative_name.encode('utf-8'))
+        sha.update(sources[module_file])
+    # END for over module_file
+    code_hashes[file_name] = sha.hexdigest()
+    return code_hashes[file_name]
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Content-hash cache
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class StageCache(object):
+    """ Content addressed store of stage outputs. Safe to share between
+        concurrent runs: every file is written to a temporary name and
+        renamed into place.
+    """
+
+    def __init__(self, cache_dir, max_size_gb=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.objects_dir = os.path.join(self.cache_dir,'objects')
+        self.stages_dir = os.path.join(self.cache_dir,'stages')
+        self.hash_index_file = os.path.join(self.cache_dir,'file_hashes.json')
+        self.max_size = None
+        if max_size_gb is not None: self.max_size = float(max_size_gb) * 1024.**3
+
+        for dirname in [self.cache_dir, self.objects_dir, self.stages_dir]:
+            if not os.path.isdir(dirname):
+                try:
+                    os.makedirs(dirname)
+                except OSError:
+                    # Created by a concurrent run
+                    if not os.path.isdir(dirname): raise
+            # END if
+        # END for over dirname
+
+        self.hash_index = self.read_json(self.hash_index_file, {})
+
+        # Outputs are linked in and out of the store, not copied
+        self.artifacts = artifact_store.ArtifactStore(self.objects_dir)
+
+    # ---------------------------------------
+    # Small file helpers
+    # ---------------------------------------
+    def read_json(self, file_name, default):
+        try:
+            with open(file_name,'r') as fin:
+                return json.load(fin)
+        except (IOError, OSError, ValueError):
+            return default
+
+    def write_atomic(self, file_name, text):
+        temp_file_name = '{0}.{1}.tmp'.format(file_name, os.getpid())
+        with open(temp_file_name,'w') as fout:
+            fout.write(text)
+        self.rename(temp_file_name, file_name)
+
+    def rename(self, temp_file_name, file_name):
+        try:
+            # Windows will not rename over an existing file
+            if os.path.exists(file_name): os.remove(file_name)
+            os.rename(temp_file_name, file_name)
+        except OSError:
+            # A concurrent run got there first
+            if os.path.exists(temp_file_name): os.remove(temp_file_name)
+
+    def object_path(self, digest):
+        return self.artifacts.object_path(digest)
+
+    # ---------------------------------------
+    # Hashing
+    # ---------------------------------------
+    def file_hash(self, file_name):
+        """ sha1 of the file contents. Reuses the stored hash when the
+            size and modification time of the file have not changed.
+        """
+        file_name = os.path.abspath(file_name)
+        stat = os.stat(file_name)
+        memo = self.hash_index.get(file_name)
+        if (memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime):
+            return memo[2]
+
+        sha = hashlib.sha1()
+        with open(file_name,'rb') as fin:
+            while True:
+                block = fin.read(1024*1024)
+                if not block: break
+                sha.update(block)
+            # END while
+        #
+        digest = sha.hexdigest()
+        self.hash_index[file_name] = [stat.st_size, stat.st_mtime, digest]
+        return digest
+
+    def input_hash(self, path):
+        """ Hash of a file, or of the names and contents of every file in
+            a directory. Returns None if the input does not exist.
+        """
+        if os.path.isfile(path): return self.file_hash(path)
+        if not os.path.isdir(path): return None
+
+        sha = hashlib.sha1()
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fname in sorted(filenames):
+                file_name = os.path.join(dirpath, fname)
+                relative_name = os.path.relpath(file_name, path).replace('\\','/')
+                sha.update(relative_name.encode('utf-8'))
+                sha.update(self.file_hash(file_name).encode('utf-8'))
+            # END for over fname
+        # END for over dirpath
+        return sha.hexdigest()
+
+    def stage_key(self, stage, inputs, root_dir):
+        """ Cache key of a stage from its name, version, the source of
+            its code, parameters, the contents of its inputs, and the
+            names of its outputs
+        """
+        input_hashes = []
+        for path in inputs:
+            digest = self.input_hash(path)
+            if digest is None: return None
+            input_hashes.append(digest)
+        # END for over path
+
+        key_data = {'stage':stage.name,
+                    'version':stage.version,
+                    'function':stage.func.__name__,
+                    'code':get_code_hash(stage.func),
+                    'params':relocate(stage.params, root_dir, RUN_ROOT),
+                    'inputs':input_hashes,
+                    'outputs':relocate(stage.outputs, root_dir, RUN_ROOT)}
+        key_text = json.dumps(key_data, sort_keys=True)
+        return hashlib.sha1(key_text.encode('utf-8')).hexdigest()
+
+    # ---------------------------------------
+    # Entries
+    # ---------------------------------------
+    def lookup(self, key):
+        """ Return the cache entry for key, or None. Entries whose output
+            objects have gone missing are ignored.
+        """
+        entry_file = os.path.join(self.stages_dir, key + '.json')
+        entry = self.read_json(entry_file, None)
+        if entry is None: return None
+        for digest in entry['outputs']:
+            if not os.path.isfile(self.object_path(digest)): return None
+        #
+        # Mark as recently used (see prune)
+        try:
+            os.utime(entry_file, None)
+        except OSError:
+            pass
+        return entry
+
+    def restore(self, entry, outputs):
+        """ Link the cached outputs to the output PATHs of this run """
+        for digest, file_out in zip(entry['outputs'], outputs):
+            self.artifacts.link(digest, file_out)
+        # END for over digest
+
+    def store(self, key, stage, outputs, result, root_dir):
+        """ Add the outputs and return value of a stage to the cache.
+            Returns False if an output is missing (nothing is stored).
+        """
+        for file_name in outputs:
+            if not os.path.isfile(file_name): return False
+        #
+
+        # Large outputs become the cached copy (hard links), so they
+        # are read-only afterwards
+        digests = []
+        for file_name in outputs:
+            digests.append(self.artifacts.put(file_name, self.file_hash(file_name), link=True))
+        # END for over file_name
+
+        entry = {'stage':stage.name,
+                 'key':key,
+                 'created':time.asctime(time.localtime()),
+                 'outputs':digests,
+                 'result':relocate(result, root_dir, RUN_ROOT)}
+        self.write_atomic(os.path.join(self.stages_dir, key + '.json'), json.dumps(entry, indent=1))
+
+        return True
+
+    def save(self):
+        """ Save the file-hash index, merged with any entries written by
+            concurrent runs
+        """
+        hash_index = self.read_json(self.hash_index_file, {})
+        hash_index.update(self.hash_index)
+        # Forget files that no longer exist
+        for file_name in list(hash_index.keys()):
+            if not os.path.exists(file_name): del hash_index[file_name]
+        #
+        self.hash_index = hash_index
+        self.write_atomic(self.hash_index_file, json.dumps(hash_index))
+
+    def prune(self):
+        """ Remove the least recently used entries until the objects fit
+            within max_size, then remove objects no entry refers to.
+        """
+        if self.max_size is None: return
+
+        entries = []
+        for fname in os.listdir(self.stages_dir):
+            if not fname.endswith('.json'): continue
+            entry_file = os.path.join(self.stages_dir, fname)
+            entry = self.read_json(entry_file, None)
+            if entry is None: continue
+            entries.append((os.path.getmtime(entry_file), entry_file, entry['outputs']))
+        # END for over fname
+        entries.sort()
+
+        object_sizes = {}
+        for dirpath, dirnames, filenames in os.walk(self.objects_dir):
+            # Extracted archives are kept (see ArtifactStore.extract)
+            if (dirpath == self.objects_dir and 'trees' in dirnames): dirnames.remove('trees')
+            for fname in filenames:
+                if fname.endswith('.tmp'): continue
+                object_sizes[fname] = os.path.getsize(os.path.join(dirpath, fname))
+        #
+
+        def referenced_size(entries):
+            digests = set()
+            for item in entries: digests.update(item[2])
+            return sum([object_sizes.get(digest, 0) for digest in digests]), digests
+
+        total_size, digests = referenced_size(entries)
+        while (entries and total_size > self.max_size):
+            os.remove(entries.pop(0)[1])
+            total_size, digests = referenced_size(entries)
+        # END while
+        digests.update(self.artifacts.get_tree_digests())
+
+        for digest in object_sizes:
+            if digest not in digests:
+                try:
+                    bscut.remove_file(self.object_path(digest))
+                except OSError:
+                    pass
+            # END if
+        # END for over digest
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Stage graph
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+class StageGraph(object):
+    """ Runs stages in dependency order, reusing cached outputs where the
+        inputs and parameters of a stage have not changed.
+
+        root_dir is the results directory of the run. Paths below it are
+        stored relative to it in the cache.
+
+        Each stage is timed in a span of trace (a run_trace.RunTrace).
+
+        Parallel stages are run by up to processes worker processes.
+    """
+
+    def __init__(self, root_dir, logfile, cache=None, trace=None, processes=1):
+        self.root_dir = os.path.abspath(root_dir)
+        self.logfile = logfile
+        self.cache = cache
+        if trace is None: trace = run_trace.RunTrace(os.path.basename(self.root_dir))
+        self.trace = trace
+        self.stages = []
+        self.results = {}
+        self.status = {}
+        self.restored = set()
+        self.skipped = set()
+        self.processes = processes
+
+    def add(self, stage):
+        for existing in self.stages:
+            if (existing.name == stage.name):
+                raise ValueError('\nERROR:\tStage {} is defined twice\n'.format(stage.name))
+        #
+        self.stages.append(stage)
+        return stage
+
+    def log(self, currentmessage, echo=True):
+        if echo: print (currentmessage)
+        run_logger.log(self.logfile, currentmessage)
+
+    def get_dependencies(self, stage):
+        """ Names of the stages that must finish before stage """
+        dependencies = set(stage.depends)
+        needed = set([os.path.abspath(path) for path in stage.inputs if isinstance(path, str)])
+        for value in list(stage.args) + list(stage.kwargs.values()) + list(stage.inputs):
+            if isinstance(value, StageResult): dependencies.add(value.stage_name)
+        #
+        for other in self.stages:
+            if (other is stage): continue
+            if needed.intersection([os.path.abspath(path) for path in other.outputs]):
+                dependencies.add(other.name)
+        # END for over other
+        return dependencies
+
+    def order(self):
+        """ Topological order of the stages. Stages keep the order in
+            which they were added unless a dependency requires otherwise.
+        """
+        names = [stage.name for stage in self.stages]
+        dependencies = {}
+        for stage in self.stages:
+            dependencies[stage.name] = self.get_dependencies(stage)
+            for name in dependencies[stage.name]:
+                if name not in names:
+                    raise ValueError('\nERROR:\tStage {0} depends on an unknown stage, {1}\n'.format(stage.name, name))
+            # END for over name
+        # END for over stage
+
+        ordered = []
+        remaining = list(self.stages)
+        while remaining:
+            for stage in remaining:
+                if dependencies[stage.name].issubset([done.name for done in ordered]):
+                    ordered.append(stage)
+                    remaining.remove(stage)
+                    break
+                # END if
+            else:
+                raise ValueError('\nERROR:\tCircular stage dependencies: {}\n'.format(
+                                 ', '.join([stage.name for stage in remaining])))
+            # END for over stage
+        # END while
+        return ordered
+
+    def resolve(self, value):
+        """ Replace StageResult placeholders with the stage return values """
+        if isinstance(value, StageResult): return self.results[value.stage_name]
+        return value
+
+    def resolve_inputs(self, inputs):
+        resolved = []
+        for value in inputs:
+            value = self.resolve(value)
+            if isinstance(value, (list, tuple)): resolved.extend(value)
+            elif value is not None: resolved.append(value)
+        # END for over value
+        return resolved
+
+    def restore_stage(self, stage):
+        """ Restore the outputs of a stage from the cache. Returns the
+            cache key (None if the stage is not cached) and whether the
+            outputs were restored.
+        """
+        if stage.message: self.log(stage.message)
+
+        if (self.cache is None or not stage.cacheable): return None, False
+
+        inputs = self.resolve_inputs(stage.inputs)
+        key = self.cache.stage_key(stage, inputs, self.root_dir)
+        entry = None
+        if key is not None: entry = self.cache.lookup(key)
+        if entry is None: return key, False
+
+        self.cache.restore(entry, stage.outputs)
+        self.results[stage.name] = relocate(entry['result'], RUN_ROOT, self.root_dir)
+        self.restored.add(stage.name)
+        self.log('\n\tStage {0}: inputs unchanged, restored {1} output file(s) from the cache ({2})\n'
+                 .format(stage.name, len(stage.outputs), key[:12]))
+        return key, True
+
+    def get_call(self, stage):
+        """ Arguments of the stage function """
+        # Outputs linked from the cache by an earlier run in this
+        # directory are read-only; remove them so the stage can write
+        for file_name in stage.outputs:
+            if (os.path.isfile(file_name) and not (os.stat(file_name).st_mode & stat.S_IWRITE)):
+                bscut.remove_file(file_name)
+        # END for over file_name
+
+        args = [self.resolve(value) for value in stage.args]
+        kwargs = dict([(name, self.resolve(stage.kwargs[name])) for name in stage.kwargs])
+        return args, kwargs
+
+    def finish_stage(self, stage, key, result):
+        """ Keep the return value of a stage that ran and cache its
+            outputs. Returns True on success.
+        """
+        self.results[stage.name] = result
+        if (result is False): return False
+
+        if key is not None:
+            try:
+                json.dumps(result)
+            except (TypeError, ValueError):
+                self.log('\n\tStage {}: return value cannot be cached\n'.format(stage.name), echo=False)
+            else:
+                if not self.cache.store(key, stage, stage.outputs, result, self.root_dir):
+                    self.log('\n\tStage {}: outputs missing, not cached\n'.format(stage.name), echo=False)
+            # end try
+        # END if
+        return True
+
+    def run_stage(self, stage):
+        """ Run (or restore) one stage. Returns True on success. """
+        key, restored = self.restore_stage(stage)
+        if restored: return True
+
+        args, kwargs = self.get_call(stage)
+        return self.finish_stage(stage, key, stage.func(*args, **kwargs))
+
+    def run_in_process(self, stage):
+        """ Run one stage in this process, timed. Returns True on success. """
+        # Stage boundaries flush the buffered log
+        run_logger.set_stage(self.logfile, stage.name, 'start')
+        stage_success = False
+        try:
+            with self.trace.span(stage.name) as span_info:
+                try:
+                    stage_success = self.run_stage(stage)
+                except ValueError as VError:
+                    self.log('\n{}'.format(VError))
+                except Exception:
+                    self.log(get_error_message(stage.name))
+                # end try
+                if not stage_success: span_info['status'] = 'failed'
+                elif stage.name in self.restored: span_info['status'] = 'cached'
+            #
+        finally:
+            run_logger.set_stage(self.logfile, stage.name, 'end' if stage_success else 'failed')
+        # end try
+        self.status[stage.name] = stage_success
+        return stage_success
+
+    def run_in_pool(self, stages, pool):
+        """ Run a group of parallel stages, each as soon as the stages it
+            depends on have finished. The stages that depend on a failed
+            stage are skipped; the others still run. Returns True if
+            every stage succeeded.
+        """
+        names = set([stage.name for stage in stages])
+        dependencies = dict([(stage.name, self.get_dependencies(stage).intersection(names))
+                             for stage in stages])
+        remaining = list(stages)
+        running = {}
+        failed = []
+        skipped = []
+
+        while (remaining or running):
+            # Start every stage that is ready
+            for stage in list(remaining):
+                if dependencies[stage.name].intersection(failed + skipped):
+                    remaining.remove(stage)
+                    skipped.append(stage.name)
+                    self.skipped.add(stage.name)
+                    self.status[stage.name] = False
+                    continue
+                # END if
+                if not all([self.status.get(name) for name in dependencies[stage.name]]): continue
+
+                remaining.remove(stage)
+                run_logger.set_stage(self.logfile, stage.name, 'start')
+                start = run_trace.get_usage()
+                try:
+                    key, restored = self.restore_stage(stage)
+                except ValueError as VError:
+                    self.log('\n{}'.format(VError))
+                    key, restored = None, None
+                except Exception:
+                    self.log(get_error_message(stage.name))
+                    key, restored = None, None
+                # end try
+                if restored:
+                    self.trace.add_span(stage.name, 'stage', start, run_trace.get_usage(), {'status':'cached'})
+                    self.status[stage.name] = True
+                    run_logger.set_stage(self.logfile, stage.name, 'end')
+                elif (restored is None):
+                    self.trace.add_span(stage.name, 'stage', start, run_trace.get_usage(), {'status':'failed'})
+                    self.status[stage.name] = False
+                    failed.append(stage.name)
+                    run_logger.set_stage(self.logfile, stage.name, 'failed')
+                else:
+                    args, kwargs = self.get_call(stage)
+                    running[stage.name] = (stage, key, start,
+                                           pool.apply_async(run_in_worker,
+                                                            (stage.name, stage.func, args, kwargs, self.logfile)))
+                # END if
+            # END for over stage
+
+            # Wait for a stage to finish
+            finished = [name for name in running if running[name][3].ready()]
+            if not finished:
+                time.sleep(0.05)
+                continue
+            #
+            for name in finished:
+                stage, key, start, async_result = running.pop(name)
+                try:
+                    result, start, end, peak_rss, worker = async_result.get()
+                except Exception:
+                    # Not raised by the stage (run_in_worker catches
+                    # its errors), e.g., a return value that cannot be
+                    # pickled
+                    self.log(get_error_message(name))
+                    result, end, peak_rss, worker = False, run_trace.get_usage(), None, None
+                # end try
+                stage_success = self.finish_stage(stage, key, result)
+                self.trace.add_span(name, 'stage', start, end, {'status':'ok' if stage_success else 'failed'},
+                                    thread=worker, peak_rss=peak_rss)
+                self.status[name] = stage_success
+                if not stage_success: failed.append(name)
+                run_logger.set_stage(self.logfile, name, 'end' if stage_success else 'failed')
+            # END for over name
+        # END while
+
+        for name in failed:
+            self.log('\nERROR:\tStage {} failed.\n'.format(name))
+        #
+        if skipped:
+            self.log('\n\tStages not run because a stage they depend on failed: {}\n'.format(', '.join(skipped)))
+        #
+        return (len(failed) == 0)
+
+    def get_pool(self):
+        """ Worker pool for the parallel stages, or None to run them in
+            this process
+        """
+        if (self.processes < 2 or not any([stage.parallel for stage in self.stages])): return None
+        if multiprocessing.current_process().daemon:
+            # Pool workers (e.g., batch jobs) cannot start processes
+            return None
+        #
+        logger = run_logger.get_logger(self.logfile)
+        queue = logger.get_queue() if logger is not None else None
+        return multiprocessing.Pool(processes=self.processes,
+                                    initializer=run_logger.init_worker,
+                                    initargs=(queue,))
+
+    def report(self):
+        """ Log the status of every stage """
+        lines = []
+        for stage in self.stages:
+            if (stage.name in self.skipped): status = 'not run, a stage it depends on failed'
+            elif (stage.name not in self.status): status = 'not run'
+            elif not self.status[stage.name]: status = 'FAILED'
+            elif (stage.name in self.restored): status = 'restored from the cache'
+            else: status = 'finished'
+            lines.append('\t\t{0}: {1}\n'.format(stage.name, status))
+        # END for over stage
+        self.log('\n\tStatus of the stages:\n' + ''.join(lines))
+
+    def run(self):
+        """ Run all stages. Stops at the first failed stage (or, for
+            parallel stages, after the independent stages finish), logs
+            the status of every stage and returns False, otherwise
+            returns True.
+        """
+        success = True
+        pool = None
+        try:
+            ordered = self.order()
+            pool = self.get_pool()
+            
+            # Consecutive parallel stages run together in the pool
+            groups = []
+            for stage in ordered:
+                if (pool is not None and stage.parallel and groups and groups[-1][0].parallel):
+                    groups[-1].append(stage)
+                else:
+                    groups.append([stage])
+            # END for over stage
+
+            for group in groups:
+                if (len(group) > 1 or (pool is not None and group[0].parallel)):
+                    group_success = self.run_in_pool(group, pool)
+                else:
+                    group_success = self.run_in_process(group[0])
+                # END if
+                if not group_success:
+                    self.log('\nERROR:\tStage {} failed. Remaining stages were not run.\n'
+                             .format(', '.join([stage.name for stage in group
+                                                if not (self.status.get(stage.name) or stage.name in self.skipped)])))
+                    success = False
+                    break
+                # END if
+            # END for over group
+
+            # Let the workers exit, so their last log messages are sent
+            if pool is not None:
+                pool.close()
+                pool.join()
+                pool = None
+            #
+            if not success: self.report()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            #
+            if self.cache is not None:
+                self.cache.save()
+                self.cache.prune()
+        # end try
+        return success
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
+
+
+
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+#
+# Run a stage function in a worker process
+#
+# Returns the result and the resource use (see
+# run_trace.RunTrace.add_span). An error is logged (a
+# ValueError by its message, any other with its
+# traceback) and returned as a failed stage (False), as
+# in StageGraph.run_in_process, so it does not stop the
+# other stages in the pool.
+#
+# xoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxoxox
+
+def run_in_worker(name, func, args, kwargs, logfile):
+
+    run_logger.set_worker_stage(name)
+    start = run_trace.get_usage()
+    try:
+        result = func(*args, **kwargs)
+    except ValueError as VError:
+        print ('\n{}'.format(VError))
+        run_logger.log(logfile, '\n{}'.format(VError))
+        result = False
+    except Exception:
+        error_message = get_error_message(name)
+        print (error_message)
+        run_logger.log(logfile, error_message)
+        result = False
+    # end try
+    end = run_trace.get_usage()
+    return (result, start, end, run_trace.get_peak_rss(),
+            multiprocessing.current_process().name)
+
+# ooooooooooooooooooooooooooooooooooooooooooooooooooooo
@@ -0,0 +1 @@
+# BAS6 placeholder of the tiny test model (not read by fake_modflow.py)
@@ -0,0 +1,72 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Tests of utilities/model_workspace.py
+
+    Run from the Tool directory with the Tool's Python:
+        python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utilities import fake_modflow
+from utilities import model_workspace
+
+
+NAM_FILE = """# name file
+LIST          2  model.lst
+BAS6          1  model.bas
+DIS          11  model.dis
+DATA(BINARY) 30  model.hds  REPLACE
+DATA(BINARY) 40  model.cbb
+DATA         50  model.ddn  UNKNOWN
+DATA         60  starting_heads.dat  OLD
+"""
+
+
+class WorkspaceOutputsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.model_dir = os.path.join(self.root_dir,'model')
+        os.mkdir(self.model_dir)
+        with open(os.path.join(self.model_dir,'model.nam'),'w') as fout: fout.write(NAM_FILE)
+        # Every file of the name file is in the shared model directory,
+        # the outputs left there by an earlier run
+        for fname in ['model.lst', 'model.bas', 'model.dis', 'model.hds', 'model.cbb',
+                      'model.ddn', 'starting_heads.dat']:
+            with open(os.path.join(self.model_dir,fname),'w') as fout: fout.write(fname)
+        # END for over fname
+        self.workspace = model_workspace.ModelWorkspace(self.model_dir, os.path.join(self.root_dir,'run'),
+                                                        'model.nam', os.path.join(self.root_dir,'log.txt'),
+                                                        run_files=[])
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def test_outputs_are_not_staged(self):
+        self.workspace.stage()
+        staged = sorted(os.listdir(self.workspace.workspace_dir))
+        self.assertEqual(staged, ['model.bas', 'model.dis', 'model.nam', 'starting_heads.dat'])
+
+    def test_outputs_match_fake_modflow(self):
+        replayed = [fname for ftype, fname in
+                    fake_modflow.get_nam_file_outputs(os.path.join(self.model_dir,'model.nam'))]
+        self.assertEqual(self.workspace.get_nam_file_outputs(), set(replayed))
+
+
+if __name__ == '__main__':
+    unittest.main()
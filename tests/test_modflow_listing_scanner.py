@@ -0,0 +1,99 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Tests of postprocess/modflow_listing_scanner.py
+
+    Run from the Tool directory with the Tool's Python:
+        python -m unittest discover -s tests
+"""
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from postprocess import modflow_listing_scanner
+from utilities import process_runner
+
+
+# Stress period 2 of a MODFLOW-NWT listing file in which the solver did not
+# converge (MXITER reached). NWT writes the failure with list-directed
+# output, between asterisks.
+NONCONVERGED_LISTING = u"""
+                            STRESS PERIOD NO.    1, LENGTH =   1.000000
+                            ----------------------------------------------
+
+ ------------------------------------------------
+       NWT REQUIRED           12 OUTER ITERATIONS
+       AND A TOTAL OF        317 INNER ITERATIONS.
+ ------------------------------------------------
+
+ OUTPUT CONTROL FOR STRESS PERIOD    1   TIME STEP    1
+    SAVE HEAD FOR ALL LAYERS
+    SAVE BUDGET
+
+                            STRESS PERIOD NO.    2, LENGTH =   1.000000
+                            ----------------------------------------------
+
+ ****FAILED TO MEET SOLVER CONVERGENCE CRITERIA IN TIME STEP           1  STRESS PERIOD           2****
+
+ ------------------------------------------------
+       NWT REQUIRED          500 OUTER ITERATIONS
+       AND A TOTAL OF      18432 INNER ITERATIONS.
+ ------------------------------------------------
+
+ OUTPUT CONTROL FOR STRESS PERIOD    2   TIME STEP    1
+    SAVE HEAD FOR ALL LAYERS
+    SAVE BUDGET
+"""
+
+
+class SolverIterationsTest(unittest.TestCase):
+
+    def scan(self, text):
+        solver = modflow_listing_scanner.SolverIterations()
+        periods = modflow_listing_scanner.StressPeriodMarkers()
+        scanner = modflow_listing_scanner.ListingScanner()
+        scanner.register(periods)
+        scanner.register(solver)
+        scanner.scan_file(io.StringIO(text))
+        return solver, periods
+
+    def test_nonconvergence_is_found(self):
+        solver, periods = self.scan(NONCONVERGED_LISTING)
+        self.assertEqual(periods.stress_periods, [1, 2])
+        self.assertEqual(solver.failed_to_converge, [(1, 2)])
+        self.assertIn('did not converge (time step 1, stress period 2)', solver.summary())
+
+    def test_iterations(self):
+        solver, periods = self.scan(NONCONVERGED_LISTING)
+        self.assertEqual(solver.outer_iterations, {(1, 1):12, (1, 2):500})
+        self.assertEqual(solver.inner_iterations, {(1, 1):317, (1, 2):18432})
+
+    def test_converged_run(self):
+        text = NONCONVERGED_LISTING.replace(
+            ' ****FAILED TO MEET SOLVER CONVERGENCE CRITERIA IN TIME STEP           1  STRESS PERIOD           2****\n',
+            '')
+        solver, periods = self.scan(text)
+        self.assertEqual(solver.failed_to_converge, [])
+
+    def test_markers_match_process_runner(self):
+        # The failures counted here are those that stop MODFLOW
+        for pattern in process_runner.NONCONVERGENCE_PATTERNS:
+            self.assertIn(pattern, modflow_listing_scanner.SolverIterations.block_markers)
+        #
+        regex = process_runner.get_error_regex(process_runner.NONCONVERGENCE_PATTERNS)
+        self.assertTrue(regex.search(NONCONVERGED_LISTING))
+
+
+if __name__ == '__main__':
+    unittest.main()
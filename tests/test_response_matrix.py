@@ -0,0 +1,90 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Tests of screening/response_matrix.py
+
+    Run from the Tool directory with the Tool's Python:
+        python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from screening import response_matrix
+
+
+def get_matrix():
+    """ Two stations and one lake; unit responses at two cells of layer 3 """
+    matrix = response_matrix.ResponseMatrix(unit_rate_cfd=100.)
+    stations = [{'number':'02320500', 'name':'Suwannee', 'WMD':'SRWMD', 'reach_type':'RIV'},
+                {'number':'02236000', 'name':'St. Johns', 'WMD':'SJRWMD', 'reach_type':'RIV'}]
+    matrix.set_baseline(stations, [10., 20.], [('lakes', 1, ['L1'], [50.])])
+    matrix.add_response((3, 100, 100), [9., 20.], [49.])
+    matrix.add_response((3, 100, 120), [10., 18.], [50.])
+    return matrix
+
+
+class SuperposeTest(unittest.TestCase):
+
+    def test_exact_and_nearest(self):
+        matrix = get_matrix()
+        dq, dh, matches = matrix.superpose([(3, 100, 100, 200.), (3, 103, 124, 100.)], max_distance=5)
+        self.assertEqual(list(dq), [-2., -2.])
+        self.assertEqual(list(dh), [-2.])
+        self.assertEqual(matches, [(0, 0.), (1, 5.)])
+
+    def test_far_well_is_not_added(self):
+        matrix = get_matrix()
+        dq, dh, matches = matrix.superpose([(3, 100, 100, 100.), (3, 300, 300, 100.)], max_distance=5)
+        self.assertEqual(list(dq), [-1., 0.])
+        self.assertEqual(matches[1][0], 1)
+        self.assertTrue(matches[1][1] > 5)
+
+    def test_layer_without_locations(self):
+        with self.assertRaises(ValueError):
+            get_matrix().superpose([(5, 100, 100, 100.)])
+
+
+class ScreenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.matrix_file = os.path.join(self.root_dir,'matrix.npz')
+        get_matrix().save(self.matrix_file)
+        self.wells_to_add = os.path.join(self.root_dir,'wells_to_add.csv')
+        self.wells_out = os.path.join(self.root_dir,'screening_wells.csv')
+        self.logfile = os.path.join(self.root_dir,'log.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def test_far_well_fails_the_screening(self):
+        with open(self.wells_to_add,'w') as fout:
+            fout.write('LAYER,ROW,COL,Q_CFD\n3,100,101,100.0\n3,300,300,100.0\n')
+        #
+        self.assertFalse(response_matrix.main(self.matrix_file, self.wells_to_add, None,
+                                              os.path.join(self.root_dir,'dq.csv'), self.root_dir,
+                                              self.wells_out, 5., self.logfile))
+        self.assertFalse(os.path.isfile(os.path.join(self.root_dir,'dq.csv')))
+        with open(self.wells_out,'r') as fin: lines = fin.read().splitlines()
+        self.assertEqual(lines[0], ','.join(response_matrix.WELL_TABLE_HEADER))
+        self.assertEqual(lines[1], '3,100,101,100.0,3,100,100,1.00,nearest')
+        self.assertTrue(lines[2].startswith('3,300,300,100.0,3,100,120,'))
+        self.assertTrue(lines[2].endswith('not screened, more than 5.0 cells away'))
+        with open(self.logfile,'r') as fin: self.assertIn('1 well(s) are more than 5.0 model cells', fin.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
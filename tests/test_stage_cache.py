@@ -0,0 +1,132 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" Tests of utilities/stage_cache.py
+
+    Run from the Tool directory with the Tool's Python:
+        python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utilities import stage_cache
+
+
+# Stage functions (module level, so the worker processes can run them)
+
+def write_file(file_name, text):
+    with open(file_name,'w') as fout: fout.write(text)
+    return True
+
+def copy_file(file_in, file_out):
+    with open(file_in,'r') as fin: text = fin.read()
+    return write_file(file_out, text)
+
+def read_missing_file(file_name):
+    # IOError, not the ValueError of the Tool's own error checks
+    with open(file_name,'r') as fin: return fin.read()
+
+
+class FailedBranchTest(unittest.TestCase):
+    """ Two independent branches, the second of which raises an IOError """
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.root_dir,'log.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def get_graph(self, processes):
+        def path(name): return os.path.join(self.root_dir,name)
+        graph = stage_cache.StageGraph(self.root_dir, self.logfile, processes=processes)
+        graph.add(stage_cache.Stage('good', write_file, args=[path('good.txt'), 'heads'],
+                                    outputs=[path('good.txt')], parallel=True))
+        graph.add(stage_cache.Stage('good_next', copy_file, args=[path('good.txt'), path('good_next.txt')],
+                                    inputs=[path('good.txt')], outputs=[path('good_next.txt')], parallel=True))
+        graph.add(stage_cache.Stage('bad', read_missing_file, args=[path('missing.txt')],
+                                    parallel=True))
+        graph.add(stage_cache.Stage('bad_next', write_file, args=[path('bad_next.txt'), 'x'],
+                                    depends=['bad'], parallel=True))
+        return graph
+
+    def check(self, graph):
+        self.assertFalse(graph.run())
+        self.assertEqual(graph.status, {'good':True, 'good_next':True, 'bad':False, 'bad_next':False})
+        self.assertEqual(graph.skipped, set(['bad_next']))
+        self.assertTrue(os.path.isfile(os.path.join(self.root_dir,'good_next.txt')))
+        self.assertFalse(os.path.isfile(os.path.join(self.root_dir,'bad_next.txt')))
+        with open(self.logfile,'r') as fin: log = fin.read()
+        self.assertIn('Stage bad failed with an unexpected error', log)
+        self.assertIn('IOError', log)
+        self.assertIn('good_next: finished', log)
+        self.assertIn('bad_next: not run, a stage it depends on failed', log)
+
+    def test_pool(self):
+        self.check(self.get_graph(processes=2))
+
+    def test_in_process(self):
+        graph = self.get_graph(processes=1)
+        self.assertFalse(graph.run())
+        # One at a time, in order: stops after the failed stage
+        self.assertEqual(graph.status, {'good':True, 'good_next':True, 'bad':False})
+        with open(self.logfile,'r') as fin: log = fin.read()
+        self.assertIn('IOError', log)
+        self.assertIn('bad_next: not run', log)
+
+
+class CodeHashTest(unittest.TestCase):
+    """ The cache key of a stage changes with the source of its code """
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.module_file = os.path.join(self.root_dir,'edited_stage.py')
+        sys.path.insert(0, self.root_dir)
+
+    def tearDown(self):
+        sys.path.remove(self.root_dir)
+        sys.modules.pop('edited_stage', None)
+        stage_cache.code_hashes.clear()
+        shutil.rmtree(self.root_dir)
+
+    def get_key(self, source):
+        with open(self.module_file,'w') as fout: fout.write(source)
+        sys.modules.pop('edited_stage', None)
+        stage_cache.code_hashes.clear()
+        import edited_stage
+        cache = stage_cache.StageCache(os.path.join(self.root_dir,'cache'))
+        stage = stage_cache.Stage('edited', edited_stage.main)
+        return cache.stage_key(stage, [], self.root_dir)
+
+    def test_edited_module(self):
+        source = 'from utilities import grid_index\ndef main():\n    return 1\n'
+        key = self.get_key(source)
+        self.assertEqual(key, self.get_key(source))
+        self.assertNotEqual(key, self.get_key(source.replace('return 1', 'return 2')))
+
+    def test_imported_tool_modules(self):
+        imported = stage_cache.get_imported_files(self.module_file, 'from utilities import grid_index\nimport numpy\n')
+        self.assertEqual([os.path.basename(name) for name in imported], ['__init__.py', 'grid_index.py'])
+
+    def test_lazy_function_is_not_imported(self):
+        from utilities import gis_backends
+        func = gis_backends.get_function('gis_tables','arcpy')
+        self.assertIsNotNone(stage_cache.get_code_hash(func))
+        self.assertNotIn('postprocess.make_ArcGIS_table_from_csv', sys.modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Please report errors and corrections to pbremner (at) sjrwmd.com
+
+""" End-to-end test of the MODFLOW adapter, fake_modflow and the
+    postprocessing on the tiny synthetic model in tests/fixtures/tiny_model
+    (see its README.txt). Needs neither MODFLOW nor arcpy.
+
+    Run from the Tool directory with the Tool's Python:
+        python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'src'))
+
+import sim_cup_main
+from postprocess import dh_rasters
+from postprocess import modflow_listing_scanner
+from postprocess import parse_modflow_listing_file_budget
+from process_heads import modflow_heads_file
+
+
+TINY_MODEL_DIR = os.path.join(TESTS_DIR, 'fixtures', 'tiny_model')
+FAKE_MODFLOW_ADAPTER = os.path.join(TESTS_DIR, '..', 'input_and_definition_files',
+                                    'modflow', 'fake_modflow.txt')
+GRID_PRJ = os.path.join(TESTS_DIR, '..', 'gis', 'projections', 'nfseg_v1_1_grid.prj')
+
+# Stress period 2 - stress period 1 of the fixture heads file
+EXPECTED_DH = {1:[[0., 0., 0., 0.], [0., -0.5, -1., -0.25], [0., -0.25, -0.5, 0.]],
+               2:[[0., 0., 0., 0.], [0., -0.25, -0.5, 0.], [0., 0., -0.25, 0.]]}
+
+
+class TinyModelPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.root_dir,'log.txt')
+        # The shipped fake_modflow adapter replays the fixtures next to it
+        adapter_dir = os.path.join(self.root_dir,'modflow')
+        os.mkdir(adapter_dir)
+        self.adapter_file = os.path.join(adapter_dir,'fake_modflow.txt')
+        shutil.copyfile(FAKE_MODFLOW_ADAPTER, self.adapter_file)
+        shutil.copytree(os.path.join(TINY_MODEL_DIR,'fake_modflow_fixtures'),
+                        os.path.join(adapter_dir,'fake_modflow_fixtures'))
+
+        self.results_dir = os.path.join(self.root_dir,'results')
+        os.mkdir(self.results_dir)
+        self.listfile = os.path.join(self.results_dir,'nfseg_auto.lst')
+        self.hdsfile = os.path.join(self.results_dir,'nfseg_auto.hds')
+        wel_file = os.path.join(self.root_dir,'nfseg_auto.wel')
+        with open(wel_file,'w') as fout: fout.write('# wel file of the tiny test model\n')
+
+        self.ran = sim_cup_main.execute_model(wel_file, [], os.path.join(TINY_MODEL_DIR,'model'),
+                                              self.root_dir, os.path.join(self.root_dir,'model_run'),
+                                              [('nfseg_auto.lst', self.listfile),
+                                               ('nfseg_auto.hds', self.hdsfile)],
+                                              False, self.logfile, timeout=60,
+                                              adapter_file=self.adapter_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def test_model_run(self):
+        self.assertTrue(self.ran)
+        self.assertFalse(os.path.isdir(os.path.join(self.root_dir,'model_run')))
+        # The shared model directory is not written to
+        self.assertEqual(sorted(os.listdir(os.path.join(TINY_MODEL_DIR,'model'))),
+                         ['nfseg_auto_2009.nam', 'tiny.bas', 'tiny.dis'])
+
+    def test_listing(self):
+        self.assertTrue(self.ran)
+        periods = modflow_listing_scanner.StressPeriodMarkers()
+        solver = modflow_listing_scanner.SolverIterations()
+        scanner = modflow_listing_scanner.ListingScanner()
+        scanner.register(periods)
+        scanner.register(solver)
+        scanner.scan(self.listfile)
+        self.assertEqual(periods.stress_periods, [1, 2])
+        self.assertEqual(solver.outer_iterations, {(1, 1):4, (1, 2):6})
+        self.assertEqual(solver.failed_to_converge, [])
+
+        budget_out = os.path.join(self.results_dir,'global_budget_change.csv')
+        parse_modflow_listing_file_budget.main(self.listfile, budget_out, self.logfile)
+        with open(budget_out,'r') as fin:
+            header = fin.readline().strip().split(',')
+            rows = [dict(zip(header, line.strip().split(','))) for line in fin]
+        #
+        changes = dict([(row['bc_flux_type'], float(row['net_rate_2_minus_1']))
+                        for row in rows if row['flux_units'].strip() == 'cfd'])
+        self.assertEqual(changes, {'CONSTANT HEAD':100., 'STORAGE':0., 'WELLS':-100.})
+
+    def test_delta_heads(self):
+        self.assertTrue(self.ran)
+        hds = modflow_heads_file.HeadsFile(self.hdsfile)
+        self.assertEqual((hds.nlay, hds.nrow, hds.ncol), (2, 3, 4))
+        deltaH_file = os.path.join(self.results_dir,'delta_head_modelwide.csv')
+        modflow_heads_file.write_delta_heads(hds, deltaH_file)
+        hds.close()
+        with open(deltaH_file,'r') as fin:
+            lines = fin.read().splitlines()
+        #
+        self.assertEqual(lines[0], 'row_col,dh_lyr1,dh_lyr2')
+        self.assertEqual(len(lines), 1 + 3*4)
+        self.assertEqual([float(value) for value in lines[1+4+2].split(',')[1:]], [-1., -0.5])
+
+    def test_dh_rasters(self):
+        self.assertTrue(self.ran)
+        out_dir = os.path.join(self.results_dir,'dh_rasters')
+        grid_definition = os.path.join(TINY_MODEL_DIR,'tiny_grid_definition.txt')
+        outfiles = dh_rasters.main(self.hdsfile, [1, 2], grid_definition, GRID_PRJ,
+                                   out_dir, 'asc', self.logfile)
+        self.assertEqual([os.path.basename(fname) for fname in outfiles], ['dh_lyr1.asc', 'dh_lyr2.asc'])
+        for layer, fname in zip([1, 2], outfiles):
+            with open(fname,'r') as fin:
+                header = dict([fin.readline().split() for i in range(6)])
+                values = np.loadtxt(fin)
+            #
+            self.assertEqual((header['ncols'], header['nrows']), ('4', '3'))
+            self.assertEqual(float(header['xllcorner']), 1000.)
+            self.assertEqual(float(header['yllcorner']), 2000.)
+            expected = np.array(EXPECTED_DH[layer])
+            # Cell (3, 4) is not in the grid, cell (1, 1) of layer 2 is inactive
+            expected[2,3] = float(header['NODATA_value'])
+            if (layer == 2): expected[0,0] = float(header['NODATA_value'])
+            np.testing.assert_array_equal(values, expected)
+            self.assertTrue(os.path.isfile(fname[:-4] + '.prj'))
+        # END for over layer
+
+        outfiles = dh_rasters.main(self.hdsfile, [1], grid_definition, GRID_PRJ,
+                                   out_dir, 'tif', self.logfile)
+        with open(outfiles[0],'rb') as fin:
+            self.assertEqual(fin.read(4), b'II*\x00')
+        #
+
+
+if __name__ == '__main__':
+    unittest.main()